@@ -30,6 +30,12 @@ def main():
     build_parser.add_argument("--config", required=True, help="Config YAML path")
     build_parser.add_argument("--output", required=True, help="Output directory")
     build_parser.add_argument("--json-logs", action="store_true", help="JSON log output")
+    build_parser.add_argument("--record", nargs="?", const="", default=None, metavar="CASSETTE",
+                              help="Record LLM/embedding traffic (default: <output>/llm_cassette.jsonl)")
+    build_parser.add_argument("--replay", default=None, metavar="CASSETTE",
+                              help="Replay a recorded cassette instead of calling providers")
+    build_parser.add_argument("--replay-latency", type=float, default=None, metavar="SCALE",
+                              help="Sleep recorded latency x SCALE on replay (default 0)")
 
     # ── resolve ──
     resolve_parser = subparsers.add_parser("resolve", help="Resume after conflict resolution")
@@ -139,6 +145,12 @@ def cmd_build(args) -> int:
     except PipelineError as e:
         _error_json(f"Config error: {e}")
         return 1
+    if getattr(args, "record", None) is not None:
+        config.cassette_mode, config.cassette_path = "record", args.record
+    elif getattr(args, "replay", None):
+        config.cassette_mode, config.cassette_path = "replay", args.replay
+    if getattr(args, "replay_latency", None) is not None:
+        config.cassette_latency_scale = args.replay_latency
 
     try:
         runner = PipelineRunner(config)
@@ -2,20 +2,48 @@
 
 Supports dual SDK: OpenAI-compatible format for custom providers (e.g. Claudible),
 Anthropic SDK for direct Anthropic API access.
+
+Calls are thread-safe: phases may fan out independent prompts with
+call_batch() / call_json_batch(), bounded per provider by max_in_flight.
+Identical in-flight prompts are single-flighted, across processes too
+when a cache_dir is shared. With batch_mode on, call_batch() submits
+through the provider's asynchronous batch API at batch pricing.
+stream_json() streams a JSON response and yields list items as they complete.
+Every request is preflighted against the model's context window, and
+every call is recorded in self.telemetry (latency, tokens, cache hits).
 """
 
 import json
 import re
 import time
 import hashlib
-import os
+import threading
 import unicodedata
-from typing import Optional
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait,
+)
+from dataclasses import dataclass
+from typing import Callable, Optional
 
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from ..core.logger import PipelineLogger
 from ..core.errors import ClaudeAPIError
+from .key_pool import KeyPool, PooledKey
+from .message_batches import (
+    BatchItem, DEFAULT_POLL_SECONDS, DEFAULT_TIMEOUT_SECONDS,
+    run_batch as run_message_batch,
+)
+from ..core.cassette import Cassette, CassetteMissError, request_key
+from ..core.json_stream import JsonStream, TRUNCATED_STOP_REASONS
+from ..core.provider_health import ProviderHealth
+from ..core.rate_limiter import RateLimiter, bucket_name, retry_after_seconds
+from ..core.telemetry import CallRecord, LlmTelemetry
+from ..core.tokens import get_token_counter, model_limits
+from ..core.response_cache import (
+    ResponseCache, DEFAULT_MAX_BYTES, DEFAULT_TTL_HOURS, DEFAULT_LEASE_SECONDS,
+)
 
 # Import both SDKs — availability determines which format is used
 _RETRYABLE_EXCEPTIONS = []
@@ -41,25 +69,149 @@ except ImportError:
 _RETRYABLE_EXCEPTIONS = tuple(_RETRYABLE_EXCEPTIONS) if _RETRYABLE_EXCEPTIONS else (ConnectionError,)
 
 
+# Sent after the cut-off reply on providers without assistant prefill
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off by the length limit. Continue exactly "
+    "where it stopped: output only the remaining text, without repeating "
+    "anything or adding commentary."
+)
+# Shortest repeated tail treated as overlap when stitching a continuation
+_MIN_STITCH_OVERLAP = 16
+# Smallest output budget worth sending once the prompt fills the context
+_MIN_OUTPUT_TOKENS = 256
+# Shortest prefix Anthropic caches (2048 on Haiku); a cache_control
+# breakpoint on a shorter prefix is silently ignored
+MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_TOKENS_HAIKU = 2048
+
+
+def min_cacheable_tokens(model: str) -> int:
+    return MIN_CACHEABLE_TOKENS_HAIKU if "haiku" in (model or "") else MIN_CACHEABLE_TOKENS
+
+# Characters that cause 500 errors on proxies: null, C0/C1 controls (tab,
+# newline and carriage return kept), BOM, private use, U+FFFD-U+FFFF,
+# everything outside the BMP. Lone surrogates are replaced with "?" first
+# (as a UTF-8 round trip with errors="replace" does).
+_UNSAFE_CHARS = re.compile(
+    r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ufeff\ue000-\uf8ff"
+    r"\ufffd-\uffff\U00010000-\U0010ffff]"
+)
+_UNSAFE_ASCII = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_SURROGATES = re.compile(r"[\ud800-\udfff]")
+
+
+def sanitize_api_text(text: str) -> str:
+    """Last-resort text cleaning before sending to API.
+
+    Same result as a UTF-8 replace round trip, NFC normalisation (Vietnamese
+    combining diacritics) and then dropping _UNSAFE_CHARS, but in one regex
+    pass — and no pass at all for clean ASCII.
+    """
+    if not text:
+        return ""
+    if text.isascii():
+        # NFC is the identity on ASCII; only C0 controls and DEL can match
+        return _UNSAFE_ASCII.sub("", text) if _UNSAFE_ASCII.search(text) else text
+    if _SURROGATES.search(text):
+        text = _SURROGATES.sub("?", text)
+    # Normalise before stripping: removing a control between a letter and
+    # its combining mark must not let them compose. (normalize() returns
+    # already-NFC text after its quick check.)
+    text = unicodedata.normalize("NFC", text)
+    return _UNSAFE_CHARS.sub("", text)
+
+
+# Provider error messages that mean the key is out of credit or quota
+CREDIT_ERROR_PHRASES = (
+    "credit balance is too low",
+    "insufficient_quota",
+    "insufficient credits",
+    "payment required",
+    "billing hard limit",
+    "quota exceeded",
+)
+
+
+def _dedupe_keys(keys: list) -> list[str]:
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def _inside_json_string(text: str) -> bool:
+    """True if text stops inside a JSON string (scanned from the first bracket)."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return False
+    in_string = escaped = False
+    for ch in text[min(starts):]:
+        if escaped:
+            escaped = False
+        elif ch == "\\" and in_string:
+            escaped = True
+        elif ch == '"':
+            in_string = not in_string
+    return in_string
+
+
+@dataclass
+class _OpenStream:
+    """A connected stream whose first delta has arrived (see _open_stream)."""
+    resources: ExitStack          # slot, pooled key and provider stream
+    deltas: object
+    first: Optional[str]
+    client: object
+    sdk_type: str
+    bucket: str
+    key: Optional[PooledKey]
+    estimated: int
+    queued: float
+    start: float
+    ttfb: Optional[float]
+    retries: int
+
+
 class CreditExhaustedError(Exception):
     """Raised when API credits are depleted — stops pipeline immediately."""
     pass
 
 
 class ClaudeClient:
+    # USD per million tokens. cache_write/cache_read price prompt-cache
+    # creation and hits; models without them fall back to 1.25x / 0.1x input.
     PRICING = {
-        "claude-sonnet-4-5-20250929": {"input": 3.0, "output": 15.0},
-        "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0},
-        "claude-haiku-4-5-20251001": {"input": 0.80, "output": 4.0},
-        "deepseek-chat": {"input": 0.14, "output": 0.28},
-        "claude-opus-4-6": {"input": 15.0, "output": 75.0},
+        "claude-sonnet-4-5-20250929": {"input": 3.0, "output": 15.0,
+                                       "cache_write": 3.75, "cache_read": 0.30},
+        "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0,
+                                     "cache_write": 3.75, "cache_read": 0.30},
+        "claude-haiku-4-5-20251001": {"input": 0.80, "output": 4.0,
+                                      "cache_write": 1.0, "cache_read": 0.08},
+        "deepseek-chat": {"input": 0.14, "output": 0.28,
+                          "cache_write": 0.14, "cache_read": 0.014},
+        "claude-opus-4-6": {"input": 15.0, "output": 75.0,
+                            "cache_write": 18.75, "cache_read": 1.50},
     }
+    BATCH_DISCOUNT = 0.5   # batch APIs bill at half the interactive price
 
     def __init__(self, api_key: str, model: str = "claude-sonnet-4-5-20250929",
                  model_light: Optional[str] = None, base_url: Optional[str] = None,
                  logger: Optional[PipelineLogger] = None, cache_dir: Optional[str] = None,
                  base_url_light: Optional[str] = None, api_key_light: Optional[str] = None,
-                 model_premium: Optional[str] = None):
+                 model_premium: Optional[str] = None,
+                 max_in_flight: int = 4, max_in_flight_light: Optional[int] = None,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                 cache_ttl_hours: float = DEFAULT_TTL_HOURS,
+                 rpm: int = 0, tpm: int = 0,
+                 rpm_light: Optional[int] = None, tpm_light: Optional[int] = None,
+                 batch_mode: bool = False, batch_min_requests: int = 4,
+                 batch_poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 batch_timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+                 prompt_caching: bool = True,
+                 max_continuations: int = 2,
+                 hedge_percentile: float = 95.0, hedge_min_delay: float = 2.0,
+                 breaker_error_rate: float = 0.5, breaker_latency: float = 0.0,
+                 breaker_cooldown: float = 60.0,
+                 api_keys: Optional[list[str]] = None,
+                 api_keys_light: Optional[list[str]] = None,
+                 cassette: Optional[Cassette] = None):
         if not api_key:
             raise ClaudeAPIError("CLAUDE_API_KEY not set", retryable=False)
 
@@ -69,40 +221,31 @@ class ClaudeClient:
         self.base_url = base_url
         self.logger = logger or PipelineLogger()
         self.cache_dir = cache_dir
+        # Record/replay — every provider request goes through the cassette,
+        # so the response cache, batch API and hedging are bypassed
+        self.cassette = cassette
+        self.response_cache = None
+        if cache_dir and not cassette:
+            self.response_cache = ResponseCache(
+                cache_dir, max_bytes=cache_max_bytes, ttl_hours=cache_ttl_hours,
+            )
+            migrated = self.response_cache.import_legacy_files()
+            if migrated:
+                self.logger.info(
+                    f"Claude cache: migrated {migrated} legacy files into "
+                    f"{self.response_cache.db_path}"
+                )
 
         # Build main client — Anthropic SDK or OpenAI-compatible based on base_url
-        if base_url:
-            if not HAS_OPENAI:
-                raise ImportError(
-                    "openai package required for custom base_url. "
-                    "Run: pip install openai"
-                )
-            api_base = base_url.rstrip("/")
-            if not api_base.endswith("/v1"):
-                api_base = api_base + "/v1"
-            self.main_client = OpenAI(api_key=api_key, base_url=api_base)
-            self.sdk_type = "openai"
-        else:
-            if not HAS_ANTHROPIC:
-                raise ImportError(
-                    "anthropic package required. Run: pip install anthropic"
-                )
-            self.main_client = anthropic.Anthropic(api_key=api_key)
-            self.sdk_type = "anthropic"
+        main_keys = _dedupe_keys([api_key] + list(api_keys or []))
+        self.main_client, self.sdk_type = self._make_sdk_client(base_url, api_key)
 
         # Build light client — separate provider when base_url_light is given
         if base_url_light:
-            if not HAS_OPENAI:
-                raise ImportError(
-                    "openai package required for base_url_light. "
-                    "Run: pip install openai"
-                )
-            light_base = base_url_light.rstrip("/")
-            if not light_base.endswith("/v1"):
-                light_base = light_base + "/v1"
-            effective_light_key = api_key_light if api_key_light else api_key
-            self.light_client = OpenAI(api_key=effective_light_key, base_url=light_base)
-            self.light_sdk_type = "openai"
+            light_keys = _dedupe_keys([api_key_light] + list(api_keys_light or [])) or main_keys
+            self.light_client, self.light_sdk_type = self._make_sdk_client(
+                base_url_light, light_keys[0], setting="base_url_light",
+            )
         else:
             # Fall back to main client — backward compatible
             self.light_client = self.main_client
@@ -110,76 +253,167 @@ class ClaudeClient:
 
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.total_cache_read_tokens = 0
+        self.total_cache_write_tokens = 0
         self.total_cost_usd = 0.0
         self.call_count = 0
+        self.continuation_count = 0
+        self.continuation_cost_usd = 0.0
         self._credit_errors_main = 0
         self._credit_errors_light = 0
         self._MAX_CREDIT_ERRORS = 3
 
-    def _sanitize_api_text(self, text: str) -> str:
-        """Last-resort text cleaning before sending to API.
+        # Concurrency — counters are shared across worker threads, and each
+        # provider (main/premium vs light) has its own in-flight request cap
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_in_flight_light = max(1, int(max_in_flight_light or max_in_flight))
+        self._lock = threading.Lock()
+        self._main_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._light_slots = threading.BoundedSemaphore(self.max_in_flight_light)
 
-        Removes characters known to cause 500 errors on proxies
-        (null, BOM, control chars, surrogates, PUA, non-BMP).
-        """
-        if not text:
-            return ""
+        # Shared RPM/TPM buckets per provider/key — coordinated through the
+        # cache dir so concurrent builds split one budget
+        replaying = cassette is not None and cassette.replaying
+        self.rate_limiter = RateLimiter(cache_dir) if cache_dir and not replaying else None
+        self._main_bucket = bucket_name(base_url, api_key)
+        self._light_bucket = (
+            bucket_name(base_url_light, light_keys[0]) if base_url_light else self._main_bucket
+        )
 
-        # UTF-8 roundtrip
-        text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
+        # Key pools — extra keys get their own client and bucket, and each
+        # request takes the key with the most rate budget left
+        self._main_keys = self._build_key_pool(
+            "main", base_url, main_keys, self.main_client, self.sdk_type,
+        )
+        self._light_keys = self._main_keys
+        if base_url_light:
+            self._light_keys = self._build_key_pool(
+                "light", base_url_light, light_keys, self.light_client, self.light_sdk_type,
+            )
+        if self.rate_limiter:
+            for key in self._main_keys.keys:
+                self.rate_limiter.configure(key.bucket, rpm=rpm, tpm=tpm)
+            if self._light_keys is not self._main_keys:
+                for key in self._light_keys.keys:
+                    self.rate_limiter.configure(
+                        key.bucket,
+                        rpm=rpm if rpm_light is None else rpm_light,
+                        tpm=tpm if tpm_light is None else tpm_light,
+                    )
 
-        # NFC normalize (Vietnamese combining diacritics)
-        text = unicodedata.normalize("NFC", text)
+        # Provider-side prompt caching (Anthropic cache_control breakpoints)
+        self.prompt_caching = prompt_caching
 
-        # Remove dangerous chars
-        text = text.replace("\x00", "")
-        text = text.replace("\ufeff", "")
-        text = re.sub(r"[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]", "", text)
-        text = re.sub(r"[\ud800-\udfff]", "", text)
-        text = re.sub(r"[\ue000-\uf8ff]", "", text)
-        text = re.sub(r"[\ufffd-\uffff]", "", text)
+        # Continue responses cut at max_tokens instead of repairing the JSON
+        self.max_continuations = max(0, int(max_continuations))
 
-        # Remove non-BMP
-        text = re.sub(r"[\U00010000-\U0010FFFF]", "", text)
+        # Batch mode — call_batch()/call_json_batch() use the provider batch API
+        self.batch_mode = batch_mode and not cassette
+        self.batch_min_requests = max(1, int(batch_min_requests))
+        self.batch_poll_seconds = batch_poll_seconds
+        self.batch_timeout_seconds = batch_timeout_seconds
 
-        return text
+        # Token estimates for rate limiting and preflight, calibrated per
+        # model from the usage the provider reports
+        self.token_counter = get_token_counter()
+
+        # Per-call latency/token records, aggregated per phase and model
+        self.telemetry = LlmTelemetry()
+        self._attempts: dict[str, int] = {}
+
+        # Provider health — with a separate light provider, light-model
+        # requests fail over to main while the light breaker is open, and a
+        # request slower than the hedge percentile gets a duplicate on the
+        # other provider (first valid response wins)
+        self.has_alternate = self.light_client is not self.main_client
+        self.health = ProviderHealth(
+            hedge_percentile=0 if cassette else hedge_percentile,
+            hedge_min_delay_s=hedge_min_delay,
+            error_rate=breaker_error_rate, max_latency_s=breaker_latency,
+            cooldown_s=breaker_cooldown,
+        )
+        self.hedge_count = 0
+        self.hedge_wins = 0
+        self.failover_count = 0
+
+        # Single-flight — identical prompts in flight share one request
+        self._in_flight: dict[str, Future] = {}
+        self.single_flight_joins = 0
+        self.lease_seconds = DEFAULT_LEASE_SECONDS
+
+    @staticmethod
+    def _make_sdk_client(base_url: Optional[str], api_key: str,
+                         setting: str = "custom base_url") -> tuple:
+        """(client, sdk_type) — OpenAI-compatible for a base_url, else Anthropic."""
+        if base_url:
+            if not HAS_OPENAI:
+                raise ImportError(
+                    f"openai package required for {setting}. "
+                    "Run: pip install openai"
+                )
+            api_base = base_url.rstrip("/")
+            if not api_base.endswith("/v1"):
+                api_base = api_base + "/v1"
+            return OpenAI(api_key=api_key, base_url=api_base), "openai"
+        if not HAS_ANTHROPIC:
+            raise ImportError(
+                "anthropic package required. Run: pip install anthropic"
+            )
+        return anthropic.Anthropic(api_key=api_key), "anthropic"
+
+    def _build_key_pool(self, name: str, base_url: Optional[str], keys: list[str],
+                        first_client, sdk_type: str) -> KeyPool:
+        pooled = [PooledKey(f"{name}#1", bucket_name(base_url, keys[0]), first_client, sdk_type)]
+        for i, key in enumerate(keys[1:], start=2):
+            client, key_sdk = self._make_sdk_client(base_url, key)
+            pooled.append(PooledKey(f"{name}#{i}", bucket_name(base_url, key), client, key_sdk))
+        return KeyPool(name, pooled, self.rate_limiter)
+
+    def _sanitize_api_text(self, text: str) -> str:
+        """Remove characters known to cause 500 errors on proxies (see sanitize_api_text)."""
+        return sanitize_api_text(text)
 
     def _cache_key(self, model: str, system: str, user: str) -> str:
-        return hashlib.sha256((model + system + user).encode()).hexdigest()[:16]
+        return hashlib.sha256((model + system + user).encode()).hexdigest()
 
-    def _get_cached(self, key: str) -> Optional[str]:
-        if not self.cache_dir:
+    def _get_cached(self, key: str, namespace: str = "") -> Optional[str]:
+        if not self.response_cache:
             return None
-        path = os.path.join(self.cache_dir, f"claude_{key}.json")
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return json.load(f).get("response")
-        return None
+        return self.response_cache.get(key, namespace)
 
-    def _set_cache(self, key: str, response: str) -> None:
-        if not self.cache_dir:
+    def _set_cache(self, key: str, response: str, namespace: str = "") -> None:
+        if not self.response_cache:
             return
-        os.makedirs(self.cache_dir, exist_ok=True)
-        path = os.path.join(self.cache_dir, f"claude_{key}.json")
-        with open(path, 'w') as f:
-            json.dump({"response": response}, f)
+        self.response_cache.set(key, response, namespace)
 
     def _check_credit_error(self, error: Exception, phase: str = None,
-                            is_light: bool = False) -> None:
+                            is_light: bool = False,
+                            key: Optional[PooledKey] = None) -> bool:
         """Detect credit/billing errors and raise CreditExhaustedError after threshold.
 
         Tracks separate counters for main/premium (is_light=False) and light (is_light=True).
+        With a key pool the failing key is retired instead; returns True while
+        other keys remain (the request can be retried on one of them) and
+        raises once the pool is empty.
         """
         error_msg = str(error).lower()
-        credit_phrases = [
-            "credit balance is too low",
-            "insufficient_quota",
-            "insufficient credits",
-            "payment required",
-            "billing hard limit",
-            "quota exceeded",
-        ]
-        if any(phrase in error_msg for phrase in credit_phrases):
+        if not any(phrase in error_msg for phrase in CREDIT_ERROR_PHRASES):
+            return False
+        if key is not None:
+            pool = self._key_pool(is_light)
+            remaining = pool.retire(key, str(error))
+            self.logger.warn(
+                f"Key {key.label} hết credit — ngừng dùng key này "
+                f"(còn {remaining}/{len(pool)} key): {error}",
+                phase=phase,
+            )
+            if remaining:
+                return True
+            raise CreditExhaustedError(
+                f"API credits exhausted [{pool.name}]: all {len(pool)} keys retired. "
+                f"Add credits and retry."
+            )
+        with self._lock:
             if is_light:
                 self._credit_errors_light += 1
                 count = self._credit_errors_light
@@ -188,24 +422,57 @@ class ClaudeClient:
                 self._credit_errors_main += 1
                 count = self._credit_errors_main
                 provider = "main"
-            self.logger.warn(
-                f"Credit error [{provider}] ({count}/{self._MAX_CREDIT_ERRORS}): {error}",
-                phase=phase,
+        self.logger.warn(
+            f"Credit error [{provider}] ({count}/{self._MAX_CREDIT_ERRORS}): {error}",
+            phase=phase,
+        )
+        if count >= self._MAX_CREDIT_ERRORS:
+            raise CreditExhaustedError(
+                f"API credits exhausted [{provider}] after {count} "
+                f"consecutive failures. Add credits and retry."
             )
-            if count >= self._MAX_CREDIT_ERRORS:
-                raise CreditExhaustedError(
-                    f"API credits exhausted [{provider}] after {count} "
-                    f"consecutive failures. Add credits and retry."
-                )
+        return False
 
     def _call_api(self, system: str, user: str, max_tokens: int,
                   temperature: float, active_model: str,
-                  client=None, sdk_type: str = None) -> tuple:
+                  client=None, sdk_type: str = None,
+                  cache_prefix: str = "", partial: str = "") -> tuple:
         """Internal: call API using the appropriate SDK format.
 
-        Returns (text, input_tokens, output_tokens).
-        client and sdk_type select which provider to use.
+        Returns (text, input_tokens, output_tokens, usage) where usage holds
+        prompt-cache token counts ("cache_read", "cache_write") and the
+        provider's "stop_reason". input_tokens excludes cached tokens.
+        client and sdk_type select which provider to use. partial is a
+        cut-off earlier reply to continue from. With a cassette the exchange
+        is recorded, or answered from the recording (core/cassette.py).
         """
+        if self.cassette is None:
+            return self._provider_call(system, user, max_tokens, temperature, active_model,
+                                       client, sdk_type, cache_prefix, partial)
+        key = request_key("llm", active_model, system, cache_prefix + user, partial)
+        if self.cassette.replaying:
+            r = self._replay(key)
+            return r["text"], r["input_tokens"], r["output_tokens"], dict(r["usage"])
+        start = time.time()
+        text, inp_tok, out_tok, usage = self._provider_call(
+            system, user, max_tokens, temperature, active_model,
+            client, sdk_type, cache_prefix, partial,
+        )
+        self.cassette.record("llm", key, {
+            "text": text, "input_tokens": inp_tok, "output_tokens": out_tok, "usage": usage,
+        }, time.time() - start)
+        return text, inp_tok, out_tok, usage
+
+    def _replay(self, key: str) -> dict:
+        try:
+            return self.cassette.replay("llm", key)
+        except CassetteMissError as e:
+            raise ClaudeAPIError(str(e), retryable=False) from e
+
+    def _provider_call(self, system: str, user: str, max_tokens: int,
+                       temperature: float, active_model: str, client=None,
+                       sdk_type: str = None, cache_prefix: str = "",
+                       partial: str = "") -> tuple:
         if client is None:
             client = self.main_client
         if sdk_type is None:
@@ -218,126 +485,912 @@ class ClaudeClient:
                 temperature=temperature,
                 messages=[
                     {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
+                    {"role": "user", "content": cache_prefix + user},
+                ] + ([
+                    {"role": "assistant", "content": partial},
+                    {"role": "user", "content": CONTINUE_PROMPT},
+                ] if partial else []),
             )
             text = response.choices[0].message.content
-            inp_tok = getattr(response.usage, 'prompt_tokens', 0) or 0
-            out_tok = getattr(response.usage, 'completion_tokens', 0) or 0
+            inp_tok, out_tok, usage = self._openai_usage(response.usage)
+            usage["stop_reason"] = response.choices[0].finish_reason
         else:
+            messages = [{"role": "user",
+                         "content": self._anthropic_user(
+                             cache_prefix, user, system, active_model)}]
+            if partial:
+                # Assistant prefill: the model resumes mid-reply
+                messages.append({"role": "assistant", "content": partial})
             response = client.messages.create(
                 model=active_model, max_tokens=max_tokens,
-                temperature=temperature, system=system,
-                messages=[{"role": "user", "content": user}],
+                temperature=temperature,
+                system=self._anthropic_system(system, active_model),
+                messages=messages,
             )
             text = response.content[0].text
-            inp_tok = response.usage.input_tokens
-            out_tok = response.usage.output_tokens
-        return text, inp_tok, out_tok
+            inp_tok, out_tok, usage = self._anthropic_usage(response.usage)
+            usage["stop_reason"] = response.stop_reason
+        return text, inp_tok, out_tok, usage
+
+    def _stream_api(self, system: str, user: str, max_tokens: int,
+                    temperature: float, active_model: str, client, sdk_type: str,
+                    cache_prefix: str, meta: dict):
+        """Internal: streaming counterpart of _call_api.
+
+        Yields text deltas; on completion fills meta with stop_reason,
+        input_tokens, output_tokens and the cache usage dict.
+        """
+        if self.cassette is not None:
+            yield from self._stream_cassette(system, user, max_tokens, temperature,
+                                             active_model, client, sdk_type, cache_prefix, meta)
+            return
+        yield from self._stream_provider(system, user, max_tokens, temperature,
+                                         active_model, client, sdk_type, cache_prefix, meta)
+
+    def _stream_cassette(self, system: str, user: str, max_tokens: int,
+                         temperature: float, active_model: str, client, sdk_type: str,
+                         cache_prefix: str, meta: dict):
+        """Stream through the cassette: replay in small deltas, or record the whole reply."""
+        key = request_key("llm", active_model, system, cache_prefix + user, "")
+        if self.cassette.replaying:
+            r = self._replay(key)
+            text = r["text"] or ""
+            for i in range(0, len(text), 64):
+                yield text[i:i + 64]
+            usage = dict(r["usage"])
+            meta.update(stop_reason=usage.pop("stop_reason", None),
+                        input_tokens=r["input_tokens"], output_tokens=r["output_tokens"],
+                        usage=usage)
+            return
+        start = time.time()
+        parts = []
+        for delta in self._stream_provider(system, user, max_tokens, temperature,
+                                           active_model, client, sdk_type, cache_prefix, meta):
+            parts.append(delta)
+            yield delta
+        self.cassette.record("llm", key, {
+            "text": "".join(parts),
+            "input_tokens": meta.get("input_tokens", 0),
+            "output_tokens": meta.get("output_tokens", 0),
+            "usage": dict(meta.get("usage", {}), stop_reason=meta.get("stop_reason")),
+        }, time.time() - start)
+
+    def _stream_provider(self, system: str, user: str, max_tokens: int,
+                         temperature: float, active_model: str, client, sdk_type: str,
+                         cache_prefix: str, meta: dict):
+        if sdk_type == "openai":
+            stream = client.chat.completions.create(
+                model=active_model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": cache_prefix + user},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            raw_usage = None
+            for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        yield choice.delta.content
+                    if choice.finish_reason:
+                        meta["stop_reason"] = choice.finish_reason
+                if getattr(chunk, "usage", None):
+                    raw_usage = chunk.usage
+            inp_tok, out_tok, usage = self._openai_usage(raw_usage)
+        else:
+            with client.messages.stream(
+                model=active_model, max_tokens=max_tokens,
+                temperature=temperature,
+                system=self._anthropic_system(system, active_model),
+                messages=[{"role": "user",
+                           "content": self._anthropic_user(
+                               cache_prefix, user, system, active_model)}],
+            ) as stream:
+                for delta in stream.text_stream:
+                    yield delta
+                final = stream.get_final_message()
+            meta["stop_reason"] = final.stop_reason
+            inp_tok, out_tok, usage = self._anthropic_usage(final.usage)
+        meta.update(input_tokens=inp_tok, output_tokens=out_tok, usage=usage)
+
+    @staticmethod
+    def _openai_usage(raw) -> tuple:
+        """(input, output, cache usage) — cached hits are split out of prompt_tokens."""
+        inp_tok = getattr(raw, 'prompt_tokens', 0) or 0
+        out_tok = getattr(raw, 'completion_tokens', 0) or 0
+        # Compatible providers cache automatically; hits are reported
+        # inside prompt_tokens
+        details = getattr(raw, 'prompt_tokens_details', None)
+        cache_read = getattr(details, 'cached_tokens', 0) or 0
+        return inp_tok - cache_read, out_tok, {"cache_read": cache_read, "cache_write": 0}
+
+    @staticmethod
+    def _anthropic_usage(raw) -> tuple:
+        return raw.input_tokens, raw.output_tokens, {
+            "cache_read": getattr(raw, 'cache_read_input_tokens', 0) or 0,
+            "cache_write": getattr(raw, 'cache_creation_input_tokens', 0) or 0,
+        }
+
+    def _cacheable(self, model: str, prefix: str) -> bool:
+        """Whether a cache breakpoint after prefix can cache anything."""
+        return (self.prompt_caching and bool(prefix)
+                and self.token_counter.count(prefix, model) >= min_cacheable_tokens(model))
+
+    def _anthropic_system(self, system: str, model: str):
+        """System prompt, with a cache breakpoint when it is long enough alone."""
+        if not self._cacheable(model, system):
+            return system
+        return [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+    def _anthropic_user(self, cache_prefix: str, user: str, system: str, model: str):
+        """User content, with a breakpoint after the stable leading part.
+
+        The cached prefix is system + cache_prefix, so a short system prompt
+        still caches once the shared context brings it over the minimum.
+        """
+        if not cache_prefix:
+            return user
+        if not self._cacheable(model, system + cache_prefix):
+            return cache_prefix + user
+        return [
+            {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": user},
+        ]
+
+    def _route(self, use_light_model: bool, use_premium_model: bool) -> tuple:
+        """Pick (model, client, sdk_type, is_light) for a request."""
+        if use_premium_model and self.model_premium:
+            return self.model_premium, self.main_client, self.sdk_type, False
+        if use_light_model:
+            if (self.has_alternate and not self.health.allow("light")
+                    and self.health.allow("main")):
+                with self._lock:
+                    self.failover_count += 1
+                return self.model_light, self.main_client, self.sdk_type, False
+            return self.model_light, self.light_client, self.light_sdk_type, True
+        return self.model, self.main_client, self.sdk_type, False
+
+    def _alternate(self, route: tuple, light_request: bool) -> Optional[tuple]:
+        """The same light-model request on the other provider, if there is one.
+
+        light_request is what the caller asked for, not the routed model:
+        with CLAUDE_MODEL == CLAUDE_MODEL_LIGHT a main request names the light
+        model too, and must still stay on the main provider.
+        """
+        model, _, _, is_light = route
+        if not self.has_alternate or not light_request:
+            return None
+        if is_light:
+            return model, self.main_client, self.sdk_type, False
+        return model, self.light_client, self.light_sdk_type, True
+
+    def _key_pool(self, is_light: bool) -> KeyPool:
+        return self._light_keys if is_light else self._main_keys
+
+    @contextmanager
+    def _use_key(self, is_light: bool):
+        """Claim a pooled key for one request (None for a single-key provider)."""
+        pool = self._key_pool(is_light)
+        if len(pool) < 2:
+            yield None
+            return
+        key = pool.pick()
+        if key is None:
+            raise CreditExhaustedError(
+                f"API credits exhausted [{pool.name}]: all {len(pool)} keys retired. "
+                f"Add credits and retry."
+            )
+        ok = False
+        try:
+            yield key
+            ok = True
+        finally:
+            pool.release(key, ok)
+
+    def _record_health(self, is_light: bool, latency_s: float,
+                       error: Optional[Exception] = None) -> None:
+        """Feed the provider breaker; client errors (4xx) say nothing about health."""
+        if error is not None:
+            if isinstance(error, ClaudeAPIError):
+                failed = error.retryable
+            else:
+                status = getattr(error, "status_code", None)
+                failed = status is None or status >= 500 or status == 429
+            if not failed:
+                return
+        self.health.record("light" if is_light else "main", error is None, latency_s)
 
-    @retry(
-        stop=stop_after_attempt(6),
-        wait=wait_exponential(multiplier=5, exp_base=3, min=5, max=120),
-        retry=retry_if_exception_type(_RETRYABLE_EXCEPTIONS),
-    )
     def call(self, system: str, user: str, max_tokens: int = 4096,
              temperature: float = 0.0, phase: str = None,
              use_light_model: bool = False,
-             use_premium_model: bool = False) -> str:
+             use_premium_model: bool = False,
+             cache_prefix: str = "") -> str:
         """Call Claude API. Returns response text.
 
         Model selection priority (highest to lowest):
           use_premium_model=True + model_premium set → premium model on main_client
           use_light_model=True                       → light model on light_client
           else                                       → main model on main_client
+
+        Identical prompts already in flight (this process or another build
+        sharing the cache dir) are not re-sent: callers wait for the first.
+
+        cache_prefix is stable leading user content (shared context repeated
+        across calls); it is sent before user and marked for provider-side
+        prompt caching along with the system prompt.
         """
         # Sanitize text before cache key and API call
         system = self._sanitize_api_text(system)
         user = self._sanitize_api_text(user)
+        cache_prefix = self._sanitize_api_text(cache_prefix)
 
-        # Determine model + client routing
-        if use_premium_model and self.model_premium:
-            active_model = self.model_premium
-            active_client = self.main_client
-            active_sdk = self.sdk_type
-            is_light_call = False
-        elif use_light_model:
-            active_model = self.model_light
-            active_client = self.light_client
-            active_sdk = self.light_sdk_type
-            is_light_call = True
-        else:
-            active_model = self.model
-            active_client = self.main_client
-            active_sdk = self.sdk_type
-            is_light_call = False
+        active_model, active_client, active_sdk, is_light_call = self._route(
+            use_light_model, use_premium_model,
+        )
 
         # Check cache — key includes model to avoid cross-model collisions
-        cache_key = self._cache_key(active_model, system, user)
-        cached = self._get_cached(cache_key)
+        cache_key = self._cache_key(active_model, system, cache_prefix + user)
+        cached = self._get_cached(cache_key, active_model)
         if cached:
-            self.logger.debug(f"Cache hit [{active_model}]: {cache_key}", phase=phase)
+            self.logger.debug(f"Cache hit [{active_model}]: {cache_key[:16]}", phase=phase)
+            self._record_call(active_model, cache_key, phase, cache_hit=True)
             return cached
 
-        start = time.time()
+        max_tokens = self._preflight(active_model, system, cache_prefix + user,
+                                     max_tokens, phase)
+        return self._single_flight(
+            cache_key, active_model, phase,
+            lambda: self._call_uncached(
+                system, user, max_tokens, temperature, phase, cache_key,
+                active_model, active_client, active_sdk, is_light_call,
+                cache_prefix, light_request=use_light_model and not (
+                    use_premium_model and self.model_premium),
+            ),
+        )
+
+    def _single_flight(self, cache_key: str, namespace: str, phase: str, fn) -> str:
+        """Run fn once per cache key; concurrent duplicates share its outcome."""
+        with self._lock:
+            flight = self._in_flight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._in_flight[cache_key] = flight
+            else:
+                self.single_flight_joins += 1
+        if not leader:
+            self.logger.debug(f"Chờ request trùng đang chạy: {cache_key[:16]}", phase=phase)
+            return flight.result()
+
         try:
-            text, inp_tok, out_tok = self._call_api(
-                system, user, max_tokens, temperature, active_model,
-                client=active_client, sdk_type=active_sdk,
+            text = self._call_with_lease(cache_key, namespace, phase, fn)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(text)
+            return text
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+                self._attempts.pop(cache_key, None)
+
+    def _await_lease(self, cache_key: str, namespace: str, phase: str) -> Optional[str]:
+        """Claim the key in the shared cache so other processes wait on us.
+
+        Returns another process's response if it lands while we wait, else
+        None once the lease is ours (or its holder is stuck past it).
+        """
+        cache = self.response_cache
+        if not cache:
+            return None
+        deadline = time.time() + self.lease_seconds
+        while not cache.acquire_lease(cache_key, namespace, ttl=self.lease_seconds):
+            text = cache.wait_for_response(
+                cache_key, namespace, timeout=max(0.0, deadline - time.time()),
             )
-        except Exception as e:
-            is_rate_limit = (
-                (HAS_ANTHROPIC and isinstance(e, anthropic.RateLimitError))
-                or (HAS_OPENAI and isinstance(e, _openai_mod.RateLimitError))
+            if text is not None:
+                with self._lock:
+                    self.single_flight_joins += 1
+                self.logger.debug(
+                    f"Nhận kết quả từ process khác: {cache_key[:16]}", phase=phase)
+                return text
+            if time.time() >= deadline:
+                # Holder is stuck past its lease — stop waiting and pay ourselves
+                break
+        return None
+
+    def _call_with_lease(self, cache_key: str, namespace: str, phase: str, fn) -> str:
+        """Run fn holding the key's shared-cache lease (see _await_lease)."""
+        text = self._await_lease(cache_key, namespace, phase)
+        if text is not None:
+            return text
+        try:
+            return fn()
+        finally:
+            if self.response_cache:
+                self.response_cache.release_lease(cache_key, namespace)
+
+    @retry(
+        stop=stop_after_attempt(6),
+        wait=wait_exponential(multiplier=5, exp_base=3, min=5, max=120),
+        retry=retry_if_exception_type(_RETRYABLE_EXCEPTIONS),
+    )
+    def _call_uncached(self, system: str, user: str, max_tokens: int,
+                       temperature: float, phase: str, cache_key: str,
+                       active_model: str, active_client, active_sdk: str,
+                       is_light_call: bool, cache_prefix: str = "",
+                       light_request: bool = False) -> str:
+        with self._lock:
+            retries = self._attempts.get(cache_key, 0)
+            self._attempts[cache_key] = retries + 1
+        route = (active_model, active_client, active_sdk, is_light_call)
+        args = (system, user, max_tokens, temperature, phase, cache_key, cache_prefix, retries)
+        alternate = self._alternate(route, light_request)
+        if (alternate and self.health.is_open("light" if is_light_call else "main")
+                and self.health.allow("light" if alternate[3] else "main")):
+            # Retrying after the provider's breaker opened — switch providers
+            with self._lock:
+                self.failover_count += 1
+            route, alternate = alternate, route
+            active_model, active_client, active_sdk, is_light_call = route
+        delay = self.health.hedge_delay("light" if is_light_call else "main")
+        if alternate and delay is not None:
+            text, usage, route = self._hedged_attempt(route, alternate, delay, *args)
+            active_model, active_client, active_sdk, is_light_call = route
+        else:
+            text, usage = self._attempt(route, *args)
+
+        if usage.get("stop_reason") in TRUNCATED_STOP_REASONS:
+            text, _ = self._continue_truncated(
+                text, system, user, max_tokens, temperature, phase,
+                active_model, active_client, active_sdk, is_light_call, cache_prefix,
+                cache_key=cache_key,
             )
-            if is_rate_limit:
-                self.logger.warn("Rate limited, retrying...", phase=phase)
-                raise
+        self._set_cache(cache_key, text, active_model)
+        return text
+
+    def _attempt(self, route: tuple, system: str, user: str, max_tokens: int,
+                 temperature: float, phase: str, cache_key: str, cache_prefix: str,
+                 retries: int) -> tuple[str, dict]:
+        """One request on one provider (and pooled key); returns (text, usage)."""
+        model, client, sdk_type, is_light = route
+        slots = self._light_slots if is_light else self._main_slots
+        bucket = self._light_bucket if is_light else self._main_bucket
+        with self._use_key(is_light) as key:
+            if key:
+                client, sdk_type, bucket = key.client, key.sdk_type, key.bucket
+            label = key.label if key else ""
+            queued = start = time.time()
+            estimated = self._reserve(bucket, system, cache_prefix + user, max_tokens,
+                                      phase, model)
+            try:
+                with slots:
+                    start = time.time()
+                    text, inp_tok, out_tok, usage = self._call_api(
+                        system, user, max_tokens, temperature, model,
+                        client=client, sdk_type=sdk_type, cache_prefix=cache_prefix,
+                    )
+            except Exception as e:
+                elapsed = time.time() - start
+                self._record_call(model, cache_key, phase, queue_wait_s=start - queued,
+                                  latency_s=elapsed, retries=retries, key=label,
+                                  error=type(e).__name__)
+                self._record_health(is_light, elapsed, e)
+                self._raise_api_error(e, bucket, estimated, phase, is_light, key=key)
+
+            elapsed = time.time() - start
+            self._record_health(is_light, elapsed)
+            self._finish_call(model, bucket, estimated, inp_tok, out_tok, usage,
+                              is_light, elapsed, phase,
+                              prompt_estimate=estimated - max_tokens, prompt_hash=cache_key,
+                              queue_wait=start - queued, retries=retries, key=label)
+            return text, usage
+
+    def _hedged_attempt(self, route: tuple, alternate: tuple, delay: float,
+                        *args) -> tuple[str, dict, tuple]:
+        """Run route; past delay seconds also run alternate. First success wins.
 
-            is_api_error = (
-                (HAS_ANTHROPIC and isinstance(e, anthropic.APIStatusError))
-                or (HAS_OPENAI and isinstance(e, _openai_mod.APIStatusError))
+        The slower request is not cancelled (the SDKs are blocking) — it runs
+        to completion in the background and is billed like any other call.
+        Returns (text, usage, winning route); when both fail, the primary's
+        error is raised.
+        """
+        phase = args[4]
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        try:
+            futures = {pool.submit(self._attempt, route, *args): route}
+            done, _ = wait(futures, timeout=delay)
+            if not done and self.health.allow("light" if alternate[3] else "main"):
+                self.logger.debug(
+                    f"Request [{route[0]}] chậm hơn {delay:.1f}s — gửi thêm request "
+                    f"dự phòng tới provider {'light' if alternate[3] else 'main'}",
+                    phase=phase,
+                )
+                with self._lock:
+                    self.hedge_count += 1
+                futures[pool.submit(self._attempt, alternate, *args)] = alternate
+
+            errors = {}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        text, usage = fut.result()
+                    except Exception as e:
+                        errors[futures[fut]] = e
+                        continue
+                    if futures[fut] is alternate:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return text, usage, futures[fut]
+            raise errors.get(route) or next(iter(errors.values()))
+        finally:
+            pool.shutdown(wait=False)
+
+    def _continue_truncated(self, text: str, system: str, user: str,
+                            max_tokens: int, temperature: float, phase: str,
+                            model: str, client, sdk_type: str, is_light: bool,
+                            cache_prefix: str = "", cache_key: str = "") -> tuple[str, bool]:
+        """Resume a reply cut at max_tokens, up to max_continuations rounds.
+
+        Each round is seeded with everything received so far and its cost is
+        booked as a continuation. Returns (text, still_truncated); when rounds
+        run out (or a round fails) call_json's repair step takes over.
+        """
+        slots = self._light_slots if is_light else self._main_slots
+        bucket = self._light_bucket if is_light else self._main_bucket
+        truncated = True
+        for round_no in range(1, self.max_continuations + 1):
+            self.logger.info(
+                f"Response bị cắt ở max_tokens={max_tokens} — tiếp tục "
+                f"lần {round_no}/{self.max_continuations}",
+                phase=phase,
             )
-            if is_api_error:
-                self._check_credit_error(e, phase, is_light=is_light_call)
-                status_code = getattr(e, 'status_code', 0)
-                if status_code >= 500:
-                    self.logger.warn(f"Server error ({status_code}), retrying...", phase=phase)
-                    raise
-                raise ClaudeAPIError(str(e), status_code=status_code, retryable=False)
+            try:
+                round_tokens = self._preflight(model, system, cache_prefix + user + text,
+                                               max_tokens, phase)
+            except ClaudeAPIError as e:
+                self.logger.warn(f"Không thể tiếp tục: {e}", phase=phase)
+                break
+            with self._use_key(is_light) as key:
+                round_client, round_sdk, round_bucket = (
+                    (key.client, key.sdk_type, key.bucket) if key else (client, sdk_type, bucket)
+                )
+                prefill, held = self._prefill(text, round_sdk)
+                queued = start = time.time()
+                estimated = self._reserve(round_bucket, system, cache_prefix + user + text,
+                                          round_tokens, phase, model)
+                try:
+                    with slots:
+                        start = time.time()
+                        more, inp_tok, out_tok, usage = self._call_api(
+                            system, user, round_tokens, temperature, model,
+                            client=round_client, sdk_type=round_sdk,
+                            cache_prefix=cache_prefix, partial=prefill,
+                        )
+                except Exception as e:
+                    self._record_call(model, cache_key, phase, kind="continuation",
+                                      queue_wait_s=start - queued, key=key.label if key else "",
+                                      latency_s=time.time() - start, error=type(e).__name__)
+                    self._record_health(is_light, time.time() - start, e)
+                    if self.rate_limiter:
+                        self.rate_limiter.settle(round_bucket, estimated, 0)
+                    if isinstance(e, CreditExhaustedError):
+                        raise
+                    self._check_credit_error(e, phase, is_light=is_light, key=key)
+                    self.logger.warn(f"Tiếp tục response thất bại: {e} — giữ phần đã nhận",
+                                     phase=phase)
+                    break
+                self._record_health(is_light, time.time() - start)
+                self._finish_call(model, round_bucket, estimated, inp_tok, out_tok, usage,
+                                  is_light, time.time() - start, phase, continuation=True,
+                                  prompt_hash=cache_key, queue_wait=start - queued,
+                                  key=key.label if key else "")
+            more = more or ""
+            if held and more.startswith(held):
+                more = more[len(held):]     # model repeated the held-back whitespace
+            text = self._stitch(prefill + held, more)
+            if usage.get("stop_reason") not in TRUNCATED_STOP_REASONS:
+                truncated = False
+                break
+        if truncated:
+            self.logger.warn(
+                f"Response vẫn bị cắt sau {self.max_continuations} lần tiếp tục",
+                phase=phase,
+            )
+        return text, truncated
 
-            raise
+    @staticmethod
+    def _prefill(text: str, sdk_type: str) -> tuple[str, str]:
+        """(partial to send, trailing whitespace held back from it).
 
-        # Reset respective credit error counter on success
-        if is_light_call:
-            self._credit_errors_light = 0
-        else:
-            self._credit_errors_main = 0
+        Anthropic rejects an assistant prefill ending in whitespace. Between
+        JSON tokens that whitespace means nothing and is dropped; inside a
+        string it is content, so it is held back and put back after the
+        continuation. OpenAI-compatible providers get the text unchanged.
+        """
+        if sdk_type == "openai":
+            return text, ""
+        prefill = text.rstrip()
+        held = text[len(prefill):]
+        return prefill, held if _inside_json_string(prefill) else ""
+
+    @staticmethod
+    def _stitch(partial: str, more: str, max_overlap: int = 400) -> str:
+        """Join a continuation onto its partial, dropping text the model repeated."""
+        limit = min(len(partial), len(more), max_overlap)
+        for k in range(limit, _MIN_STITCH_OVERLAP - 1, -1):
+            if partial.endswith(more[:k]):
+                return partial + more[k:]
+        return partial + more
+
+    def _preflight(self, model: str, system: str, user: str, max_tokens: int,
+                   phase: str = None) -> int:
+        """Check a request fits the model's context window; returns max_tokens to use.
+
+        Output budgets are clamped to the model's output cap and to what the
+        prompt leaves of the window. A prompt that leaves no room raises a
+        non-retryable ClaudeAPIError instead of a provider 400 (or a proxy
+        timeout) after the upload.
+        """
+        window, max_output = model_limits(model)
+        if max_output and max_tokens > max_output:
+            max_tokens = max_output
+        prompt = (self.token_counter.count(system, model)
+                  + self.token_counter.count(user, model))
+        room = window - prompt
+        if room < _MIN_OUTPUT_TOKENS:
+            raise ClaudeAPIError(
+                f"Prompt ~{prompt} tokens vượt context window {window} của {model}",
+                retryable=False,
+            )
+        if max_tokens > room:
+            self.logger.warn(
+                f"Prompt ~{prompt} tokens: giảm max_tokens {max_tokens} → {room} "
+                f"cho vừa context window {window}",
+                phase=phase,
+            )
+            max_tokens = room
+        return max_tokens
+
+    def _reserve(self, bucket: str, system: str, user: str, max_tokens: int,
+                 phase: str = None, model: str = None) -> int:
+        """Take rate-limit budget for a call; returns the token estimate."""
+        # Reserve the worst case up front; settled to real usage afterwards
+        estimated = (self.token_counter.count(system, model)
+                     + self.token_counter.count(user, model) + max_tokens)
+        if self.rate_limiter:
+            waited = self.rate_limiter.acquire(bucket, estimated)
+            if waited >= 1.0:
+                self.logger.debug(f"Rate limiter: chờ {waited:.1f}s [{bucket}]", phase=phase)
+        return estimated
+
+    def _raise_api_error(self, e: Exception, bucket: str, estimated: int,
+                         phase: str, is_light: bool,
+                         key: Optional[PooledKey] = None) -> None:
+        """Classify a provider error: re-raise retryable ones, wrap the rest.
+
+        A pooled key that ran out of credit is retired and the error
+        re-raised as retryable, so the retry goes to another key.
+        """
+        if self.rate_limiter:
+            self.rate_limiter.settle(bucket, estimated, 0)
+        is_api_error = (
+            (HAS_ANTHROPIC and isinstance(e, anthropic.APIStatusError))
+            or (HAS_OPENAI and isinstance(e, _openai_mod.APIStatusError))
+        )
+        if key is not None and is_api_error and self._check_credit_error(
+                e, phase, is_light=is_light, key=key):
+            raise e
+        is_rate_limit = (
+            (HAS_ANTHROPIC and isinstance(e, anthropic.RateLimitError))
+            or (HAS_OPENAI and isinstance(e, _openai_mod.RateLimitError))
+        )
+        if is_rate_limit:
+            retry_after = retry_after_seconds(e)
+            if self.rate_limiter and retry_after:
+                self.rate_limiter.penalize(bucket, retry_after)
+            self.logger.warn(
+                f"Rate limited (retry-after {retry_after:.0f}s), retrying...", phase=phase)
+            raise e
 
-        # Track cost
-        self.total_input_tokens += inp_tok
-        self.total_output_tokens += out_tok
-        pricing = self.PRICING.get(active_model, {"input": 3.0, "output": 15.0})
-        cost = (inp_tok * pricing["input"] + out_tok * pricing["output"]) / 1_000_000
-        self.total_cost_usd += cost
-        self.call_count += 1
+        if is_api_error:
+            if key is None:
+                self._check_credit_error(e, phase, is_light=is_light)
+            status_code = getattr(e, 'status_code', 0)
+            if status_code >= 500:
+                self.logger.warn(f"Server error ({status_code}), retrying...", phase=phase)
+                raise e
+            raise ClaudeAPIError(str(e), status_code=status_code, retryable=False) from e
 
+        raise e
+
+    def _finish_call(self, model: str, bucket: str, estimated: int, inp_tok: int,
+                     out_tok: int, usage: dict, is_light: bool, elapsed: float,
+                     phase: str = None, continuation: bool = False,
+                     prompt_estimate: int = 0, prompt_hash: str = "",
+                     queue_wait: float = 0.0, retries: int = 0,
+                     kind: str = "call", ttfb: Optional[float] = None,
+                     key: str = "") -> None:
+        cache_read = usage.get("cache_read", 0)
+        cache_write = usage.get("cache_write", 0)
+        self._record_call(
+            model, prompt_hash, phase, kind="continuation" if continuation else kind,
+            queue_wait_s=queue_wait, ttfb_s=ttfb, latency_s=elapsed,
+            input_tokens=inp_tok, output_tokens=out_tok, cache_read_tokens=cache_read,
+            cache_write_tokens=cache_write, retries=retries, key=key,
+        )
+        if prompt_estimate:
+            self.token_counter.observe(model, prompt_estimate,
+                                       inp_tok + cache_read + cache_write)
+        if self.rate_limiter:
+            self.rate_limiter.settle(
+                bucket, estimated, inp_tok + out_tok + cache_read + cache_write,
+            )
+        self._record_usage(model, inp_tok, out_tok, is_light, elapsed, phase,
+                           cache_read=cache_read, cache_write=cache_write,
+                           continuation=continuation)
+
+    def _record_call(self, model: str, prompt_hash: str, phase: str = None, **fields) -> None:
+        self.telemetry.record(CallRecord(
+            phase=phase or "-", model=model, prompt_hash=prompt_hash[:16], **fields,
+        ))
+
+    def _record_usage(self, model: str, inp_tok: int, out_tok: int,
+                      is_light: bool, elapsed: float, phase: str = None,
+                      discount: float = 1.0, cache_read: int = 0,
+                      cache_write: int = 0, continuation: bool = False) -> None:
+        cost = discount * self._token_cost(model, inp_tok, out_tok, cache_read, cache_write)
+
+        with self._lock:
+            # Reset respective credit error counter on success
+            if is_light:
+                self._credit_errors_light = 0
+            else:
+                self._credit_errors_main = 0
+
+            # Track cost
+            self.total_input_tokens += inp_tok
+            self.total_output_tokens += out_tok
+            self.total_cache_read_tokens += cache_read
+            self.total_cache_write_tokens += cache_write
+            self.total_cost_usd += cost
+            self.call_count += 1
+            if continuation:
+                self.continuation_count += 1
+                self.continuation_cost_usd += cost
+            call_no = self.call_count
+            total_cost = self.total_cost_usd
+            total_tokens = self.total_input_tokens + self.total_output_tokens
+
+        cached_note = (
+            f" (cache đọc {cache_read}, ghi {cache_write})" if cache_read or cache_write else ""
+        )
         self.logger.debug(
-            f"API #{self.call_count} [{active_model}]: "
-            f"{inp_tok}+{out_tok} tok, ${cost:.4f}, {time.time()-start:.1f}s",
+            f"API #{call_no}{' (tiếp tục)' if continuation else ''} [{model}]: "
+            f"{inp_tok}+{out_tok} tok{cached_note}, ${cost:.4f}, {elapsed:.1f}s",
             phase=phase)
-        self.logger.report_cost(self.total_cost_usd, self.total_input_tokens + self.total_output_tokens)
+        self.logger.report_cost(total_cost, total_tokens)
 
-        self._set_cache(cache_key, text)
-        return text
+    def _token_cost(self, model: str, inp_tok: int, out_tok: int,
+                    cache_read: int = 0, cache_write: int = 0) -> float:
+        pricing = self.PRICING.get(model, {"input": 3.0, "output": 15.0})
+        return (
+            inp_tok * pricing["input"]
+            + out_tok * pricing["output"]
+            + cache_write * pricing.get("cache_write", pricing["input"] * 1.25)
+            + cache_read * pricing.get("cache_read", pricing["input"] * 0.1)
+        ) / 1_000_000
 
     def call_json(self, system: str, user: str, max_tokens: int = 4096,
                   phase: str = None, use_light_model: bool = False,
-                  use_premium_model: bool = False) -> dict | list:
+                  use_premium_model: bool = False,
+                  cache_prefix: str = "") -> dict | list:
         """Call Claude expecting JSON. Strips code fences, retries on parse failure."""
         raw = self.call(system, user, max_tokens=max_tokens, temperature=0.0,
                         phase=phase, use_light_model=use_light_model,
-                        use_premium_model=use_premium_model)
+                        use_premium_model=use_premium_model,
+                        cache_prefix=cache_prefix)
+        return self._parse_json(raw, phase)
+
+    def stream_json(self, system: str, user: str, max_tokens: int = 4096,
+                    phase: str = None, use_light_model: bool = False,
+                    use_premium_model: bool = False, cache_prefix: str = "",
+                    items_key: Optional[str] = None) -> JsonStream:
+        """Streaming call_json: iterate the result for list items as they complete.
+
+        Items come from the response's main array (items_key, e.g. "atoms",
+        or the first array found). Once iterated, .truncated reports a
+        max_tokens cut-off and .items holds every complete item; .result()
+        parses the full response exactly like call_json().
+        """
+        system = self._sanitize_api_text(system)
+        user = self._sanitize_api_text(user)
+        cache_prefix = self._sanitize_api_text(cache_prefix)
+        active_model, active_client, active_sdk, is_light_call = self._route(
+            use_light_model, use_premium_model,
+        )
+        parse = lambda text: self._parse_json(text, phase)  # noqa: E731
+
+        cache_key = self._cache_key(active_model, system, cache_prefix + user)
+        cached = self._get_cached(cache_key, active_model)
+        if cached:
+            self.logger.debug(f"Cache hit [{active_model}]: {cache_key[:16]}", phase=phase)
+            self._record_call(active_model, cache_key, phase, kind="stream", cache_hit=True)
+            return JsonStream([cached], parse, items_key, {"stop_reason": "cached"})
+
+        max_tokens = self._preflight(active_model, system, cache_prefix + user,
+                                     max_tokens, phase)
+        meta: dict = {}
+        chunks = self._stream_single_flight(
+            cache_key, active_model, phase, meta,
+            lambda: self._stream_uncached(
+                system, user, max_tokens, phase, cache_key, active_model,
+                active_client, active_sdk, is_light_call, cache_prefix, meta,
+            ),
+        )
+        return JsonStream(chunks, parse, items_key, meta)
+
+    def _stream_single_flight(self, cache_key: str, namespace: str, phase: str,
+                              meta: dict, stream):
+        """Streaming _single_flight: the first caller streams; duplicates in
+        flight here, or leased by another process, get its text in one chunk."""
+        with self._lock:
+            flight = self._in_flight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._in_flight[cache_key] = flight
+            else:
+                self.single_flight_joins += 1
+        if not leader:
+            self.logger.debug(f"Chờ request trùng đang chạy: {cache_key[:16]}", phase=phase)
+            text = flight.result()
+            meta["stop_reason"] = "joined"
+            yield text
+            return
+
+        try:
+            text = self._await_lease(cache_key, namespace, phase)
+            if text is not None:
+                meta["stop_reason"] = "joined"
+                yield text
+            else:
+                try:
+                    text = yield from stream()
+                finally:
+                    if self.response_cache:
+                        self.response_cache.release_lease(cache_key, namespace)
+        except GeneratorExit:
+            # Consumer dropped the stream: waiters must not hang on it
+            flight.set_exception(ClaudeAPIError(
+                f"Stream closed before completion: {cache_key[:16]}", retryable=True))
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(text)
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+                self._attempts.pop(cache_key, None)
+
+    @retry(
+        stop=stop_after_attempt(6),
+        wait=wait_exponential(multiplier=5, exp_base=3, min=5, max=120),
+        retry=retry_if_exception_type(_RETRYABLE_EXCEPTIONS),
+    )
+    def _open_stream(self, system: str, user: str, max_tokens: int,
+                     phase: str, cache_key: str, active_model: str,
+                     active_client, active_sdk: str, is_light_call: bool,
+                     cache_prefix: str, meta: dict) -> _OpenStream:
+        """Connect a stream and read its first delta, retried like _call_uncached.
+
+        Nothing has reached the consumer yet, so a failed connect is safe to
+        repeat. The slot, pooled key and connection stay held in the returned
+        resources until _stream_uncached closes them.
+        """
+        with self._lock:
+            retries = self._attempts.get(cache_key, 0)
+            self._attempts[cache_key] = retries + 1
+        slots = self._light_slots if is_light_call else self._main_slots
+        bucket = self._light_bucket if is_light_call else self._main_bucket
+        with ExitStack() as resources:
+            key = resources.enter_context(self._use_key(is_light_call))
+            if key:
+                active_client, active_sdk, bucket = key.client, key.sdk_type, key.bucket
+            queued = start = time.time()
+            estimated = self._reserve(bucket, system, cache_prefix + user, max_tokens,
+                                      phase, active_model)
+            slots.acquire()
+            resources.callback(slots.release)
+            start = time.time()
+            deltas = self._stream_api(
+                system, user, max_tokens, 0.0, active_model,
+                active_client, active_sdk, cache_prefix, meta,
+            )
+            resources.callback(deltas.close)
+            try:
+                first = next(deltas, None)
+            except Exception as e:
+                self._record_call(active_model, cache_key, phase, kind="stream",
+                                  queue_wait_s=start - queued, retries=retries,
+                                  key=key.label if key else "",
+                                  latency_s=time.time() - start, error=type(e).__name__)
+                self._record_health(is_light_call, time.time() - start, e)
+                self._raise_api_error(e, bucket, estimated, phase, is_light_call, key=key)
+            ttfb = time.time() - start if first is not None else None
+            return _OpenStream(resources.pop_all(), deltas, first, active_client,
+                               active_sdk, bucket, key, estimated, queued, start,
+                               ttfb, retries)
+
+    def _stream_uncached(self, system: str, user: str, max_tokens: int,
+                         phase: str, cache_key: str, active_model: str,
+                         active_client, active_sdk: str, is_light_call: bool,
+                         cache_prefix: str, meta: dict):
+        """Yield the response's deltas; returns the full (continued) text."""
+        opened = self._open_stream(
+            system, user, max_tokens, phase, cache_key, active_model,
+            active_client, active_sdk, is_light_call, cache_prefix, meta,
+        )
+        label = opened.key.label if opened.key else ""
+        start = opened.start
+        parts = []
+        try:
+            try:
+                if opened.first is not None:
+                    parts.append(opened.first)
+                    yield opened.first
+                for delta in opened.deltas:
+                    parts.append(delta)
+                    yield delta
+            except Exception as e:
+                self._record_call(active_model, cache_key, phase, kind="stream",
+                                  queue_wait_s=start - opened.queued, ttfb_s=opened.ttfb,
+                                  retries=opened.retries, key=label,
+                                  latency_s=time.time() - start, error=type(e).__name__)
+                self._record_health(is_light_call, time.time() - start, e)
+                self._raise_api_error(e, opened.bucket, opened.estimated, phase,
+                                      is_light_call, key=opened.key)
+
+            self._record_health(is_light_call, time.time() - start)
+            self._finish_call(active_model, opened.bucket, opened.estimated,
+                              meta.get("input_tokens", 0), meta.get("output_tokens", 0),
+                              meta.get("usage", {}), is_light_call, time.time() - start,
+                              phase, prompt_estimate=opened.estimated - max_tokens,
+                              prompt_hash=cache_key, queue_wait=start - opened.queued,
+                              retries=opened.retries, kind="stream", ttfb=opened.ttfb,
+                              key=label)
+        finally:
+            # Runs on GeneratorExit too (consumer stopped early or dropped
+            # the stream), so the slot and pooled key never leak
+            opened.resources.close()
+        text = "".join(parts)
+        if meta.get("stop_reason") in TRUNCATED_STOP_REASONS:
+            full, truncated = self._continue_truncated(
+                text, system, user, max_tokens, 0.0, phase, active_model,
+                opened.client, opened.sdk_type, is_light_call, cache_prefix,
+                cache_key=cache_key,
+            )
+            # Stream the continued tail so its items reach the consumer too
+            # (only insignificant whitespace can have been dropped from text)
+            tail = full[len(text):] if full.startswith(text) else full[len(text.rstrip()):]
+            if tail:
+                yield tail
+            text = full
+            if not truncated:
+                meta["stop_reason"] = "end_turn"
+        self._set_cache(cache_key, text, active_model)
+        return text
+
+    def _parse_json(self, raw: str, phase: str = None) -> dict | list:
         text = raw.strip()
 
         # Strip ```json ... ```
@@ -366,6 +1419,199 @@ class ClaudeClient:
 
             raise ClaudeAPIError(f"Non-JSON response: {text[:200]}...", retryable=True)
 
+    def call_batch(self, requests: list[dict],
+                   max_workers: Optional[int] = None,
+                   on_result: Optional[Callable[[int, object], None]] = None) -> list:
+        """Run many call() requests concurrently. Returns results in input order.
+
+        Each request is a dict of call() keyword arguments (system, user,
+        max_tokens, phase, use_light_model, ...). A request that fails yields
+        its exception in the matching slot so callers keep per-item fallbacks.
+        CreditExhaustedError cancels the remaining requests and is re-raised.
+        on_result(index, result) is called from the caller's thread as each
+        request completes (progress reporting).
+
+        In batch mode, large enough batches go through the provider's
+        asynchronous batch API instead (cheaper, no per-request rate limits).
+        """
+        if self.batch_mode and len(requests) >= self.batch_min_requests:
+            return self._run_message_batch(requests, as_json=False, on_result=on_result)
+        return self._run_batch(self.call, requests, max_workers, on_result)
+
+    def call_json_batch(self, requests: list[dict],
+                        max_workers: Optional[int] = None,
+                        on_result: Optional[Callable[[int, object], None]] = None,
+                        stream: bool = False) -> list:
+        """Concurrent call_json() — same contract as call_batch().
+
+        stream=True sends each interactive request through stream_json(),
+        for long outputs: tokens keep the connection busy, and a max_tokens
+        cut-off continues from the last complete item.
+        """
+        if self.batch_mode and len(requests) >= self.batch_min_requests:
+            return self._run_message_batch(requests, as_json=True, on_result=on_result)
+        fn = self._stream_json_result if stream else self.call_json
+        return self._run_batch(fn, requests, max_workers, on_result)
+
+    def _stream_json_result(self, system: str, user: str, **kwargs) -> dict | list:
+        return self.stream_json(system, user, **kwargs).result()
+
+    def _run_message_batch(self, requests: list[dict], as_json: bool,
+                           on_result: Optional[Callable[[int, object], None]] = None,
+                           ) -> list:
+        """Submit uncached requests as one provider batch per client.
+
+        Cache hits are served directly and identical prompts are submitted
+        once. Items the batch could not answer fall back to the concurrent
+        interactive path, so the result contract matches _run_batch().
+        """
+        results: list = [None] * len(requests)
+        # (client id) -> {cache_key: [BatchItem, is_light, [request indices]]}
+        groups: dict[int, dict] = {}
+        clients: dict[int, tuple] = {}
+        for i, req in enumerate(requests):
+            system = self._sanitize_api_text(req.get("system", ""))
+            cache_prefix = self._sanitize_api_text(req.get("cache_prefix", ""))
+            user = self._sanitize_api_text(req.get("user", ""))
+            model, client, sdk, is_light = self._route(
+                req.get("use_light_model", False), req.get("use_premium_model", False),
+            )
+            cache_key = self._cache_key(model, system, cache_prefix + user)
+            cached = self._get_cached(cache_key, model)
+            if cached:
+                self._record_call(model, cache_key, req.get("phase"), kind="batch",
+                                  cache_hit=True)
+                results[i] = cached
+                continue
+            pending = groups.get(id(client), {})
+            if cache_key in pending:
+                pending[cache_key][2].append(i)
+                continue
+            try:
+                max_tokens = self._preflight(model, system, cache_prefix + user,
+                                             req.get("max_tokens", 4096), req.get("phase"))
+            except ClaudeAPIError as e:
+                results[i] = e
+                continue
+            clients[id(client)] = (client, sdk, is_light)
+            pending = groups.setdefault(id(client), {})
+            item = BatchItem(
+                custom_id=f"req-{len(pending):05d}", model=model,
+                system=system, user=user,
+                max_tokens=max_tokens,
+                temperature=req.get("temperature", 0.0),
+                cache_prefix=cache_prefix,
+                cache_system=self._cacheable(model, system),
+                cache_user_prefix=bool(cache_prefix)
+                and self._cacheable(model, system + cache_prefix),
+            )
+            pending[cache_key] = [item, is_light, [i]]
+
+        phase = next((r.get("phase") for r in requests if r.get("phase")), None)
+        fallback: list[int] = []
+        for client_id, pending in groups.items():
+            client, sdk, is_light = clients[client_id]
+            items = [entry[0] for entry in pending.values()]
+            self.logger.info(
+                f"Batch mode: gửi {len(items)} request qua batch API [{sdk}]",
+                phase=phase,
+            )
+            start = time.time()
+            try:
+                outcomes = run_message_batch(
+                    client, sdk, items,
+                    poll_seconds=self.batch_poll_seconds,
+                    timeout_seconds=self.batch_timeout_seconds,
+                    on_progress=lambda bid, done, total: self.logger.debug(
+                        f"Batch {bid}: {done}/{total}", phase=phase),
+                )
+            except CreditExhaustedError:
+                raise
+            except Exception as e:
+                self._check_credit_error(e, phase, is_light=is_light)
+                self.logger.warn(
+                    f"Batch API thất bại ({e}) — chuyển sang gọi trực tiếp", phase=phase,
+                )
+                for entry in pending.values():
+                    fallback.extend(entry[2])
+                continue
+
+            elapsed = time.time() - start
+            for cache_key, (item, light, indices) in pending.items():
+                outcome = outcomes[item.custom_id]
+                if outcome.error or not outcome.text:
+                    self.logger.debug(
+                        f"Batch item {item.custom_id} lỗi: {outcome.error}", phase=phase)
+                    fallback.extend(indices)
+                    continue
+                self._record_usage(item.model, outcome.input_tokens, outcome.output_tokens,
+                                   light, elapsed, phase, discount=self.BATCH_DISCOUNT,
+                                   cache_read=outcome.cache_read_tokens,
+                                   cache_write=outcome.cache_write_tokens)
+                self._record_call(
+                    item.model, cache_key, phase, kind="batch", latency_s=elapsed,
+                    input_tokens=outcome.input_tokens, output_tokens=outcome.output_tokens,
+                    cache_read_tokens=outcome.cache_read_tokens,
+                    cache_write_tokens=outcome.cache_write_tokens,
+                )
+                text = outcome.text
+                if outcome.stop_reason in TRUNCATED_STOP_REASONS:
+                    text, _ = self._continue_truncated(
+                        text, item.system, item.user, item.max_tokens,
+                        item.temperature, phase, item.model, client, sdk, light,
+                        cache_prefix=item.cache_prefix, cache_key=cache_key,
+                    )
+                self._set_cache(cache_key, text, item.model)
+                for i in indices:
+                    results[i] = text
+
+        if as_json:
+            for i, text in enumerate(results):
+                if isinstance(text, str):
+                    try:
+                        results[i] = self._parse_json(text, requests[i].get("phase"))
+                    except ClaudeAPIError as e:
+                        results[i] = e
+
+        fallback.sort()
+        if on_result:
+            pending_fallback = set(fallback)
+            for i, result in enumerate(results):
+                if i not in pending_fallback:
+                    on_result(i, result)
+        if fallback:
+            fn = self.call_json if as_json else self.call
+            retried = self._run_batch(
+                fn, [requests[i] for i in fallback], None,
+                on_result and (lambda j, result: on_result(fallback[j], result)),
+            )
+            for i, result in zip(fallback, retried):
+                results[i] = result
+        return results
+
+    def _run_batch(self, fn, requests: list[dict], max_workers: Optional[int],
+                   on_result: Optional[Callable[[int, object], None]] = None) -> list:
+        if not requests:
+            return []
+        workers = max_workers or (self.max_in_flight + self.max_in_flight_light)
+        workers = max(1, min(workers, len(requests)))
+
+        results: list = [None] * len(requests)
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix="claude") as executor:
+            futures = {executor.submit(fn, **req): i for i, req in enumerate(requests)}
+            for future in as_completed(futures):
+                exc = future.exception()
+                if isinstance(exc, CreditExhaustedError):
+                    for f in futures:
+                        f.cancel()
+                    raise exc
+                index = futures[future]
+                results[index] = exc if exc is not None else future.result()
+                if on_result:
+                    on_result(index, results[index])
+        return results
+
     @staticmethod
     def _repair_truncated_json(text: str) -> dict | list | None:
         """Attempt to repair JSON truncated by max_tokens limit.
@@ -427,10 +1673,64 @@ class ClaudeClient:
         except json.JSONDecodeError:
             return None
 
-    def get_cost_summary(self) -> dict:
+    def get_provider_health(self) -> dict:
+        """Breaker state per provider plus hedge/failover counts."""
         return {
-            "calls": self.call_count,
-            "input_tokens": self.total_input_tokens,
-            "output_tokens": self.total_output_tokens,
-            "cost_usd": round(self.total_cost_usd, 4),
+            "providers": self.health.stats(),
+            "hedged": self.hedge_count,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failover_count,
         }
+
+    def get_key_pool_stats(self) -> dict:
+        """Per-key requests, errors, rate headroom and retirement (multi-key pools only)."""
+        pools = {id(p): p for p in (self._main_keys, self._light_keys)}.values()
+        return {pool.name: pool.stats() for pool in pools if len(pool) > 1}
+
+    def get_telemetry_summary(self) -> dict:
+        """Latency/throughput percentiles per phase, model and pooled key."""
+        summary = self.telemetry.summary()
+        key_pools = self.get_key_pool_stats()
+        if key_pools:
+            summary["key_pools"] = key_pools
+        return summary
+
+    def write_telemetry(self, output_dir: str, **sections) -> str:
+        """Write llm_telemetry.json; sections (e.g. phase timings) join the summary."""
+        summary = self.get_telemetry_summary()
+        summary.update({k: v for k, v in sections.items() if v})
+        return self.telemetry.write(output_dir, summary=summary)
+
+    def get_cache_stats(self) -> dict:
+        """Response cache hit/miss counters and size (empty if caching is off)."""
+        if not self.response_cache:
+            return {}
+        stats = self.response_cache.stats()
+        stats["single_flight_joins"] = self.single_flight_joins
+        return stats
+
+    def get_rate_limit_stats(self) -> dict:
+        """Current RPM/TPM utilisation per provider bucket (empty if disabled)."""
+        if not self.rate_limiter:
+            return {}
+        buckets = {"main": self._main_bucket}
+        if self._light_bucket != self._main_bucket:
+            buckets["light"] = self._light_bucket
+        for pool in {id(p): p for p in (self._main_keys, self._light_keys)}.values():
+            if len(pool) > 1:
+                buckets.pop(pool.name, None)
+                buckets.update({key.label: key.bucket for key in pool.keys})
+        return {name: self.rate_limiter.utilisation(b) for name, b in buckets.items()}
+
+    def get_cost_summary(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.call_count,
+                "input_tokens": self.total_input_tokens,
+                "output_tokens": self.total_output_tokens,
+                "cache_read_tokens": self.total_cache_read_tokens,
+                "cache_write_tokens": self.total_cache_write_tokens,
+                "continuations": self.continuation_count,
+                "continuation_cost_usd": round(self.continuation_cost_usd, 4),
+                "cost_usd": round(self.total_cost_usd, 4),
+            }
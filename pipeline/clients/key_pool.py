@@ -0,0 +1,92 @@
+"""Pool of API keys for one provider.
+
+Each key has its own SDK client and its own RateLimiter bucket (limits are
+per key), so N keys give N times one key's RPM/TPM. pick() hands out the
+active key with the most rate budget left — ties go to the key with the
+fewest requests in flight, then the fewest requests overall, which is
+round-robin when no limits are configured. Keys that run out of credit
+are retired for the rest of the process.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from ..core.rate_limiter import RateLimiter
+
+
+@dataclass
+class PooledKey:
+    label: str                  # "main#2" — the raw key is never logged
+    bucket: str
+    client: Any
+    sdk_type: str
+    in_flight: int = 0
+    requests: int = 0
+    errors: int = 0
+    retired: bool = False
+    retired_reason: str = ""
+
+
+class KeyPool:
+    def __init__(self, name: str, keys: list[PooledKey],
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.name = name
+        self.keys = keys
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def active(self) -> list[PooledKey]:
+        return [k for k in self.keys if not k.retired]
+
+    def headroom(self, bucket: str) -> float:
+        """Share of a key bucket's per-minute budget still available (1.0 = unlimited)."""
+        if not self.rate_limiter:
+            return 1.0
+        usage = self.rate_limiter.utilisation(bucket)
+        if usage["blocked_for_s"] > 0:
+            return 0.0
+        return 1.0 - max(usage["rpm_utilisation"], usage["tpm_utilisation"])
+
+    def pick(self) -> Optional[PooledKey]:
+        """Claim the active key with the most budget left (None if all retired)."""
+        with self._lock:
+            active = self.active
+            if not active:
+                return None
+            best = max(active, key=lambda k: (
+                self.headroom(k.bucket), -k.in_flight, -k.requests,
+            ))
+            best.in_flight += 1
+            best.requests += 1
+            return best
+
+    def release(self, key: PooledKey, ok: bool = True) -> None:
+        with self._lock:
+            key.in_flight -= 1
+            if not ok:
+                key.errors += 1
+
+    def retire(self, key: PooledKey, reason: str = "") -> int:
+        """Stop handing out key; returns how many keys remain active."""
+        with self._lock:
+            key.retired = True
+            key.retired_reason = reason[:200]
+            return len(self.active)
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            keys = [(k.label, k.requests, k.errors, k.in_flight, k.retired, k.retired_reason,
+                     k.bucket) for k in self.keys]
+        return [
+            {
+                "key": label, "requests": requests, "errors": errors, "in_flight": in_flight,
+                "retired": retired, "retired_reason": reason,
+                "headroom": round(self.headroom(bucket), 4),
+            }
+            for label, requests, errors, in_flight, retired, reason, bucket in keys
+        ]
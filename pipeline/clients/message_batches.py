@@ -0,0 +1,197 @@
+"""Asynchronous batch submission for bulk, latency-insensitive prompts.
+
+Two provider flavours, same contract:
+- Anthropic Message Batches: POST /v1/messages/batches, poll, read results_url
+- OpenAI-compatible Batch API: upload a JSONL file, POST /v1/batches, poll,
+  download the output (and error) file
+
+run_batch() takes BatchItem objects and returns {custom_id: BatchOutcome}.
+Items missing from the provider's output come back as errors so the caller
+can retry them interactively.
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from ..core.errors import ClaudeAPIError
+
+DEFAULT_POLL_SECONDS = 10.0
+DEFAULT_TIMEOUT_SECONDS = 24 * 3600
+_OPENAI_TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BatchItem:
+    custom_id: str
+    model: str
+    system: str
+    user: str
+    max_tokens: int
+    temperature: float
+    # Stable leading user content, sent before user
+    cache_prefix: str = ""
+    # Anthropic cache_control breakpoints after the system prompt / cache_prefix
+    cache_system: bool = False
+    cache_user_prefix: bool = False
+
+
+@dataclass
+class BatchOutcome:
+    text: str = ""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    stop_reason: str = ""
+    error: Optional[str] = None
+
+
+def run_batch(client, sdk_type: str, items: list[BatchItem],
+              poll_seconds: float = DEFAULT_POLL_SECONDS,
+              timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+              on_progress: Optional[Callable[[str, int, int], None]] = None,
+              ) -> dict[str, BatchOutcome]:
+    """Submit items as one provider batch and block until it finishes."""
+    if sdk_type == "openai":
+        return _run_openai(client, items, poll_seconds, timeout_seconds, on_progress)
+    return _run_anthropic(client, items, poll_seconds, timeout_seconds, on_progress)
+
+
+def _fill_missing(items: list[BatchItem],
+                  outcomes: dict[str, BatchOutcome]) -> dict[str, BatchOutcome]:
+    for item in items:
+        outcomes.setdefault(item.custom_id, BatchOutcome(error="missing from batch output"))
+    return outcomes
+
+
+# ── Anthropic ──
+
+def _anthropic_system(item: BatchItem):
+    if not item.cache_system:
+        return item.system
+    return [{"type": "text", "text": item.system, "cache_control": {"type": "ephemeral"}}]
+
+
+def _anthropic_user(item: BatchItem):
+    if not item.cache_user_prefix:
+        return item.cache_prefix + item.user
+    return [
+        {"type": "text", "text": item.cache_prefix, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": item.user},
+    ]
+
+
+def _run_anthropic(client, items, poll_seconds, timeout_seconds, on_progress):
+    batch = client.messages.batches.create(requests=[{
+        "custom_id": item.custom_id,
+        "params": {
+            "model": item.model,
+            "max_tokens": item.max_tokens,
+            "temperature": item.temperature,
+            "system": _anthropic_system(item),
+            "messages": [{"role": "user", "content": _anthropic_user(item)}],
+        },
+    } for item in items])
+
+    deadline = time.time() + timeout_seconds
+    while batch.processing_status != "ended":
+        if time.time() > deadline:
+            client.messages.batches.cancel(batch.id)
+            raise ClaudeAPIError(f"Message batch {batch.id} timed out", retryable=True)
+        if on_progress:
+            counts = batch.request_counts
+            done = counts.succeeded + counts.errored + counts.canceled + counts.expired
+            on_progress(batch.id, done, len(items))
+        time.sleep(poll_seconds)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    outcomes: dict[str, BatchOutcome] = {}
+    for entry in client.messages.batches.results(batch.id):
+        result = entry.result
+        if result.type == "succeeded":
+            message = result.message
+            outcomes[entry.custom_id] = BatchOutcome(
+                text=message.content[0].text if message.content else "",
+                input_tokens=message.usage.input_tokens,
+                output_tokens=message.usage.output_tokens,
+                cache_read_tokens=getattr(message.usage, "cache_read_input_tokens", 0) or 0,
+                cache_write_tokens=getattr(message.usage, "cache_creation_input_tokens", 0) or 0,
+                stop_reason=message.stop_reason or "",
+            )
+        else:
+            detail = getattr(getattr(result, "error", None), "error", None)
+            outcomes[entry.custom_id] = BatchOutcome(
+                error=f"{result.type}: {getattr(detail, 'message', '') or result.type}",
+            )
+    return _fill_missing(items, outcomes)
+
+
+# ── OpenAI-compatible ──
+
+def _run_openai(client, items, poll_seconds, timeout_seconds, on_progress):
+    lines = [json.dumps({
+        "custom_id": item.custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": item.model,
+            "max_tokens": item.max_tokens,
+            "temperature": item.temperature,
+            "messages": [
+                {"role": "system", "content": item.system},
+                {"role": "user", "content": item.cache_prefix + item.user},
+            ],
+        },
+    }, ensure_ascii=False) for item in items]
+    upload = client.files.create(
+        file=("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8")),
+        purpose="batch",
+    )
+    batch = client.batches.create(
+        input_file_id=upload.id, endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+    deadline = time.time() + timeout_seconds
+    while batch.status not in _OPENAI_TERMINAL:
+        if time.time() > deadline:
+            client.batches.cancel(batch.id)
+            raise ClaudeAPIError(f"Batch {batch.id} timed out", retryable=True)
+        if on_progress and batch.request_counts:
+            counts = batch.request_counts
+            on_progress(batch.id, counts.completed + counts.failed, len(items))
+        time.sleep(poll_seconds)
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" and not batch.output_file_id:
+        raise ClaudeAPIError(f"Batch {batch.id} ended with status {batch.status}",
+                             retryable=True)
+
+    outcomes: dict[str, BatchOutcome] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record.get("custom_id", "")
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            if record.get("error") or response.get("status_code", 200) >= 400:
+                err = record.get("error") or body.get("error") or {}
+                outcomes[custom_id] = BatchOutcome(
+                    error=str(err.get("message", err)) if isinstance(err, dict) else str(err),
+                )
+                continue
+            usage = body.get("usage") or {}
+            choices = body.get("choices") or [{}]
+            outcomes[custom_id] = BatchOutcome(
+                stop_reason=choices[0].get("finish_reason") or "",
+                text=(choices[0].get("message") or {}).get("content") or "",
+                input_tokens=usage.get("prompt_tokens", 0) or 0,
+                output_tokens=usage.get("completion_tokens", 0) or 0,
+            )
+    return _fill_missing(items, outcomes)
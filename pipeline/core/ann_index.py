@@ -0,0 +1,208 @@
+"""Approximate nearest-neighbour index for cosine similarity (random-projection LSH).
+
+Each of L tables hashes a unit vector to the signs of b random hyperplane
+projections; two vectors at cosine s share a table's bucket with
+probability (1 - arccos(s)/π)^b. b and L are picked from the threshold
+the caller cares about so a pair at that similarity is found with at
+least `recall` probability, while unrelated pairs rarely collide. Only
+colliding pairs are scored exactly, so cost grows with the number of
+near pairs instead of N².
+
+Exact blocked search (similarity.py) is used instead when:
+- queries × corpus is at most exact_max_pairs (small sets — exact is
+  cheap and returns the same results the full matrix would)
+- the threshold is too low for LSH to prune anything at the target recall
+- rows are sparse TF-IDF (their inverted-index join already only touches
+  pairs that share a term)
+"""
+
+import math
+from typing import Optional, Union
+
+import numpy as np
+
+from . import similarity as sim
+from .sparse_tfidf import SparseRows
+
+Rows = Union[np.ndarray, SparseRows]
+
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_RECALL = 0.95
+EXACT_MAX_PAIRS = 1 << 22          # ~4M pairs: exact search is still fast
+MAX_TABLES = 32
+MAX_BITS = 20
+MIN_BITS = 4                       # fewer bits prune too little to beat exact search
+
+
+def lsh_params(threshold: float, recall: float = DEFAULT_RECALL,
+               max_tables: int = MAX_TABLES) -> Optional[tuple[int, int]]:
+    """(bits per table, tables) reaching recall at threshold; None = search exactly."""
+    if threshold <= 0 or threshold >= 1:
+        return None
+    p = 1.0 - math.acos(threshold) / math.pi
+    for bits in range(MAX_BITS, MIN_BITS - 1, -1):
+        hit = p ** bits
+        tables = math.ceil(math.log(1.0 - recall) / math.log(1.0 - hit))
+        if tables <= max_tables:
+            return bits, max(1, tables)
+    return None
+
+
+class AnnIndex:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, recall: float = DEFAULT_RECALL,
+                 seed: int = 0, exact_max_pairs: int = EXACT_MAX_PAIRS):
+        self.threshold = threshold
+        self.recall = recall
+        self.exact_max_pairs = exact_max_pairs
+        self.candidates = 0          # pairs scored exactly in LSH mode
+        self.exact_searches = 0
+        self._seed = seed
+        self._chunks: list[Rows] = []
+        self._rows: Optional[Rows] = None
+        self._tables = None          # (projection, sorted keys, order) once built
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self._chunks)
+
+    def add(self, vectors: Rows) -> None:
+        """Append unit rows (dense float32 matrix or SparseRows)."""
+        if len(vectors):
+            self._chunks.append(vectors)
+            self._rows = None
+            self._tables = None
+
+    @property
+    def rows(self) -> Rows:
+        if self._rows is None:
+            if not self._chunks:
+                self._rows = np.zeros((0, 0), dtype=np.float32)
+            elif isinstance(self._chunks[0], SparseRows):
+                self._rows = SparseRows.concat(self._chunks)
+            else:
+                self._rows = np.vstack(self._chunks)
+        return self._rows
+
+    # ── Queries ──
+
+    def range_query(self, queries: Optional[Rows] = None, threshold: Optional[float] = None,
+                    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(query_idx, index_idx, scores) of pairs scoring >= threshold, row-major.
+
+        Without queries the index is joined with itself (i < j only).
+        """
+        threshold = self.threshold if threshold is None else threshold
+        params = self._params(queries, threshold)
+        if params is None:
+            self.exact_searches += 1
+            if queries is None:
+                return sim.pairs_above(self.rows, threshold=threshold)
+            return sim.pairs_above(queries, self.rows, threshold=threshold)
+        qi, ci, scores = self._candidates(queries, params)
+        keep = scores >= threshold
+        return qi[keep], ci[keep], scores[keep]
+
+    def query_topk(self, queries: Rows, k: int = 1,
+                   ) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, scores), each (n_queries, k), best first; -1 / 0 pad.
+
+        In LSH mode matches below the index threshold may be missed.
+        """
+        params = self._params(queries, self.threshold)
+        if params is None:
+            self.exact_searches += 1
+            return sim.top_k(queries, self.rows, k=k)
+        n = len(queries)
+        indices = np.full((n, k), -1, dtype=np.intp)
+        top = np.zeros((n, k), dtype=np.float32)
+        qi, ci, scores = self._candidates(queries, params)
+        if not len(qi) or k <= 0:
+            return indices, top
+        # Best first within each query, then the rank of each pair in its query
+        order = np.lexsort((ci, -scores, qi))
+        qi, ci, scores = qi[order], ci[order], scores[order]
+        starts = np.searchsorted(qi, qi, side="left")
+        rank = np.arange(len(qi)) - starts
+        keep = rank < k
+        indices[qi[keep], rank[keep]] = ci[keep]
+        top[qi[keep], rank[keep]] = scores[keep]
+        return indices, top
+
+    # ── LSH ──
+
+    def _params(self, queries: Optional[Rows], threshold: float):
+        rows = self.rows
+        n_queries = len(rows) if queries is None else len(queries)
+        if (isinstance(rows, SparseRows) or not len(rows) or not n_queries
+                or n_queries * len(rows) <= self.exact_max_pairs):
+            return None
+        return lsh_params(threshold, self.recall)
+
+    def _keys(self, vectors: np.ndarray, projection: np.ndarray, bits: int) -> np.ndarray:
+        """(n, tables) int64 bucket keys from projection signs."""
+        signs = (vectors @ projection) > 0
+        weights = (1 << np.arange(bits, dtype=np.int64))
+        return signs.reshape(len(vectors), -1, bits).astype(np.int64) @ weights
+
+    def _build(self, params: tuple[int, int]):
+        if self._tables is None or self._tables[0] != params:
+            bits, tables = params
+            rows = self.rows
+            rng = np.random.default_rng(self._seed)
+            projection = rng.standard_normal((rows.shape[1], bits * tables)).astype(np.float32)
+            keys = self._keys(rows, projection, bits)
+            order = np.argsort(keys, axis=0, kind="stable")
+            sorted_keys = np.take_along_axis(keys, order, axis=0)
+            self._tables = (params, projection, sorted_keys, order)
+        return self._tables
+
+    def _candidates(self, queries: Optional[Rows], params: tuple[int, int]):
+        """Exact scores of every (query, row) pair sharing a bucket in any table."""
+        _, projection, sorted_keys, order = self._build(params)
+        bits, tables = params
+        rows = self.rows
+        self_join = queries is None
+        if self_join:
+            queries = rows
+        step = max(1, sim.BLOCK_ELEMENTS // max(1, len(rows)))
+        out_q, out_c, out_s = [], [], []
+        for start in range(0, len(queries), step):
+            chunk = queries[start:start + step]
+            keys = self._keys(chunk, projection, bits)
+            pair_codes = []
+            for t in range(tables):
+                lo = np.searchsorted(sorted_keys[:, t], keys[:, t], side="left")
+                hi = np.searchsorted(sorted_keys[:, t], keys[:, t], side="right")
+                counts = hi - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(total)
+                q_local = np.repeat(np.arange(len(chunk)), counts)
+                pair_codes.append(q_local * len(rows) + order[offsets, t])
+            if not pair_codes:
+                continue
+            codes = np.unique(np.concatenate(pair_codes))
+            qi, ci = np.divmod(codes, len(rows))
+            qi = qi + start
+            if self_join:
+                upper = ci > qi
+                qi, ci = qi[upper], ci[upper]
+            out_q.append(qi)
+            out_c.append(ci)
+            out_s.append(self._pair_scores(queries, qi, ci))
+        self.candidates += sum(len(q) for q in out_q)
+        if not out_q:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty.copy(), np.zeros(0, dtype=np.float32)
+        return np.concatenate(out_q), np.concatenate(out_c), np.concatenate(out_s)
+
+    def _pair_scores(self, queries: np.ndarray, qi: np.ndarray, ci: np.ndarray) -> np.ndarray:
+        rows = self.rows
+        scores = np.empty(len(qi), dtype=np.float32)
+        step = max(1, sim.BLOCK_ELEMENTS // max(1, rows.shape[1]))
+        for start in range(0, len(qi), step):
+            q = queries[qi[start:start + step]]
+            c = rows[ci[start:start + step]]
+            scores[start:start + step] = np.einsum("ij,ij->i", q, c)
+        np.clip(scores, 0.0, 1.0, out=scores)
+        return scores
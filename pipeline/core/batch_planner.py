@@ -0,0 +1,135 @@
+"""Token-budget batch planning for multi-atom prompts (P3, P4, P5).
+
+A fixed atoms-per-call limit is wrong both ways: 30 one-line atoms waste
+round-trips, 30 long ones overflow the output budget and hit proxy
+timeouts. plan_batches() packs items in order until the next one would
+push a request past its input or output token budget (or max_items), then
+evens the batches out so concurrent requests finish at similar times.
+"""
+
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from .tokens import get_token_counter, model_limits
+
+# Per-request budgets. Output is the one that times out: ~6k tokens is
+# roughly a minute and a half of generation, under common 100s proxy limits.
+DEFAULT_INPUT_BUDGET = 30_000
+DEFAULT_OUTPUT_BUDGET = 6_000
+# Response headroom on top of the output estimate
+OUTPUT_HEADROOM = 1.25
+OUTPUT_SLACK_TOKENS = 256
+
+
+@dataclass
+class BatchPlan:
+    batches: list[list] = field(default_factory=list)
+    input_tokens: list[int] = field(default_factory=list)
+    output_tokens: list[int] = field(default_factory=list)   # estimates
+    max_tokens: list[int] = field(default_factory=list)      # per-request max_tokens
+
+    def __len__(self) -> int:
+        return len(self.batches)
+
+    def describe(self) -> str:
+        sizes = "+".join(str(len(b)) for b in self.batches)
+        return (
+            f"{len(self.batches)} batch ({sizes}), "
+            f"~{sum(self.input_tokens) / 1000:.1f}k in / "
+            f"{sum(self.output_tokens) / 1000:.1f}k out tok"
+        )
+
+
+def atom_tokens(atom: dict, model: Optional[str] = None, indent: int = 1) -> int:
+    """Tokens an atom takes when serialised into a prompt."""
+    return get_token_counter().count(
+        json.dumps(atom, ensure_ascii=False, indent=indent), model,
+    )
+
+
+def plan_batches(items: list,
+                 input_tokens: Callable[[Any], int],
+                 output_tokens: Callable[[Any], int],
+                 model: Optional[str] = None,
+                 overhead_tokens: int = 0,
+                 max_input_tokens: int = DEFAULT_INPUT_BUDGET,
+                 max_output_tokens: int = DEFAULT_OUTPUT_BUDGET,
+                 max_items: Optional[int] = None,
+                 min_max_tokens: int = 4096,
+                 item_size: Optional[Callable[[Any], int]] = None) -> BatchPlan:
+    """Split items into order-preserving batches that fit the token budgets.
+
+    input_tokens/output_tokens estimate one item's prompt and response
+    share; overhead_tokens is the fixed prompt (system + template) every
+    request carries. An item too large for any budget gets a batch of its
+    own. max_tokens per batch is the output estimate plus headroom, never
+    below min_max_tokens and never above the model's output cap.
+    max_items caps the summed item_size per batch (default 1 per item,
+    e.g. atoms per call when items are clusters of atoms).
+    """
+    if not items:
+        return BatchPlan()
+    window, model_max_output = model_limits(model)
+    max_input_tokens = min(max_input_tokens, window - max_output_tokens)
+    if model_max_output:
+        max_output_tokens = min(max_output_tokens, model_max_output)
+
+    costs = [(input_tokens(item), output_tokens(item), item_size(item) if item_size else 1)
+             for item in items]
+    bounds = _pack(costs, max_input_tokens - overhead_tokens, max_output_tokens, max_items)
+
+    # Even out: shrink all budgets by the smallest factor that still packs
+    # into the same number of batches
+    n = len(bounds)
+    if n > 1:
+        lo, hi = 0.0, 1.0
+        for _ in range(12):
+            f = (lo + hi) / 2
+            trial = _pack(
+                costs, f * (max_input_tokens - overhead_tokens), f * max_output_tokens,
+                max(1, math.ceil(f * max_items)) if max_items else None,
+            )
+            if len(trial) <= n:
+                hi, bounds = f, trial
+            else:
+                lo = f
+
+    plan = BatchPlan()
+    for start, end in bounds:
+        est_in = overhead_tokens + sum(c[0] for c in costs[start:end])
+        est_out = sum(c[1] for c in costs[start:end])
+        budget = max(min_max_tokens, math.ceil(est_out * OUTPUT_HEADROOM) + OUTPUT_SLACK_TOKENS)
+        if model_max_output:
+            budget = min(budget, model_max_output)
+        plan.batches.append(items[start:end])
+        plan.input_tokens.append(est_in)
+        plan.output_tokens.append(est_out)
+        plan.max_tokens.append(budget)
+    return plan
+
+
+def _pack(costs: list[tuple[int, int, int]], input_budget: float, output_budget: float,
+          max_items: Optional[int]) -> list[tuple[int, int]]:
+    """Greedy next-fit over (input, output, size) costs; returns (start, end) index ranges."""
+    bounds = []
+    start = 0
+    used_in = used_out = used_size = 0
+    for i, (cin, cout, size) in enumerate(costs):
+        full = (
+            i > start and (
+                used_in + cin > input_budget
+                or used_out + cout > output_budget
+                or (max_items and used_size + size > max_items)
+            )
+        )
+        if full:
+            bounds.append((start, i))
+            start = i
+            used_in = used_out = used_size = 0
+        used_in += cin
+        used_out += cout
+        used_size += size
+    bounds.append((start, len(costs)))
+    return bounds
@@ -0,0 +1,154 @@
+"""Record/replay cassettes for LLM and embedding traffic.
+
+record: every provider request ClaudeClient and EmbeddingClient send is
+appended to one JSONL file with its response and wall time.
+replay: the same requests are answered from the file with no network —
+deterministically (identical requests are served in recorded order) and,
+with latency_scale > 0, after sleeping the recorded time multiplied by the
+scale. With latency_scale=0 a replayed build measures only the CPU-side
+cost of each phase.
+
+Requests are keyed by a hash of what the provider sees (model, prompts),
+not by max_tokens or API key, so a replay still matches when token
+estimates or key pools change. Embedding vectors are stored as base64
+float32 to keep cassettes small.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Optional
+
+from .errors import PipelineError
+
+CASSETTE_FILENAME = "llm_cassette.jsonl"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMissError(PipelineError):
+    """Replay found no recorded response for a request."""
+
+
+def request_key(kind: str, *parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in (kind,) + parts:
+        digest.update((part or "").encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def pack_vectors(vectors: list[list[float]]) -> dict:
+    """Float vectors → {"dim", "data"} with data as base64 float32."""
+    dim = len(vectors[0]) if vectors else 0
+    flat = array("f", (x for vec in vectors for x in vec))
+    return {"dim": dim, "data": base64.b64encode(flat.tobytes()).decode("ascii")}
+
+
+def unpack_vectors(packed: dict) -> list[list[float]]:
+    flat = array("f")
+    flat.frombytes(base64.b64decode(packed["data"]))
+    dim = packed["dim"]
+    if not dim:
+        return []
+    values = flat.tolist()
+    return [values[i:i + dim] for i in range(0, len(values), dim)]
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency_scale: float = 0.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Cassette mode must be '{RECORD}' or '{REPLAY}', got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = max(0.0, latency_scale)
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[dict]] = defaultdict(list)
+        self._served: dict[str, int] = defaultdict(int)
+        self._file = None
+        if mode == REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # torn last line of an interrupted recording
+                self._entries[entry["key"]].append(entry)
+
+    def has(self, kind: str) -> bool:
+        return any(e[0]["kind"] == kind for e in self._entries.values())
+
+    def record(self, kind: str, key: str, response: dict, elapsed_s: float) -> None:
+        line = json.dumps(
+            {"kind": kind, "key": key, "elapsed_s": round(elapsed_s, 4), "response": response},
+            ensure_ascii=False, separators=(",", ":"),
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def replay(self, kind: str, key: str) -> dict:
+        """Recorded response for key; repeats are served in recorded order."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMissError(
+                    f"No recorded {kind} response for request {key[:16]} in {self.path}"
+                )
+            # Past the last recording, keep serving it
+            entry = entries[min(self._served[key], len(entries) - 1)]
+            self._served[key] += 1
+            self.replayed += 1
+        if self.latency_scale:
+            time.sleep(entry["elapsed_s"] * self.latency_scale)
+        return entry["response"]
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def open_cassette(mode: str, path: Optional[str], output_dir: str,
+                  latency_scale: float = 0.0) -> Optional[Cassette]:
+    """Cassette for a build (None when mode is empty); default path is in output_dir."""
+    if not mode:
+        return None
+    return Cassette(path or os.path.join(output_dir, CASSETTE_FILENAME), mode, latency_scale)
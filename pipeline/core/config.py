@@ -44,6 +44,8 @@ def load_config(config_path: str, output_dir: str) -> BuildConfig:
                 if p.suffix.lower() in pdf_exts and str(p) not in pdf_paths:
                     pdf_paths.append(str(p))
 
+    api_keys = _split_keys(os.environ.get("CLAUDE_API_KEYS", ""))
+
     return BuildConfig(
         name=raw.get("name", "Untitled"),
         domain=raw.get("domain", "custom"),
@@ -54,7 +56,8 @@ def load_config(config_path: str, output_dir: str) -> BuildConfig:
         transcript_paths=transcript_paths,
         output_dir=output_dir,
         config_path=config_path,
-        claude_api_key=os.environ.get("CLAUDE_API_KEY", "") or raw.get("claude_api_key", ""),
+        claude_api_key=(os.environ.get("CLAUDE_API_KEY", "") or raw.get("claude_api_key", "")
+                        or (api_keys[0] if api_keys else "")),
         claude_model=raw.get("claude_model", "") or os.environ.get("CLAUDE_MODEL", "claude-sonnet-4-5-20250929"),
         seekers_cache_dir=os.environ.get("SEEKERS_CACHE_DIR", "./data/cache"),
         seekers_cache_ttl_hours=int(os.environ.get("SEEKERS_CACHE_TTL_HOURS", "168")),
@@ -67,15 +70,50 @@ def load_config(config_path: str, output_dir: str) -> BuildConfig:
         claude_model_light=raw.get("claude_model_light", "") or os.environ.get("CLAUDE_MODEL_LIGHT", "claude-haiku-4-5-20251001"),
         claude_base_url_light=os.environ.get("CLAUDE_BASE_URL_LIGHT", ""),
         claude_api_key_light=os.environ.get("CLAUDE_API_KEY_LIGHT", ""),
+        claude_api_keys=api_keys,
+        claude_api_keys_light=_split_keys(os.environ.get("CLAUDE_API_KEYS_LIGHT", "")),
         claude_model_premium=os.environ.get("CLAUDE_MODEL_PREMIUM", ""),
+        claude_max_in_flight=int(os.environ.get("CLAUDE_MAX_IN_FLIGHT", "4")),
+        claude_max_in_flight_light=int(os.environ.get("CLAUDE_MAX_IN_FLIGHT_LIGHT", "4")),
+        claude_cache_max_mb=int(os.environ.get("CLAUDE_CACHE_MAX_MB", "1024")),
+        claude_cache_ttl_hours=int(os.environ.get("CLAUDE_CACHE_TTL_HOURS", "720")),
+        claude_rpm=int(os.environ.get("CLAUDE_RPM", "0")),
+        claude_tpm=int(os.environ.get("CLAUDE_TPM", "0")),
+        claude_rpm_light=int(os.environ.get("CLAUDE_RPM_LIGHT", "0")),
+        claude_tpm_light=int(os.environ.get("CLAUDE_TPM_LIGHT", "0")),
+        claude_batch_mode=os.environ.get("CLAUDE_BATCH_MODE", "").lower() in ("1", "true", "yes"),
+        claude_prompt_caching=os.environ.get(
+            "CLAUDE_PROMPT_CACHING", "1").lower() in ("1", "true", "yes"),
+        claude_max_continuations=int(os.environ.get("CLAUDE_MAX_CONTINUATIONS", "2")),
+        claude_hedge_percentile=float(os.environ.get("CLAUDE_HEDGE_PERCENTILE", "95")),
+        claude_hedge_min_delay=float(os.environ.get("CLAUDE_HEDGE_MIN_DELAY", "2")),
+        claude_breaker_error_rate=float(os.environ.get("CLAUDE_BREAKER_ERROR_RATE", "0.5")),
+        claude_breaker_latency=float(os.environ.get("CLAUDE_BREAKER_LATENCY", "0")),
+        claude_breaker_cooldown=float(os.environ.get("CLAUDE_BREAKER_COOLDOWN", "60")),
+        dedup_max_workers=int(os.environ.get("DEDUP_MAX_WORKERS", "0")),
+        dedup_store=os.environ.get("DEDUP_STORE", "1").lower() in ("1", "true", "yes"),
         domain_lessons=os.environ.get("DOMAIN_LESSONS", ""),
         clean_input=raw.get('clean_input', True),
         embedding_api_key=os.environ.get("EMBEDDING_API_KEY", ""),
         embedding_model=os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small"),
         embedding_base_url=os.environ.get("EMBEDDING_BASE_URL", "https://api.openai.com/v1"),
+        embedding_max_concurrency=int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "4")),
+        embedding_batch_tokens=int(os.environ.get("EMBEDDING_BATCH_TOKENS", "50000")),
+        embedding_store_max_entries=int(os.environ.get("EMBEDDING_STORE_MAX_ENTRIES", "200000")),
+        embedding_store_dtype=os.environ.get("EMBEDDING_STORE_DTYPE", "float32").lower(),
+        embedding_tfidf_incremental=os.environ.get(
+            "EMBEDDING_TFIDF_INCREMENTAL", "1").lower() in ("1", "true", "yes"),
+        cassette_mode=os.environ.get("PIPELINE_CASSETTE", "").lower(),
+        cassette_path=os.environ.get("PIPELINE_CASSETTE_PATH", ""),
+        cassette_latency_scale=float(os.environ.get("PIPELINE_CASSETTE_LATENCY", "0")),
     )
 
 
+def _split_keys(value: str) -> list[str]:
+    """Comma-separated API keys → list (blanks dropped)."""
+    return [k.strip() for k in value.split(",") if k.strip()]
+
+
 def get_tier_params(tier: str) -> dict:
     return {
         "draft": {"max_atoms_per_chunk": 20, "verify_sample_pct": 30, "dedup_threshold": 0.7},
@@ -0,0 +1,180 @@
+"""Per-skill store of P3 dedup state, so rebuilds only dedup what changed.
+
+One WAL-mode SQLite file per skill (<store_dir>/<skill_key>.db):
+- atoms: every atom P3 has seen, keyed by a hash of its content (P2 atom
+  ids are renumbered whenever a transcript is added), with its keyword
+  set and the cluster it last belonged to
+- decisions: Claude's dedup response for one cluster, keyed by the
+  cluster's atom keys and namespaced by prompt version, model and
+  language, so a prompt or model change never replays stale answers
+- resolutions: the user's answer to a conflict, keyed by the pair's atom
+  keys, so a replayed conflict is not sent back for review
+
+Embedding vectors are not kept here: they live in the shared embedding
+store, keyed by text, so known atoms never hit the embedding API again.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+_QUERY_CHUNK = 500                 # stay under SQLite's bound-parameter limit
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def atom_key(atom: dict) -> str:
+    """Content hash of an atom: stable across builds, unlike its id."""
+    return _sha256(json.dumps(
+        [atom.get("category", ""), atom.get("source", ""),
+         atom.get("title", ""), atom.get("content", "")],
+        ensure_ascii=False,
+    ))
+
+
+def cluster_key(keys: list[str]) -> str:
+    """Order-independent key of a cluster of atom keys."""
+    return _sha256("\n".join(sorted(keys)))
+
+
+def conflict_key(atom_a: dict, atom_b: dict) -> str:
+    """Order-independent key of a conflicting atom pair."""
+    return cluster_key([atom_key(atom_a), atom_key(atom_b)])
+
+
+def skill_key(name: str, domain: str) -> str:
+    """Filesystem-safe store name: readable slug plus a short hash."""
+    slug = re.sub(r"[^\w-]+", "_", f"{domain}_{name}".lower(), flags=re.ASCII).strip("_")
+    return f"{slug[:48]}_{_sha256(f'{domain}:{name}')[:12]}"
+
+
+class DedupStore:
+    def __init__(self, store_dir: str, skill: str):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.store_dir / f"{skill}.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=30, check_same_thread=False,
+            isolation_level=None,
+        )
+        self._init_db()
+
+    def _init_db(self):
+        with self._lock:
+            conn = self._conn
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS atoms (
+                key TEXT PRIMARY KEY, category TEXT NOT NULL,
+                keywords TEXT NOT NULL, cluster TEXT NOT NULL,
+                seen_at REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS decisions (
+                namespace TEXT NOT NULL, cluster TEXT NOT NULL,
+                result TEXT NOT NULL, created_at REAL NOT NULL,
+                PRIMARY KEY (namespace, cluster))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS resolutions (
+                pair TEXT PRIMARY KEY, resolution TEXT NOT NULL,
+                created_at REAL NOT NULL)""")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM atoms").fetchone()[0]
+
+    # ── Lookup ──
+
+    def known_atoms(self, keys: list[str]) -> dict[str, tuple[set[str], str]]:
+        """{atom key: (keywords, last cluster key)} for every stored key."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), _QUERY_CHUNK):
+                chunk = unique[start:start + _QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"""SELECT key, keywords, cluster FROM atoms
+                    WHERE key IN ({','.join('?' * len(chunk))})""",
+                    chunk,
+                ).fetchall()
+                found.update((k, (set(json.loads(kw)), c)) for k, kw, c in rows)
+        return found
+
+    def decisions(self, namespace: str, clusters: list[str]) -> dict[str, dict]:
+        """{cluster key: stored dedup response} for every stored cluster."""
+        found = {}
+        unique = list(dict.fromkeys(clusters))
+        with self._lock:
+            for start in range(0, len(unique), _QUERY_CHUNK):
+                chunk = unique[start:start + _QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"""SELECT cluster, result FROM decisions
+                    WHERE namespace = ? AND cluster IN ({','.join('?' * len(chunk))})""",
+                    [namespace, *chunk],
+                ).fetchall()
+                found.update((c, json.loads(r)) for c, r in rows)
+        return found
+
+    def resolutions(self, pairs: list[str]) -> dict[str, dict]:
+        """{pair key: stored user resolution} for every stored pair."""
+        found = {}
+        unique = list(dict.fromkeys(pairs))
+        with self._lock:
+            for start in range(0, len(unique), _QUERY_CHUNK):
+                chunk = unique[start:start + _QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"""SELECT pair, resolution FROM resolutions
+                    WHERE pair IN ({','.join('?' * len(chunk))})""",
+                    chunk,
+                ).fetchall()
+                found.update((p, json.loads(r)) for p, r in rows)
+        return found
+
+    # ── Update ──
+
+    def save(self, namespace: str,
+             atoms: list[tuple[str, str, set[str], str]],
+             decisions: dict[str, dict]) -> None:
+        """Record (key, category, keywords, cluster key) of this run's atoms
+        and its new cluster decisions, in one transaction."""
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    """INSERT OR REPLACE INTO atoms (key, category, keywords, cluster, seen_at)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    [(key, category, json.dumps(sorted(keywords), ensure_ascii=False),
+                      cluster, now)
+                     for key, category, keywords, cluster in atoms],
+                )
+                conn.executemany(
+                    """INSERT OR REPLACE INTO decisions (namespace, cluster, result, created_at)
+                    VALUES (?, ?, ?, ?)""",
+                    [(namespace, cluster, json.dumps(result, ensure_ascii=False), now)
+                     for cluster, result in decisions.items()],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def save_resolutions(self, resolutions: dict[str, dict]) -> None:
+        """Record user conflict resolutions ({pair key: resolution})."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO resolutions (pair, resolution, created_at)
+                VALUES (?, ?, ?)""",
+                [(pair, json.dumps(resolution, ensure_ascii=False), now)
+                 for pair, resolution in resolutions.items()],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
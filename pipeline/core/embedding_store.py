@@ -0,0 +1,258 @@
+"""Persistent embedding store shared by builds.
+
+Vectors live in one memory-mapped array file per dimension
+(vectors_<dim>.f32 or .f16) and are indexed by a WAL-mode SQLite table
+keyed by (model, sha256(text)) → slot:
+- Lookup: one IN query per batch, then a fancy-index read from the map
+- Append: writers hold the SQLite write lock while they claim slots and
+  write rows, so concurrent builds never hand out the same slot; the
+  index row is committed after the vector, so readers only see whole rows
+- Size cap: past max_entries the least recently used entries are dropped
+  down to a low watermark; their slots are reused once SLOT_REUSE_GRACE_S
+  has passed, so a reader that just looked a slot up never sees it
+  overwritten
+
+float16 halves the file at ~1e-3 relative error per component; vectors are
+always returned as float32.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+DB_FILENAME = "index.db"
+DEFAULT_MAX_ENTRIES = 200_000
+EVICT_LOW_WATERMARK = 0.9
+SLOT_REUSE_GRACE_S = 300.0
+DTYPES = {"float32": ("f32", np.float32), "float16": ("f16", np.float16)}
+_QUERY_CHUNK = 500                 # stay under SQLite's bound-parameter limit
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir: str, dtype: str = "float32",
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        if dtype not in DTYPES:
+            raise ValueError(f"Embedding store dtype must be one of {sorted(DTYPES)}, got {dtype!r}")
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._maps: dict[int, np.memmap] = {}
+        self._conn = sqlite3.connect(
+            str(self.store_dir / DB_FILENAME), timeout=30,
+            check_same_thread=False, isolation_level=None,
+        )
+        # The first build to create the store fixes its dtype
+        self.dtype = self._init_db(dtype)
+        self._suffix, self._np_dtype = DTYPES[self.dtype]
+
+    def _init_db(self, dtype: str) -> str:
+        with self._lock:
+            conn = self._conn
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL, text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL, slot INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (model, text_hash))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON entries(accessed_at)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS slots (
+                dim INTEGER PRIMARY KEY, next_slot INTEGER NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS free_slots (
+                dim INTEGER NOT NULL, slot INTEGER NOT NULL, freed_at REAL NOT NULL,
+                PRIMARY KEY (dim, slot))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY, value TEXT NOT NULL)""")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dtype', ?)", (dtype,))
+            return conn.execute("SELECT value FROM meta WHERE name = 'dtype'").fetchone()[0]
+
+    # ── Vector files ──
+
+    def _path(self, dim: int) -> Path:
+        return self.store_dir / f"vectors_{dim}.{self._suffix}"
+
+    def _row_bytes(self, dim: int) -> int:
+        return dim * np.dtype(self._np_dtype).itemsize
+
+    def _map(self, dim: int, min_rows: int) -> np.memmap:
+        """Read-only map of the dim file covering at least min_rows rows."""
+        mapped = self._maps.get(dim)
+        if mapped is None or len(mapped) < min_rows:
+            rows = os.path.getsize(self._path(dim)) // self._row_bytes(dim)
+            mapped = np.memmap(self._path(dim), dtype=self._np_dtype, mode="r",
+                               shape=(rows, dim))
+            self._maps[dim] = mapped
+        return mapped
+
+    # ── Lookup ──
+
+    def get_many(self, model: str, texts: list[str]) -> dict[int, np.ndarray]:
+        """{position in texts: float32 vector} for every stored text."""
+        keys = [text_key(t) for t in texts]
+        found: dict[str, tuple[int, int]] = {}
+        with self._lock:
+            for start in range(0, len(keys), _QUERY_CHUNK):
+                chunk = list(set(keys[start:start + _QUERY_CHUNK]))
+                rows = self._conn.execute(
+                    f"""SELECT text_hash, dim, slot FROM entries
+                    WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})""",
+                    [model, *chunk],
+                ).fetchall()
+                found.update((h, (dim, slot)) for h, dim, slot in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+
+            by_dim: dict[int, list[tuple[int, int]]] = {}
+            for i, key in enumerate(keys):
+                if key in found:
+                    dim, slot = found[key]
+                    by_dim.setdefault(dim, []).append((i, slot))
+            result: dict[int, np.ndarray] = {}
+            for dim, items in by_dim.items():
+                slots = np.fromiter((slot for _, slot in items), dtype=np.intp)
+                vectors = self._map(dim, int(slots.max()) + 1)[slots].astype(np.float32)
+                result.update((i, vec) for (i, _), vec in zip(items, vectors))
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    # ── Append ──
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]) -> int:
+        """Store vectors not stored yet; returns how many were written."""
+        pending: dict[str, list[float]] = {}
+        for text, vec in zip(texts, vectors):
+            if vec:
+                pending.setdefault(text_key(text), vec)
+        if not pending:
+            return 0
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                keys = list(pending)
+                for start in range(0, len(keys), _QUERY_CHUNK):
+                    chunk = keys[start:start + _QUERY_CHUNK]
+                    for (h,) in conn.execute(
+                        f"""SELECT text_hash FROM entries
+                        WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})""",
+                        [model, *chunk],
+                    ):
+                        pending.pop(h, None)
+                by_dim: dict[int, list[str]] = {}
+                for h, vec in pending.items():
+                    by_dim.setdefault(len(vec), []).append(h)
+                now = time.time()
+                for dim, hashes in by_dim.items():
+                    slots = self._claim_slots(dim, len(hashes), now)
+                    matrix = np.asarray([pending[h] for h in hashes], dtype=self._np_dtype)
+                    self._write_rows(dim, slots, matrix)
+                    conn.executemany(
+                        """INSERT INTO entries (model, text_hash, dim, slot, accessed_at)
+                        VALUES (?, ?, ?, ?, ?)""",
+                        [(model, h, dim, slot, now) for h, slot in zip(hashes, slots)],
+                    )
+                self._evict_locked(now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.writes += len(pending)
+        return len(pending)
+
+    def _claim_slots(self, dim: int, count: int, now: float) -> list[int]:
+        """Reuse slots freed before the grace period, then grow the file."""
+        conn = self._conn
+        reused = [row[0] for row in conn.execute(
+            "SELECT slot FROM free_slots WHERE dim = ? AND freed_at < ? ORDER BY slot LIMIT ?",
+            (dim, now - SLOT_REUSE_GRACE_S, count),
+        )]
+        conn.executemany("DELETE FROM free_slots WHERE dim = ? AND slot = ?",
+                         [(dim, slot) for slot in reused])
+        fresh = count - len(reused)
+        if not fresh:
+            return reused
+        conn.execute("INSERT OR IGNORE INTO slots (dim, next_slot) VALUES (?, 0)", (dim,))
+        first = conn.execute("SELECT next_slot FROM slots WHERE dim = ?", (dim,)).fetchone()[0]
+        conn.execute("UPDATE slots SET next_slot = ? WHERE dim = ?", (first + fresh, dim))
+        return reused + list(range(first, first + fresh))
+
+    def _write_rows(self, dim: int, slots: list[int], matrix: np.ndarray) -> None:
+        row_bytes = self._row_bytes(dim)
+        path = self._path(dim)
+        with open(path, "r+b" if path.exists() else "w+b") as f:
+            for slot, row in zip(slots, matrix):
+                f.seek(slot * row_bytes)
+                f.write(row.tobytes())
+
+    # ── Eviction ──
+
+    def _evict_locked(self, now: float) -> None:
+        """Drop least recently used entries down to the low watermark."""
+        if not self.max_entries:
+            return
+        total = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if total <= self.max_entries:
+            return
+        excess = total - int(self.max_entries * EVICT_LOW_WATERMARK)
+        victims = self._conn.execute(
+            "SELECT rowid, dim, slot FROM entries ORDER BY accessed_at, rowid LIMIT ?",
+            (excess,),
+        ).fetchall()
+        self._conn.executemany("DELETE FROM entries WHERE rowid = ?",
+                               [(rowid,) for rowid, _, _ in victims])
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO free_slots (dim, slot, freed_at) VALUES (?, ?, ?)",
+            [(dim, slot, now) for _, dim, slot in victims],
+        )
+        self.evictions += len(victims)
+
+    # ── Management ──
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total_bytes = sum(p.stat().st_size for p in self.store_dir.glob(f"vectors_*.{self._suffix}"))
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "total_bytes": total_bytes,
+            "dtype": self.dtype,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._maps.clear()
+            self._conn.close()
+
+
+def open_embedding_store(store_dir: str, dtype: str = "float32",
+                         max_entries: int = DEFAULT_MAX_ENTRIES) -> Optional[EmbeddingStore]:
+    """Store for a build (None when max_entries is 0 = disabled)."""
+    if max_entries <= 0:
+        return None
+    return EmbeddingStore(store_dir, dtype, max_entries)
@@ -1,16 +1,35 @@
 """Embedding API client with TF-IDF fallback for hybrid similarity matching."""
 
 import hashlib
+import importlib.util
 import logging
 import math
+import random
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from typing import Optional
 
 import httpx
+import numpy as np
+
+from . import similarity as sim
+from .ann_index import DEFAULT_THRESHOLD as ANN_DEFAULT_THRESHOLD, AnnIndex
+from .cassette import Cassette, pack_vectors, request_key, unpack_vectors
+from .embedding_store import EmbeddingStore
+from .rate_limiter import retry_after_seconds
+from .sparse_tfidf import SparseRows, TfidfModel, hashed_terms
+from .tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
+DEFAULT_BATCH_TOKENS = 50_000       # provider limit is 300k tokens per request
+MAX_BATCH_INPUTS = 2048             # provider limit on inputs per request
+
 
 @dataclass
 class EmbeddingResult:
@@ -40,14 +59,37 @@ class EmbeddingClient:
         model: str = "text-embedding-3-small",
         base_url: str = "https://api.openai.com/v1",
         cache_enabled: bool = True,
+        cassette: Optional[Cassette] = None,
+        store: Optional[EmbeddingStore] = None,
+        tfidf_incremental: bool = False,
+        max_concurrency: int = 4,
+        batch_tokens: int = DEFAULT_BATCH_TOKENS,
     ) -> None:
         self._api_key = api_key
         self._model = model
         self._base_url = base_url.rstrip("/")
         self._cache_enabled = cache_enabled
-        self._api_available = bool(api_key)
+        self._max_concurrency = max(1, max_concurrency)
+        self._batch_tokens = max(1, batch_tokens)
+        self._http: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
+        self._retries = 0
+        # Record/replay: a replayed build uses the API path only if the
+        # recording had one (otherwise TF-IDF, exactly as recorded)
+        self._cassette = cassette
+        if cassette is not None and cassette.replaying:
+            self._api_available = cassette.has("embed")
+        else:
+            self._api_available = bool(api_key)
+        # Cross-build vector store; off under a cassette, whose recordings
+        # must see the same embedding requests on every run
+        self._store = store if cassette is None else None
         self._cache: dict[str, list[float]] = {}
         self._total_tokens = 0
+        # Incremental TF-IDF: IDF accumulates over every distinct text this
+        # client sees instead of being refitted per similarity call
+        self._tfidf_model = TfidfModel() if tfidf_incremental else None
+        self._tfidf_seen: set[str] = set()
 
     # ── Public API ────────────────────────────────────────────────────────────
 
@@ -58,65 +100,44 @@ class EmbeddingClient:
                 vectors=[], model=self._model, tokens_used=0,
                 from_cache=False, fallback_used=False,
             )
-
-        keys = [self._cache_key(t) for t in texts]
-
-        # Collect cached
-        result_map: dict[str, list[float]] = {}
-        uncached_indices: list[int] = []
-        for i, key in enumerate(keys):
-            if self._cache_enabled and key in self._cache:
-                result_map[key] = self._cache[key]
-            else:
-                uncached_indices.append(i)
-
-        # Cache only applies when API is available (TF-IDF vectors are corpus-dependent)
-        all_from_cache = not uncached_indices and self._api_available
-        fallback_used = False
-        tokens_used = 0
-
-        if uncached_indices:
-            uncached_texts = [texts[i] for i in uncached_indices]
-            if self._api_available:
-                try:
-                    vecs, tokens_used = self._api_embed(uncached_texts)
-                    fallback_used = False
-                    # Only cache API vectors (corpus-independent)
-                    for idx, vec in zip(uncached_indices, vecs):
-                        key = keys[idx]
-                        result_map[key] = vec
-                        if self._cache_enabled:
-                            self._cache[key] = vec
-                except Exception as exc:
-                    logger.warning("Embedding API failed (%s), using TF-IDF fallback", exc)
-                    vecs = self._tfidf_fallback(uncached_texts)
-                    fallback_used = True
-                    # Do NOT cache TF-IDF vectors — corpus-dependent
-                    for idx, vec in zip(uncached_indices, vecs):
-                        result_map[keys[idx]] = vec
-            else:
-                vecs = self._tfidf_fallback(uncached_texts)
-                fallback_used = True
-                # Do NOT cache TF-IDF vectors — corpus-dependent
-                for idx, vec in zip(uncached_indices, vecs):
-                    result_map[keys[idx]] = vec
-
-        self._total_tokens += tokens_used
-        vectors = [result_map[k] for k in keys]
+        embedded = self._api_vectors(texts)
+        if embedded is None:
+            # Do NOT cache TF-IDF vectors — corpus-dependent
+            return EmbeddingResult(
+                vectors=self._tfidf_fallback(texts), model="tfidf-fallback",
+                tokens_used=0, from_cache=False, fallback_used=True,
+            )
+        vectors, tokens_used, from_cache = embedded
         return EmbeddingResult(
-            vectors=vectors,
-            model=self._model if not fallback_used else "tfidf-fallback",
-            tokens_used=tokens_used,
-            from_cache=all_from_cache,
-            fallback_used=fallback_used,
+            vectors=vectors, model=self._model, tokens_used=tokens_used,
+            from_cache=from_cache, fallback_used=False,
         )
 
+    def fit_tfidf(self, texts: list[str]) -> None:
+        """Seed the incremental TF-IDF statistics with the build corpus."""
+        if self._tfidf_model is not None:
+            self._tfidf_terms(texts)
+
     def similarity(self, text_a: str, text_b: str) -> float:
         """Embed both texts, return cosine similarity."""
-        result = self.embed_texts([text_a, text_b])
-        if len(result.vectors) < 2:
-            return 0.0
-        return _cosine_similarity(result.vectors[0], result.vectors[1])
+        return float(self.similarity_array([text_a], [text_b])[0, 0])
+
+    def embed_matrix(self, texts: list[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dim) float32 matrix of unit rows."""
+        return sim.unit_matrix(self.embed_texts(texts).vectors)
+
+    def _embed_pair(self, queries: list[str], corpus: list[str]):
+        # One embed call so TF-IDF fallback shares IDF statistics across both sides
+        rows = self._embed_rows(queries + corpus)
+        return rows[: len(queries)], rows[len(queries):]
+
+    def similarity_array(
+        self, queries: list[str], corpus: list[str]
+    ) -> np.ndarray:
+        """Pairwise cosine matrix[query][corpus] as a float32 array."""
+        if not queries or not corpus:
+            return np.zeros((len(queries), len(corpus)), dtype=np.float32)
+        return sim.cosine_matrix(*self._embed_pair(queries, corpus))
 
     def similarity_matrix(
         self, queries: list[str], corpus: list[str]
@@ -124,21 +145,57 @@ class EmbeddingClient:
         """Embed all texts once, return pairwise cosine matrix[query][corpus]."""
         if not queries or not corpus:
             return []
-        all_texts = queries + corpus
-        result = self.embed_texts(all_texts)
-        q_vecs = result.vectors[: len(queries)]
-        c_vecs = result.vectors[len(queries):]
-        return [
-            [_cosine_similarity(qv, cv) for cv in c_vecs]
-            for qv in q_vecs
-        ]
+        return self.similarity_array(queries, corpus).tolist()
+
+    def similar_pairs(
+        self, queries: list[str], corpus: Optional[list[str]] = None,
+        threshold: float = 0.0,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(query_idx, corpus_idx, scores) for pairs scoring >= threshold.
+
+        Without a corpus, queries are compared with each other (i < j only).
+        Large sets go through an LSH index (see ann_index.py).
+        """
+        index = AnnIndex(threshold=threshold)
+        if corpus is None:
+            index.add(self._embed_rows(queries))
+            return index.range_query()
+        if not queries or not corpus:
+            return sim.pairs_above(np.zeros((0, 0), dtype=np.float32))
+        query_rows, corpus_rows = self._embed_pair(queries, corpus)
+        index.add(corpus_rows)
+        return index.range_query(query_rows)
+
+    def top_matches(
+        self, queries: list[str], corpus: list[str], k: int = 1,
+        threshold: float = 0.0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, scores) of each query's k best corpus matches (-1 = none).
+
+        On large sets matches under max(threshold, 0.5) are approximate.
+        """
+        if not queries or not corpus:
+            return sim.top_k(np.zeros((len(queries), 0), dtype=np.float32),
+                             np.zeros((0, 0), dtype=np.float32), k)
+        query_rows, corpus_rows = self._embed_pair(queries, corpus)
+        index = AnnIndex(threshold=max(threshold, ANN_DEFAULT_THRESHOLD))
+        index.add(corpus_rows)
+        indices, scores = index.query_topk(query_rows, k)
+        below = scores < threshold
+        indices[below] = -1
+        scores[below] = 0.0
+        return indices, scores
 
     def get_stats(self) -> dict:
-        return {
+        stats = {
             "tokens_used": self._total_tokens,
             "cache_size": len(self._cache),
             "api_available": self._api_available,
+            "retries": self._retries,
         }
+        if self._store is not None:
+            stats["store"] = self._store.stats()
+        return stats
 
     # ── Private helpers ───────────────────────────────────────────────────────
 
@@ -146,97 +203,205 @@ class EmbeddingClient:
     def _cache_key(text: str) -> str:
         return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
 
+    def _api_vectors(
+        self, texts: list[str]
+    ) -> Optional[tuple[list[list[float]], int, bool]]:
+        """(vectors, tokens, all_from_cache) via cache → store → API; None = use TF-IDF."""
+        if not self._api_available:
+            return None
+        keys = [self._cache_key(t) for t in texts]
+
+        # Collect cached
+        result_map: dict[str, list[float]] = {}
+        uncached_indices: list[int] = []
+        for i, key in enumerate(keys):
+            if self._cache_enabled and key in self._cache:
+                result_map[key] = self._cache[key]
+            else:
+                uncached_indices.append(i)
+
+        if uncached_indices and self._store is not None:
+            uncached_indices = self._store_lookup(texts, keys, uncached_indices, result_map)
+        all_from_cache = not uncached_indices
+        tokens_used = 0
+
+        if uncached_indices:
+            uncached_texts = [texts[i] for i in uncached_indices]
+            try:
+                vecs, tokens_used = self._api_embed(uncached_texts)
+            except Exception as exc:
+                # Whole batch falls back, not just the misses: cached/stored
+                # API vectors cannot be mixed with TF-IDF vectors
+                logger.warning("Embedding API failed (%s), using TF-IDF fallback", exc)
+                return None
+            # Only cache API vectors (corpus-independent)
+            for idx, vec in zip(uncached_indices, vecs):
+                key = keys[idx]
+                result_map[key] = vec
+                if self._cache_enabled:
+                    self._cache[key] = vec
+            self._store_save(uncached_texts, vecs)
+
+        self._total_tokens += tokens_used
+        return [result_map[k] for k in keys], tokens_used, all_from_cache
+
+    def _embed_rows(self, texts: list[str]):
+        """Unit rows: dense float32 API matrix, or sparse TF-IDF rows on fallback."""
+        embedded = self._api_vectors(texts)
+        if embedded is None:
+            return self._tfidf_rows(texts)
+        return sim.unit_matrix(embedded[0])
+
+    def _store_lookup(
+        self, texts: list[str], keys: list[str], indices: list[int],
+        result_map: dict[str, list[float]],
+    ) -> list[int]:
+        """Fill result_map from the persistent store; returns indices still missing."""
+        try:
+            stored = self._store.get_many(self._model, [texts[i] for i in indices])
+        except Exception as exc:
+            logger.warning("Embedding store lookup failed (%s), embedding via API", exc)
+            return indices
+        missing = []
+        for pos, idx in enumerate(indices):
+            if pos not in stored:
+                missing.append(idx)
+                continue
+            vec = stored[pos].tolist()
+            result_map[keys[idx]] = vec
+            if self._cache_enabled:
+                self._cache[keys[idx]] = vec
+        return missing
+
+    def _store_save(self, texts: list[str], vectors: list[list[float]]) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.put_many(self._model, texts, vectors)
+        except Exception as exc:
+            logger.warning("Embedding store write failed (%s)", exc)
+
     def _api_embed(self, texts: list[str]) -> tuple[list[list[float]], int]:
-        """Call OpenAI-compatible embedding endpoint. Batches up to 100 texts."""
+        """Call the OpenAI-compatible embedding endpoint, batches in parallel."""
+        batches = self._plan_batches(texts)
+        if len(batches) == 1:
+            return self._call_api_with_retry(batches[0])
         all_vectors: list[list[float]] = []
         total_tokens = 0
-        batch_size = 100
-
-        for start in range(0, len(texts), batch_size):
-            batch = texts[start : start + batch_size]
-            vecs, tokens = self._call_api_with_retry(batch)
-            all_vectors.extend(vecs)
-            total_tokens += tokens
-
+        workers = min(self._max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            # map() keeps batch order; the first failed batch raises here
+            for vecs, tokens in pool.map(self._call_api_with_retry, batches):
+                all_vectors.extend(vecs)
+                total_tokens += tokens
         return all_vectors, total_tokens
 
+    def _plan_batches(self, texts: list[str]) -> list[list[str]]:
+        """Consecutive batches of at most batch_tokens tokens / MAX_BATCH_INPUTS texts."""
+        batches: list[list[str]] = []
+        current: list[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if current and (current_tokens + tokens > self._batch_tokens
+                            or len(current) >= MAX_BATCH_INPUTS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _http_client(self) -> httpx.Client:
+        """Long-lived pooled client (HTTP/2 when h2 is installed), shared by threads."""
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    http2=HAS_HTTP2, timeout=60.0,
+                    limits=httpx.Limits(max_connections=self._max_concurrency,
+                                        max_keepalive_connections=self._max_concurrency),
+                    headers={"Authorization": f"Bearer {self._api_key}"},
+                )
+            return self._http
+
+    def close(self) -> None:
+        with self._http_lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
     def _call_api_with_retry(
         self, texts: list[str], retries: int = 2
     ) -> tuple[list[list[float]], int]:
         """POST /embeddings with exponential backoff on failure."""
+        if self._cassette is not None:
+            key = request_key("embed", self._model, *texts)
+            if self._cassette.replaying:
+                recorded = self._cassette.replay("embed", key)
+                return unpack_vectors(recorded["vectors"]), recorded["tokens"]
+            start = time.time()
+            vectors, tokens = self._post_embeddings(texts, retries)
+            self._cassette.record("embed", key, {
+                "vectors": pack_vectors(vectors), "tokens": tokens,
+            }, time.time() - start)
+            return vectors, tokens
+        return self._post_embeddings(texts, retries)
+
+    def _post_embeddings(
+        self, texts: list[str], retries: int
+    ) -> tuple[list[list[float]], int]:
         url = f"{self._base_url}/embeddings"
-        headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "Content-Type": "application/json",
-        }
         body = {"model": self._model, "input": texts}
 
-        last_exc: Exception = RuntimeError("No attempts made")
         for attempt in range(retries + 1):
-            if attempt > 0:
-                time.sleep(2 ** attempt)
             try:
-                with httpx.Client(timeout=60.0) as client:
-                    resp = client.post(url, headers=headers, json=body)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    vectors = [item["embedding"] for item in data["data"]]
-                    tokens = data.get("usage", {}).get("total_tokens", 0)
-                    return vectors, tokens
-            except Exception as exc:
-                last_exc = exc
-                logger.debug("Embedding API attempt %d failed: %s", attempt + 1, exc)
-
-        raise last_exc
+                resp = self._http_client().post(url, json=body)
+                resp.raise_for_status()
+                data = resp.json()
+                vectors = [item["embedding"] for item in data["data"]]
+                tokens = data.get("usage", {}).get("total_tokens", 0)
+                return vectors, tokens
+            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
+                status = exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else 0
+                if (status and status != 429 and status < 500) or attempt == retries:
+                    raise
+                # Honour the provider's retry-after; otherwise back off with jitter
+                delay = retry_after_seconds(exc) or min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+                logger.debug("Embedding API attempt %d failed (%s), retry in %.1fs",
+                             attempt + 1, exc, delay)
+                with self._http_lock:
+                    self._retries += 1
+                time.sleep(delay)
+        raise RuntimeError("No attempts made")
+
+    def _tfidf_terms(self, texts: list[str]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Hashed terms of texts; in incremental mode new texts join the IDF corpus."""
+        terms = [hashed_terms(t) for t in texts]
+        if self._tfidf_model is not None:
+            unseen = {}
+            for text, term in zip(texts, terms):
+                key = self._cache_key(text)
+                if key not in self._tfidf_seen:
+                    unseen[key] = term
+            self._tfidf_seen.update(unseen)
+            self._tfidf_model.partial_fit(unseen.values())
+        return terms
+
+    def _tfidf_rows(self, texts: list[str]) -> SparseRows:
+        """Unit sparse TF-IDF rows; IDF from texts alone unless incremental."""
+        terms = self._tfidf_terms(texts)
+        model = self._tfidf_model
+        if model is None:
+            model = TfidfModel()
+            model.partial_fit(terms)
+        return model.transform(terms).normalized()
 
     def _tfidf_fallback(self, texts: list[str]) -> list[list[float]]:
-        """Compute TF-IDF vectors aligned to shared vocabulary."""
+        """Dense TF-IDF vectors over the features the texts use."""
         if not texts:
             return []
-
-        tokenized = [re.findall(r"\w+", t.lower()) for t in texts]
-
-        # Build vocabulary
-        vocab: dict[str, int] = {}
-        for tokens in tokenized:
-            for tok in tokens:
-                if tok not in vocab:
-                    vocab[tok] = len(vocab)
-
-        if not vocab:
-            return [[0.0] for _ in texts]
-
-        n_docs = len(tokenized)
-        vocab_size = len(vocab)
-
-        # Document frequency per term
-        df: dict[str, int] = {}
-        for tokens in tokenized:
-            for tok in set(tokens):
-                df[tok] = df.get(tok, 0) + 1
-
-        # Check whether any term has df < n_docs (non-trivial IDF)
-        has_idf = any(df[tok] < n_docs for tok in vocab)
-
-        vectors: list[list[float]] = []
-        for tokens in tokenized:
-            vec = [0.0] * vocab_size
-            if not tokens:
-                vectors.append(vec)
-                continue
-            tf: dict[str, float] = {}
-            for tok in tokens:
-                tf[tok] = tf.get(tok, 0) + 1
-            for tok, count in tf.items():
-                if has_idf:
-                    idf = math.log(n_docs / df[tok]) if df[tok] < n_docs else 0.0
-                    vec[vocab[tok]] = (count / len(tokens)) * idf
-                else:
-                    # All terms appear in every document (IDF = 0) — use raw TF
-                    vec[vocab[tok]] = count / len(tokens)
-            vectors.append(vec)
-
-        return vectors
+        return self._tfidf_rows(texts).to_dense_lists()
 
     def _keyword_similarity(self, text_a: str, text_b: str) -> float:
         """Jaccard similarity on keyword sets."""
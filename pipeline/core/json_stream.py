@@ -0,0 +1,206 @@
+"""Incremental JSON item extraction for streamed LLM responses.
+
+Responses from the extract/verify/dedup prompts are one JSON object holding
+a list ("atoms", "results", "groups", ...) or a bare list. The parser is fed
+text as it streams in and hands back each list element as soon as its
+closing bracket arrives, so callers can start work before the response ends
+and know exactly which items survived if the stream is cut off.
+"""
+
+import json
+from typing import Optional
+
+
+class IncrementalJsonParser:
+    """Yield complete elements of the target JSON array from streamed text.
+
+    Target array: the root if it is a list, else the value of items_key in
+    the root object (or its first array-valued key when items_key is None).
+    Text before the first '{' or '[' (prose, ``` fences) is skipped.
+    """
+
+    def __init__(self, items_key: Optional[str] = None):
+        self.items_key = items_key
+        self.text = ""
+        self.complete = False          # root value closed
+        self.items_emitted = 0
+        self.last_item_end = 0         # text offset just past the last emitted item
+        self._pos = 0
+        self._stack: list[str] = []    # open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._root_start = -1
+        self._target_depth = 0         # stack depth of the target array (0 = none yet)
+        self._target_done = False
+        self._item_start = -1
+        # Root-object key tracking (to find items_key)
+        self._key_start = -1
+        self._last_key: Optional[str] = None
+        self._expect_key = False
+
+    @property
+    def root_start(self) -> int:
+        return self._root_start
+
+    def feed(self, chunk: str) -> list:
+        """Add text; return elements completed by it (possibly none)."""
+        if not chunk or self.complete:
+            self.text += chunk or ""
+            return []
+        self.text += chunk
+        items = []
+        text = self.text
+        i = self._pos
+        n = len(text)
+        while i < n and not self.complete:
+            ch = text[i]
+            depth = len(self._stack)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start >= 0:
+                        try:
+                            self._last_key = json.loads(text[self._key_start:i + 1])
+                        except ValueError:
+                            self._last_key = None
+                        self._key_start = -1
+                i += 1
+                continue
+
+            if self._root_start < 0:
+                if ch in "{[":
+                    self._root_start = i
+                else:
+                    i += 1
+                    continue
+
+            in_target = self._target_depth and depth == self._target_depth
+            if in_target and self._item_start < 0 and not ch.isspace() and ch not in ",]":
+                self._item_start = i
+
+            if ch == '"':
+                self._in_string = True
+                if depth == 1 and self._stack[0] == "{" and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+            elif ch in "{[":
+                if ch == "[" and not self._target_done and not self._target_depth:
+                    if self._is_target_array(depth):
+                        self._target_depth = depth + 1
+                self._stack.append(ch)
+                if ch == "{" and depth == 0:
+                    self._expect_key = True
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                new_depth = len(self._stack)
+                if in_target and ch == "]":
+                    # Target array closes — flush a trailing scalar element
+                    self._emit(items, i, scalar=True)
+                    self._target_depth = 0
+                    self._target_done = True
+                elif self._target_depth and new_depth == self._target_depth:
+                    self._emit(items, i + 1)
+                if new_depth == 0:
+                    self.complete = True
+            elif ch == ",":
+                if in_target:
+                    self._emit(items, i, scalar=True)
+                if depth == 1 and self._stack[0] == "{":
+                    self._expect_key = True
+            i += 1
+
+        self._pos = i
+        return items
+
+    def _is_target_array(self, depth: int) -> bool:
+        if depth == 0:
+            return self.items_key is None
+        if depth == 1 and self._stack[0] == "{":
+            return self.items_key is None or self._last_key == self.items_key
+        return False
+
+    def _emit(self, items: list, end: int, scalar: bool = False) -> None:
+        if self._item_start < 0:
+            return
+        segment = self.text[self._item_start:end]
+        if scalar:
+            segment = segment.strip()
+            if not segment:
+                self._item_start = -1
+                return
+        try:
+            items.append(json.loads(segment))
+        except ValueError:
+            pass
+        else:
+            self.items_emitted += 1
+            self.last_item_end = end
+        self._item_start = -1
+
+
+# Provider stop reasons meaning "output cut at max_tokens" (Anthropic / OpenAI)
+TRUNCATED_STOP_REASONS = ("max_tokens", "length")
+
+
+class JsonStream:
+    """Iterable over the complete items of a streamed JSON response.
+
+    Iterating drives the underlying stream. Afterwards (or at any point):
+    - items: every complete item seen so far
+    - truncated: the provider stopped at max_tokens, or the root value
+      never closed — items past last_item_end were lost
+    - result(): drain the stream and parse the whole text (call_json rules)
+    """
+
+    def __init__(self, chunks, parse, items_key: Optional[str] = None,
+                 meta: Optional[dict] = None):
+        self._chunks = iter(chunks)
+        self._parse = parse
+        self._parser = IncrementalJsonParser(items_key)
+        self.meta = meta if meta is not None else {}
+        self.items: list = []
+        self.finished = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            for item in self._parser.feed(chunk):
+                self.items.append(item)
+                yield item
+        self.finished = True
+
+    @property
+    def text(self) -> str:
+        return self._parser.text
+
+    @property
+    def stop_reason(self) -> str:
+        return self.meta.get("stop_reason") or ""
+
+    @property
+    def truncated(self) -> bool:
+        if self.stop_reason in TRUNCATED_STOP_REASONS:
+            return True
+        parser = self._parser
+        return self.finished and parser.root_start >= 0 and not parser.complete
+
+    @property
+    def last_item_end(self) -> int:
+        """Text offset just past the last complete item (continuation point)."""
+        return self._parser.last_item_end
+
+    def result(self):
+        for _ in self:
+            pass
+        return self._parse(self.text)
+
+    def close(self) -> None:
+        """Stop reading early; frees the underlying connection."""
+        close = getattr(self._chunks, "close", None)
+        if close:
+            close()
@@ -1,9 +1,14 @@
 """JSON stdout logger compatible with Next.js build-runner.ts SSE streaming."""
 
 import json
+import threading
 import time
 from typing import Optional
 
+# One lock for all loggers — print() writes text and newline separately,
+# so concurrent phase workers could otherwise interleave JSON lines.
+_EMIT_LOCK = threading.Lock()
+
 
 class PipelineLogger:
     """
@@ -16,6 +21,7 @@ class PipelineLogger:
     - "cost"     → updates cost tracker
     - "conflict" → pauses build for review
     - "package"  → enables download button
+    - "perf"     → LLM latency/throughput summary (shown as a log line)
     """
 
     def __init__(self, build_id: str = ""):
@@ -23,11 +29,12 @@ class PipelineLogger:
         self._start = time.time()
 
     def _emit(self, data: dict) -> None:
-        try:
-            print(json.dumps(data, ensure_ascii=False), flush=True)
-        except UnicodeEncodeError:
-            # Fallback for Windows consoles without UTF-8 support
-            print(json.dumps(data, ensure_ascii=True), flush=True)
+        with _EMIT_LOCK:
+            try:
+                print(json.dumps(data, ensure_ascii=False), flush=True)
+            except UnicodeEncodeError:
+                # Fallback for Windows consoles without UTF-8 support
+                print(json.dumps(data, ensure_ascii=True), flush=True)
 
     # ── Phase events ──
 
@@ -75,6 +82,17 @@ class PipelineLogger:
     def report_cost(self, usd: float, tokens: int) -> None:
         self._emit({"event": "cost", "api_cost_usd": round(usd, 4), "tokens_used": tokens})
 
+    # ── LLM performance ──
+
+    def report_perf(self, summary: dict) -> None:
+        overall = summary.get("overall", {})
+        latency = overall.get("latency_s", {})
+        self._emit({"event": "perf", **summary,
+                     "message": (f"LLM: {overall.get('calls', 0)} calls, "
+                                 f"p50 {latency.get('p50', 0):.1f}s / "
+                                 f"p95 {latency.get('p95', 0):.1f}s, "
+                                 f"cache hit {overall.get('cache_hit_rate', 0):.0%}")})
+
     # ── Quality aggregate ──
 
     def report_quality(self, quality_score: float, atoms_extracted: int,
@@ -0,0 +1,205 @@
+"""MinHash signatures and banded LSH over keyword sets.
+
+A signature keeps, for each of num_perm multiply-shift hashes
+h(x) = (a·x + b mod 2⁶⁴) >> 32 of a token's CRC32, the minimum over the
+set's tokens; two sets agree on one signature row with probability equal
+to their Jaccard similarity J. Rows are cut into b bands of r rows and
+every band is hashed to a bucket, so a pair shares at least one bucket
+with probability 1 - (1 - J^r)^b. lsh_bands() picks (b, r) so pairs at
+the target Jaccard are found with `recall` probability while unrelated
+pairs rarely collide; only colliding pairs need an exact comparison.
+
+P3 scores keyword sets with the overlap coefficient |A∩B| / min(|A|, |B|),
+which is never below Jaccard. overlap_to_jaccard() converts an overlap
+threshold into the Jaccard a pair reaches when the larger set is at most
+size_ratio times the smaller one — pairs with more lopsided sets may be
+missed in LSH mode.
+
+candidate_pairs() joins exactly instead (every pair sharing a keyword)
+when queries × corpus is at most exact_max_pairs, so small builds keep
+the results of the full all-pairs loop.
+"""
+
+import zlib
+
+import numpy as np
+
+DEFAULT_NUM_PERM = 256
+DEFAULT_RECALL = 0.95
+DEFAULT_SIZE_RATIO = 2.0
+EXACT_MAX_PAIRS = 1 << 16          # ~65k pairs: checking them all is still cheap
+_EMPTY = np.uint64(1 << 32)        # signature of an empty set (above any hash)
+_TOKEN_CHUNK = 1 << 14             # tokens hashed per block (× num_perm uint64)
+_BLOCK_CELLS = 1 << 24             # query × index cells per candidate bitmap
+
+
+def lsh_bands(threshold: float, num_perm: int = DEFAULT_NUM_PERM,
+              recall: float = DEFAULT_RECALL) -> tuple[int, int]:
+    """(bands, rows per band): the most selective split of num_perm rows
+    that still finds pairs at Jaccard >= threshold with `recall`."""
+    best = (num_perm, 1)
+    for rows in range(2, num_perm + 1):
+        bands = num_perm // rows
+        if expected_recall(threshold, bands, rows) < recall:
+            break
+        best = (bands, rows)
+    return best
+
+
+def expected_recall(jaccard: float, bands: int, rows: int) -> float:
+    """Probability that a pair at this Jaccard shares a bucket."""
+    return 1.0 - (1.0 - jaccard ** rows) ** bands if jaccard > 0 else 0.0
+
+
+def overlap_to_jaccard(overlap: float, size_ratio: float = DEFAULT_SIZE_RATIO) -> float:
+    """Lowest Jaccard of two sets at this overlap coefficient whose sizes
+    differ by at most size_ratio."""
+    return overlap / (1.0 + size_ratio - overlap)
+
+
+def _token_hashes(sets: list[set[str]]) -> tuple[np.ndarray, np.ndarray]:
+    """(CRC32 of every token, owning set index), grouped by set."""
+    sizes = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+    hashes = np.fromiter(
+        (zlib.crc32(t.encode("utf-8", errors="surrogatepass")) for s in sets for t in s),
+        dtype=np.uint64, count=int(sizes.sum()),
+    )
+    return hashes, np.repeat(np.arange(len(sets)), sizes)
+
+
+class MinHashLSH:
+    def __init__(self, threshold: float, num_perm: int = DEFAULT_NUM_PERM,
+                 recall: float = DEFAULT_RECALL, seed: int = 0):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_bands(threshold, num_perm, recall)
+        self.candidates = 0          # pairs returned by query()
+        rng = np.random.default_rng(seed)
+        info = np.iinfo(np.uint64)
+        self._a = rng.integers(0, info.max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, info.max, size=num_perm, dtype=np.uint64)
+        self._chunks: list[np.ndarray] = []      # band keys of added sets
+        self._empty: list[np.ndarray] = []
+        self._tables = None          # (sorted keys, order, empty mask) once built
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self._chunks)
+
+    def signatures(self, sets: list[set[str]]) -> np.ndarray:
+        """(len(sets), num_perm) MinHash rows; empty sets keep the 2³² sentinel."""
+        sig = np.full((len(sets), self.num_perm), _EMPTY, dtype=np.uint64)
+        hashes, owners = _token_hashes(sets)
+        for start in range(0, len(hashes), _TOKEN_CHUNK):
+            x = hashes[start:start + _TOKEN_CHUNK, None]
+            chunk_owners = owners[start:start + _TOKEN_CHUNK]
+            values = (self._a * x + self._b) >> np.uint64(32)   # wraps mod 2⁶⁴
+            # Minimum per owning set (tokens are grouped by owner)
+            firsts = np.flatnonzero(np.r_[True, chunk_owners[1:] != chunk_owners[:-1]])
+            targets = chunk_owners[firsts]
+            sig[targets] = np.minimum(sig[targets],
+                                      np.minimum.reduceat(values, firsts, axis=0))
+        return sig
+
+    def _band_keys(self, sets: list[set[str]]) -> np.ndarray:
+        """(n, bands) uint64 bucket keys: a polynomial hash of each band's rows."""
+        sig = self.signatures(sets)
+        rows = sig[:, :self.bands * self.rows].reshape(len(sets), self.bands, self.rows)
+        keys = np.zeros((len(sets), self.bands), dtype=np.uint64)
+        for r in range(self.rows):
+            keys = keys * np.uint64(0x9E3779B1) + rows[:, :, r]   # wraps mod 2⁶⁴
+        return keys
+
+    def add(self, sets: list[set[str]]) -> None:
+        """Append keyword sets; query() results index them in insertion order."""
+        if sets:
+            self._chunks.append(self._band_keys(sets))
+            self._empty.append(np.fromiter((not s for s in sets), dtype=bool,
+                                           count=len(sets)))
+            self._tables = None
+
+    def _build(self):
+        if self._tables is None:
+            keys = np.vstack(self._chunks)
+            order = np.argsort(keys, axis=0, kind="stable")
+            self._tables = (np.take_along_axis(keys, order, axis=0), order,
+                            np.concatenate(self._empty))
+        return self._tables
+
+    def query(self, sets: list[set[str]]) -> tuple[np.ndarray, np.ndarray]:
+        """(query_idx, index_idx) of pairs sharing a bucket in any band, row-major.
+
+        Empty sets never match.
+        """
+        n_index = len(self)
+        if not sets or not n_index:
+            return _no_pairs()
+        sorted_keys, order, empty = self._build()
+        keys = self._band_keys(sets)
+        live = np.fromiter((bool(s) for s in sets), dtype=bool, count=len(sets))
+        step = max(1, _BLOCK_CELLS // n_index)
+        out_q, out_c = [], []
+        for start in range(0, len(sets), step):
+            chunk = keys[start:start + step]
+            # Bitmap of (query, row) cells hit by any band — cheaper than unique()
+            hit = np.zeros(len(chunk) * n_index, dtype=bool)
+            for band in range(self.bands):
+                lo = np.searchsorted(sorted_keys[:, band], chunk[:, band], side="left")
+                hi = np.searchsorted(sorted_keys[:, band], chunk[:, band], side="right")
+                counts = np.where(live[start:start + step], hi - lo, 0)
+                total = int(counts.sum())
+                if not total:
+                    continue
+                offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(total)
+                hit[np.repeat(np.arange(len(chunk)), counts) * n_index
+                    + order[offsets, band]] = True
+            qi, ci = np.divmod(np.flatnonzero(hit), n_index)
+            keep = ~empty[ci]
+            out_q.append(qi[keep] + start)
+            out_c.append(ci[keep])
+        qi, ci = np.concatenate(out_q), np.concatenate(out_c)
+        self.candidates += len(qi)
+        return qi, ci
+
+
+def _no_pairs() -> tuple[np.ndarray, np.ndarray]:
+    empty = np.zeros(0, dtype=np.int64)
+    return empty, empty.copy()
+
+
+def shared_token_pairs(queries: list[set[str]], corpus: list[set[str]],
+                       ) -> tuple[np.ndarray, np.ndarray]:
+    """(query_idx, corpus_idx) of every pair sharing at least one token, row-major."""
+    vocab: dict[str, int] = {}
+    corpus_ids = [[vocab.setdefault(t, len(vocab)) for t in s] for s in corpus]
+    query_ids = [[vocab[t] for t in s if t in vocab] for s in queries]
+    # Inverted index: corpus postings sorted by token id
+    tokens = np.fromiter((t for ids in corpus_ids for t in ids), dtype=np.int64)
+    docs = np.repeat(np.arange(len(corpus)), [len(ids) for ids in corpus_ids])
+    order = np.argsort(tokens, kind="stable")
+    tokens, docs = tokens[order], docs[order]
+    q_tokens = np.fromiter((t for ids in query_ids for t in ids), dtype=np.int64)
+    if not len(tokens) or not len(q_tokens):
+        return _no_pairs()
+    q_rows = np.repeat(np.arange(len(queries)), [len(ids) for ids in query_ids])
+    lo = np.searchsorted(tokens, q_tokens, side="left")
+    hi = np.searchsorted(tokens, q_tokens, side="right")
+    counts = hi - lo
+    offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+    codes = np.unique(np.repeat(q_rows, counts) * len(corpus) + docs[offsets])
+    return np.divmod(codes, len(corpus))
+
+
+def candidate_pairs(queries: list[set[str]], corpus: list[set[str]], min_overlap: float,
+                    exact_max_pairs: int = EXACT_MAX_PAIRS,
+                    size_ratio: float = DEFAULT_SIZE_RATIO, **lsh_kwargs,
+                    ) -> tuple[np.ndarray, np.ndarray]:
+    """(query_idx, corpus_idx) pairs worth scoring for overlap >= min_overlap, row-major.
+
+    Small inputs get every pair sharing a keyword (exact); larger ones the
+    MinHash LSH candidates.
+    """
+    if len(queries) * len(corpus) <= exact_max_pairs:
+        return shared_token_pairs(queries, corpus)
+    index = MinHashLSH(overlap_to_jaccard(min_overlap, size_ratio), **lsh_kwargs)
+    index.add(corpus)
+    return index.query(queries)
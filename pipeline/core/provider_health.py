@@ -0,0 +1,157 @@
+"""Rolling provider health: circuit breakers and hedge deadlines.
+
+ClaudeClient can reach two providers (main and light). Each one gets a
+CircuitBreaker over its most recent outcomes:
+- closed: normal routing
+- open: the rolling error rate reached error_rate (or, when max_latency_s
+  is set, p95 latency of successful calls reached it) over at least
+  min_calls outcomes — requests go to the other provider for cooldown_s
+- half_open: after the cooldown a single probe request is let through;
+  its outcome closes the breaker or opens it again
+hedge_delay() is how long a light-model request may run before a duplicate
+goes to the other provider: a percentile of recent successful latencies,
+never below min_delay_s, and None until there are enough samples.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from .telemetry import percentile
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 max_latency_s: float = 0.0, cooldown_s: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_calls = max(1, int(min_calls))
+        self.error_rate = error_rate
+        self.max_latency_s = max_latency_s
+        self.cooldown_s = cooldown_s
+        self.state = CLOSED
+        self.trips = 0
+        self._clock = clock
+        self._outcomes: deque[tuple[bool, float]] = deque(maxlen=max(self.min_calls, window))
+        self._opened_at = 0.0
+        self._probe_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may go to this provider now (claims the probe when half-open)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = self._clock()
+            if self.state == OPEN:
+                if now - self._opened_at < self.cooldown_s:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_at = None
+            # A probe that never reported back (cache hit, preflight error)
+            # frees the slot after another cooldown
+            if self._probe_at is not None and now - self._probe_at < self.cooldown_s:
+                return False
+            self._probe_at = now
+            return True
+
+    def record(self, ok: bool, latency_s: float = 0.0) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_at = None
+                if ok and not self._too_slow([latency_s]):
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open_locked()
+                return
+            self._outcomes.append((ok, latency_s))
+            if self.state == CLOSED and self._unhealthy_locked():
+                self._open_locked()
+
+    def _too_slow(self, latencies: list[float]) -> bool:
+        return bool(self.max_latency_s and latencies
+                    and percentile(latencies, 95) >= self.max_latency_s)
+
+    def _unhealthy_locked(self) -> bool:
+        if len(self._outcomes) < self.min_calls:
+            return False
+        errors = sum(1 for ok, _ in self._outcomes if not ok)
+        if errors / len(self._outcomes) >= self.error_rate:
+            return True
+        return self._too_slow([lat for ok, lat in self._outcomes if ok])
+
+    def _open_locked(self) -> None:
+        self.state = OPEN
+        self.trips += 1
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        latencies = [lat for ok, lat in outcomes if ok]
+        return {
+            "state": self.state,
+            "calls": len(outcomes),
+            "error_rate": round(sum(1 for ok, _ in outcomes if not ok) / len(outcomes), 3)
+            if outcomes else 0.0,
+            "p95_latency_s": round(percentile(latencies, 95), 3),
+            "trips": self.trips,
+        }
+
+
+class ProviderHealth:
+    """Breakers and recent latencies for each named provider ("main", "light")."""
+
+    def __init__(self, hedge_percentile: float = 95.0, hedge_min_delay_s: float = 2.0,
+                 hedge_min_samples: int = 10, latency_window: int = 200,
+                 **breaker_kwargs):
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        self._latency_window = latency_window
+        self._breaker_kwargs = breaker_kwargs
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latencies: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(**self._breaker_kwargs)
+                self._latencies[provider] = deque(maxlen=self._latency_window)
+            return self._breakers[provider]
+
+    def allow(self, provider: str) -> bool:
+        return self.breaker(provider).allow()
+
+    def is_open(self, provider: str) -> bool:
+        return self.breaker(provider).state != CLOSED
+
+    def record(self, provider: str, ok: bool, latency_s: float) -> None:
+        breaker = self.breaker(provider)
+        if ok:
+            with self._lock:
+                self._latencies[provider].append(latency_s)
+        breaker.record(ok, latency_s)
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds before a request on provider gets a hedged duplicate (None = never)."""
+        if self.hedge_percentile <= 0:
+            return None
+        self.breaker(provider)
+        with self._lock:
+            latencies = list(self._latencies[provider])
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay_s, percentile(latencies, self.hedge_percentile))
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(self._breakers)
+        return {name: self.breaker(name).stats() for name in names}
@@ -0,0 +1,195 @@
+"""Cross-process token-bucket rate limiter for LLM providers.
+
+Every build process on the host shares one SQLite file, so the
+requests/minute and tokens/minute budget of a provider key is split
+between concurrent builds instead of each backing off on its own:
+- One bucket row per provider/key, refilled continuously at rpm/60 and
+  tpm/60 per second (capacity = one minute of budget)
+- acquire() blocks until both a request and the estimated tokens fit
+- settle() corrects the token estimate once real usage is known
+- penalize() records a provider retry-after so every process pauses
+- A limit of 0 disables that dimension; retry-after is always honored
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DB_FILENAME = "ratelimit.db"
+MAX_SLEEP_SECONDS = 5.0     # re-check shared state at least this often
+
+
+def bucket_name(base_url: Optional[str], api_key: str) -> str:
+    """Bucket id for a provider/key pair — never stores the raw key."""
+    key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    return f"{(base_url or 'anthropic').rstrip('/')}#{key_hash}"
+
+
+class RateLimiter:
+    def __init__(self, db_dir: str):
+        Path(db_dir).mkdir(parents=True, exist_ok=True)
+        self.db_path = str(Path(db_dir) / DB_FILENAME)
+        self._limits: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=30, check_same_thread=False,
+            isolation_level=None,
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                requests REAL NOT NULL, tokens REAL NOT NULL,
+                updated_at REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)""")
+
+    def configure(self, bucket: str, rpm: int = 0, tpm: int = 0) -> None:
+        """Set this process's view of a bucket's limits (0 = unlimited)."""
+        self._limits[bucket] = (max(0, int(rpm or 0)), max(0, int(tpm or 0)))
+
+    # ── Bucket state ──
+
+    def _load_locked(self, bucket: str, now: float) -> tuple[float, float, float]:
+        """Return (requests, tokens, blocked_until) refilled up to now."""
+        rpm, tpm = self._limits.get(bucket, (0, 0))
+        row = self._conn.execute(
+            "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE name = ?",
+            (bucket,),
+        ).fetchone()
+        if not row:
+            return float(rpm), float(tpm), 0.0
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        requests = min(float(rpm), requests + elapsed * rpm / 60.0)
+        tokens = min(float(tpm), tokens + elapsed * tpm / 60.0)
+        return requests, tokens, blocked_until
+
+    def _store_locked(self, bucket: str, requests: float, tokens: float,
+                      now: float, blocked_until: float) -> None:
+        self._conn.execute(
+            """INSERT INTO buckets (name, requests, tokens, updated_at, blocked_until)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                requests = excluded.requests, tokens = excluded.tokens,
+                updated_at = excluded.updated_at,
+                blocked_until = excluded.blocked_until""",
+            (bucket, requests, tokens, now, blocked_until),
+        )
+
+    def _try_take(self, bucket: str, tokens_needed: int) -> float:
+        """Take one request + tokens_needed if available. Returns 0 or seconds to wait."""
+        rpm, tpm = self._limits.get(bucket, (0, 0))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, blocked_until = self._load_locked(bucket, now)
+                wait = 0.0
+                if blocked_until > now:
+                    wait = blocked_until - now
+                else:
+                    if rpm and requests < 1:
+                        wait = max(wait, (1 - requests) * 60.0 / rpm)
+                    # A request larger than a full minute only needs a full bucket
+                    need = min(tokens_needed, tpm)
+                    if tpm and tokens < need:
+                        wait = max(wait, (need - tokens) * 60.0 / tpm)
+                if wait == 0.0:
+                    if rpm:
+                        requests -= 1
+                    if tpm:
+                        tokens -= tokens_needed
+                self._store_locked(bucket, requests, tokens, now, blocked_until)
+                self._conn.execute("COMMIT")
+                return wait
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self, bucket: str, tokens: int = 0,
+                timeout: Optional[float] = None) -> float:
+        """Block until one request and `tokens` fit the bucket.
+
+        Returns seconds spent waiting. Raises TimeoutError past timeout.
+        """
+        start = time.time()
+        while True:
+            wait = self._try_take(bucket, tokens)
+            if wait <= 0:
+                return time.time() - start
+            if timeout is not None and time.time() - start + wait > timeout:
+                raise TimeoutError(f"Rate limit wait for {bucket} exceeds {timeout}s")
+            # Sleep in slices: another process may release budget or penalize
+            time.sleep(min(wait, MAX_SLEEP_SECONDS))
+
+    def settle(self, bucket: str, estimated: int, actual: int) -> None:
+        """Return (or charge) the difference between estimated and real tokens."""
+        _, tpm = self._limits.get(bucket, (0, 0))
+        if not tpm or estimated == actual:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, blocked_until = self._load_locked(bucket, now)
+                tokens = min(float(tpm), tokens + estimated - actual)
+                self._store_locked(bucket, requests, tokens, now, blocked_until)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def penalize(self, bucket: str, retry_after: float) -> None:
+        """Block the bucket for every process until now + retry_after."""
+        if retry_after <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, blocked_until = self._load_locked(bucket, now)
+                blocked_until = max(blocked_until, now + retry_after)
+                self._store_locked(bucket, requests, tokens, now, blocked_until)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ── Reporting ──
+
+    def utilisation(self, bucket: str) -> dict:
+        """Share of the per-minute budget currently spent (0.0–1.0+)."""
+        rpm, tpm = self._limits.get(bucket, (0, 0))
+        now = time.time()
+        with self._lock:
+            requests, tokens, blocked_until = self._load_locked(bucket, now)
+        return {
+            "rpm_limit": rpm,
+            "tpm_limit": tpm,
+            "rpm_utilisation": round(1 - requests / rpm, 4) if rpm else 0.0,
+            "tpm_utilisation": round(1 - tokens / tpm, 4) if tpm else 0.0,
+            "blocked_for_s": round(max(0.0, blocked_until - now), 2),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def retry_after_seconds(error: Exception) -> float:
+    """Read retry-after(-ms) from an SDK error's HTTP response, 0 if absent."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return 0.0
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return 0.0
@@ -0,0 +1,381 @@
+"""Single-file SQLite cache for LLM responses.
+
+Replaces one-JSON-file-per-call (claude_<key>.json) with one WAL-mode
+database per cache dir:
+- Key: full SHA-256 hex, namespaced per model
+- TTL: entries older than ttl_hours are treated as misses and dropped
+- Size cap: total response bytes kept under max_bytes, evicting least
+  recently used entries down to a low watermark
+- Migration: legacy claude_*.json files are imported once under the
+  "legacy" namespace and promoted to their full key on first hit
+- Leases: a process about to pay for a prompt claims its key so other
+  build processes sharing the cache wait for the answer instead
+
+Safe for several threads and several build processes sharing one file.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+DB_FILENAME = "responses.db"
+LEGACY_NAMESPACE = "legacy"
+LEGACY_KEY_LEN = 16
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+DEFAULT_TTL_HOURS = 720                 # 30 days
+EVICT_LOW_WATERMARK = 0.9               # evict down to 90% of max_bytes
+DEFAULT_LEASE_SECONDS = 600             # covers a call plus its retries
+LEASE_POLL_SECONDS = 0.5
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_hours: float = DEFAULT_TTL_HOURS):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.cache_dir / DB_FILENAME)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours and ttl_hours > 0 else 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=30, check_same_thread=False,
+            isolation_level=None,
+        )
+        self._init_db()
+        self._has_legacy = self._count(LEGACY_NAMESPACE) > 0
+
+    def _init_db(self):
+        with self._lock:
+            conn = self._conn
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                namespace TEXT NOT NULL, key TEXT NOT NULL,
+                response TEXT NOT NULL, size INTEGER NOT NULL,
+                created_at REAL NOT NULL, accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY, value INTEGER NOT NULL)""")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('total_bytes', 0)")
+            # Keep the byte total in step with every row change (any process)
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_size_insert
+                AFTER INSERT ON responses BEGIN
+                UPDATE meta SET value = value + NEW.size WHERE name = 'total_bytes';
+                END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_size_delete
+                AFTER DELETE ON responses BEGIN
+                UPDATE meta SET value = value - OLD.size WHERE name = 'total_bytes';
+                END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_size_update
+                AFTER UPDATE OF size ON responses BEGIN
+                UPDATE meta SET value = value - OLD.size + NEW.size
+                WHERE name = 'total_bytes';
+                END""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+                namespace TEXT NOT NULL, key TEXT NOT NULL,
+                owner TEXT NOT NULL, expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key))""")
+
+    # ── Lookup ──
+
+    def get(self, key: str, namespace: str = "") -> Optional[str]:
+        """Return cached response or None on miss/expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row and self._expired(row[1], now):
+                self._conn.execute(
+                    "DELETE FROM responses WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                )
+                row = None
+            if row:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key),
+                )
+                self.hits += 1
+                return row[0]
+
+        if self._has_legacy:
+            legacy = self._promote_legacy(key, namespace, now)
+            if legacy is not None:
+                with self._lock:
+                    self.hits += 1
+                return legacy
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str, namespace: str = "") -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._upsert_locked(namespace, key, response, size, now, now)
+            self._evict_locked()
+
+    def _upsert_locked(self, namespace: str, key: str, response: str,
+                       size: int, created_at: float, accessed_at: float) -> None:
+        # ON CONFLICT ... DO UPDATE (not OR REPLACE) so the size triggers fire
+        self._conn.execute(
+            """INSERT INTO responses
+            (namespace, key, response, size, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (namespace, key) DO UPDATE SET
+                response = excluded.response, size = excluded.size,
+                created_at = excluded.created_at,
+                accessed_at = excluded.accessed_at""",
+            (namespace, key, response, size, created_at, accessed_at),
+        )
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    # ── Eviction ──
+
+    def _total_bytes_locked(self) -> int:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE name = 'total_bytes'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _evict_locked(self) -> None:
+        """Drop least recently used rows until under the low watermark."""
+        if not self.max_bytes or self._total_bytes_locked() <= self.max_bytes:
+            return
+        excess = self._total_bytes_locked() - int(self.max_bytes * EVICT_LOW_WATERMARK)
+        # Oldest-first running total: delete exactly the prefix covering the excess
+        cur = self._conn.execute(
+            """DELETE FROM responses WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, size,
+                           SUM(size) OVER (ORDER BY accessed_at, rowid) AS running
+                    FROM responses)
+                WHERE running - size < ?)""",
+            (excess,),
+        )
+        self.evictions += max(cur.rowcount, 0)
+
+    def purge_expired(self) -> int:
+        """Delete all entries past TTL. Returns number removed."""
+        if not self.ttl_seconds:
+            return 0
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+            return max(cur.rowcount, 0)
+
+    # ── Legacy migration ──
+
+    def import_legacy_files(self, directory: Optional[str] = None,
+                            remove: bool = True) -> int:
+        """Import claude_<key>.json files into the legacy namespace.
+
+        Legacy keys are the first 16 hex digits of sha256(model + system +
+        user), the same digest as today's full key. The prefix cannot be
+        extended and the files do not record their model, so they cannot
+        be re-keyed or namespaced up front; get() promotes them lazily
+        once a lookup supplies the full key and namespace.
+        Returns the number of files imported.
+        """
+        directory = directory or str(self.cache_dir)
+        if not os.path.isdir(directory):
+            return 0
+        imported = 0
+        rows = []
+        paths = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                if not (name.startswith("claude_") and name.endswith(".json")):
+                    continue
+                key = name[len("claude_"):-len(".json")]
+                try:
+                    with open(entry.path, "r") as f:
+                        response = json.load(f).get("response")
+                    mtime = entry.stat().st_mtime
+                except (OSError, ValueError, AttributeError):
+                    continue
+                if not response:
+                    continue
+                size = len(response.encode("utf-8"))
+                rows.append((LEGACY_NAMESPACE, key, response, size, mtime, mtime))
+                paths.append(entry.path)
+
+        if rows:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany(
+                        """INSERT OR IGNORE INTO responses
+                        (namespace, key, response, size, created_at, accessed_at)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                        rows,
+                    )
+                    self._conn.execute("COMMIT")
+                except sqlite3.Error:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._evict_locked()
+            imported = len(rows)
+            self._has_legacy = True
+            if remove:
+                for p in paths:
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+        return imported
+
+    def _promote_legacy(self, key: str, namespace: str, now: float) -> Optional[str]:
+        legacy_key = key[:LEGACY_KEY_LEN]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE namespace = ? AND key = ?",
+                (LEGACY_NAMESPACE, legacy_key),
+            ).fetchone()
+            if not row:
+                return None
+            self._conn.execute(
+                "DELETE FROM responses WHERE namespace = ? AND key = ?",
+                (LEGACY_NAMESPACE, legacy_key),
+            )
+            if self._expired(row[1], now):
+                return None
+            self._upsert_locked(namespace, key, row[0],
+                                len(row[0].encode("utf-8")), row[1], now)
+            return row[0]
+
+    # ── Cross-process leases ──
+
+    def acquire_lease(self, key: str, namespace: str = "",
+                      ttl: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Claim key for this cache instance. False if another owner holds it.
+
+        Expired leases (owner crashed or hung) are taken over.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT owner, expires_at FROM leases WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                ).fetchone()
+                if row and row[0] != self.owner and row[1] > now:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    """INSERT INTO leases (namespace, key, owner, expires_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, key) DO UPDATE SET
+                        owner = excluded.owner, expires_at = excluded.expires_at""",
+                    (namespace, key, self.owner, now + ttl),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def release_lease(self, key: str, namespace: str = "") -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?",
+                (namespace, key, self.owner),
+            )
+
+    def _lease_held_elsewhere(self, key: str, namespace: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner, expires_at FROM leases WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        return bool(row) and row[0] != self.owner and row[1] > time.time()
+
+    def _peek(self, key: str, namespace: str) -> Optional[str]:
+        """Read without touching hit/miss counters or access time."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def wait_for_response(self, key: str, namespace: str = "",
+                          timeout: float = DEFAULT_LEASE_SECONDS,
+                          poll: float = LEASE_POLL_SECONDS) -> Optional[str]:
+        """Wait while another owner holds the lease on key.
+
+        Returns the response once it lands in the cache, or None when the
+        lease is released without one (owner failed) or timeout passes.
+        """
+        deadline = time.time() + timeout
+        while True:
+            response = self._peek(key, namespace)
+            if response is not None:
+                return response
+            if not self._lease_held_elsewhere(key, namespace):
+                # Owner writes the response before releasing — look once more
+                return self._peek(key, namespace)
+            if time.time() >= deadline:
+                return None
+            time.sleep(poll)
+
+    # ── Management ──
+
+    def _count(self, namespace: Optional[str] = None) -> int:
+        with self._lock:
+            if namespace is None:
+                return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM responses WHERE namespace = ?", (namespace,),
+            ).fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = dict(self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM responses GROUP BY namespace"
+            ).fetchall())
+            total_bytes = self._total_bytes_locked()
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(namespaces.values()),
+                "total_bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+                "namespaces": namespaces,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def clear(self, namespace: Optional[str] = None) -> int:
+        with self._lock:
+            if namespace is None:
+                cur = self._conn.execute("DELETE FROM responses")
+            else:
+                cur = self._conn.execute(
+                    "DELETE FROM responses WHERE namespace = ?", (namespace,),
+                )
+            return max(cur.rowcount, 0)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
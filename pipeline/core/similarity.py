@@ -0,0 +1,127 @@
+"""Vectorised cosine similarity over embedding matrices.
+
+Vectors are held as one contiguous float32 matrix whose rows are L2
+normalised once (zero rows stay zero), so a queries×corpus similarity
+block is a single BLAS matmul. Work is done in row blocks sized to
+BLOCK_ELEMENTS so memory stays bounded however large the corpus is —
+pairs_above() and top_k() never materialise the full matrix and return
+index arrays rather than nested lists.
+
+Every helper also takes the sparse TF-IDF rows of sparse_tfidf.py.
+Scores are clamped to [0, 1] like _cosine_similarity in embeddings.py.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .sparse_tfidf import SparseRows, sparse_blocks
+
+# Scores per block: 4M float32 = 16 MB of temporaries
+BLOCK_ELEMENTS = 1 << 22
+
+
+def unit_matrix(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    """(n, dim) C-contiguous float32 matrix with unit-length rows."""
+    matrix = np.array(vectors, dtype=np.float32, order="C", ndmin=2)
+    if matrix.size == 0:
+        return np.zeros((len(vectors), 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _rows_per_block(n_cols: int, chunk_rows: Optional[int]) -> int:
+    if chunk_rows:
+        return max(1, chunk_rows)
+    return max(1, BLOCK_ELEMENTS // max(1, n_cols))
+
+
+def iter_blocks(queries: np.ndarray, corpus: np.ndarray,
+                chunk_rows: Optional[int] = None):
+    """Yield (first_row, scores) blocks of queries @ corpus.T, clamped to [0, 1].
+
+    Also accepts two SparseRows (TF-IDF fallback) in place of dense matrices.
+    """
+    step = _rows_per_block(len(corpus), chunk_rows)
+    if isinstance(queries, SparseRows):
+        yield from sparse_blocks(queries, corpus, step)
+        return
+    corpus_t = corpus.T
+    for start in range(0, len(queries), step):
+        block = queries[start:start + step] @ corpus_t
+        np.clip(block, 0.0, 1.0, out=block)
+        yield start, block
+
+
+def cosine_matrix(queries: np.ndarray, corpus: np.ndarray,
+                  chunk_rows: Optional[int] = None) -> np.ndarray:
+    """Full (n_queries, n_corpus) similarity matrix of two unit matrices."""
+    out = np.zeros((len(queries), len(corpus)), dtype=np.float32)
+    if not out.size or queries.shape[1] != corpus.shape[1]:
+        return out
+    for start, block in iter_blocks(queries, corpus, chunk_rows):
+        out[start:start + len(block)] = block
+    return out
+
+
+def pairs_above(queries: np.ndarray, corpus: Optional[np.ndarray] = None,
+                threshold: float = 0.0, chunk_rows: Optional[int] = None,
+                ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(rows, cols, scores) of every pair with score >= threshold, row-major.
+
+    With corpus=None the queries are compared with themselves and only
+    pairs with row < col are returned.
+    """
+    self_pairs = corpus is None
+    if self_pairs:
+        corpus = queries
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    scores: list[np.ndarray] = []
+    if len(queries) and len(corpus) and queries.shape[1] == corpus.shape[1]:
+        for start, block in iter_blocks(queries, corpus, chunk_rows):
+            hit = block >= threshold
+            if self_pairs:
+                # Upper triangle only: col > global row index
+                hit &= np.arange(len(corpus)) > np.arange(start, start + len(block))[:, None]
+            r, c = np.nonzero(hit)
+            rows.append(r + start)
+            cols.append(c)
+            scores.append(block[r, c])
+    if not rows:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty.copy(), np.zeros(0, dtype=np.float32)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int = 1,
+          threshold: float = 0.0, chunk_rows: Optional[int] = None,
+          ) -> tuple[np.ndarray, np.ndarray]:
+    """(indices, scores), each (n_queries, k), best match first.
+
+    Slots with no corpus row at or above threshold (or past the corpus
+    size) hold index -1 and score 0.
+    """
+    n = len(queries)
+    indices = np.full((n, k), -1, dtype=np.intp)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if not n or not len(corpus) or k <= 0 or queries.shape[1] != corpus.shape[1]:
+        return indices, scores
+    take = min(k, len(corpus))
+    for start, block in iter_blocks(queries, corpus, chunk_rows):
+        if take < block.shape[1]:
+            # Partition on the negated block, then sort just the top slice
+            part = np.argpartition(-block, take - 1, axis=1)[:, :take]
+            part.sort(axis=1)
+            part_scores = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(-part_scores, axis=1, kind="stable")
+            best = np.take_along_axis(part, order, axis=1)
+        else:
+            best = np.argsort(-block, axis=1, kind="stable")
+        best_scores = np.take_along_axis(block, best, axis=1)
+        keep = best_scores >= threshold
+        rows = slice(start, start + len(block))
+        indices[rows, :take] = np.where(keep, best, -1)
+        scores[rows, :take] = np.where(keep, best_scores, 0.0)
+    return indices, scores
@@ -0,0 +1,179 @@
+"""Sparse hashed TF-IDF: the no-API embedding fallback.
+
+Tokens (\\w+, lower-cased) are hashed into N_FEATURES buckets with CRC32,
+so there is no vocabulary to build and every text becomes a short CSR row
+(indices/values) instead of a dense vocabulary-sized list. Rows are L2
+normalised once; similarity blocks are sparse dot products computed by
+joining query terms against an inverted index of the corpus (numpy only).
+
+Weights match the old dense fallback: tf = count / len(tokens),
+idf = log(n_docs / df), 0 for terms in every document — and raw tf when
+every term is in every document.
+
+TfidfModel keeps document frequencies. Fitted per call it reproduces the
+old behaviour; fitted incrementally (partial_fit) it accumulates IDF over
+every distinct text of a build, so repeated similarity calls reuse one
+set of statistics instead of recomputing them.
+"""
+
+import re
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+N_FEATURES = 1 << 18
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def hashed_terms(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """(feature ids, counts) of a text's tokens, ids sorted."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    ids = np.fromiter(
+        (zlib.crc32(t.encode("utf-8", errors="surrogatepass")) & (N_FEATURES - 1)
+         for t in tokens),
+        dtype=np.int64, count=len(tokens),
+    )
+    features, counts = np.unique(ids, return_counts=True)
+    return features, counts.astype(np.float32)
+
+
+class SparseRows:
+    """CSR matrix (n, N_FEATURES): row i is indices/data[indptr[i]:indptr[i+1]]."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[np.ndarray, np.ndarray]]) -> "SparseRows":
+        rows = list(rows)
+        lengths = [len(idx) for idx, _ in rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if not rows or not indptr[-1]:
+            return cls(indptr, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        indices = np.concatenate([idx for idx, _ in rows])
+        data = np.concatenate([val for _, val in rows]).astype(np.float32)
+        return cls(indptr, indices, data)
+
+    @classmethod
+    def concat(cls, parts: list["SparseRows"]) -> "SparseRows":
+        offsets = np.cumsum([0] + [len(p.indices) for p in parts[:-1]])
+        indptr = np.concatenate([[0]] + [p.indptr[1:] + off for p, off in zip(parts, offsets)])
+        return cls(indptr.astype(np.int64), np.concatenate([p.indices for p in parts]),
+                   np.concatenate([p.data for p in parts]))
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self), N_FEATURES
+
+    def __getitem__(self, rows: slice) -> "SparseRows":
+        start, stop, _ = rows.indices(len(self))
+        lo, hi = self.indptr[start], self.indptr[max(start, stop)]
+        return SparseRows(self.indptr[start:max(start, stop) + 1] - lo,
+                          self.indices[lo:hi], self.data[lo:hi])
+
+    def row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def norms(self) -> np.ndarray:
+        squares = np.bincount(self.row_ids(), weights=self.data.astype(np.float64) ** 2,
+                              minlength=len(self))
+        return np.sqrt(squares)
+
+    def normalized(self) -> "SparseRows":
+        """Unit-length rows (zero rows stay zero), explicit zeros dropped."""
+        norms = self.norms()
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        data = (self.data * scale[self.row_ids()]).astype(np.float32)
+        keep = data != 0
+        if keep.all():
+            return SparseRows(self.indptr, self.indices, data)
+        indptr = np.zeros_like(self.indptr)
+        np.cumsum(np.bincount(self.row_ids()[keep], minlength=len(self)), out=indptr[1:])
+        return SparseRows(indptr, self.indices[keep], data[keep])
+
+    def to_dense_lists(self) -> list[list[float]]:
+        """Dense rows over the features actually used (compact columns)."""
+        features, columns = np.unique(self.indices, return_inverse=True)
+        dense = np.zeros((len(self), max(1, len(features))), dtype=np.float64)
+        dense[self.row_ids(), columns] = self.data
+        return dense.tolist()
+
+
+class TfidfModel:
+    def __init__(self):
+        self.df = np.zeros(N_FEATURES, dtype=np.int64)
+        self.n_docs = 0
+        self._idf: Optional[np.ndarray] = None
+
+    def partial_fit(self, term_rows: Iterable[tuple[np.ndarray, np.ndarray]]) -> None:
+        """Add documents' (feature ids, counts) to the document frequencies."""
+        for features, _ in term_rows:
+            self.df[features] += 1
+            self.n_docs += 1
+            self._idf = None
+
+    def idf(self) -> Optional[np.ndarray]:
+        """Per-feature IDF, or None when every seen term is in every document."""
+        if self._idf is None:
+            seen = self.df > 0
+            if not self.n_docs or not (self.df[seen] < self.n_docs).any():
+                self._idf = np.zeros(0, dtype=np.float32)
+            else:
+                # Unseen features (incremental mode) weigh as the rarest term
+                df = np.maximum(self.df, 1)
+                self._idf = np.where(
+                    df < self.n_docs, np.log(self.n_docs / df), 0.0,
+                ).astype(np.float32)
+        return self._idf if len(self._idf) else None
+
+    def transform(self, term_rows: list[tuple[np.ndarray, np.ndarray]]) -> SparseRows:
+        idf = self.idf()
+        weighted = []
+        for features, counts in term_rows:
+            tf = counts / counts.sum() if len(counts) else counts
+            weighted.append((features, tf * idf[features] if idf is not None else tf))
+        return SparseRows.from_rows(weighted)
+
+
+def sparse_blocks(queries: SparseRows, corpus: SparseRows, rows_per_block: int):
+    """Yield (first_row, dense scores) blocks of queries · corpusᵀ, clamped to [0, 1]."""
+    n_corpus = len(corpus)
+    # Inverted index: corpus nonzeros sorted by feature
+    order = np.argsort(corpus.indices, kind="stable")
+    features = corpus.indices[order]
+    docs = corpus.row_ids()[order]
+    values = corpus.data[order]
+    for start in range(0, len(queries), rows_per_block):
+        chunk = queries[start:start + rows_per_block]
+        lo = np.searchsorted(features, chunk.indices, side="left")
+        hi = np.searchsorted(features, chunk.indices, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        block = np.zeros(len(chunk) * n_corpus, dtype=np.float64)
+        if total:
+            # Expand each query term into its posting list
+            offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(total)
+            cells = np.repeat(chunk.row_ids(), counts) * n_corpus + docs[offsets]
+            block += np.bincount(cells, weights=np.repeat(chunk.data, counts) * values[offsets],
+                                 minlength=len(block))
+        block = block.reshape(len(chunk), n_corpus).astype(np.float32)
+        np.clip(block, 0.0, 1.0, out=block)
+        yield start, block
+
+
+def tfidf_rows(texts: list[str], model: Optional[TfidfModel] = None) -> SparseRows:
+    """Unit TF-IDF rows; without a model, IDF comes from texts alone."""
+    terms = [hashed_terms(t) for t in texts]
+    if model is None:
+        model = TfidfModel()
+        model.partial_fit(terms)
+    return model.transform(terms).normalized()
@@ -0,0 +1,129 @@
+"""Per-call LLM telemetry: latency percentiles, throughput, cache hits.
+
+ClaudeClient records one CallRecord per API attempt, cache hit and batch
+item. summary() aggregates them per phase and per model — p50/p95/p99
+latency, time to first token, queue wait, output tokens/sec, cache hit
+rate, retries and errors — which is what shows which phase to
+parallelise or move to the light model. write() dumps summary and raw
+records to llm_telemetry.json.
+"""
+
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .utils import write_json
+
+TELEMETRY_FILENAME = "llm_telemetry.json"
+
+
+@dataclass
+class CallRecord:
+    phase: str
+    model: str
+    prompt_hash: str
+    kind: str = "call"              # call | stream | continuation | batch
+    cache_hit: bool = False
+    queue_wait_s: float = 0.0       # rate limiter + in-flight slot
+    ttfb_s: Optional[float] = None  # streaming only
+    latency_s: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    retries: int = 0
+    error: str = ""                 # exception class name
+    key: str = ""                   # pooled API key label ("main#2")
+    at: float = field(default_factory=time.time)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for no values)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))   # ceil
+    return ordered[int(rank) - 1]
+
+
+def _aggregate(records: list[CallRecord]) -> dict:
+    api = [r for r in records if not r.cache_hit and not r.error]
+    hits = sum(1 for r in records if r.cache_hit)
+    latencies = [r.latency_s for r in api]
+    ttfbs = [r.ttfb_s for r in api if r.ttfb_s is not None]
+    waits = [r.queue_wait_s for r in api]
+    out_tokens = sum(r.output_tokens for r in api)
+    busy = sum(latencies)
+    lookups = hits + sum(1 for r in records if not r.cache_hit and r.kind != "continuation"
+                         and not r.error)
+    return {
+        "calls": len(api),
+        "cache_hits": hits,
+        "cache_hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "errors": sum(1 for r in records if r.error),
+        "retries": sum(r.retries for r in api),
+        "input_tokens": sum(r.input_tokens for r in api),
+        "output_tokens": out_tokens,
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "ttfb_s": {
+            "p50": round(percentile(ttfbs, 50), 3),
+            "p95": round(percentile(ttfbs, 95), 3),
+        },
+        "queue_wait_s": {
+            "p50": round(percentile(waits, 50), 3),
+            "p95": round(percentile(waits, 95), 3),
+        },
+        "output_tokens_per_s": round(out_tokens / busy, 1) if busy else 0.0,
+    }
+
+
+class LlmTelemetry:
+    """Thread-safe collector of CallRecords."""
+
+    def __init__(self):
+        self._records: list[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def record(self, rec: CallRecord) -> None:
+        with self._lock:
+            self._records.append(rec)
+
+    @property
+    def records(self) -> list[CallRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> dict:
+        records = self.records
+        by_phase: dict[str, list] = {}
+        by_model: dict[str, list] = {}
+        by_key: dict[str, list] = {}
+        for r in records:
+            by_phase.setdefault(r.phase, []).append(r)
+            by_model.setdefault(r.model, []).append(r)
+            if r.key:
+                by_key.setdefault(r.key, []).append(r)
+        summary = {
+            "overall": _aggregate(records),
+            "by_phase": {k: _aggregate(v) for k, v in sorted(by_phase.items())},
+            "by_model": {k: _aggregate(v) for k, v in sorted(by_model.items())},
+        }
+        if by_key:
+            summary["by_key"] = {k: _aggregate(v) for k, v in sorted(by_key.items())}
+        return summary
+
+    def write(self, output_dir: str, summary: Optional[dict] = None) -> str:
+        """Write summary + raw records to output_dir/llm_telemetry.json."""
+        path = os.path.join(output_dir, TELEMETRY_FILENAME)
+        write_json({
+            "summary": summary or self.summary(),
+            "calls": [asdict(r) for r in self.records],
+        }, path)
+        return path
@@ -0,0 +1,199 @@
+"""Offline token counting for chunking, batching and request preflight.
+
+The old len(text) // 4 rule holds for English but undercounts Vietnamese
+badly: diacritic letters (ế, ệ, ữ ...) rarely merge into multi-character
+tokens, so real prompts ran 40-60% over their estimate. Two counters:
+- HeuristicTokenCounter (default): per-script character rates, no files
+- TiktokenCounter: exact BPE counts from a local .tiktoken vocabulary
+  (TOKENIZER_VOCAB) — never downloads anything. Needs the optional
+  tiktoken package; without it the heuristic is used (logged once)
+
+Neither is Claude's own tokenizer, so both learn a per-model correction
+from the input token counts the provider reports back (observe()).
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+# (context window, max output tokens). Output 0 = unknown, don't clamp.
+MODEL_LIMITS = {
+    "claude-sonnet-4-5-20250929": (200_000, 64_000),
+    "claude-sonnet-4-20250514": (200_000, 64_000),
+    "claude-haiku-4-5-20251001": (200_000, 64_000),
+    "claude-opus-4-6": (200_000, 32_000),
+    "deepseek-chat": (64_000, 8_192),
+}
+DEFAULT_LIMITS = (200_000, 0)
+
+logger = logging.getLogger(__name__)
+
+
+def model_limits(model: str) -> tuple[int, int]:
+    """(context_window, max_output) for a model; unknown models get DEFAULT_LIMITS."""
+    return MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+
+
+class TokenCounter(ABC):
+    """Base counter: subclasses implement raw_count(); calibration is shared."""
+
+    name = "base"
+    # Prompts shorter than this say more about message overhead than the text
+    MIN_OBSERVED_TOKENS = 200
+    CALIBRATION_WEIGHT = 0.2
+    SCALE_BOUNDS = (0.5, 2.0)
+
+    def __init__(self):
+        self._scales: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def raw_count(self, text: str) -> int:
+        """Uncalibrated token count of non-empty text."""
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        raw = self.raw_count(text)
+        scale = self._scales.get(model, 1.0) if model else 1.0
+        return max(1, math.ceil(raw * scale))
+
+    def chars_per_token(self, text: str, model: Optional[str] = None) -> float:
+        """Average characters per token of text (for char-based splitting)."""
+        tokens = self.count(text, model)
+        return len(text) / tokens if tokens else 4.0
+
+    def observe(self, model: str, estimated: int, actual: int) -> None:
+        """Move model's correction toward actual/estimated (an exponential average)."""
+        if not model or estimated <= 0 or actual < self.MIN_OBSERVED_TOKENS:
+            return
+        low, high = self.SCALE_BOUNDS
+        with self._lock:
+            scale = self._scales.get(model, 1.0)
+            target = scale * actual / estimated
+            scale += self.CALIBRATION_WEIGHT * (target - scale)
+            self._scales[model] = min(high, max(low, scale))
+
+    def scale(self, model: str) -> float:
+        return self._scales.get(model, 1.0)
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """Per-script character rates, fitted on Vietnamese/English transcripts and JSON prompts."""
+
+    name = "heuristic"
+    # Tokens per character by class
+    ASCII_ALNUM = 0.25          # English words, identifiers: ~4 chars/token
+    ASCII_PUNCT = 0.45          # JSON punctuation merges in pairs ('":', '",')
+    WHITESPACE = 0.1            # spaces ride along with the next word
+    LATIN_EXTENDED = 0.9        # Vietnamese diacritic letters: ~1 token each
+    CJK = 1.2
+    OTHER = 0.6
+
+    _RE_ALNUM = re.compile(r"[A-Za-z0-9]")
+    _RE_SPACE = re.compile(r"\s")
+    _RE_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+    _RE_LATIN_EXT = re.compile(r"[\u00c0-\u024f\u0300-\u036f\u1e00-\u1eff]")
+    _RE_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+    def raw_count(self, text: str) -> int:
+        total = len(text)
+        alnum = self._RE_ALNUM.subn("", text)[1]
+        space = self._RE_SPACE.subn("", text)[1]
+        if text.isascii():
+            punct = total - alnum - space
+            return math.ceil(alnum * self.ASCII_ALNUM + punct * self.ASCII_PUNCT
+                             + space * self.WHITESPACE)
+        latin = self._RE_LATIN_EXT.subn("", text)[1]
+        cjk = self._RE_CJK.subn("", text)[1]
+        non_ascii = self._RE_NON_ASCII.subn("", text)[1]
+        punct = total - alnum - space - non_ascii
+        other = non_ascii - latin - cjk
+        return math.ceil(
+            alnum * self.ASCII_ALNUM + punct * self.ASCII_PUNCT
+            + space * self.WHITESPACE + latin * self.LATIN_EXTENDED
+            + cjk * self.CJK + other * self.OTHER
+        )
+
+
+# cl100k_base pre-tokenizer split, used with vocabularies that ship without one
+CL100K_PATTERN = (
+    r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}"""
+    r"""| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+)
+
+
+class TiktokenCounter(TokenCounter):
+    """Exact BPE counts from a local .tiktoken vocabulary file."""
+
+    name = "tiktoken"
+
+    def __init__(self, vocab_path: str, pattern: str = CL100K_PATTERN):
+        super().__init__()
+        import tiktoken
+        from tiktoken.load import load_tiktoken_bpe
+
+        self.vocab_path = vocab_path
+        self._encoding = tiktoken.Encoding(
+            name=os.path.basename(vocab_path),
+            pat_str=pattern,
+            mergeable_ranks=load_tiktoken_bpe(vocab_path),
+            special_tokens={},
+        )
+
+    def raw_count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+
+_default_counter: Optional[TokenCounter] = None
+_default_lock = threading.Lock()
+_fallback_logged = False
+
+
+def get_token_counter() -> TokenCounter:
+    """Process-wide counter: TiktokenCounter if TOKENIZER_VOCAB loads, else heuristic."""
+    global _default_counter
+    if _default_counter is None:
+        with _default_lock:
+            if _default_counter is None:
+                _default_counter = _build_default_counter()
+    return _default_counter
+
+
+def set_token_counter(counter: Optional[TokenCounter]) -> None:
+    """Replace the process-wide counter (None = rebuild from env on next use)."""
+    global _default_counter
+    with _default_lock:
+        _default_counter = counter
+
+
+def _build_default_counter() -> TokenCounter:
+    vocab = os.environ.get("TOKENIZER_VOCAB", "")
+    if not vocab:
+        return HeuristicTokenCounter()
+    if not os.path.isfile(vocab):
+        reason = f"vocabulary {vocab} not found"
+    else:
+        try:
+            return TiktokenCounter(vocab)
+        except ImportError:
+            reason = "tiktoken is not installed (pip install tiktoken)"
+        except Exception as exc:  # unreadable or malformed vocab
+            reason = f"vocabulary {vocab} unreadable ({exc})"
+    _log_fallback(reason)
+    return HeuristicTokenCounter()
+
+
+def _log_fallback(reason: str) -> None:
+    global _fallback_logged
+    if not _fallback_logged:
+        _fallback_logged = True
+        logger.warning("TOKENIZER_VOCAB ignored: %s; using heuristic token counts", reason)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return get_token_counter().count(text, model)
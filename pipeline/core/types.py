@@ -178,7 +178,42 @@ class BuildConfig:
     claude_model_light: str = "claude-haiku-4-5-20251001"
     claude_base_url_light: str = ""
     claude_api_key_light: str = ""
+    # Extra keys per provider, pooled with the key above (each key gets its
+    # own rate limit bucket; keys out of credit are retired)
+    claude_api_keys: list[str] = field(default_factory=list)
+    claude_api_keys_light: list[str] = field(default_factory=list)
     claude_model_premium: str = ""
+    # Max concurrent in-flight requests per provider (main/premium, light)
+    claude_max_in_flight: int = 4
+    claude_max_in_flight_light: int = 4
+    # Response cache (single SQLite file under seekers_cache_dir/claude)
+    claude_cache_max_mb: int = 1024
+    claude_cache_ttl_hours: int = 720
+    # Provider rate limits shared by all builds on the host (0 = unlimited)
+    claude_rpm: int = 0
+    claude_tpm: int = 0
+    claude_rpm_light: int = 0
+    claude_tpm_light: int = 0
+    # Route call_batch()/call_json_batch() through the provider batch API
+    claude_batch_mode: bool = False
+    # Anthropic prompt caching: cache_control breakpoints on prompt prefixes
+    # long enough for the provider to cache
+    claude_prompt_caching: bool = True
+    # Extra calls to finish a reply cut at max_tokens (0 = repair only)
+    claude_max_continuations: int = 2
+    # Light provider failover: hedge a light request on the main provider
+    # once it runs past this latency percentile (0 = never hedge), and open
+    # a provider's breaker at this rolling error rate / p95 latency (0 = off)
+    claude_hedge_percentile: float = 95.0
+    claude_hedge_min_delay: float = 2.0
+    claude_breaker_error_rate: float = 0.5
+    claude_breaker_latency: float = 0.0
+    claude_breaker_cooldown: float = 60.0
+    # Concurrent P3 dedup group calls (0 = the light provider's in-flight limit)
+    dedup_max_workers: int = 0
+    # Per-skill P3 dedup store under seekers_cache_dir/dedup: rebuilds only
+    # send clusters with new atoms to Claude
+    dedup_store: bool = True
     # Quality
     min_phase_score: float = 70.0
     auto_resolve_threshold: float = 0.8
@@ -199,6 +234,21 @@ class BuildConfig:
     embedding_api_key: str = ""
     embedding_model: str = "text-embedding-3-small"
     embedding_base_url: str = "https://api.openai.com/v1"
+    # Parallel embedding requests and the token budget of each request
+    embedding_max_concurrency: int = 4
+    embedding_batch_tokens: int = 50_000
+    # Cross-build vector store under seekers_cache_dir/embeddings, capped at
+    # this many vectors (0 = off); float16 halves the file
+    embedding_store_max_entries: int = 200_000
+    embedding_store_dtype: str = "float32"
+    # TF-IDF fallback IDF accumulated over the whole build instead of per call
+    embedding_tfidf_incremental: bool = True
+    # Record/replay LLM + embedding traffic ("record" | "replay" | "");
+    # default cassette is <output_dir>/llm_cassette.jsonl. Replay sleeps the
+    # recorded latency times cassette_latency_scale (0 = CPU cost only)
+    cassette_mode: str = ""
+    cassette_path: str = ""
+    cassette_latency_scale: float = 0.0
 
 
 @dataclass
@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import Any
 
 from .text_cleaner import clean_transcript
+from .tokens import count_tokens, get_token_counter
 
 
 def read_transcript(path: str, clean: bool = True) -> str:
@@ -51,9 +52,14 @@ def read_all_transcripts(paths: list[str], clean: bool = True) -> list[dict]:
 
 
 def chunk_text(text: str, max_tokens: int = 6000, overlap: int = 200) -> list[str]:
-    """Split text into chunks respecting paragraph boundaries."""
-    max_chars = max_tokens * 4  # ~4 chars per token for Vietnamese
-    overlap_chars = overlap * 4
+    """Split text into chunks respecting paragraph boundaries.
+
+    Budgets are in tokens; the text's own chars-per-token ratio (lower for
+    Vietnamese than English) converts them to character limits.
+    """
+    chars_per_token = get_token_counter().chars_per_token(text) if text else 4.0
+    max_chars = int(max_tokens * chars_per_token)
+    overlap_chars = int(overlap * chars_per_token)
 
     if len(text) <= max_chars:
         return [text]
@@ -91,8 +97,9 @@ def chunk_text(text: str, max_tokens: int = 6000, overlap: int = 200) -> list[st
     return [c for c in chunks if len(c.strip()) > 50]  # Skip tiny fragments
 
 
-def estimate_tokens(text: str) -> int:
-    return len(text) // 4  # Rough estimate: ~4 chars per token
+def estimate_tokens(text: str, model: str = None) -> int:
+    """Token estimate from the process-wide counter (see core.tokens)."""
+    return count_tokens(text, model)
 
 
 def write_json(data: Any, path: str) -> None:
@@ -2,10 +2,14 @@
 
 import json
 import os
+import time
 import uuid
 from datetime import datetime
 
 from ..core.types import BuildConfig, PipelineState, PHASE_MODEL_MAP
+from ..core.cassette import open_cassette
+from ..core.dedup_store import atom_key, conflict_key
+from ..core.embedding_store import open_embedding_store
 from ..core.embeddings import EmbeddingClient
 from ..core.logger import PipelineLogger
 from ..core.utils import read_json, write_json
@@ -15,7 +19,7 @@ from ..seekers.lookup import SeekersLookup
 from ..phases.p0_baseline import run_p0
 from ..phases.p1_audit import run_p1
 from ..phases.p2_extract import run_p2
-from ..phases.p3_dedup import run_p3
+from ..phases.p3_dedup import run_p3, open_dedup_store
 from ..phases.p4_verify import run_p4
 from ..phases.p5_build import run_p5
 from ..phases.p6_optimize import run_p6
@@ -46,11 +50,23 @@ class PipelineRunner:
         # Ensure output dir
         os.makedirs(config.output_dir, exist_ok=True)
 
+        # Record/replay cassette shared by the Claude and embedding clients
+        self.cassette = open_cassette(
+            config.cassette_mode, config.cassette_path, config.output_dir,
+            config.cassette_latency_scale,
+        )
+        replaying = self.cassette is not None and self.cassette.replaying
+        if self.cassette:
+            self.logger.info(
+                f"Cassette [{self.cassette.mode}]: {self.cassette.path}"
+            )
+        self.phase_timings: dict[str, dict] = {}
+
         # Initialize Claude client (may raise if no API key)
         self.claude = None
-        if config.claude_api_key:
+        if config.claude_api_key or replaying:
             self.claude = ClaudeClient(
-                api_key=config.claude_api_key,
+                api_key=config.claude_api_key or "replay",
                 model=config.claude_model,
                 model_light=config.claude_model_light,
                 base_url=config.claude_base_url or None,
@@ -58,14 +74,45 @@ class PipelineRunner:
                 cache_dir=os.path.join(config.seekers_cache_dir, "claude"),
                 base_url_light=config.claude_base_url_light or None,
                 api_key_light=config.claude_api_key_light or None,
+                api_keys=config.claude_api_keys or None,
+                api_keys_light=config.claude_api_keys_light or None,
                 model_premium=config.claude_model_premium or None,
+                max_in_flight=config.claude_max_in_flight,
+                max_in_flight_light=config.claude_max_in_flight_light,
+                cache_max_bytes=config.claude_cache_max_mb * 1024 * 1024,
+                cache_ttl_hours=config.claude_cache_ttl_hours,
+                rpm=config.claude_rpm,
+                tpm=config.claude_tpm,
+                rpm_light=config.claude_rpm_light or None,
+                tpm_light=config.claude_tpm_light or None,
+                batch_mode=config.claude_batch_mode,
+                prompt_caching=config.claude_prompt_caching,
+                max_continuations=config.claude_max_continuations,
+                hedge_percentile=config.claude_hedge_percentile,
+                hedge_min_delay=config.claude_hedge_min_delay,
+                breaker_error_rate=config.claude_breaker_error_rate,
+                breaker_latency=config.claude_breaker_latency,
+                breaker_cooldown=config.claude_breaker_cooldown,
+                cassette=self.cassette,
             )
 
         # Initialize EmbeddingClient (always created; falls back to TF-IDF if no key)
+        self.embedding_store = None
+        if config.embedding_api_key and not self.cassette:
+            self.embedding_store = open_embedding_store(
+                os.path.join(config.seekers_cache_dir, "embeddings"),
+                dtype=config.embedding_store_dtype,
+                max_entries=config.embedding_store_max_entries,
+            )
         embedding_client = EmbeddingClient(
             api_key=config.embedding_api_key,
             model=config.embedding_model,
             base_url=config.embedding_base_url,
+            cassette=self.cassette,
+            store=self.embedding_store,
+            tfidf_incremental=config.embedding_tfidf_incremental,
+            max_concurrency=config.embedding_max_concurrency,
+            batch_tokens=config.embedding_batch_tokens,
         )
         config.embedding_client = embedding_client  # type: ignore[attr-defined]
 
@@ -81,6 +128,12 @@ class PipelineRunner:
 
         Returns exit code: 0=success, 1=failed, 2=paused (conflicts).
         """
+        try:
+            return self._run()
+        finally:
+            self._report_build_stats()
+
+    def _run(self) -> int:
         self.logger.info(f"Pipeline bắt đầu: {self.config.name} (build {self.build_id})")
         self.logger.info(f"Domain: {self.config.domain}, Tier: {self.config.quality_tier}")
         self.logger.debug(f"Thư mục output: {self.config.output_dir}")
@@ -118,6 +171,7 @@ class PipelineRunner:
                     return 1
 
                 # Run phase
+                wall, cpu = time.time(), time.process_time()
                 result = phase_func(
                     self.config,
                     self.claude,
@@ -125,6 +179,7 @@ class PipelineRunner:
                     self.lookup,
                     self.logger,
                 )
+                self._record_phase_timing(phase_id, phase_name, wall, cpu)
 
                 # Update state and checkpoint
                 update_state_with_result(state, result)
@@ -181,6 +236,12 @@ class PipelineRunner:
 
         Applies resolutions to atoms_deduplicated.json, then runs P4→P5.
         """
+        try:
+            return self._resume_after_resolve(resolutions)
+        finally:
+            self._report_build_stats()
+
+    def _resume_after_resolve(self, resolutions: dict) -> int:
         self.logger.info("Tiếp tục pipeline sau khi giải quyết xung đột")
 
         state = load_checkpoint(self.config.output_dir)
@@ -190,6 +251,7 @@ class PipelineRunner:
 
         # Apply resolutions to deduplicated atoms
         _apply_resolutions(self.config.output_dir, resolutions, self.logger)
+        _remember_resolutions(self.config, resolutions, self.logger)
 
         # Clear pause state
         state.is_paused = False
@@ -203,6 +265,7 @@ class PipelineRunner:
                 self.logger.info(f"Bỏ qua {phase_name} (đã hoàn thành)")
                 continue
 
+            wall, cpu = time.time(), time.process_time()
             result = phase_func(
                 self.config,
                 self.claude,
@@ -210,6 +273,7 @@ class PipelineRunner:
                 self.lookup,
                 self.logger,
             )
+            self._record_phase_timing(phase_id, phase_name, wall, cpu)
 
             update_state_with_result(state, result)
             save_checkpoint(state, self.config.output_dir)
@@ -239,6 +303,98 @@ class PipelineRunner:
         )
         return 0
 
+    def _report_build_stats(self) -> None:
+        """Cache stats and LLM telemetry, reported however the run ended
+        (done, paused, failed or raised) — failed builds need them most.
+        The cassette is closed last, even if reporting fails."""
+        try:
+            self._log_cache_stats()
+            self._report_telemetry()
+        except Exception as e:
+            self.logger.warn(f"Không báo cáo được thống kê build: {e}")
+        finally:
+            self._close_cassette()
+
+    def _close_cassette(self) -> None:
+        if not self.cassette:
+            return
+        stats = self.cassette.stats()
+        self.logger.info(
+            f"Cassette [{stats['mode']}]: {stats['recorded']} ghi, "
+            f"{stats['replayed']} phát lại, {stats['misses']} thiếu — {stats['path']}"
+        )
+        self.cassette.close()
+
+    def _log_cache_stats(self) -> None:
+        stats = self.claude.get_cache_stats() if self.claude else {}
+        if stats:
+            self.logger.info(
+                f"Claude cache: {stats['hits']} hit / {stats['misses']} miss "
+                f"({stats['hit_rate']:.0%}), {stats['entries']} entries, "
+                f"{stats['total_bytes'] / 1_048_576:.1f} MB, "
+                f"{stats.get('single_flight_joins', 0)} request trùng được gộp"
+            )
+        if self.embedding_store:
+            store = self.embedding_store.stats()
+            self.logger.info(
+                f"Embedding store: {store['hits']} hit / {store['misses']} miss "
+                f"({store['hit_rate']:.0%}), {store['entries']} vector, "
+                f"{store['total_bytes'] / 1_048_576:.1f} MB"
+            )
+        for name, usage in (self.claude.get_rate_limit_stats() if self.claude else {}).items():
+            if usage["rpm_limit"] or usage["tpm_limit"]:
+                self.logger.info(
+                    f"Rate limit [{name}]: RPM {usage['rpm_utilisation']:.0%} / "
+                    f"{usage['rpm_limit']}, TPM {usage['tpm_utilisation']:.0%} / "
+                    f"{usage['tpm_limit']}"
+                )
+        health = self.claude.get_provider_health() if self.claude else {}
+        if health.get("hedged") or health.get("failovers"):
+            self.logger.info(
+                f"Provider: {health['hedged']} request dự phòng "
+                f"({health['hedge_wins']} nhanh hơn), {health['failovers']} lần chuyển provider"
+            )
+        for name, breaker in health.get("providers", {}).items():
+            if breaker["trips"]:
+                self.logger.warn(
+                    f"Circuit breaker [{name}] đã ngắt {breaker['trips']} lần "
+                    f"(hiện tại: {breaker['state']})"
+                )
+
+    def _record_phase_timing(self, phase_id: str, phase_name: str,
+                             wall_start: float, cpu_start: float) -> None:
+        """Wall and process CPU time of a phase (all threads), kept for telemetry."""
+        wall = time.time() - wall_start
+        cpu = time.process_time() - cpu_start
+        self.phase_timings[phase_id] = {"wall_s": round(wall, 3), "cpu_s": round(cpu, 3)}
+        message = f"{phase_name}: {wall:.2f}s wall, {cpu:.2f}s CPU"
+        if self.cassette and self.cassette.replaying:
+            self.logger.info(message, phase=phase_id)
+        else:
+            self.logger.debug(message, phase=phase_id)
+
+    def _report_telemetry(self) -> None:
+        """Write llm_telemetry.json and emit the per-phase latency summary."""
+        if not self.claude or not hasattr(self.claude, "get_telemetry_summary"):
+            return
+        try:
+            path = self.claude.write_telemetry(self.config.output_dir,
+                                               phases=self.phase_timings)
+        except OSError as e:
+            self.logger.warn(f"Không ghi được telemetry LLM: {e}")
+            return
+        summary = self.claude.get_telemetry_summary()
+        self.logger.report_perf(summary)
+        for phase, stats in summary["by_phase"].items():
+            latency = stats["latency_s"]
+            self.logger.info(
+                f"LLM [{phase}]: {stats['calls']} call, p50 {latency['p50']:.1f}s / "
+                f"p95 {latency['p95']:.1f}s / p99 {latency['p99']:.1f}s, "
+                f"{stats['output_tokens_per_s']:.0f} tok/s, "
+                f"cache hit {stats['cache_hit_rate']:.0%}, {stats['errors']} lỗi"
+            )
+        self.logger.debug(f"Telemetry LLM: {path}")
+
 
 def _apply_resolutions(output_dir: str, resolutions: dict, logger: PipelineLogger) -> None:
     """Apply conflict resolutions to atoms_deduplicated.json."""
@@ -281,6 +437,50 @@ def _apply_resolutions(output_dir: str, resolutions: dict, logger: PipelineLogge
     logger.info(f"Đã áp dụng {len(resolutions)} resolutions → còn lại {len(resolved_atoms)} atoms")
 
 
+def _remember_resolutions(config: BuildConfig, resolutions: dict,
+                          logger: PipelineLogger) -> None:
+    """Keep the user's conflict resolutions in the skill's dedup store, so a
+    rebuild replaying the same P3 decisions does not ask again."""
+    if not config.dedup_store or not resolutions:
+        return
+    try:
+        conflicts = read_json(os.path.join(config.output_dir, "conflicts.json"))
+    except (FileNotFoundError, ValueError):
+        return
+
+    # Conflict atoms are the P3 inputs, so their content keys match a rebuild's
+    atoms = {}
+    for c in conflicts.get("conflicts", []):
+        for atom in (c.get("atom_a"), c.get("atom_b")):
+            if atom and atom.get("content"):
+                atoms.setdefault(atom.get("id"), atom)
+
+    records = {}
+    for resolution in resolutions.values():
+        atom_a = atoms.get(resolution.get("atom_a_id"))
+        atom_b = atoms.get(resolution.get("atom_b_id"))
+        action = resolution.get("action", "keep_a")
+        merged = resolution.get("merged_content") if action == "merge" else None
+        keep = {"keep_a": atom_a, "keep_b": atom_b,
+                "merge": atom_a if merged else None}.get(action)
+        if atom_a is None or atom_b is None or (keep is None and action != "discard"):
+            continue
+        records[conflict_key(atom_a, atom_b)] = {
+            "keep": atom_key(keep) if keep else None,
+            "merged_content": merged,
+        }
+
+    store = open_dedup_store(config) if records else None
+    if store is None:
+        return
+    try:
+        store.save_resolutions(records)
+    except Exception as e:
+        logger.warn(f"Không lưu được resolution vào kho dedup: {e}")
+    finally:
+        store.close()
+
+
 def _emit_final_score(config: BuildConfig, state: PipelineState,
                       logger: PipelineLogger) -> None:
     """Compute final score: Pipeline×0.6 + SmokeTestAvg×0.3 + TriggerTest×0.1
@@ -15,7 +15,8 @@ from ..seekers.cache import SeekersCache
 from ..seekers.lookup import SeekersLookup
 from ..seekers.taxonomy import get_all_categories
 from ..prompts.p2_extract_prompts import (
-    P2_SYSTEM, P2_USER_TEMPLATE, PROMPT_VERSION as P2_PROMPT_VERSION,
+    P2_SYSTEM, P2_USER_PREFIX_TEMPLATE, P2_USER_TEMPLATE,
+    PROMPT_VERSION as P2_PROMPT_VERSION,
     P2_GAP_SYSTEM, P2_GAP_USER_TEMPLATE,
     P2_CODE_SYSTEM, P2_CODE_USER_TEMPLATE,
 )
@@ -65,80 +66,128 @@ def run_p2(config: BuildConfig, claude: ClaudeClient,
         cache_misses = 0
 
         # ── Stream A: Per-file transcript extraction with cache ──
-        total_chunks = 0
-        for t in valid_transcripts:
-            total_chunks += len(chunk_text(t["content"], max_tokens=3000))
-
-        logger.info(f"Tổng số chunks cần xử lý: {total_chunks}", phase=phase_id)
-        processed_chunks = 0
-
+        # Pass 1: resolve cache hits and collect prompts for every uncached
+        # chunk, so all chunks of all files go out as one concurrent batch.
+        # Instructions shared by every chunk call lead the prompt, so the
+        # provider can cache them with the system prompt
+        user_prefix = P2_USER_PREFIX_TEMPLATE.format(
+            language=config.language, domain=config.domain,
+            categories=", ".join(categories),
+        )
+        file_plans = []
+        requests = []
+        request_chunks: list[tuple[str, int, int]] = []   # (file, chunk no, chunks)
         for t in valid_transcripts:
             filename = t["filename"]
             file_path = t.get("path", "")
+            chunks = chunk_text(t["content"], max_tokens=3000)
+            plan = {"filename": filename, "file_path": file_path,
+                    "file_hash": None, "cached": None, "chunks": chunks,
+                    "first_request": len(requests)}
 
             # Per-file cache check (Stream A only)
             if build_cache and file_path:
-                file_hash = BuildCache.file_content_hash(file_path)
-                cached = build_cache.get_atoms(
-                    file_hash=file_hash, model=config.claude_model,
+                plan["file_hash"] = BuildCache.file_content_hash(file_path)
+                plan["cached"] = build_cache.get_atoms(
+                    file_hash=plan["file_hash"], model=config.claude_model,
                     prompt_version=P2_PROMPT_VERSION,
                     tier=config.quality_tier,
                 )
-                if cached:
-                    cache_hits += 1
-                    # Rebuild KnowledgeAtom objects from cached dicts
-                    for raw in cached:
-                        atom_counter += 1
-                        atom = KnowledgeAtom(
-                            id=f"atom_{atom_counter:04d}",
-                            title=raw.get("title", "Untitled"),
-                            content=raw.get("content", ""),
-                            category=raw.get("category", "general"),
-                            tags=raw.get("tags", []),
-                            source_video=raw.get("source_video", filename),
-                            source_timestamp=raw.get("source_timestamp"),
-                            confidence=float(raw.get("confidence", 0.5)),
-                            status="raw",
-                            created_at=raw.get("created_at",
-                                                datetime.now(timezone.utc).isoformat()),
-                            source="transcript",
-                        )
-                        transcript_atoms.append(atom)
-                    # Skip chunks for this file in progress tracking
-                    file_chunks = chunk_text(t["content"], max_tokens=3000)
-                    processed_chunks += len(file_chunks)
-                    logger.info(
-                        f"P2 cache hit: {filename} ({len(cached)} atoms)",
-                        phase=phase_id,
+
+            if not plan["cached"]:
+                for ci, chunk in enumerate(chunks):
+                    user_prompt = P2_USER_TEMPLATE.format(
+                        chunk_index=ci + 1,
+                        total_chunks=len(chunks),
+                        filename=filename,
+                        chunk=chunk,
                     )
-                    continue
+                    requests.append({
+                        "system": P2_SYSTEM, "user": user_prompt,
+                        "cache_prefix": user_prefix,
+                        "max_tokens": 8192, "phase": phase_id,
+                    })
+                    request_chunks.append((filename, ci + 1, len(chunks)))
+            file_plans.append(plan)
+
+        total_chunks = sum(len(p["chunks"]) for p in file_plans)
+        logger.info(f"Tổng số chunks cần xử lý: {total_chunks}", phase=phase_id)
+        if requests:
+            logger.info(
+                f"Gửi {len(requests)} chunks song song "
+                f"(tối đa {claude.max_in_flight} request đồng thời)",
+                phase=phase_id,
+            )
+        # Cached files count as done; the rest advance as each chunk returns
+        processed_chunks = total_chunks - len(requests)
+
+        def _on_chunk_done(index, result):
+            nonlocal processed_chunks
+            processed_chunks += 1
+            logger.phase_progress(
+                phase_id, phase_name,
+                int(processed_chunks / max(total_chunks, 1) * 70),
+            )
+            filename, chunk_no, chunk_count = request_chunks[index]
+            logger.debug(
+                f"Chunk {chunk_no}/{chunk_count} của {filename} xong"
+                f"{' (lỗi)' if isinstance(result, Exception) else ''} "
+                f"({processed_chunks}/{total_chunks})",
+                phase=phase_id,
+            )
 
-            cache_misses += 1
+        # Streamed: an 8k-token atom list keeps its connection busy, and a
+        # max_tokens cut-off continues from the last complete atom
+        responses = claude.call_json_batch(requests, on_result=_on_chunk_done,
+                                           stream=True)
+
+        # Pass 2: assemble atoms in original file/chunk order (stable IDs)
+        for plan in file_plans:
+            filename = plan["filename"]
+            file_path = plan["file_path"]
+            cached = plan["cached"]
+            chunks = plan["chunks"]
+
+            if cached:
+                cache_hits += 1
+                # Rebuild KnowledgeAtom objects from cached dicts
+                for raw in cached:
+                    atom_counter += 1
+                    atom = KnowledgeAtom(
+                        id=f"atom_{atom_counter:04d}",
+                        title=raw.get("title", "Untitled"),
+                        content=raw.get("content", ""),
+                        category=raw.get("category", "general"),
+                        tags=raw.get("tags", []),
+                        source_video=raw.get("source_video", filename),
+                        source_timestamp=raw.get("source_timestamp"),
+                        confidence=float(raw.get("confidence", 0.5)),
+                        status="raw",
+                        created_at=raw.get("created_at",
+                                            datetime.now(timezone.utc).isoformat()),
+                        source="transcript",
+                    )
+                    transcript_atoms.append(atom)
+                logger.info(
+                    f"P2 cache hit: {filename} ({len(cached)} atoms)",
+                    phase=phase_id,
+                )
+                continue
 
-            # Extract atoms from all chunks of this file
-            chunks = chunk_text(t["content"], max_tokens=3000)
+            cache_misses += 1
             file_atoms_raw: list[dict] = []
 
-            for ci, chunk in enumerate(chunks):
-                progress = int((processed_chunks / max(total_chunks, 1)) * 70)
-                logger.phase_progress(phase_id, phase_name, progress)
-
-                user_prompt = P2_USER_TEMPLATE.format(
-                    chunk_index=ci + 1,
-                    total_chunks=len(chunks),
-                    language=config.language,
-                    domain=config.domain,
-                    categories=", ".join(categories),
-                    filename=filename,
-                    chunk=chunk,
-                )
-
-                try:
-                    result = claude.call_json(
-                        system=P2_SYSTEM, user=user_prompt,
-                        max_tokens=8192, phase=phase_id,
+            for ci in range(len(chunks)):
+                result = responses[plan["first_request"] + ci]
+                if isinstance(result, Exception):
+                    logger.warn(
+                        f"Chunk {ci + 1}/{len(chunks)} "
+                        f"của {filename} THẤT BẠI — bỏ qua. Lỗi: {result}",
+                        phase=phase_id,
                     )
+                    continue
 
+                try:
                     raw_atoms = result.get("atoms", [])
                     for raw in raw_atoms:
                         atom_counter += 1
@@ -167,8 +216,6 @@ def run_p2(config: BuildConfig, claude: ClaudeClient,
                         phase=phase_id,
                     )
 
-                except CreditExhaustedError:
-                    raise
                 except Exception as e:
                     logger.warn(
                         f"Chunk {ci + 1}/{len(chunks)} "
@@ -176,12 +223,10 @@ def run_p2(config: BuildConfig, claude: ClaudeClient,
                         phase=phase_id,
                     )
 
-                processed_chunks += 1
-
             # Save file atoms to cache
             if build_cache and file_path and file_atoms_raw:
                 build_cache.save_atoms(
-                    file_hash=file_hash, model=config.claude_model,
+                    file_hash=plan["file_hash"], model=config.claude_model,
                     prompt_version=P2_PROMPT_VERSION,
                     tier=config.quality_tier, atoms=file_atoms_raw,
                 )
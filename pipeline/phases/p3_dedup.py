@@ -9,18 +9,121 @@ from ..core.types import BuildConfig, PhaseResult, Conflict
 from ..core.logger import PipelineLogger
 from ..core.utils import read_json, write_json
 from ..core.errors import PhaseError
+from ..core.batch_planner import BatchPlan, atom_tokens, plan_batches
+from ..core.tokens import count_tokens
+from ..core.minhash import candidate_pairs
+from ..core.dedup_store import DedupStore, atom_key, cluster_key, conflict_key, skill_key
 from ..clients.claude_client import ClaudeClient, CreditExhaustedError
 from ..seekers.cache import SeekersCache
 from ..seekers.lookup import SeekersLookup
-from ..prompts.p3_dedup_prompts import P3_SYSTEM, P3_USER_TEMPLATE
+from ..prompts.p3_dedup_prompts import (
+    P3_SYSTEM, P3_USER_TEMPLATE, PROMPT_VERSION as P3_PROMPT_VERSION,
+)
 
-# Max atoms per single Claude API call to avoid 524 timeout on proxy
-MAX_ATOMS_PER_API_CALL = 30
+# Upper bound on atoms per Claude call; the token budget usually binds first
+MAX_ATOMS_PER_API_CALL = 60
+# Embedding similarity that links two atoms of a category into one dedup cluster
+CLUSTER_SIMILARITY = 0.60
+# Per-atom response overhead (id, merged_from, JSON punctuation)
+_DEDUP_OUTPUT_OVERHEAD = 40
 
 
-def _chunk_list(items: list, chunk_size: int) -> list[list]:
-    """Split list into chunks of at most chunk_size."""
-    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+def _plan_dedup_batches(clusters: list[list[dict]], config: BuildConfig,
+                        claude: ClaudeClient) -> BatchPlan:
+    """Pack atom clusters into dedup calls by token budget (light model).
+
+    A cluster is never split across calls unless it alone overflows one.
+    The response echoes every kept atom in full, so each atom costs about
+    its own size again in output tokens.
+    """
+    model = claude.model_light
+    overhead = count_tokens(P3_SYSTEM, model) + count_tokens(
+        P3_USER_TEMPLATE.format(atom_count=0, language=config.language,
+                                domain=config.domain, atoms_json=""), model)
+    return plan_batches(
+        clusters,
+        input_tokens=lambda c: sum(atom_tokens(a, model) for a in c),
+        output_tokens=lambda c: sum(atom_tokens(a, model) + _DEDUP_OUTPUT_OVERHEAD
+                                    for a in c),
+        model=model, overhead_tokens=overhead,
+        max_items=MAX_ATOMS_PER_API_CALL, item_size=len,
+    )
+
+
+def _cluster_atoms(atoms: list[dict], embedding_client=None,
+                   dup_threshold: float = 0.6, keywords: list[set] = None,
+                   prior: list = None) -> list[list[dict]]:
+    """Single-linkage clusters of one category's atoms, in first-atom order.
+
+    Atoms join when their embedding similarity reaches CLUSTER_SIMILARITY
+    (embedding API available) or their keyword overlap reaches the
+    contradiction threshold (2/3 of dup_threshold), with MinHash LSH
+    candidates on large categories.
+
+    prior gives each atom's cluster key from the dedup store (None = new
+    atom): known atoms keep their previous clusters and only new atoms are
+    compared, with each other and with the known ones.
+    """
+    if len(atoms) < 2:
+        return [[a] for a in atoms]
+    new = [i for i in range(len(atoms)) if prior is None or prior[i] is None]
+    rows = cols = None
+    if not new:
+        rows, cols = [], []
+    elif embedding_client is not None and getattr(embedding_client, "_api_available", False):
+        try:
+            texts = [_build_atom_text(a) for a in atoms]
+            if len(new) == len(atoms):
+                rows, cols, _ = embedding_client.similar_pairs(
+                    texts, threshold=CLUSTER_SIMILARITY,
+                )
+                rows = rows.tolist()
+            else:
+                qi, cols, _ = embedding_client.similar_pairs(
+                    [texts[i] for i in new], texts, threshold=CLUSTER_SIMILARITY,
+                )
+                rows = [new[q] for q in qi.tolist()]
+            cols = cols.tolist()
+        except Exception:
+            rows = cols = None              # keyword linkage below
+    if rows is None:
+        min_overlap = dup_threshold * 2 / 3
+        if keywords is None:
+            keywords = [_extract_keywords(f"{a.get('title', '')} {a.get('content', '')}")
+                        for a in atoms]
+        qi, ci = candidate_pairs([keywords[i] for i in new], keywords,
+                                 min_overlap=min_overlap)
+        is_new = set(new)
+        # New × new pairs come back both ways; score each once
+        linked = [(new[q], j) for q, j in zip(qi.tolist(), ci.tolist())
+                  if (new[q] < j or j not in is_new)
+                  and _keyword_overlap(keywords[new[q]], keywords[j]) >= min_overlap]
+        rows = [i for i, _ in linked]
+        cols = [j for _, j in linked]
+
+    parent = list(range(len(atoms)))
+    if prior is not None:
+        first_of: dict[str, int] = {}
+        for i, key in enumerate(prior):
+            if key is not None:
+                rows.append(first_of.setdefault(key, i))
+                cols.append(i)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(rows, cols):
+        ri, rj = root(i), root(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    clusters: dict[int, list[dict]] = {}
+    for i, atom in enumerate(atoms):
+        clusters.setdefault(root(i), []).append(atom)
+    return list(clusters.values())
 
 
 def _get_adaptive_threshold(base_threshold: float, atom_count: int) -> float:
@@ -50,8 +153,10 @@ def run_p3(config: BuildConfig, claude: ClaudeClient,
            logger: PipelineLogger = None) -> PhaseResult:
     """Deduplicate Knowledge Atoms and detect conflicts.
 
-    Reads atoms_raw.json from P2, groups by category, calls Claude
-    for each group, merges duplicates, and flags conflicts.
+    Reads atoms_raw.json from P2, clusters each category by similarity,
+    calls Claude for the multi-atom clusters only, merges duplicates, and
+    flags conflicts. With the dedup store, clusters already decided by an
+    earlier build of the skill replay that decision instead.
     """
     logger = logger or PipelineLogger()
     phase_id = "p3"
@@ -99,6 +204,9 @@ def run_p3(config: BuildConfig, claude: ClaudeClient,
             phase=phase_id,
         )
         embedding_client = getattr(config, "embedding_client", None)
+        if embedding_client is not None:
+            # TF-IDF fallback: IDF over every atom of the build, fitted once
+            embedding_client.fit_tfidf([_build_atom_text(a) for a in raw_atoms])
         cross_result = _cross_source_dedup(
             raw_atoms, logger,
             dup_threshold=adaptive,
@@ -126,92 +234,157 @@ def run_p3(config: BuildConfig, claude: ClaudeClient,
         all_conflicts = []
         total_duplicates = cross_stats["duplicates_merged"]
 
-        # Split into solo groups (>= MIN_ATOMS_FOR_SOLO) and mini groups
-        MIN_ATOMS_FOR_SOLO = 15
-        solo_groups = {k: v for k, v in groups.items() if len(v) >= MIN_ATOMS_FOR_SOLO}
-        medium_groups = {k: v for k, v in groups.items()
-                         if 3 <= len(v) < MIN_ATOMS_FOR_SOLO}
-        tiny_groups = {k: v for k, v in groups.items() if len(v) <= 2}
+        # Dedup store (graceful — None if disabled or unavailable)
+        store = open_dedup_store(config) if config.dedup_store else None
+        namespace = f"{P3_PROMPT_VERSION}:{claude.model_light}:{config.language}"
+        # Content key of every atom by its id in this build: the ids
+        # themselves are renumbered whenever a transcript is added
+        atom_keys: dict[str, str] = {}
+        store_rows = []
+        new_atoms = 0
+
+        # Pre-cluster each category by similarity: only atoms with a likely
+        # duplicate go to Claude, and near-duplicates always share a call
+        clusters = []
+        singletons = 0
+        for category, atoms in groups.items():
+            keywords = prior = None
+            if store is not None:
+                keys = [atom_key(a) for a in atoms]
+                known = store.known_atoms(keys)
+                keywords = [known[k][0] if k in known else _extract_keywords(
+                    f"{a.get('title', '')} {a.get('content', '')}")
+                    for k, a in zip(keys, atoms)]
+                prior = [known[k][1] if k in known else None for k in keys]
+                new_atoms += prior.count(None)
+                atom_keys.update((a.get("id"), k) for a, k in zip(atoms, keys))
+                keywords_of = {a.get("id"): kw for a, kw in zip(atoms, keywords)}
+            for cluster in _cluster_atoms(atoms, embedding_client, adaptive,
+                                          keywords=keywords, prior=prior):
+                if store is not None:
+                    ckey = cluster_key([atom_keys[a.get("id")] for a in cluster])
+                    store_rows.extend((atom_keys[a.get("id")], category,
+                                       keywords_of[a.get("id")], ckey)
+                                      for a in cluster)
+                if len(cluster) > 1:
+                    clusters.append(cluster)
+                    continue
+                cluster[0]["status"] = "deduplicated"
+                all_unique_atoms.append(cluster[0])
+                singletons += 1
+
+        # Clusters an earlier build already sent to Claude replay its answer
+        replayed = []
+        if store is not None and clusters:
+            ckeys = [cluster_key([atom_keys[a.get("id")] for a in c]) for c in clusters]
+            stored = store.decisions(namespace, ckeys)
+            fresh = []
+            for cluster, ckey in zip(clusters, ckeys):
+                if ckey in stored:
+                    ids = [a.get("id") for a in _canonical_order(cluster, atom_keys)]
+                    replayed.append((cluster, _decode_ids(stored[ckey], ids)))
+                else:
+                    fresh.append(cluster)
+            logger.info(
+                f"Kho dedup: {new_atoms}/{len(raw_atoms)} atoms mới, "
+                f"dùng lại quyết định của {len(replayed)}/{len(clusters)} cụm",
+                phase=phase_id,
+            )
+        else:
+            fresh = clusters
+        logger.info(
+            f"Phân cụm: {len(fresh)} cụm "
+            f"({sum(len(c) for c in fresh)} atoms) gửi Claude, "
+            f"{singletons} atoms đơn lẻ giữ nguyên",
+            phase=phase_id,
+        )
 
-        # Tiny groups — keep as-is, no Claude call needed
-        for category, atoms in tiny_groups.items():
-            for a in atoms:
-                a["status"] = "deduplicated"
-            all_unique_atoms.extend(atoms)
+        # Pass 1: pack whole clusters into dedup calls
+        # (label, atoms, max_tokens, min atoms Claude must keep, clusters;
+        # no clusters for a piece of a split cluster)
+        jobs: list[tuple[str, list, int, int | None, list]] = []
+        plan = _plan_dedup_batches(fresh, config, claude)
+        if len(plan) > 1:
+            logger.info(f"Cụm trùng lặp chia thành {plan.describe()}", phase=phase_id)
+        for bi, (batch, max_tokens) in enumerate(zip(plan.batches, plan.max_tokens)):
+            atoms = [a for cluster in batch for a in cluster]
+            if len(batch) == 1 and len(atoms) > MAX_ATOMS_PER_API_CALL:
+                # One chained cluster larger than a call: split it by atoms
+                sub_plan = _plan_dedup_batches([[a] for a in atoms], config, claude)
+                for si, (sub, sub_tokens) in enumerate(zip(sub_plan.batches,
+                                                           sub_plan.max_tokens)):
+                    jobs.append((f"cluster_batch_{bi+1}_{si+1}",
+                                 [c[0] for c in sub], sub_tokens, None, []))
+                continue
+            # Every cluster keeps at least one atom
+            jobs.append((f"cluster_batch_{bi+1}", atoms, max_tokens, len(batch), batch))
+
+        # Groups are independent: dispatch them concurrently
+        completed = 0
+
+        def _on_group_done(index, _result):
+            nonlocal completed
+            completed += 1
+            logger.phase_progress(phase_id, phase_name, int(completed / len(jobs) * 80))
+            logger.debug(
+                f"Nhóm '{jobs[index][0]}' xong ({completed}/{len(jobs)})",
+                phase=phase_id,
+            )
 
-        # Batch mini groups into one Claude call (sub-batched if large)
-        if medium_groups:
-            mini_total = sum(len(v) for v in medium_groups.values())
+        if len(jobs) > 1:
+            limit = claude.max_in_flight_light
+            if config.dedup_max_workers:
+                limit = min(limit, config.dedup_max_workers)
             logger.info(
-                f"Xử lý batch {len(medium_groups)} nhóm nhỏ ({mini_total} atoms)",
+                f"Gửi {len(jobs)} nhóm song song (tối đa {limit} nhóm đồng thời)",
                 phase=phase_id,
             )
-            combined_atoms = []
-            for cat, atoms in medium_groups.items():
-                for a in atoms:
-                    a["_batch_category"] = cat
-                combined_atoms.extend(atoms)
-
-            if len(combined_atoms) > MAX_ATOMS_PER_API_CALL:
-                batches = _chunk_list(combined_atoms, MAX_ATOMS_PER_API_CALL)
-                batch_sizes = "+".join(str(len(b)) for b in batches)
-                logger.info(
-                    f"Batch tổng hợp ({len(combined_atoms)} atoms) chia thành "
-                    f"{len(batches)} sub-batch: {batch_sizes}",
-                    phase=phase_id,
-                )
-                for bi, batch in enumerate(batches):
-                    all_unique_atoms, all_conflicts, total_duplicates = (
-                        _dedup_group(
-                            f"combined_batch_{bi+1}", batch, raw_atoms,
-                            config, claude, lookup, logger,
-                            all_unique_atoms, all_conflicts, total_duplicates,
-                            phase_id,
-                        )
-                    )
-            else:
-                all_unique_atoms, all_conflicts, total_duplicates = (
-                    _dedup_group(
-                        "combined_batch", combined_atoms, raw_atoms,
-                        config, claude, lookup, logger,
-                        all_unique_atoms, all_conflicts, total_duplicates,
-                        phase_id,
-                    )
-                )
+        responses = claude.call_json_batch(
+            [_dedup_request(atoms, config, max_tokens, phase_id)
+             for _, atoms, max_tokens, _, _ in jobs],
+            max_workers=config.dedup_max_workers or None,
+            on_result=_on_group_done,
+        )
 
-        # Solo groups — each gets its own Claude call (sub-batched if large)
-        total_solo = len(solo_groups)
-        for gi, (category, atoms) in enumerate(solo_groups.items()):
-            progress = int(((gi + 1) / max(total_solo, 1)) * 80)
-            logger.phase_progress(phase_id, phase_name, progress)
-            logger.info(f"Nhóm loại bỏ trùng lặp '{category}': {len(atoms)} atoms", phase=phase_id)
-
-            if len(atoms) > MAX_ATOMS_PER_API_CALL:
-                batches = _chunk_list(atoms, MAX_ATOMS_PER_API_CALL)
-                batch_sizes = "+".join(str(len(b)) for b in batches)
-                logger.info(
-                    f"Nhóm '{category}' ({len(atoms)} atoms) chia thành "
-                    f"{len(batches)} sub-batch: {batch_sizes}",
-                    phase=phase_id,
-                )
-                for bi, batch in enumerate(batches):
-                    all_unique_atoms, all_conflicts, total_duplicates = (
-                        _dedup_group(
-                            f"{category}_batch_{bi+1}", batch, raw_atoms,
-                            config, claude, lookup, logger,
-                            all_unique_atoms, all_conflicts, total_duplicates,
-                            phase_id,
-                        )
-                    )
-            else:
-                all_unique_atoms, all_conflicts, total_duplicates = (
-                    _dedup_group(
-                        category, atoms, raw_atoms,
-                        config, claude, lookup, logger,
-                        all_unique_atoms, all_conflicts, total_duplicates,
-                        phase_id,
-                    )
-                )
+        # Pass 2: merge results in category order (stable conflict IDs)
+        atoms_by_id: dict[str, dict] = {}
+        for atom in raw_atoms:
+            atoms_by_id.setdefault(atom.get("id"), atom)
+        for n, (cluster, result) in enumerate(replayed):
+            all_unique_atoms, all_conflicts, total_duplicates = _dedup_group(
+                f"stored_{n+1}", cluster, result, atoms_by_id,
+                config, lookup, logger,
+                all_unique_atoms, all_conflicts, total_duplicates,
+                phase_id, min_keep=1,
+            )
+        decisions = {}
+        for (label, atoms, _, min_keep, batch), result in zip(jobs, responses):
+            all_unique_atoms, all_conflicts, total_duplicates = _dedup_group(
+                label, atoms, result, atoms_by_id,
+                config, lookup, logger,
+                all_unique_atoms, all_conflicts, total_duplicates,
+                phase_id, min_keep=min_keep,
+            )
+            if store is not None and batch and _keeps_enough(result, atoms, min_keep):
+                for cluster, part in zip(batch, _split_result(result, batch)):
+                    if part["unique_atoms"]:
+                        ids = [a.get("id") for a in _canonical_order(cluster, atom_keys)]
+                        decisions[cluster_key([atom_keys[a.get("id")] for a in cluster])] = (
+                            _encode_ids(part, ids))
+        if store is not None and all_conflicts:
+            reused = _reuse_user_resolutions(store, all_conflicts)
+            if reused:
+                logger.info(f"Kho dedup: {reused} xung đột đã được giải quyết ở build trước",
+                            phase=phase_id)
+        all_unique_atoms = _apply_resolutions(all_unique_atoms, all_conflicts)
+
+        if store is not None:
+            try:
+                store.save(namespace, store_rows, decisions)
+            except Exception as e:
+                logger.warn(f"Không lưu được kho dedup: {e}", phase=phase_id)
+            finally:
+                store.close()
 
         # Separate unresolved conflicts
         unresolved = [c for c in all_conflicts if not c.auto_resolved]
@@ -335,6 +508,10 @@ def run_p3(config: BuildConfig, claude: ClaudeClient,
                 "duplicates_merged": total_duplicates,
                 "conflicts_total": len(all_conflicts),
                 "conflicts_unresolved": len(unresolved),
+                "dedup_clusters": len(clusters),
+                "dedup_singletons": singletons,
+                "dedup_reused": len(replayed),
+                "dedup_new_atoms": new_atoms if store is not None else len(raw_atoms),
                 "is_paused": len(unresolved) > 0,
                 "cross_source_duplicates": cross_stats["duplicates_merged"],
                 "cross_source_contradictions": cross_stats["contradictions_flagged"],
@@ -354,10 +531,8 @@ def run_p3(config: BuildConfig, claude: ClaudeClient,
         )
 
 
-def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
-                  logger, all_unique_atoms, all_conflicts,
-                  total_duplicates, phase_id):
-    """Call Claude to dedup a single group, return updated accumulators."""
+def _dedup_request(atoms, config, max_tokens, phase_id) -> dict:
+    """call_json() arguments for deduping one group."""
     atoms_json = json.dumps(atoms, ensure_ascii=False, indent=1)
     user_prompt = P3_USER_TEMPLATE.format(
         atom_count=len(atoms),
@@ -365,13 +540,25 @@ def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
         domain=config.domain,
         atoms_json=atoms_json,
     )
+    return {
+        "system": P3_SYSTEM, "user": user_prompt,
+        "max_tokens": max_tokens, "phase": phase_id,
+        "use_light_model": True,
+    }
+
 
+def _dedup_group(category, atoms, result, atoms_by_id, config, lookup,
+                  logger, all_unique_atoms, all_conflicts,
+                  total_duplicates, phase_id, min_keep=None):
+    """Apply Claude's dedup result for a single group, return updated accumulators.
+
+    result is the call_json() response, or the exception the call raised.
+    Fewer than min_keep kept atoms (default 30% of the group) is treated
+    as a bad response.
+    """
     try:
-        result = claude.call_json(
-            system=P3_SYSTEM, user=user_prompt,
-            max_tokens=4096, phase=phase_id,
-            use_light_model=True,
-        )
+        if isinstance(result, Exception):
+            raise result
 
         unique_from_claude = result.get("unique_atoms", [])
         conflicts = result.get("conflicts", [])
@@ -379,9 +566,9 @@ def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
 
         total_duplicates += stats.get("duplicates_found", 0)
 
-        # Safeguard: if Claude returned empty or removed >70% of atoms,
+        # Safeguard: if Claude returned empty or removed too many atoms,
         # keep all original atoms rather than losing data
-        if not unique_from_claude or len(unique_from_claude) < len(atoms) * 0.3:
+        if not _keeps_enough(result, atoms, min_keep):
             logger.warn(
                 f"Claude loại bỏ trùng lặp quá mạnh cho '{category}': "
                 f"{len(atoms)}→{len(unique_from_claude)} atoms — giữ tất cả",
@@ -422,8 +609,8 @@ def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
         for c in conflicts:
             conflict = Conflict(
                 id=f"conflict_{len(all_conflicts)+1:03d}",
-                atom_a=_find_atom(raw_atoms, c.get("atom_a_id", "")),
-                atom_b=_find_atom(raw_atoms, c.get("atom_b_id", "")),
+                atom_a=_find_atom(atoms_by_id, c.get("atom_a_id", "")),
+                atom_b=_find_atom(atoms_by_id, c.get("atom_b_id", "")),
                 conflict_type=c.get("conflict_type", "contradictory_data"),
                 description=c.get("description", ""),
             )
@@ -463,18 +650,6 @@ def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
 
             all_conflicts.append(conflict)
 
-        # Apply auto-resolved conflicts — remove rejected atoms
-        for conflict in all_conflicts:
-            if not conflict.auto_resolved:
-                continue
-            reject_id = None
-            if conflict.resolution == "keep_a" and conflict.atom_b:
-                reject_id = conflict.atom_b.get("id")
-            elif conflict.resolution == "keep_b" and conflict.atom_a:
-                reject_id = conflict.atom_a.get("id")
-            if reject_id:
-                all_unique_atoms = [a for a in all_unique_atoms if a.get("id") != reject_id]
-
         logger.debug(
             f"Nhóm '{category}': {len(atoms)}->{len(unique_from_claude)} atoms, "
             f"{len(conflicts)} xung đột",
@@ -495,14 +670,153 @@ def _dedup_group(category, atoms, raw_atoms, config, claude, lookup,
     return all_unique_atoms, all_conflicts, total_duplicates
 
 
-def _find_atom(atoms: list[dict], atom_id: str) -> dict:
-    """Find atom dict by ID, return empty dict if not found."""
-    for a in atoms:
-        if a.get("id") == atom_id:
-            return a
+def _keeps_enough(result, atoms, min_keep=None) -> bool:
+    """Whether a dedup response keeps at least min_keep atoms (default 30%)."""
+    if not isinstance(result, dict):
+        return False
+    unique = result.get("unique_atoms", [])
+    if min_keep is None:
+        min_keep = len(atoms) * 0.3
+    return bool(unique) and len(unique) >= min_keep
+
+
+def _split_result(result: dict, clusters: list[list[dict]]) -> list[dict]:
+    """Cut one call's response into one response per cluster.
+
+    A kept atom goes to the cluster of its id or of the first atom it was
+    merged from, a conflict to the cluster of atom_a (else atom_b); atoms
+    Claude made up, to the first cluster.
+    """
+    owner: dict[str, int] = {}
+    for n, cluster in enumerate(clusters):
+        for atom in cluster:
+            owner.setdefault(atom.get("id"), n)
+    parts = [{"unique_atoms": [], "conflicts": []} for _ in clusters]
+    for atom in result.get("unique_atoms", []):
+        ids = [atom.get("id"), *(atom.get("merged_from") or [])]
+        n = next((owner[i] for i in ids if isinstance(i, str) and i in owner), 0)
+        parts[n]["unique_atoms"].append(atom)
+    for c in result.get("conflicts", []):
+        n = owner.get(c.get("atom_a_id"), owner.get(c.get("atom_b_id"), 0))
+        parts[n]["conflicts"].append(c)
+    for part, cluster in zip(parts, clusters):
+        part["stats"] = {
+            "duplicates_found": max(0, len(cluster) - len(part["unique_atoms"])),
+        }
+    return parts
+
+
+def _canonical_order(cluster: list[dict], atom_keys: dict[str, str]) -> list[dict]:
+    """Cluster atoms sorted by content key — the same order in every build."""
+    return sorted(cluster, key=lambda a: atom_keys[a.get("id")])
+
+
+def _map_ids(result: dict, mapping: dict) -> dict:
+    """Copy of a dedup response with every atom id passed through mapping."""
+    def swap(value):
+        return mapping.get(value, value) if isinstance(value, str) else value
+
+    return {
+        "unique_atoms": [
+            {**atom, "id": swap(atom.get("id")),
+             **({"merged_from": [swap(i) for i in atom["merged_from"]]}
+                if isinstance(atom.get("merged_from"), list) else {})}
+            for atom in result.get("unique_atoms", [])
+        ],
+        "conflicts": [
+            {**c, "atom_a_id": swap(c.get("atom_a_id")),
+             "atom_b_id": swap(c.get("atom_b_id"))}
+            for c in result.get("conflicts", [])
+        ],
+        "stats": dict(result.get("stats", {})),
+    }
+
+
+def _encode_ids(result: dict, ids: list[str]) -> dict:
+    """Replace build-specific atom ids by positions ("@0", "@1", ...) in
+    the cluster's canonical order, for the dedup store."""
+    mapping: dict[str, str] = {}
+    for n, aid in enumerate(ids):
+        mapping.setdefault(aid, f"@{n}")
+    return _map_ids(result, mapping)
+
+
+def _decode_ids(result: dict, ids: list[str]) -> dict:
+    """Inverse of _encode_ids for this build's ids."""
+    return _map_ids(result, {f"@{n}": aid for n, aid in enumerate(ids)})
+
+
+def open_dedup_store(config: BuildConfig) -> DedupStore | None:
+    """Get this skill's DedupStore, or None if unavailable (graceful degradation)."""
+    try:
+        return DedupStore(f"{config.seekers_cache_dir}/dedup",
+                          skill_key(config.name, config.domain))
+    except Exception:
+        return None
+
+
+def _find_atom(atoms_by_id: dict[str, dict], atom_id: str) -> dict:
+    """Find atom dict by ID, return a placeholder if not found."""
+    atom = atoms_by_id.get(atom_id)
+    if atom is not None:
+        return atom
     return {"id": atom_id, "title": "Unknown", "content": ""}
 
 
+def _reuse_user_resolutions(store: DedupStore, conflicts: list[Conflict]) -> int:
+    """Resolve conflicts the user already settled in an earlier build, so a
+    replayed cluster does not pause the pipeline again. Returns the count."""
+    pending = [c for c in conflicts
+               if not c.auto_resolved and c.atom_a.get("content") and c.atom_b.get("content")]
+    if not pending:
+        return 0
+    pairs = [conflict_key(c.atom_a, c.atom_b) for c in pending]
+    stored = store.resolutions(pairs)
+    reused = 0
+    for conflict, pair in zip(pending, pairs):
+        record = stored.get(pair)
+        if record is None:
+            continue
+        keep = record.get("keep")
+        if keep is None:
+            conflict.resolution = "discard"
+        else:
+            conflict.resolution = "keep_a" if keep == atom_key(conflict.atom_a) else "keep_b"
+            kept = conflict.atom_a if conflict.resolution == "keep_a" else conflict.atom_b
+            if record.get("merged_content"):
+                conflict.merged_atom = {**kept, "content": record["merged_content"]}
+        conflict.auto_resolved = True
+        conflict.resolution_note = "Người dùng đã giải quyết xung đột này ở build trước"
+        reused += 1
+    return reused
+
+
+def _apply_resolutions(atoms: list[dict], conflicts: list[Conflict]) -> list[dict]:
+    """Drop every atom rejected by an auto-resolved conflict and apply
+    merged content (one pass)."""
+    rejected = set()
+    merged = {}
+    for conflict in conflicts:
+        if not conflict.auto_resolved:
+            continue
+        a_id = conflict.atom_a.get("id") if conflict.atom_a else None
+        b_id = conflict.atom_b.get("id") if conflict.atom_b else None
+        if conflict.resolution in ("keep_a", "merge"):
+            rejected.add(b_id)
+        elif conflict.resolution == "keep_b":
+            rejected.add(a_id)
+        elif conflict.resolution == "discard":
+            rejected.update((a_id, b_id))
+        if conflict.merged_atom:
+            merged[conflict.merged_atom.get("id")] = conflict.merged_atom.get("content", "")
+    rejected.discard(None)
+    if not rejected and not merged:
+        return atoms
+    return [{**a, "content": merged[a.get("id")], "status": "deduplicated"}
+            if a.get("id") in merged else a
+            for a in atoms if a.get("id") not in rejected]
+
+
 # ── Cross-source dedup helpers ──
 
 STOP_WORDS = frozenset({
@@ -611,7 +925,7 @@ def _embedding_pre_filter(
     b_texts = [_build_atom_text(a) for a in baseline_atoms]
 
     try:
-        matrix = embedding_client.similarity_matrix(t_texts, b_texts)
+        rows, cols, scores = embedding_client.similar_pairs(t_texts, b_texts, threshold=0.60)
     except Exception as exc:
         logger.warn(
             f"Embedding similarity_matrix failed: {exc} — falling back to keyword dedup",
@@ -621,24 +935,18 @@ def _embedding_pre_filter(
 
     auto_merge = []
     uncertain = []
-    skip_count = 0
-
-    for ti, row in enumerate(matrix):
-        for bi, sim in enumerate(row):
-            if sim >= 0.85:
-                auto_merge.append((
-                    transcript_atoms[ti].get("id", ""),
-                    baseline_atoms[bi].get("id", ""),
-                    sim,
-                ))
-            elif sim >= 0.60:
-                uncertain.append((
-                    transcript_atoms[ti].get("id", ""),
-                    baseline_atoms[bi].get("id", ""),
-                    sim,
-                ))
-            else:
-                skip_count += 1
+    skip_count = len(t_texts) * len(b_texts) - len(scores)
+
+    for ti, bi, sim in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+        pair = (
+            transcript_atoms[ti].get("id", ""),
+            baseline_atoms[bi].get("id", ""),
+            sim,
+        )
+        if sim >= 0.85:
+            auto_merge.append(pair)
+        else:
+            uncertain.append(pair)
 
     emb_stats = embedding_client.get_stats()
     logger.info(
@@ -693,6 +1001,9 @@ def _cross_source_dedup(
         text = f"{a.get('title', '')} {a.get('content', '')}"
         kw_map[a.get("id", "")] = _extract_keywords(text)
 
+    transcript_by_id = {a.get("id", ""): a for a in transcript_atoms}
+    baseline_by_id = {a.get("id", ""): a for a in baseline_atoms}
+
     conflicts = []
     merged_ids = set()
     replaced_ids = set()
@@ -705,7 +1016,7 @@ def _cross_source_dedup(
     )
 
     # Track which pairs are covered by embedding results
-    embedding_covered_pairs: set[tuple[str, str]] = set()  # (t_id, b_id)
+    covered_by_transcript: dict[str, set[str]] = {}  # t_id -> {b_id}
 
     if use_embedding:
         pre = _embedding_pre_filter(
@@ -721,8 +1032,8 @@ def _cross_source_dedup(
                     continue
 
                 # Find atom objects for confidence comparison
-                at = next((a for a in transcript_atoms if a.get("id") == t_id), None)
-                ab = next((a for a in baseline_atoms if a.get("id") == b_id), None)
+                at = transcript_by_id.get(t_id)
+                ab = baseline_by_id.get(b_id)
                 if not at or not ab:
                     continue
 
@@ -750,24 +1061,49 @@ def _cross_source_dedup(
                     f"Embedding auto-merge: '{title}' (sim={sim:.2f})",
                     phase=phase_id,
                 )
-                embedding_covered_pairs.add((t_id, b_id))
+                covered_by_transcript.setdefault(t_id, set()).add(b_id)
 
             # Mark uncertain pairs as covered — they go through keyword logic below
             for t_id, b_id, _sim in pre["uncertain"]:
-                embedding_covered_pairs.add((t_id, b_id))
+                covered_by_transcript.setdefault(t_id, set()).add(b_id)
 
-            # Pairs < 0.60 are NOT in embedding_covered_pairs — they are skipped as UNIQUE
+            # Pairs < 0.60 are NOT in covered_by_transcript — they are skipped as UNIQUE
             # (no entry added means they won't be processed by keyword loop)
 
     # ── Keyword-based dedup ────────────────────────────────────────────────
     # When embedding is active: only process uncertain pairs (0.60-0.85)
-    # When embedding is inactive or failed: process all pairs (backward compatible)
-    for at in transcript_atoms:
+    # When embedding is inactive or failed: only pairs that can reach the
+    # contradiction threshold (MinHash LSH candidates; every pair sharing
+    # a keyword on small builds). Candidates keep baseline list order.
+    candidates: dict[int, list[int]] = {}  # transcript index -> baseline indices
+    if use_embedding and pre is not None:
+        baseline_pos = {a.get("id", ""): i for i, a in enumerate(baseline_atoms)}
+        for ti, at in enumerate(transcript_atoms):
+            covered = covered_by_transcript.get(at.get("id", ""))
+            if covered:
+                candidates[ti] = sorted(baseline_pos[b_id] for b_id in covered)
+    else:
+        t_pos, b_pos = candidate_pairs(
+            [kw_map.get(a.get("id", ""), set()) for a in transcript_atoms],
+            [kw_map.get(a.get("id", ""), set()) for a in baseline_atoms],
+            min_overlap=dup_threshold * 2 / 3,  # contradiction threshold
+        )
+        for ti, bi in zip(t_pos.tolist(), b_pos.tolist()):
+            candidates.setdefault(ti, []).append(bi)
+        logger.debug(
+            f"Ứng viên từ khóa: {len(t_pos)}/"
+            f"{len(transcript_atoms) * len(baseline_atoms)} cặp",
+            phase=phase_id,
+        )
+
+    for ti, b_indices in candidates.items():
+        at = transcript_atoms[ti]
         at_id = at.get("id", "")
         if at_id in merged_ids or at_id in replaced_ids:
             continue
 
-        for ab in baseline_atoms:
+        for bi in b_indices:
+            ab = baseline_atoms[bi]
             ab_id = ab.get("id", "")
             if ab_id in merged_ids or ab_id in replaced_ids:
                 continue
@@ -776,13 +1112,6 @@ def _cross_source_dedup(
             if at_id in merged_ids or ab_id in merged_ids:
                 continue
 
-            # When embedding is active: only handle uncertain pairs here
-            # Skip pairs that embedding classified as UNIQUE (< 0.60) — not in covered set
-            if use_embedding and pre is not None:
-                pair_key = (at_id, ab_id)
-                if pair_key not in embedding_covered_pairs:
-                    continue  # embedding said < 0.60 — skip (unique)
-
             kw_a = kw_map.get(at_id, set())
             kw_b = kw_map.get(ab_id, set())
             overlap = _keyword_overlap(kw_a, kw_b)
@@ -11,6 +11,8 @@ from ..core.logger import PipelineLogger
 from ..core.config import get_tier_params
 from ..core.utils import read_json, write_json
 from ..core.errors import PhaseError
+from ..core.batch_planner import atom_tokens, plan_batches
+from ..core.tokens import count_tokens
 from ..clients.claude_client import ClaudeClient, CreditExhaustedError
 from ..seekers.cache import SeekersCache
 from ..seekers.lookup import SeekersLookup
@@ -150,24 +152,26 @@ def _verify_with_embeddings(atoms_to_verify, ss_references, embedding_client, lo
     if not ref_texts:
         return 0, len(atoms_to_verify), {a.get("id", "") for a in atoms_to_verify}
 
-    for atom in atoms_to_verify:
-        atom_id = atom.get("id", "")
-        atom_title = atom.get("title", "")
-        atom_content = atom.get("content", "")
-        atom_text = f"{atom_title}: {atom_content[:300]}"
-
-        try:
-            scores = embedding_client.similarity_matrix([atom_text], ref_texts)[0]
-        except Exception as e:
-            logger.warn(f"Embedding similarity failed for atom {atom_id}: {e}", phase=phase_id)
+    atom_texts = [
+        f"{atom.get('title', '')}: {atom.get('content', '')[:300]}"
+        for atom in atoms_to_verify
+    ]
+    # Best reference for every atom in one indexed search
+    try:
+        best_idx, best_scores = embedding_client.top_matches(atom_texts, ref_texts)
+    except Exception as e:
+        logger.warn(f"Embedding similarity failed for {len(atom_texts)} atoms: {e}",
+                    phase=phase_id)
+        for atom in atoms_to_verify:
             atom["status"] = "unverified"
             atom["verification_note"] = "Expert insight — embedding verify failed"
-            unverified_count += 1
-            verified_ids.add(atom_id)
-            continue
+            verified_ids.add(atom.get("id", ""))
+        return 0, len(atoms_to_verify), verified_ids
 
-        best_score = max(scores) if scores else 0.0
-        best_ref_idx = scores.index(best_score) if scores else 0
+    for i, atom in enumerate(atoms_to_verify):
+        atom_id = atom.get("id", "")
+        best_score = float(best_scores[i, 0])
+        best_ref_idx = max(0, int(best_idx[i, 0]))
         best_ref_path = ss_references[best_ref_idx].get("path", "ref") if ss_references else "ref"
 
         if best_score >= 0.70:
@@ -307,33 +311,56 @@ def _verify_with_skill_seekers(atoms_to_verify, ss_references, logger):
     return strong_count + weak_count, none_count, verified_ids
 
 
-BATCH_SIZE = 10
+# Upper bound on atoms per verify call; the token budget usually binds first
+MAX_ATOMS_PER_BATCH = 25
+# Verdict JSON per atom (status, adjustment, note, reference)
+_VERDICT_TOKENS = 120
+# Baseline excerpts per batch: up to 20 keywords x 2 hits x ~500 chars
+_EXCERPT_TOKENS = 6000
+
+
+def _verify_payload(atom: dict) -> dict:
+    return {
+        "atom_id": atom.get("id", ""),
+        "title": atom.get("title", ""),
+        "content": atom.get("content", ""),
+        "category": atom.get("category", ""),
+        "tags": atom.get("tags", []),
+    }
 
 
 def _verify_with_claude_batch(atoms_to_verify, config, claude, lookup, logger):
-    """Verify atoms via Claude API in batches of BATCH_SIZE (light model)."""
+    """Verify atoms via Claude API in token-budgeted batches (light model)."""
     phase_id = "p4"
     verified_count = 0
     updated_count = 0
     flagged_count = 0
     verified_ids = set()
 
-    total_batches = (len(atoms_to_verify) + BATCH_SIZE - 1) // BATCH_SIZE
+    model = claude.model_light
+    overhead = (count_tokens(P4_BATCH_VERIFY_SYSTEM, model)
+                + count_tokens(P4_BATCH_VERIFY_USER_TEMPLATE, model)
+                + (_EXCERPT_TOKENS if lookup else 0))
+    plan = plan_batches(
+        atoms_to_verify,
+        input_tokens=lambda a: atom_tokens(_verify_payload(a), model, indent=2),
+        output_tokens=lambda a: _VERDICT_TOKENS,
+        model=model, overhead_tokens=overhead,
+        max_items=MAX_ATOMS_PER_BATCH,
+    )
+    total_batches = len(plan)
     logger.info(
         f"Xác minh batch {len(atoms_to_verify)} atoms trong "
-        f"{total_batches} batch (light model)",
+        f"{plan.describe()} (light model)",
         phase=phase_id,
     )
 
-    for i in range(0, len(atoms_to_verify), BATCH_SIZE):
-        batch = atoms_to_verify[i:i + BATCH_SIZE]
-        batch_num = (i // BATCH_SIZE) + 1
-        progress = int((batch_num / max(total_batches, 1)) * 85)
-        logger.phase_progress(phase_id, "Verify", progress)
-        logger.info(
-            f"Batch {batch_num}/{total_batches} ({len(batch)} atoms)",
-            phase=phase_id,
-        )
+    # Pass 1: build every batch prompt — batches are independent, so they
+    # are sent together (concurrently, or as one provider batch job)
+    batches = []
+    requests = []
+    for batch, max_tokens in zip(plan.batches, plan.max_tokens):
+        batches.append(batch)
 
         # Collect baseline excerpts for entire batch
         baseline_excerpts = ""
@@ -354,28 +381,43 @@ def _verify_with_claude_batch(atoms_to_verify, config, claude, lookup, logger):
                         )
 
         # Build atoms JSON for prompt
-        atoms_json = json.dumps([{
-            "atom_id": a.get("id", ""),
-            "title": a.get("title", ""),
-            "content": a.get("content", ""),
-            "category": a.get("category", ""),
-            "tags": a.get("tags", []),
-        } for a in batch], ensure_ascii=False, indent=2)
+        atoms_json = json.dumps([_verify_payload(a) for a in batch],
+                                ensure_ascii=False, indent=2)
 
         user_prompt = P4_BATCH_VERIFY_USER_TEMPLATE.format(
             baseline_excerpts=baseline_excerpts or "(No baseline references available)",
             atoms_json=atoms_json,
             batch_size=len(batch),
         )
+        requests.append({
+            "system": P4_BATCH_VERIFY_SYSTEM,
+            "user": user_prompt,
+            "max_tokens": max_tokens,
+            "phase": phase_id,
+            "use_light_model": True,
+        })
+
+    # Progress follows batches as they return, in completion order
+    completed = 0
+
+    def _on_batch_done(index, _result):
+        nonlocal completed
+        completed += 1
+        logger.phase_progress(phase_id, "Verify",
+                              int(completed / max(total_batches, 1) * 85))
+        logger.info(
+            f"Batch {index + 1}/{total_batches} ({len(batches[index])} atoms) xong "
+            f"({completed}/{total_batches})",
+            phase=phase_id,
+        )
 
+    responses = claude.call_json_batch(requests, on_result=_on_batch_done)
+
+    # Pass 2: apply results in batch order
+    for batch_num, (batch, result) in enumerate(zip(batches, responses), start=1):
         try:
-            result = claude.call_json(
-                system=P4_BATCH_VERIFY_SYSTEM,
-                user=user_prompt,
-                max_tokens=4096,
-                phase=phase_id,
-                use_light_model=True,
-            )
+            if isinstance(result, Exception):
+                raise result
 
             results_list = result.get("results", [])
             results_map = {r.get("atom_id", ""): r for r in results_list}
@@ -13,17 +13,21 @@ from ..core.types import BuildConfig, PhaseResult
 from ..core.logger import PipelineLogger
 from ..core.utils import read_json, write_json, write_file, create_zip
 from ..core.errors import PhaseError
+from ..core.batch_planner import atom_tokens, plan_batches
+from ..core.tokens import count_tokens
 from ..clients.claude_client import ClaudeClient, CreditExhaustedError
 from ..seekers.cache import SeekersCache
 from ..seekers.lookup import SeekersLookup
 from ..prompts.p5_build_prompts import (
     P5_SKILL_SYSTEM, P5_SKILL_USER,
-    P5_KNOWLEDGE_SYSTEM, P5_KNOWLEDGE_USER,
+    P5_KNOWLEDGE_SYSTEM, P5_KNOWLEDGE_USER_PREFIX, P5_KNOWLEDGE_USER,
     P5_QA_EXAMPLES_SYSTEM, P5_QA_EXAMPLES_USER,
 )
 
-# Max atoms per single Claude API call to avoid 524 timeout on proxy
-MAX_ATOMS_PER_API_CALL = 30
+# Upper bound on atoms per knowledge call; the token budget usually binds first
+MAX_ATOMS_PER_API_CALL = 60
+# Knowledge prose runs a bit shorter than the atom JSON it is written from
+_KNOWLEDGE_OUTPUT_RATIO = 0.8
 
 MAX_ANTIGRAVITY_CHARS = 50000
 
@@ -138,7 +142,13 @@ def _enrich_atoms_multi_source(atoms, config, logger):
     logger.info(f"P5: Enrichment -- {len(source_files)} sources, checking topic clusters", phase="p5")
 
     atom_texts = [f"{a['title']}: {a.get('content', '')[:200]}" for a in atoms]
-    sim_matrix = embedding_client.similarity_matrix(atom_texts, atom_texts)
+    rows, cols, scores = embedding_client.similar_pairs(atom_texts, threshold=0.80)
+
+    # Similar later atoms per atom (i < j), in index order
+    neighbours = {}
+    for i, j, score in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+        if score > 0.80:
+            neighbours.setdefault(i, []).append(j)
 
     # Find clusters of similar atoms from different sources
     enriched = set()
@@ -147,14 +157,13 @@ def _enrich_atoms_multi_source(atoms, config, logger):
             continue
         cluster_sources = {atoms[i].get('source_video', '')}
         cluster_indices = [i]
-        for j in range(i + 1, len(atoms)):
+        for j in neighbours.get(i, ()):
             if j in enriched:
                 continue
-            if sim_matrix[i][j] > 0.80:
-                src = atoms[j].get('source_video', '')
-                if src and src not in cluster_sources:
-                    cluster_sources.add(src)
-                    cluster_indices.append(j)
+            src = atoms[j].get('source_video', '')
+            if src and src not in cluster_sources:
+                cluster_sources.add(src)
+                cluster_indices.append(j)
 
         if len(cluster_sources) >= 2:
             # Mark primary atom with cross-reference
@@ -1185,101 +1194,126 @@ def run_p5(config: BuildConfig, claude: ClaudeClient,
             refs_copied = _copy_seekers_references(baseline, config.output_dir, logger)
 
         # ── Step 1: Generate knowledge files per pillar (chunked if large) ──
+        # All pillar chunks are independent: build every prompt first, send
+        # them together, then assemble files in pillar order
+        jobs = []       # (pillar_name, chunk_index, chunk_count, chunk)
+        requests = []
+        chunk_counts: dict[str, int] = {}
+        model = (claude.model_premium if use_premium and claude.model_premium
+                 else claude.model)
+        user_prefix = P5_KNOWLEDGE_USER_PREFIX.format(language=config.language)
+        overhead = (count_tokens(P5_KNOWLEDGE_SYSTEM, model) + count_tokens(user_prefix, model)
+                    + count_tokens(P5_KNOWLEDGE_USER, model))
         for pillar_name, atoms in pillars.items():
-            current_step += 1
-            progress = int((current_step / max(total_steps, 1)) * 80)
-            logger.phase_progress(phase_id, phase_name, progress)
-
-            fp = os.path.join(knowledge_dir, f"{pillar_name}.md")
-
-            if len(atoms) > MAX_ATOMS_PER_API_CALL:
-                # Chunk large pillar to avoid API timeout
-                chunks = [atoms[i:i + MAX_ATOMS_PER_API_CALL]
-                          for i in range(0, len(atoms), MAX_ATOMS_PER_API_CALL)]
+            # Chunk large pillars by token budget to avoid API timeouts
+            plan = plan_batches(
+                atoms,
+                input_tokens=lambda a: atom_tokens(a, model),
+                output_tokens=lambda a: int(atom_tokens(a, model) * _KNOWLEDGE_OUTPUT_RATIO),
+                model=model, overhead_tokens=overhead,
+                max_items=MAX_ATOMS_PER_API_CALL,
+            )
+            chunks = plan.batches
+            chunk_counts[pillar_name] = len(chunks)
+            if len(chunks) > 1:
                 logger.info(
                     f"Đang tạo knowledge/{pillar_name}.md "
-                    f"({len(atoms)} atoms, {len(chunks)} chunks)",
+                    f"({len(atoms)} atoms, {plan.describe()})",
                     phase=phase_id,
                 )
-                merged_parts = []
-                for ci, chunk in enumerate(chunks):
-                    atoms_json = json.dumps(chunk, ensure_ascii=False, indent=1)
-                    user_prompt = P5_KNOWLEDGE_USER.format(
-                        pillar_name=pillar_name,
-                        language=config.language,
-                        atom_count=len(chunk),
-                        atoms_json=atoms_json,
-                    )
-                    try:
-                        result = claude.call_json(
-                            system=P5_KNOWLEDGE_SYSTEM, user=user_prompt,
-                            max_tokens=4096, phase=phase_id,
-                            use_premium_model=use_premium,
-                        )
-                        content = result.get("content", "")
-                        if content:
-                            # Strip duplicate heading from subsequent chunks
-                            if ci > 0 and content.startswith("# "):
-                                content = content.split("\n", 1)[-1].lstrip("\n")
-                            merged_parts.append(content)
-                    except CreditExhaustedError:
-                        raise
-                    except Exception as e:
-                        logger.warn(
-                            f"Chunk {ci+1}/{len(chunks)} của {pillar_name} thất bại: {e}",
-                            phase=phase_id,
-                        )
-                        merged_parts.append(
-                            _generate_fallback_knowledge(
-                                f"{pillar_name} (part {ci+1})", chunk,
-                            )
-                        )
-
-                if merged_parts:
-                    write_file(fp, "\n\n".join(merged_parts))
-                else:
-                    write_file(fp, _generate_fallback_knowledge(pillar_name, atoms))
-                output_files.append(fp)
             else:
                 logger.info(
                     f"Đang tạo knowledge/{pillar_name}.md "
                     f"({len(atoms)} atoms)",
                     phase=phase_id,
                 )
-                atoms_json = json.dumps(atoms, ensure_ascii=False, indent=1)
+
+            for ci, (chunk, max_tokens) in enumerate(zip(chunks, plan.max_tokens)):
+                atoms_json = json.dumps(chunk, ensure_ascii=False, indent=1)
                 user_prompt = P5_KNOWLEDGE_USER.format(
                     pillar_name=pillar_name,
-                    language=config.language,
-                    atom_count=len(atoms),
+                    atom_count=len(chunk),
                     atoms_json=atoms_json,
                 )
-                try:
-                    result = claude.call_json(
-                        system=P5_KNOWLEDGE_SYSTEM, user=user_prompt,
-                        max_tokens=4096, phase=phase_id,
-                        use_premium_model=use_premium,
+                jobs.append((pillar_name, ci, len(chunks), chunk))
+                requests.append({
+                    "system": P5_KNOWLEDGE_SYSTEM, "user": user_prompt,
+                    "cache_prefix": user_prefix,
+                    "max_tokens": max_tokens, "phase": phase_id,
+                    "use_premium_model": use_premium,
+                })
+
+        # Knowledge files take len(pillars) of total_steps; progress moves
+        # as each chunk's response arrives, not once the whole batch is back
+        completed = 0
+
+        def _on_chunk_done(index, result):
+            nonlocal completed
+            completed += 1
+            pillar_name, ci, n_chunks, _ = jobs[index]
+            done_steps = len(pillars) * completed / len(requests)
+            logger.phase_progress(
+                phase_id, phase_name,
+                int(((current_step + done_steps) / max(total_steps, 1)) * 80),
+            )
+            logger.debug(
+                f"knowledge/{pillar_name}.md: chunk {ci+1}/{n_chunks} xong"
+                f"{' (lỗi)' if isinstance(result, Exception) else ''} "
+                f"({completed}/{len(requests)})",
+                phase=phase_id,
+            )
+
+        responses = claude.call_json_batch(requests, on_result=_on_chunk_done)
+        current_step += len(pillars)
+
+        merged: dict[str, list] = {}
+        for (pillar_name, ci, n_chunks, chunk), result in zip(jobs, responses):
+            parts = merged.setdefault(pillar_name, [])
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                content = result.get("content", "")
+                if content and n_chunks > 1 and ci > 0 and content.startswith("# "):
+                    # Strip duplicate heading from subsequent chunks
+                    content = content.split("\n", 1)[-1].lstrip("\n")
+                if content:
+                    parts.append(content)
+                elif n_chunks == 1:
+                    logger.warn(
+                        f"Nội dung trống cho pillar '{pillar_name}'",
+                        phase=phase_id,
+                    )
+            except CreditExhaustedError:
+                raise
+            except Exception as e:
+                if n_chunks > 1:
+                    logger.warn(
+                        f"Chunk {ci+1}/{n_chunks} của {pillar_name} thất bại: {e}",
+                        phase=phase_id,
                     )
-                    content = result.get("content", "")
-                    if content:
-                        write_file(fp, content)
-                        output_files.append(fp)
-                    else:
-                        logger.warn(
-                            f"Nội dung trống cho pillar '{pillar_name}'",
-                            phase=phase_id,
+                    parts.append(
+                        _generate_fallback_knowledge(
+                            f"{pillar_name} (part {ci+1})", chunk,
                         )
-                except CreditExhaustedError:
-                    raise
-                except Exception as e:
+                    )
+                else:
                     logger.warn(
                         f"Không tạo được {pillar_name}.md: {e}",
                         phase=phase_id,
                     )
-                    fallback = _generate_fallback_knowledge(
-                        pillar_name, atoms,
-                    )
-                    write_file(fp, fallback)
-                    output_files.append(fp)
+                    parts.append(_generate_fallback_knowledge(pillar_name, chunk))
+
+        for pillar_name, atoms in pillars.items():
+            fp = os.path.join(knowledge_dir, f"{pillar_name}.md")
+            parts = merged.get(pillar_name, [])
+            if parts:
+                write_file(fp, "\n\n".join(parts))
+            elif chunk_counts.get(pillar_name, 1) > 1:
+                write_file(fp, _generate_fallback_knowledge(pillar_name, atoms))
+            else:
+                # Empty single-call response: no file, as before
+                continue
+            output_files.append(fp)
 
         # ── Step 2: Generate SKILL.md ──
         current_step += 1
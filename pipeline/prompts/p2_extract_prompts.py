@@ -1,6 +1,6 @@
 """Phase 2 — Extract: Break transcripts into discrete Knowledge Atoms."""
 
-PROMPT_VERSION = "p2_extract_v1"
+PROMPT_VERSION = "p2_extract_v2"
 
 P2_SYSTEM = """\
 You are a Knowledge Atom Extractor transforming video transcripts into structured, retrievable knowledge units.
@@ -30,22 +30,19 @@ EXTRACTION GUIDE:
 OUTPUT: Valid JSON only. No markdown fences. Write in the transcript's language.\
 """
 
-P2_USER_TEMPLATE = """\
-Extract Knowledge Atoms from this transcript chunk.
+# Stable leading user content shared by every chunk call of a build
+# (sent as the cache_prefix); the chunk itself follows in P2_USER_TEMPLATE
+P2_USER_PREFIX_TEMPLATE = """\
+Extract Knowledge Atoms from the transcript chunk below.
 
-**Chunk:** {chunk_index} of {total_chunks}
 **Language:** {language}
 **Domain:** {domain}
 **Available categories:** {categories}
-**Source file:** {filename}
 
---- CHUNK START ---
-{chunk}
---- CHUNK END ---
-
-Return a JSON object with this EXACT structure:
+Return a JSON object with this EXACT structure, with chunk_index set to the
+chunk number given below:
 {{
-  "chunk_index": {chunk_index},
+  "chunk_index": 0,
   "atoms": [
     {{
       "title": "Clear descriptive title of the knowledge atom",
@@ -58,7 +55,17 @@ Return a JSON object with this EXACT structure:
   ],
   "atoms_count": 0,
   "chunk_quality": "high"
-}}\
+}}
+
+"""
+
+P2_USER_TEMPLATE = """\
+**Chunk:** {chunk_index} of {total_chunks}
+**Source file:** {filename}
+
+--- CHUNK START ---
+{chunk}
+--- CHUNK END ---\
 """
 
 # ── Gap-fill: extract atoms from baseline reference docs ──
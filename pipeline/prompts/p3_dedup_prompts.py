@@ -1,5 +1,7 @@
 """Phase 3 — Dedup: Deduplicate and merge overlapping Knowledge Atoms."""
 
+PROMPT_VERSION = "p3_dedup_v1"
+
 P3_SYSTEM = """\
 You are a Deduplication Expert ensuring a clean, non-redundant knowledge base.
 
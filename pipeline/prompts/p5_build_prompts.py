@@ -168,23 +168,30 @@ RULES:
 - Respond ONLY with valid JSON containing the "content" field, no markdown fences around JSON\
 """
 
-P5_KNOWLEDGE_USER = """\
-Create a knowledge file for this pillar.
+# Leading user content shared by every pillar/chunk call of a build (sent
+# as the cache_prefix); the pillar's atoms follow in P5_KNOWLEDGE_USER
+P5_KNOWLEDGE_USER_PREFIX = """\
+Create a knowledge file for the pillar below from its atoms.
 
-**Pillar:** {pillar_name}
 **Language:** {language}
-**Number of atoms:** {atom_count}
-
---- ATOMS ---
-{atoms_json}
 
-Return a JSON object with this EXACT structure:
+Return a JSON object with this EXACT structure, with pillar set to the
+pillar name given below:
 {{
-  "pillar": "{pillar_name}",
+  "pillar": "pillar name",
   "content": "The full knowledge file content as a Markdown string with all atoms formatted",
   "atom_ids": ["list of atom IDs included in this file"],
   "word_count": 0
-}}\
+}}
+
+"""
+
+P5_KNOWLEDGE_USER = """\
+**Pillar:** {pillar_name}
+**Number of atoms:** {atom_count}
+
+--- ATOMS ---
+{atoms_json}\
 """
 
 P5_QA_EXAMPLES_SYSTEM = """\
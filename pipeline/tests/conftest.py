@@ -37,6 +37,8 @@ class MockClaudeClient:
         self._consecutive_credit_errors = 0
         self.model_usage = {"main": 0, "light": 0}
         self._call_history = []  # Track calls with their flags
+        self.max_in_flight = 1
+        self.max_in_flight_light = 1
 
     def call(self, system, user, **kwargs):
         self.call_count += 1
@@ -338,6 +340,29 @@ class MockClaudeClient:
 
         return {"result": "unknown_prompt"}
 
+    def call_batch(self, requests, max_workers=None, on_result=None):
+        return self._run_batch(self.call, requests, on_result)
+
+    def call_json_batch(self, requests, max_workers=None, on_result=None, stream=False):
+        return self._run_batch(self.call_json, requests, on_result)
+
+    @staticmethod
+    def _run_batch(fn, requests, on_result=None):
+        """Sequential stand-in for ClaudeClient batches — errors fill their slot."""
+        from pipeline.clients.claude_client import CreditExhaustedError
+        results = []
+        for req in requests:
+            req = dict(req)
+            try:
+                results.append(fn(req.pop("system"), req.pop("user"), **req))
+            except CreditExhaustedError:
+                raise
+            except Exception as e:
+                results.append(e)
+            if on_result:
+                on_result(len(results) - 1, results[-1])
+        return results
+
     def get_cost_summary(self):
         return {
             "calls": self.call_count,
@@ -0,0 +1,113 @@
+"""Tests for the LSH nearest-neighbour index."""
+
+import numpy as np
+
+from pipeline.core import similarity as sim
+from pipeline.core.ann_index import AnnIndex, lsh_params
+from pipeline.core.sparse_tfidf import tfidf_rows
+
+
+def _planted(n_pairs=500, dim=64, noise=0.3, seed=0):
+    """Unit rows where row i and row i + n_pairs are near-duplicates."""
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal((n_pairs, dim))
+    near = base + noise * rng.standard_normal(base.shape)
+    return sim.unit_matrix(np.vstack([base, near]))
+
+
+def _pairs(result):
+    rows, cols, _ = result
+    return set(zip(rows.tolist(), cols.tolist()))
+
+
+class TestLshParams:
+
+    def test_higher_threshold_allows_more_bits(self):
+        low, high = lsh_params(0.5), lsh_params(0.85)
+        assert low[0] < high[0]
+        for threshold, (bits, tables) in ((0.5, low), (0.85, high)):
+            p = 1 - np.arccos(threshold) / np.pi
+            assert 1 - (1 - p ** bits) ** tables >= 0.95
+
+    def test_no_lsh_without_threshold(self):
+        assert lsh_params(0.0) is None
+        assert lsh_params(1.0) is None
+
+
+class TestAnnIndex:
+
+    def test_small_sets_search_exactly(self):
+        vectors = _planted(50)
+        index = AnnIndex(threshold=0.8)
+        index.add(vectors)
+        assert _pairs(index.range_query()) == _pairs(sim.pairs_above(vectors, threshold=0.8))
+        assert index.exact_searches == 1 and index.candidates == 0
+
+    def test_range_query_recall(self):
+        vectors = _planted(500)
+        index = AnnIndex(threshold=0.8, exact_max_pairs=0)
+        index.add(vectors[:300])
+        index.add(vectors[300:])
+        found = _pairs(index.range_query())
+        exact = _pairs(sim.pairs_above(vectors, threshold=0.8))
+        assert found <= exact
+        assert len(found & exact) >= 0.95 * len(exact)
+        assert index.candidates < 1000 * 999 / 2 * 0.2
+        assert all(r < c for r, c in found)
+
+    def test_range_query_against_queries(self):
+        vectors = _planted(400)
+        index = AnnIndex(threshold=0.8, exact_max_pairs=0)
+        index.add(vectors[400:])
+        rows, cols, scores = index.range_query(vectors[:400])
+        assert np.mean(rows == cols) >= 0.95 and len(rows) >= 0.95 * 400
+        assert np.allclose(scores, np.einsum("ij,ij->i", vectors[rows], vectors[400 + cols]),
+                           atol=1e-5)
+
+    def test_query_topk(self):
+        vectors = _planted(400)
+        index = AnnIndex(threshold=0.8, exact_max_pairs=0)
+        index.add(vectors[400:])
+        indices, scores = index.query_topk(vectors[:400], k=2)
+        exact_idx, _ = sim.top_k(vectors[:400], vectors[400:], k=1)
+        assert np.mean(indices[:, 0] == exact_idx[:, 0]) >= 0.95
+        assert (scores[:, 0] >= scores[:, 1]).all()
+
+    def test_sparse_rows_search_exactly(self):
+        rows = tfidf_rows(["ads budget", "ads budget", "python loops"])
+        index = AnnIndex(threshold=0.8, exact_max_pairs=0)
+        index.add(rows[:2])
+        index.add(rows[2:])
+        assert _pairs(index.range_query()) == {(0, 1)}
+        assert index.exact_searches == 1
+
+    def test_empty(self):
+        index = AnnIndex()
+        assert len(index) == 0
+        assert len(index.range_query()[0]) == 0
+
+
+def test_verify_with_embeddings_batches_atoms():
+    from pipeline.core.embeddings import EmbeddingClient
+    from pipeline.phases.p4_verify import _verify_with_embeddings
+
+    class Logger:
+        def info(self, *a, **k):
+            pass
+        warn = info
+
+    client = EmbeddingClient()
+    calls = []
+    original = client.top_matches
+    client.top_matches = lambda q, c, **k: calls.append(len(q)) or original(q, c, **k)
+    atoms = [
+        {"id": "a1", "title": "Facebook ads budget", "content": "daily budget for ads"},
+        {"id": "a2", "title": "Unrelated", "content": "cooking pasta recipe"},
+    ]
+    refs = [{"path": "ads.md", "content": "Facebook ads budget: daily budget for ads"},
+            {"path": "seo.md", "content": "keyword research for search"}]
+    verified, unverified, ids = _verify_with_embeddings(atoms, refs, client, Logger())
+    assert calls == [2]
+    assert (verified, unverified, ids) == (1, 1, {"a1", "a2"})
+    assert atoms[0]["baseline_reference"] == "ads.md"
+    assert atoms[1]["status"] == "unverified"
@@ -0,0 +1,95 @@
+"""Tests for token-budget batch planning."""
+
+from pipeline.core.batch_planner import BatchPlan, atom_tokens, plan_batches
+
+
+def _atoms(sizes):
+    return [{"id": f"a{i}", "content": "x" * size} for i, size in enumerate(sizes)]
+
+
+def _plan(atoms, **kwargs):
+    kwargs.setdefault("overhead_tokens", 0)
+    return plan_batches(
+        atoms,
+        input_tokens=lambda a: len(a["content"]),
+        output_tokens=lambda a: len(a["content"]) // 2,
+        **kwargs,
+    )
+
+
+class TestPlanBatches:
+
+    def test_empty(self):
+        plan = _plan([])
+        assert isinstance(plan, BatchPlan)
+        assert len(plan) == 0
+
+    def test_short_atoms_share_one_call(self):
+        atoms = _atoms([50] * 80)
+        plan = _plan(atoms, max_input_tokens=30_000, max_output_tokens=6_000)
+        assert len(plan) == 1
+        assert plan.batches[0] == atoms
+
+    def test_long_atoms_split_by_input_budget(self):
+        atoms = _atoms([4_000] * 10)
+        plan = _plan(atoms, max_input_tokens=10_000, max_output_tokens=100_000)
+        assert all(plan.input_tokens[i] <= 10_000 for i in range(len(plan)))
+        assert [a for b in plan.batches for a in b] == atoms
+
+    def test_output_budget_binds(self):
+        plan = _plan(_atoms([1_000] * 12), max_input_tokens=100_000, max_output_tokens=2_000)
+        assert len(plan) == 3
+        assert all(out <= 2_000 for out in plan.output_tokens)
+
+    def test_overhead_counts_against_input_budget(self):
+        plan = _plan(_atoms([1_000] * 10), max_input_tokens=5_000,
+                     max_output_tokens=100_000, overhead_tokens=2_000)
+        assert all(tokens <= 5_000 for tokens in plan.input_tokens)
+        assert len(plan) == 4
+
+    def test_max_items_cap(self):
+        plan = _plan(_atoms([10] * 100), max_items=30)
+        assert [len(b) for b in plan.batches] == [25, 25, 25, 25]
+
+    def test_max_items_counts_item_size(self):
+        clusters = [_atoms([10] * n) for n in (20, 20, 20, 5, 30)]
+        plan = plan_batches(
+            clusters,
+            input_tokens=lambda c: sum(len(a["content"]) for a in c),
+            output_tokens=lambda c: 0,
+            max_items=45, item_size=len,
+        )
+        assert [[len(c) for c in b] for b in plan.batches] == [[20, 20], [20, 5], [30]]
+
+    def test_batches_are_balanced(self):
+        plan = _plan(_atoms([1_000] * 11), max_input_tokens=10_000, max_output_tokens=100_000)
+        sizes = [len(b) for b in plan.batches]
+        assert len(plan) == 2
+        assert max(sizes) - min(sizes) <= 1
+
+    def test_oversized_atom_gets_own_batch(self):
+        atoms = _atoms([100, 50_000, 100])
+        plan = _plan(atoms, max_input_tokens=10_000, max_output_tokens=100_000)
+        assert [len(b) for b in plan.batches] == [1, 1, 1]
+
+    def test_max_tokens_has_headroom_and_floor(self):
+        plan = _plan(_atoms([8_000]), max_input_tokens=100_000, max_output_tokens=100_000,
+                     min_max_tokens=4096)
+        assert plan.max_tokens[0] > plan.output_tokens[0]
+        small = _plan(_atoms([100]), min_max_tokens=4096)
+        assert small.max_tokens == [4096]
+
+    def test_model_output_cap(self):
+        plan = _plan(_atoms([40_000]), model="deepseek-chat",
+                     max_input_tokens=100_000, max_output_tokens=100_000)
+        assert plan.max_tokens == [8_192]
+
+    def test_describe(self):
+        plan = _plan(_atoms([1_000] * 4), max_input_tokens=2_000, max_output_tokens=100_000)
+        assert plan.describe().startswith("2 batch (2+2)")
+
+
+def test_atom_tokens_grow_with_content():
+    short = atom_tokens({"content": "ngắn"})
+    long = atom_tokens({"content": "nội dung dài hơn nhiều " * 50})
+    assert long > short * 10
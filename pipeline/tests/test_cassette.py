@@ -0,0 +1,189 @@
+"""Tests for record/replay cassettes (ClaudeClient, EmbeddingClient, runner)."""
+
+import json
+import time
+
+import pytest
+
+from pipeline.clients.claude_client import ClaudeClient
+from pipeline.core.cassette import (
+    RECORD, REPLAY, Cassette, CassetteMissError, pack_vectors, request_key, unpack_vectors,
+)
+from pipeline.core.embeddings import EmbeddingClient
+from pipeline.core.errors import ClaudeAPIError
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "build" / "llm_cassette.jsonl")
+
+
+class TestCassette:
+
+    def test_vectors_round_trip_as_float32(self):
+        vectors = [[0.1, -0.25, 3.0], [1e-3, 0.0, -7.5]]
+        packed = pack_vectors(vectors)
+        assert packed["dim"] == 3
+        restored = unpack_vectors(json.loads(json.dumps(packed)))
+        assert restored == [pytest.approx(v, rel=1e-6) for v in vectors]
+        assert unpack_vectors(pack_vectors([])) == []
+
+    def test_record_then_replay_in_order(self, path):
+        rec = Cassette(path, RECORD)
+        rec.record("llm", "k", {"text": "first"}, 0.5)
+        rec.record("llm", "k", {"text": "second"}, 0.5)
+        rec.record("embed", "e", {"tokens": 1}, 0.1)
+        rec.close()
+
+        play = Cassette(path, REPLAY)
+        assert [play.replay("llm", "k")["text"] for _ in range(3)] == [
+            "first", "second", "second"]
+        assert play.has("embed") and not play.has("other")
+        with pytest.raises(CassetteMissError):
+            play.replay("llm", "missing")
+        assert play.stats()["replayed"] == 3
+        assert play.stats()["misses"] == 1
+
+    def test_torn_last_line_ignored(self, path):
+        rec = Cassette(path, RECORD)
+        rec.record("llm", "k", {"text": "ok"}, 0.0)
+        rec.close()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"kind": "llm", "key": "k2", "resp')
+        assert Cassette(path, REPLAY).replay("llm", "k")["text"] == "ok"
+
+    def test_latency_scale(self, path):
+        rec = Cassette(path, RECORD)
+        rec.record("llm", "k", {"text": "ok"}, 0.2)
+        rec.close()
+        start = time.time()
+        Cassette(path, REPLAY, latency_scale=0.5).replay("llm", "k")
+        assert 0.09 <= time.time() - start < 0.5
+
+    def test_invalid_mode(self, path):
+        with pytest.raises(ValueError):
+            Cassette(path, "rewind")
+
+    def test_key_depends_on_every_part(self):
+        assert request_key("llm", "m", "s", "u") != request_key("llm", "m", "su", "")
+        assert request_key("llm", "m", "s", "u") == request_key("llm", "m", "s", "u")
+
+
+def _scripted(replies):
+    calls = []
+
+    def provider_call(system, user, max_tokens, temperature, model, client, sdk_type,
+                      cache_prefix, partial):
+        calls.append(partial)
+        text, stop = replies.pop(0)
+        return text, 100, 20, {"cache_read": 0, "cache_write": 0, "stop_reason": stop}
+    return provider_call, calls
+
+
+class TestClaudeClient:
+
+    def _record(self, path, monkeypatch, replies):
+        cassette = Cassette(path, RECORD)
+        client = ClaudeClient(api_key="k", cassette=cassette, cache_dir=str(path) + ".cache")
+        provider, calls = _scripted(replies)
+        monkeypatch.setattr(client, "_provider_call", provider)
+        return client, cassette, calls
+
+    def test_replay_serves_recorded_calls_and_continuations(self, path, monkeypatch):
+        client, cassette, _ = self._record(path, monkeypatch, [
+            ('{"atoms": [{"id": 1}, ', "max_tokens"), ('{"id": 2}]}', "end_turn"),
+        ])
+        assert client.response_cache is None
+        recorded = client.call_json("sys", "u", phase="p2")
+        cassette.close()
+
+        replay = ClaudeClient(api_key="replay", cassette=Cassette(path, REPLAY))
+        monkeypatch.setattr(replay, "_provider_call", lambda *a, **k: pytest.fail("network"))
+        assert replay.call_json("sys", "u", phase="p2") == recorded
+        assert replay.get_cost_summary()["continuations"] == 1
+        assert replay.get_cost_summary()["input_tokens"] == 200
+
+    def test_replay_miss_is_non_retryable(self, path, monkeypatch):
+        client, cassette, _ = self._record(path, monkeypatch, [('{"a": 1}', "end_turn")])
+        client.call("sys", "u")
+        cassette.close()
+        replay = ClaudeClient(api_key="replay", cassette=Cassette(path, REPLAY))
+        with pytest.raises(ClaudeAPIError) as exc:
+            replay.call("sys", "other prompt")
+        assert not exc.value.retryable
+
+    def test_stream_replays_items(self, path, monkeypatch):
+        client, cassette, _ = self._record(path, monkeypatch, [
+            ('{"atoms": [{"id": 1}, {"id": 2}, {"id": 3}]}', "end_turn"),
+        ])
+        client.call("sys", "u")
+        cassette.close()
+        replay = ClaudeClient(api_key="replay", cassette=Cassette(path, REPLAY))
+        stream = replay.stream_json("sys", "u", items_key="atoms")
+        assert [a["id"] for a in stream] == [1, 2, 3]
+        assert not stream.truncated
+
+    def test_batch_mode_and_hedging_disabled(self, path):
+        client = ClaudeClient(api_key="k", batch_mode=True, cache_dir=str(path) + ".cache",
+                              cassette=Cassette(path, RECORD))
+        assert not client.batch_mode
+        assert client.health.hedge_percentile == 0
+
+
+class TestEmbeddingClient:
+
+    def test_record_and_replay_without_key(self, path, monkeypatch):
+        cassette = Cassette(path, RECORD)
+        recorder = EmbeddingClient(api_key="k", cassette=cassette)
+        monkeypatch.setattr(recorder, "_post_embeddings",
+                            lambda texts, retries: ([[float(len(t)), 1.0] for t in texts], 7))
+        recorded = recorder.embed_texts(["một", "hai ba"])
+        cassette.close()
+
+        replayer = EmbeddingClient(api_key="", cassette=Cassette(path, REPLAY))
+        monkeypatch.setattr(replayer, "_post_embeddings",
+                            lambda *a: pytest.fail("network"))
+        result = replayer.embed_texts(["một", "hai ba"])
+        assert not result.fallback_used
+        assert result.vectors == recorded.vectors
+        assert result.tokens_used == 7
+
+    def test_replay_without_recorded_embeddings_uses_tfidf(self, path):
+        rec = Cassette(path, RECORD)
+        rec.record("llm", "k", {"text": "x"}, 0.0)
+        rec.close()
+        client = EmbeddingClient(api_key="k", cassette=Cassette(path, REPLAY))
+        assert client.embed_texts(["a b", "b c"]).fallback_used
+
+
+def test_runner_replays_without_api_key(build_config, path):
+    from pipeline.orchestrator.runner import PipelineRunner
+
+    rec = Cassette(path, RECORD)
+    rec.record("llm", "k", {"text": "x"}, 0.0)
+    rec.close()
+    build_config.claude_api_key = ""
+    build_config.cassette_mode = REPLAY
+    build_config.cassette_path = path
+    runner = PipelineRunner(build_config)
+    assert runner.claude is not None
+    assert runner.claude.cassette is runner.cassette
+    assert build_config.embedding_client._cassette is runner.cassette
+
+
+def test_runner_closes_cassette_when_run_fails(build_config, path, monkeypatch):
+    from pipeline.orchestrator import runner as runner_mod
+
+    def _boom(*args):
+        raise RuntimeError("boom")
+
+    build_config.cassette_mode = RECORD
+    build_config.cassette_path = path
+    monkeypatch.setattr(runner_mod, "PHASES", [("p4", "P4 Verify", _boom)])
+    runner = runner_mod.PipelineRunner(build_config)
+    runner.claude.cassette.record("llm", "k", {"text": "x"}, 0.0)
+    monkeypatch.setattr(runner, "_report_telemetry", _boom)
+    with pytest.raises(RuntimeError):
+        runner.run()
+    assert runner.cassette._file is None
+    assert Cassette(path, REPLAY).replay("llm", "k")["text"] == "x"
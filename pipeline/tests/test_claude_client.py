@@ -0,0 +1,662 @@
+"""Tests for ClaudeClient concurrency, caching and accounting (no network)."""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from pipeline.clients.claude_client import ClaudeClient, CreditExhaustedError
+from pipeline.core.errors import ClaudeAPIError
+
+
+def _make_client(**kwargs) -> ClaudeClient:
+    kwargs.setdefault("model", "claude-sonnet-4-5-20250929")
+    kwargs.setdefault("model_light", "claude-haiku-4-5-20251001")
+    return ClaudeClient(api_key="test-key", base_url="https://example.com", **kwargs)
+
+
+class _FakeApi:
+    """Stand-in for ClaudeClient._call_api that records peak concurrency."""
+
+    def __init__(self, delay: float = 0.02, fail_on: set | None = None):
+        self.delay = delay
+        self.fail_on = fail_on or set()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, system, user, max_tokens, temperature, active_model,
+                 client=None, sdk_type=None, cache_prefix=""):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if user in self.fail_on:
+                raise ClaudeAPIError(f"bad request: {user}", retryable=False)
+            return f'{{"echo": "{user}"}}', 100, 50, {}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class TestCallBatch:
+
+    def test_results_keep_input_order(self, monkeypatch):
+        client = _make_client(max_in_flight=4)
+        monkeypatch.setattr(client, "_call_api", _FakeApi())
+        requests = [{"system": "s", "user": f"u{i}"} for i in range(12)]
+        results = client.call_json_batch(requests)
+        assert [r["echo"] for r in results] == [f"u{i}" for i in range(12)]
+
+    def test_in_flight_bounded_per_provider(self, monkeypatch):
+        client = _make_client(max_in_flight=3, max_in_flight_light=2)
+        api = _FakeApi(delay=0.05)
+        monkeypatch.setattr(client, "_call_api", api)
+
+        client.call_batch([{"system": "s", "user": f"m{i}"} for i in range(9)])
+        assert api.peak <= 3
+
+        api.peak = 0
+        client.call_batch([{"system": "s", "user": f"l{i}", "use_light_model": True}
+                           for i in range(9)])
+        assert api.peak <= 2
+
+    def test_runs_concurrently(self, monkeypatch):
+        client = _make_client(max_in_flight=4)
+        api = _FakeApi(delay=0.05)
+        monkeypatch.setattr(client, "_call_api", api)
+        client.call_batch([{"system": "s", "user": f"u{i}"} for i in range(8)])
+        assert api.peak > 1
+
+    def test_failed_request_fills_its_slot(self, monkeypatch):
+        client = _make_client()
+        monkeypatch.setattr(client, "_call_api", _FakeApi(fail_on={"u1"}))
+        results = client.call_json_batch(
+            [{"system": "s", "user": f"u{i}"} for i in range(3)],
+        )
+        assert results[0] == {"echo": "u0"}
+        assert isinstance(results[1], ClaudeAPIError)
+        assert results[2] == {"echo": "u2"}
+
+    def test_credit_exhausted_propagates(self, monkeypatch):
+        client = _make_client()
+
+        def _broke(*args, **kwargs):
+            raise CreditExhaustedError("credits gone")
+
+        monkeypatch.setattr(client, "_call_api", _broke)
+        with pytest.raises(CreditExhaustedError):
+            client.call_batch([{"system": "s", "user": f"u{i}"} for i in range(4)])
+
+    def test_empty_batch(self):
+        assert _make_client().call_batch([]) == []
+
+
+class TestConcurrentAccounting:
+
+    def test_cost_and_counts_exact_under_concurrency(self, monkeypatch):
+        client = _make_client(max_in_flight=8)
+        monkeypatch.setattr(client, "_call_api", _FakeApi(delay=0.001))
+        n = 64
+        client.call_batch([{"system": "s", "user": f"u{i}"} for i in range(n)])
+
+        summary = client.get_cost_summary()
+        assert summary["calls"] == n
+        assert summary["input_tokens"] == 100 * n
+        assert summary["output_tokens"] == 50 * n
+        expected = n * (100 * 3.0 + 50 * 15.0) / 1_000_000
+        assert summary["cost_usd"] == pytest.approx(round(expected, 4))
+
+    def test_credit_error_counter_thread_safe(self):
+        client = _make_client()
+        client._MAX_CREDIT_ERRORS = 1000
+        err = Exception("Your credit balance is too low")
+
+        def _hit():
+            for _ in range(50):
+                client._check_credit_error(err, is_light=True)
+
+        threads = [threading.Thread(target=_hit) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert client._credit_errors_light == 400
+
+
+class TestConcurrentDiskCache:
+
+    def test_cache_written_once_and_reused(self, monkeypatch, tmp_path):
+        client = _make_client(cache_dir=str(tmp_path))
+        api = _FakeApi()
+        monkeypatch.setattr(client, "_call_api", api)
+
+        client.call_batch([{"system": "s", "user": f"u{i}"} for i in range(6)])
+        assert api.calls == 6
+        assert not list(tmp_path.glob("*.tmp"))
+
+        results = client.call_batch([{"system": "s", "user": f"u{i}"} for i in range(6)])
+        assert api.calls == 6
+        assert results[3] == '{"echo": "u3"}'
+
+
+class TestSingleFlight:
+
+    def _race(self, client, n, **call_kwargs):
+        barrier = threading.Barrier(n)
+        results = [None] * n
+
+        def _worker(i):
+            barrier.wait()
+            try:
+                results[i] = client.call("s", "same prompt", **call_kwargs)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=_worker, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_identical_prompts_share_one_request(self, monkeypatch):
+        client = _make_client(max_in_flight=8)
+        api = _FakeApi(delay=0.1)
+        monkeypatch.setattr(client, "_call_api", api)
+
+        results = self._race(client, 8)
+        assert api.calls == 1
+        assert results == ['{"echo": "same prompt"}'] * 8
+        assert client.call_count == 1
+        assert client.single_flight_joins == 7
+
+    def test_different_models_not_merged(self, monkeypatch):
+        client = _make_client(max_in_flight=4)
+        api = _FakeApi(delay=0.05)
+        monkeypatch.setattr(client, "_call_api", api)
+        client.call_batch([
+            {"system": "s", "user": "u"},
+            {"system": "s", "user": "u", "use_light_model": True},
+        ])
+        assert api.calls == 2
+
+    def test_failure_shared_then_cleared(self, monkeypatch):
+        client = _make_client(max_in_flight=4)
+        api = _FakeApi(delay=0.1, fail_on={"same prompt"})
+        monkeypatch.setattr(client, "_call_api", api)
+
+        results = self._race(client, 4)
+        assert api.calls == 1
+        assert all(isinstance(r, ClaudeAPIError) for r in results)
+        # The failed flight is not remembered — a later call tries again
+        with pytest.raises(ClaudeAPIError):
+            client.call("s", "same prompt")
+        assert api.calls == 2
+
+    def test_waits_for_other_process_lease(self, monkeypatch, tmp_path):
+        other = _make_client(cache_dir=str(tmp_path))
+        client = _make_client(cache_dir=str(tmp_path))
+        api = _FakeApi()
+        monkeypatch.setattr(client, "_call_api", api)
+
+        key = client._cache_key(client.model, "s", "u")
+        assert other.response_cache.acquire_lease(key, client.model)
+
+        def _finish():
+            time.sleep(0.2)
+            other._set_cache(key, "from other process", client.model)
+            other.response_cache.release_lease(key, client.model)
+
+        t = threading.Thread(target=_finish)
+        t.start()
+        assert client.call("s", "u") == "from other process"
+        t.join()
+        assert api.calls == 0
+        assert client.get_cache_stats()["single_flight_joins"] == 1
+
+    def test_takes_over_when_other_process_fails(self, monkeypatch, tmp_path):
+        other = _make_client(cache_dir=str(tmp_path))
+        client = _make_client(cache_dir=str(tmp_path))
+        api = _FakeApi()
+        monkeypatch.setattr(client, "_call_api", api)
+
+        key = client._cache_key(client.model, "s", "u")
+        assert other.response_cache.acquire_lease(key, client.model)
+        threading.Timer(
+            0.2, other.response_cache.release_lease, args=(key, client.model),
+        ).start()
+
+        assert client.call("s", "u") == '{"echo": "u"}'
+        assert api.calls == 1
+        # Lease released after the call, so the next owner is not blocked
+        assert other.response_cache.acquire_lease(key, client.model)
+
+
+class _FakeMessages:
+    """Anthropic messages.create stand-in that records request kwargs."""
+
+    def __init__(self, cache_read=0, cache_write=0):
+        self.kwargs = []
+        self.usage = SimpleNamespace(input_tokens=100, output_tokens=50,
+                                     cache_read_input_tokens=cache_read,
+                                     cache_creation_input_tokens=cache_write)
+
+    def create(self, **kwargs):
+        self.kwargs.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text="ok")], usage=self.usage,
+                               stop_reason="end_turn")
+
+
+class TestPromptCaching:
+
+    def _anthropic_client(self, messages, **kwargs):
+        client = ClaudeClient(api_key="k", **kwargs)
+        client.main_client = client.light_client = SimpleNamespace(messages=messages)
+        return client
+
+    LONG = "Quy tắc tối ưu chiến dịch quảng cáo. " * 300
+
+    def test_system_prompt_gets_breakpoint(self):
+        messages = _FakeMessages()
+        client = self._anthropic_client(messages)
+        client.call(self.LONG, "question")
+        sent = messages.kwargs[0]
+        assert sent["system"] == [{"type": "text", "text": self.LONG,
+                                   "cache_control": {"type": "ephemeral"}}]
+        assert sent["messages"][0]["content"] == "question"
+
+    def test_cache_prefix_is_leading_cached_block(self):
+        messages = _FakeMessages()
+        client = self._anthropic_client(messages)
+        client.call("sys", "tail", cache_prefix=self.LONG)
+        sent = messages.kwargs[0]
+        assert sent["system"] == "sys"
+        content = sent["messages"][0]["content"]
+        assert content[0] == {"type": "text", "text": self.LONG,
+                              "cache_control": {"type": "ephemeral"}}
+        assert content[1] == {"type": "text", "text": "tail"}
+
+    def test_short_prefix_sent_without_breakpoint(self):
+        messages = _FakeMessages()
+        client = self._anthropic_client(messages)
+        client.call("sys", "tail", cache_prefix="shared context ")
+        sent = messages.kwargs[0]
+        assert sent["system"] == "sys"
+        assert sent["messages"][0]["content"] == "shared context tail"
+
+    def test_haiku_needs_longer_prefix(self):
+        client = _make_client()
+        text = "Quy tắc tối ưu chiến dịch quảng cáo. " * 150
+        assert 1024 <= client.token_counter.count(text, "claude-sonnet-4-5") < 2048
+        assert client._cacheable("claude-sonnet-4-5", text)
+        assert not client._cacheable("claude-haiku-4-5", text)
+
+    def test_prefix_is_part_of_response_cache_key(self, tmp_path):
+        messages = _FakeMessages()
+        client = self._anthropic_client(messages, cache_dir=str(tmp_path))
+        client.call("sys", "tail", cache_prefix="A ")
+        client.call("sys", "tail", cache_prefix="B ")
+        client.call("sys", "tail", cache_prefix="A ")
+        assert len(messages.kwargs) == 2
+
+    def test_disabled_sends_plain_strings(self):
+        messages = _FakeMessages()
+        client = self._anthropic_client(messages, prompt_caching=False)
+        client.call("sys", "tail", cache_prefix="head ")
+        sent = messages.kwargs[0]
+        assert sent["system"] == "sys"
+        assert sent["messages"][0]["content"] == "head tail"
+
+    def test_cache_tokens_priced_separately(self):
+        messages = _FakeMessages(cache_read=10_000, cache_write=2_000)
+        client = self._anthropic_client(messages)
+        client.call("sys", "u")
+        summary = client.get_cost_summary()
+        assert summary["cache_read_tokens"] == 10_000
+        assert summary["cache_write_tokens"] == 2_000
+        expected = (100 * 3.0 + 50 * 15.0 + 2_000 * 3.75 + 10_000 * 0.30) / 1_000_000
+        assert client.total_cost_usd == pytest.approx(expected)
+
+    def test_unknown_model_derives_cache_prices(self):
+        client = _make_client()
+        cost = client._token_cost("mystery-model", 0, 0, cache_read=1_000_000,
+                                  cache_write=1_000_000)
+        assert cost == pytest.approx(3.0 * 0.1 + 3.0 * 1.25)
+
+    def test_openai_cached_tokens_split_out(self):
+        client = _make_client()
+        usage = SimpleNamespace(prompt_tokens=1_000, completion_tokens=20,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=800))
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"),
+                                     finish_reason="stop")], usage=usage,
+        )
+        completions = SimpleNamespace(create=lambda **kwargs: response)
+        client.main_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        client.call("sys", "u")
+        summary = client.get_cost_summary()
+        assert summary["input_tokens"] == 200
+        assert summary["cache_read_tokens"] == 800
+
+
+class _FakeAnthropicStream:
+    def __init__(self, deltas, stop_reason, usage, progress):
+        self.deltas = deltas
+        self.final = SimpleNamespace(stop_reason=stop_reason, usage=usage)
+        self.progress = progress
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for delta in self.deltas:
+            self.progress.append(delta)
+            yield delta
+
+    def get_final_message(self):
+        return self.final
+
+
+class TestStreamJson:
+
+    BODY = '{"atoms": [{"id": 1}, {"id": 2}, {"id": 3}], "atoms_count": 3}'
+
+    def _client(self, deltas, stop_reason="end_turn", **kwargs):
+        progress = []
+        usage = SimpleNamespace(input_tokens=100, output_tokens=50)
+        calls = []
+
+        def _stream(**request):
+            calls.append(request)
+            return _FakeAnthropicStream(deltas, stop_reason, usage, progress)
+
+        client = ClaudeClient(api_key="k", **kwargs)
+        client.main_client = SimpleNamespace(messages=SimpleNamespace(stream=_stream))
+        return client, progress, calls
+
+    def test_items_arrive_before_stream_ends(self):
+        deltas = [self.BODY[i:i + 7] for i in range(0, len(self.BODY), 7)]
+        client, progress, _ = self._client(deltas)
+        seen_at = []
+        stream = client.stream_json("sys", "u", items_key="atoms")
+        for item in stream:
+            seen_at.append(len(progress))
+        assert stream.items == [{"id": 1}, {"id": 2}, {"id": 3}]
+        assert seen_at[0] < len(deltas)
+        assert not stream.truncated
+        assert stream.result()["atoms_count"] == 3
+        assert client.get_cost_summary()["calls"] == 1
+
+    def test_truncation_reported_with_complete_items(self):
+        cut = self.BODY[:self.BODY.index('{"id": 3}') + 5]
+        client, _, _ = self._client([cut], stop_reason="max_tokens")
+        stream = client.stream_json("sys", "u", items_key="atoms")
+        assert list(stream) == [{"id": 1}, {"id": 2}]
+        assert stream.truncated
+        assert stream.stop_reason == "max_tokens"
+
+    def test_cached_stream_replays_without_api(self, tmp_path):
+        client, _, calls = self._client([self.BODY], cache_dir=str(tmp_path))
+        assert len(list(client.stream_json("sys", "u"))) == 3
+        again = client.stream_json("sys", "u")
+        assert len(list(again)) == 3
+        assert again.stop_reason == "cached"
+        assert len(calls) == 1
+        # call_json shares the cache entry
+        assert client.call_json("sys", "u")["atoms_count"] == 3
+
+    def test_connect_failure_retried(self, monkeypatch):
+        import anthropic
+        import httpx
+
+        client, _, calls = self._client([self.BODY])
+        response = httpx.Response(529, request=httpx.Request("POST", "https://example.com"))
+        stream = client.main_client.messages.stream
+
+        def _flaky(**request):
+            if not calls:
+                calls.append(request)
+                raise anthropic.APIStatusError("overloaded", response=response, body=None)
+            return stream(**request)
+
+        client.main_client.messages.stream = _flaky
+        monkeypatch.setattr(type(client)._open_stream.retry, "sleep", lambda s: None)
+        assert client.stream_json("sys", "u").result()["atoms_count"] == 3
+        assert len(calls) == 2
+        failed, ok = client.telemetry.records
+        assert failed.error == "APIStatusError" and ok.retries == 1
+
+    def test_slot_released_when_consumer_stops(self):
+        client, _, _ = self._client([self.BODY[:20], self.BODY[20:]], max_in_flight=1)
+        stream = client.stream_json("sys", "u", items_key="atoms")
+        assert next(iter(stream)) == {"id": 1}
+        assert not client._main_slots.acquire(blocking=False)
+        stream.close()
+        assert client._main_slots.acquire(blocking=False)
+        client._main_slots.release()
+        assert not client._in_flight
+
+    def test_duplicate_stream_joins_leader(self):
+        client, _, calls = self._client([self.BODY[:20], self.BODY[20:]])
+        leader = client.stream_json("sys", "u", items_key="atoms")
+        assert next(iter(leader)) == {"id": 1}
+        joined = []
+        thread = threading.Thread(
+            target=lambda: joined.append(client.stream_json("sys", "u").result()))
+        thread.start()
+        while not client.single_flight_joins:
+            time.sleep(0.01)
+        assert leader.result()["atoms_count"] == 3
+        thread.join(timeout=5)
+        assert joined == [leader.result()]
+        assert len(calls) == 1
+
+    def test_batch_can_stream(self):
+        client, _, calls = self._client([self.BODY])
+        results = client.call_json_batch([{"system": "sys", "user": "u", "phase": "p2"}],
+                                         stream=True)
+        assert results[0]["atoms_count"] == 3
+        assert len(calls) == 1
+        assert client.telemetry.records[0].kind == "stream"
+
+    def test_openai_stream(self):
+        client = _make_client()
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=self.BODY[:20]), finish_reason=None)], usage=None),
+            SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=self.BODY[20:]), finish_reason="length")], usage=None),
+            SimpleNamespace(choices=[], usage=SimpleNamespace(
+                prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)),
+        ]
+        completions = SimpleNamespace(create=lambda **kwargs: iter(chunks))
+        client.main_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        stream = client.stream_json("sys", "u")
+        assert len(list(stream)) == 3
+        assert stream.truncated
+        assert client.get_cost_summary()["output_tokens"] == 5
+
+
+class _ScriptedApi:
+    """_call_api stand-in returning scripted (text, stop_reason) replies."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.partials = []
+        self.max_tokens = []
+
+    def __call__(self, system, user, max_tokens, temperature, active_model,
+                 client=None, sdk_type=None, cache_prefix="", partial=""):
+        self.partials.append(partial)
+        self.max_tokens.append(max_tokens)
+        text, stop_reason = self.replies.pop(0)
+        return text, 100, 50, {"stop_reason": stop_reason}
+
+
+class TestContinuation:
+
+    FULL = '{"atoms": [{"id": 1, "title": "first atom"}, {"id": 2, "title": "second atom"}]}'
+
+    def test_truncated_reply_is_continued_and_stitched(self, monkeypatch, tmp_path):
+        client = _make_client(cache_dir=str(tmp_path))
+        cut = self.FULL.index('{"id": 2')
+        api = _ScriptedApi([(self.FULL[:cut], "max_tokens"), (self.FULL[cut:], "end_turn")])
+        monkeypatch.setattr(client, "_call_api", api)
+
+        result = client.call_json("sys", "u")
+        assert [a["id"] for a in result["atoms"]] == [1, 2]
+        assert api.partials == ["", self.FULL[:cut]]
+        summary = client.get_cost_summary()
+        assert summary["calls"] == 2
+        assert summary["continuations"] == 1
+        assert summary["continuation_cost_usd"] == pytest.approx(
+            round((100 * 3.0 + 50 * 15.0) / 1_000_000, 4))
+        # The stitched response is what gets cached
+        assert json.loads(client.call("sys", "u")) == json.loads(self.FULL)
+
+    def test_anthropic_prefill_strips_whitespace_between_tokens(self, monkeypatch):
+        client = ClaudeClient(api_key="k")
+        cut = self.FULL.index('{"id": 2')
+        api = _ScriptedApi([(self.FULL[:cut], "max_tokens"), (self.FULL[cut:], "end_turn")])
+        monkeypatch.setattr(client, "_call_api", api)
+        assert json.loads(client.call("sys", "u")) == json.loads(self.FULL)
+        assert api.partials == ["", self.FULL[:cut].rstrip()]
+
+    @pytest.mark.parametrize("repeated", [False, True])
+    def test_anthropic_prefill_keeps_whitespace_inside_string(self, monkeypatch, repeated):
+        client = ClaudeClient(api_key="k")
+        cut = self.FULL.index('atom"')   # inside "first atom"
+        more = self.FULL[cut - 1 if repeated else cut:]
+        api = _ScriptedApi([(self.FULL[:cut], "max_tokens"), (more, "end_turn")])
+        monkeypatch.setattr(client, "_call_api", api)
+        assert client.call("sys", "u") == self.FULL
+        assert api.partials[1] == self.FULL[:cut - 1]
+
+    def test_repeated_overlap_dropped(self):
+        partial = 'abc {"title": "a long enough repeated tail'
+        more = '"title": "a long enough repeated tail", "x": 1}'
+        assert ClaudeClient._stitch(partial, more) == (
+            'abc {"title": "a long enough repeated tail", "x": 1}'
+        )
+        # Short accidental overlaps are not trimmed
+        assert ClaudeClient._stitch('{"a": "', '"}') == '{"a": ""}'
+
+    def test_rounds_capped_then_repaired(self, monkeypatch):
+        client = _make_client(max_continuations=2)
+        api = _ScriptedApi([('{"atoms": [{"id": 1}, ', "max_tokens"),
+                            ('{"id": 2}, ', "max_tokens"),
+                            ('{"id": 3}, {"id": 4, "title": "cut', "max_tokens")])
+        monkeypatch.setattr(client, "_call_api", api)
+        result = client.call_json("sys", "u")
+        assert len(api.partials) == 3
+        assert [a["id"] for a in result["atoms"]] == [1, 2, 3, 4]
+        assert client.get_cost_summary()["continuations"] == 2
+
+    def test_disabled_with_zero_rounds(self, monkeypatch):
+        client = _make_client(max_continuations=0)
+        api = _ScriptedApi([('{"atoms": [{"id": 1}, {"id": 2, "t": "cu', "max_tokens")])
+        monkeypatch.setattr(client, "_call_api", api)
+        assert client.call_json("sys", "u") == {"atoms": [{"id": 1}, {"id": 2, "t": "cu"}]}
+        assert len(api.partials) == 1
+
+    def test_failed_round_keeps_partial(self, monkeypatch):
+        client = _make_client()
+        api = _ScriptedApi([('{"atoms": [{"id": 1}, {"id": 2, "t": "cu', "max_tokens")])
+
+        def _flaky(*args, partial="", **kwargs):
+            if partial:
+                raise ClaudeAPIError("boom", retryable=False)
+            return api(*args, partial=partial, **kwargs)
+
+        monkeypatch.setattr(client, "_call_api", _flaky)
+        assert client.call_json("sys", "u") == {"atoms": [{"id": 1}, {"id": 2, "t": "cu"}]}
+
+    def test_anthropic_continuation_uses_prefill(self):
+        replies = iter([('{"a": [1, ', "max_tokens"), ('2]}', "end_turn")])
+        sent = []
+
+        def _create(**kwargs):
+            sent.append(kwargs)
+            text, stop = next(replies)
+            return SimpleNamespace(content=[SimpleNamespace(text=text)], stop_reason=stop,
+                                   usage=SimpleNamespace(input_tokens=1, output_tokens=1))
+
+        client = ClaudeClient(api_key="k")
+        client.main_client = SimpleNamespace(messages=SimpleNamespace(create=_create))
+        assert client.call_json("sys", "u") == {"a": [1, 2]}
+        assert sent[1]["messages"][-1] == {"role": "assistant", "content": '{"a": [1,'}
+
+    def test_stream_continues_and_yields_tail_items(self):
+        client = ClaudeClient(api_key="k")
+        head = '{"atoms": [{"id": 1}, {"id": 2'
+        usage = SimpleNamespace(input_tokens=10, output_tokens=10)
+        client.main_client = SimpleNamespace(messages=SimpleNamespace(
+            stream=lambda **kw: _FakeAnthropicStream([head], "max_tokens", usage, []),
+        ))
+        continued = []
+
+        def _continue(system, user, max_tokens, temperature, model, client=None,
+                      sdk_type=None, cache_prefix="", partial=""):
+            continued.append(partial)
+            return '}, {"id": 3}]}', 5, 5, {"stop_reason": "end_turn"}
+
+        client._call_api = _continue
+        stream = client.stream_json("sys", "u", items_key="atoms")
+        assert [a["id"] for a in stream] == [1, 2, 3]
+        assert continued == [head]
+        assert not stream.truncated
+
+
+class TestPreflight:
+
+    def test_output_clamped_to_model_cap(self, monkeypatch):
+        client = _make_client()
+        api = _ScriptedApi([('{"ok": 1}', "stop")])
+        monkeypatch.setattr(client, "_call_api", api)
+        client.call("sys", "u", max_tokens=500_000)
+        assert api.max_tokens == [64_000]
+
+    def test_output_clamped_to_remaining_window(self, monkeypatch):
+        client = _make_client(model="deepseek-chat")
+        api = _ScriptedApi([('{"ok": 1}', "stop")])
+        monkeypatch.setattr(client, "_call_api", api)
+        prompt = "word " * 52_000
+        client.call("sys", prompt, max_tokens=8192)
+        counter = client.token_counter
+        room = 64_000 - counter.count("sys", "deepseek-chat") - counter.count(prompt, "deepseek-chat")
+        assert 0 < room < 8192
+        assert api.max_tokens == [room]
+
+    def test_oversized_prompt_rejected_before_sending(self, monkeypatch):
+        client = _make_client(model="deepseek-chat")
+        api = _ScriptedApi([])
+        monkeypatch.setattr(client, "_call_api", api)
+        with pytest.raises(ClaudeAPIError) as exc:
+            client.call("sys", "word " * 400_000)
+        assert not exc.value.retryable
+        assert api.partials == []
+
+    def test_reported_usage_calibrates_estimates(self, monkeypatch):
+        from pipeline.core.tokens import HeuristicTokenCounter
+        client = _make_client()
+        client.token_counter = HeuristicTokenCounter()
+        prompt = "tiếng việt có dấu " * 200
+        estimate = client.token_counter.count(prompt, client.model)
+
+        def _api(system, user, max_tokens, *args, **kwargs):
+            return "ok", estimate * 2, 10, {}
+
+        monkeypatch.setattr(client, "_call_api", _api)
+        for i in range(5):
+            client.call("", prompt + str(i))
+        assert client.token_counter.scale(client.model) > 1.3
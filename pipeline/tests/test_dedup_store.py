@@ -0,0 +1,195 @@
+"""Tests for the per-skill dedup store and incremental P3 rebuilds."""
+
+import json
+import os
+
+from pipeline.core.dedup_store import (
+    DedupStore, atom_key, cluster_key, conflict_key, skill_key,
+)
+from pipeline.core.utils import read_json, write_json
+from pipeline.orchestrator.runner import _remember_resolutions
+from pipeline.phases.p3_dedup import _canonical_order, _cluster_atoms, run_p3
+from pipeline.tests.conftest import MockClaudeClient
+
+
+def _atom(aid, topic, n=0, category="campaign_management"):
+    return {"id": aid, "title": topic, "category": category,
+            "content": f"{topic} {topic}chitiết bảnghi{n}.",
+            "tags": [], "confidence": 0.9, "status": "raw", "source": "transcript"}
+
+
+class TestDedupStore:
+
+    def test_keys_ignore_atom_id(self):
+        a, b = _atom("atom_0001", "pixel"), _atom("atom_0042", "pixel")
+        assert atom_key(a) == atom_key(b) != atom_key(_atom("atom_0001", "pixel", 1))
+        assert cluster_key(["x", "y"]) == cluster_key(["y", "x"])
+        assert skill_key("Skill A", "fb_ads") != skill_key("Skill B", "fb_ads")
+        assert "/" not in skill_key("a/b", "../c")
+        a, b = _atom("atom_0001", "pixel"), _atom("atom_0002", "lookalike")
+        assert conflict_key(a, b) == conflict_key(b, a)
+
+    def test_canonical_order_survives_copies(self):
+        cluster = [_atom(f"atom_{i:04d}", t) for i, t in enumerate(["pixel", "ads", "seo"])]
+        keys = {a["id"]: atom_key(a) for a in cluster}
+        copies = [dict(a) for a in reversed(cluster)]
+        assert ([a["id"] for a in _canonical_order(copies, keys)]
+                == [a["id"] for a in _canonical_order(cluster, keys)])
+
+    def test_roundtrip_across_instances(self, tmp_cache_dir):
+        store = DedupStore(tmp_cache_dir, "skill")
+        store.save("ns", [("k1", "cat", {"pixel", "ads"}, "c1"), ("k2", "cat", set(), "c1")],
+                   {"c1": {"unique_atoms": [{"id": "@0"}], "conflicts": []}})
+        store.close()
+
+        store = DedupStore(tmp_cache_dir, "skill")
+        assert len(store) == 2
+        assert store.known_atoms(["k1", "k3"]) == {"k1": ({"pixel", "ads"}, "c1")}
+        assert store.decisions("ns", ["c1", "c2"]) == {
+            "c1": {"unique_atoms": [{"id": "@0"}], "conflicts": []}}
+        assert store.decisions("other", ["c1"]) == {}
+
+        store.save_resolutions({"p1": {"keep": "k1", "merged_content": None}})
+        store.close()
+        store = DedupStore(tmp_cache_dir, "skill")
+        assert store.resolutions(["p1", "p2"]) == {"p1": {"keep": "k1", "merged_content": None}}
+
+
+class TestIncrementalClustering:
+
+    def test_only_new_atoms_compared(self):
+        atoms = [_atom(f"a{i}", t) for i, t in enumerate(["pixel", "pixel", "lookalike", "pixel"])]
+        # a0/a1 were split apart last build: known atoms keep that decision
+        clusters = _cluster_atoms(atoms, prior=["c0", "c1", "c2", None])
+        assert [[a["id"] for a in c] for c in clusters] == [["a0", "a1", "a3"], ["a2"]]
+        clusters = _cluster_atoms(atoms[:3], prior=["c0", "c1", "c2"])
+        assert [[a["id"] for a in c] for c in clusters] == [["a0"], ["a1"], ["a2"]]
+
+    def test_embedding_queries_new_atoms_only(self):
+        import numpy as np
+
+        class FakeEmbeddings:
+            _api_available = True
+            calls = []
+
+            def similar_pairs(self, queries, corpus=None, threshold=0.0):
+                self.calls.append((len(queries), len(corpus)))
+                return np.array([0]), np.array([1]), np.array([0.9])
+
+        atoms = [_atom(f"a{i}", f"t{i}") for i in range(4)]
+        embeddings = FakeEmbeddings()
+        clusters = _cluster_atoms(atoms, embeddings, prior=["c0", "c0", "c2", None])
+        assert embeddings.calls == [(1, 4)]
+        assert [[a["id"] for a in c] for c in clusters] == [["a0", "a1", "a3"], ["a2"]]
+
+
+class _MergingClaude(MockClaudeClient):
+    """Keeps the first atom of each call, merging the rest into it, and
+    flags a conflict between the first two."""
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def call_json(self, system, user, **kwargs):
+        self.call_count += 1
+        atoms = json.loads(user.split("--- ATOMS START ---")[1]
+                           .split("--- ATOMS END ---")[0])
+        ids = [a["id"] for a in atoms]
+        self.prompts.append(ids)
+        by_topic: dict[str, list[str]] = {}
+        for a in atoms:
+            by_topic.setdefault(a["title"], []).append(a["id"])
+        return {
+            "unique_atoms": [{"id": group[0], "merged_from": group}
+                             for group in by_topic.values()],
+            "conflicts": [{"atom_a_id": group[0], "atom_b_id": group[1],
+                           "conflict_type": "contradictory_data",
+                           "description": "Số liệu khác nhau"}
+                          for group in by_topic.values() if len(group) > 1],
+            "stats": {"duplicates_found": len(atoms) - len(by_topic)},
+        }
+
+
+class TestIncrementalP3:
+
+    TOPICS = [(t, n) for n, t in enumerate(
+        ["pixel", "pixel", "lookalike", "lookalike", "lookalike", "retarget", "ngân_sách"])]
+
+    def _run(self, build_config, logger, topics):
+        atoms = [_atom(f"atom_{i:04d}", t, n) for i, (t, n) in enumerate(topics)]
+        write_json({"atoms": atoms, "total_atoms": len(atoms), "score": 85.0},
+                   os.path.join(build_config.output_dir, "atoms_raw.json"))
+        claude = _MergingClaude()
+        result = run_p3(build_config, claude, None, None, logger)
+        assert result.status == "done"
+        dedup = read_json(os.path.join(build_config.output_dir, "atoms_deduplicated.json"))
+        conflicts = read_json(os.path.join(build_config.output_dir, "conflicts.json"))
+        return claude, result, dedup, conflicts
+
+    @staticmethod
+    def _summary(dedup, conflicts):
+        """Output with atoms named by content rather than build-specific id."""
+        return (sorted((a["content"], len(a.get("merged_from", []))) for a in dedup["atoms"]),
+                dedup["duplicates_merged"],
+                sorted((c["atom_a"]["content"], c["atom_b"]["content"])
+                       for c in conflicts["conflicts"]))
+
+    def test_rebuild_replays_stored_decisions(self, build_config, logger):
+        claude, first, dedup, conflicts = self._run(build_config, logger, self.TOPICS)
+        assert claude.call_count == 1
+        assert first.metrics["dedup_new_atoms"] == len(self.TOPICS)
+
+        # A transcript was added in front: every P2 id shifts by two
+        claude, second, dedup2, conflicts2 = self._run(
+            build_config, logger, [("seo", 100), ("email", 101)] + self.TOPICS)
+        assert claude.call_count == 0
+        assert second.metrics["dedup_reused"] == 2
+        assert second.metrics["dedup_new_atoms"] == 2
+        assert self._summary(dedup2, conflicts2)[0] == sorted(
+            self._summary(dedup, conflicts)[0]
+            + [(_atom("", "seo", 100)["content"], 0), (_atom("", "email", 101)["content"], 0)])
+        assert self._summary(dedup2, conflicts2)[1:] == self._summary(dedup, conflicts)[1:]
+        assert {a["id"] for a in dedup2["atoms"]} >= {"atom_0002", "atom_0004"}
+
+    def test_new_duplicate_sends_only_its_cluster(self, build_config, logger):
+        self._run(build_config, logger, self.TOPICS)
+        topics = self.TOPICS + [("pixel", 100)]
+        claude, result, dedup, conflicts = self._run(build_config, logger, topics)
+        assert claude.prompts == [["atom_0000", "atom_0001", "atom_0007"]]
+        assert result.metrics["dedup_reused"] == 1
+
+        build_config.dedup_store = False
+        cold = self._run(build_config, logger, topics)
+        assert self._summary(dedup, conflicts) == self._summary(*cold[2:])
+
+    def test_prompt_change_invalidates_decisions(self, build_config, logger, monkeypatch):
+        self._run(build_config, logger, self.TOPICS)
+        monkeypatch.setattr("pipeline.phases.p3_dedup.P3_PROMPT_VERSION", "p3_dedup_v2")
+        claude, *_ = self._run(build_config, logger, self.TOPICS)
+        assert claude.call_count == 1
+
+    def test_user_resolutions_not_asked_again(self, build_config, logger):
+        _, first, _, conflicts = self._run(build_config, logger, self.TOPICS)
+        assert first.metrics["conflicts_unresolved"] == 2
+        pixel, lookalike = sorted(conflicts["conflicts"], key=lambda c: c["atom_a"]["title"],
+                                  reverse=True)
+        resolutions = {
+            pixel["id"]: {"action": "keep_a", "atom_a_id": pixel["atom_a"]["id"],
+                          "atom_b_id": pixel["atom_b"]["id"]},
+            lookalike["id"]: {"action": "merge", "atom_a_id": lookalike["atom_a"]["id"],
+                              "atom_b_id": lookalike["atom_b"]["id"],
+                              "merged_content": "Nội dung đã gộp."},
+        }
+        _remember_resolutions(build_config, resolutions, logger)
+
+        # Ids shift, the replayed clusters raise the same conflicts
+        claude, second, dedup, conflicts = self._run(
+            build_config, logger, [("seo", 100)] + self.TOPICS)
+        assert claude.call_count == 0
+        assert second.metrics["conflicts_unresolved"] == 0
+        assert sorted(c["resolution"] for c in conflicts["conflicts"]) == ["keep_a", "keep_a"]
+        contents = [a["content"] for a in dedup["atoms"]]
+        assert "Nội dung đã gộp." in contents
+        assert lookalike["atom_a"]["content"] not in contents
+        assert pixel["atom_a"]["content"] in contents
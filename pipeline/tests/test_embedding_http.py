@@ -0,0 +1,138 @@
+"""Tests for pooled, concurrent embedding requests against a local stub API."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from pipeline.core.embeddings import EmbeddingClient
+
+
+class _StubEmbeddings:
+    """OpenAI-compatible /embeddings: vector = [len(text), index]."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.script: list[tuple[int, dict]] = []    # (status, headers) served first
+        self.requests = 0
+        self.ports: set[int] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"           # keep-alive
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.ports.add(self.client_address[1])
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status, headers = stub.script.pop(0) if stub.script else (200, {})
+                time.sleep(stub.delay)
+                if status == 200:
+                    payload = {
+                        "data": [{"embedding": [float(len(t)), float(i)]}
+                                 for i, t in enumerate(body["input"])],
+                        "usage": {"total_tokens": len(body["input"])},
+                    }
+                else:
+                    payload = {"error": {"message": "slow down"}}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                with stub._lock:
+                    stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = _StubEmbeddings()
+    yield server
+    server.close()
+
+
+def _client(stub, **kwargs):
+    return EmbeddingClient(api_key="k", base_url=stub.url, **kwargs)
+
+
+class TestBatchPlanning:
+
+    def test_batches_by_token_budget(self):
+        client = EmbeddingClient(api_key="k", batch_tokens=10)
+        batches = client._plan_batches(["one two three four"] * 5)
+        assert sum(len(b) for b in batches) == 5
+        assert all(len(b) <= 2 for b in batches)
+
+    def test_oversized_text_gets_own_batch(self):
+        client = EmbeddingClient(api_key="k", batch_tokens=5)
+        batches = client._plan_batches(["a", "word " * 50, "b"])
+        assert batches == [["a"], ["word " * 50], ["b"]]
+
+
+class TestConcurrentRequests:
+
+    def test_corpus_embedded_in_parallel_over_pooled_connections(self, stub):
+        stub.delay = 0.05
+        client = _client(stub, max_concurrency=8, batch_tokens=2000, cache_enabled=False)
+        texts = [f"văn bản số {i} " * 3 for i in range(5000)]
+        start = time.perf_counter()
+        result = client.embed_texts(texts)
+        elapsed = time.perf_counter() - start
+        batches = len(client._plan_batches(texts))
+
+        assert not result.fallback_used
+        assert [v[0] for v in result.vectors] == [float(len(t)) for t in texts]
+        assert result.tokens_used == 5000
+        assert stub.requests == batches > 8
+        assert stub.max_in_flight > 1
+        assert len(stub.ports) <= 8                     # connections reused
+        assert elapsed < batches * stub.delay / 2       # well below sequential
+        client.close()
+
+    def test_retry_after_honoured_on_429(self, stub):
+        stub.script = [(429, {"retry-after": "0.3"})]
+        client = _client(stub)
+        start = time.perf_counter()
+        result = client.embed_texts(["xin chào"])
+        assert not result.fallback_used
+        assert time.perf_counter() - start >= 0.3
+        assert client.get_stats()["retries"] == 1
+        assert stub.requests == 2
+
+    def test_client_error_not_retried(self, stub):
+        stub.script = [(400, {})]
+        client = _client(stub)
+        with pytest.raises(httpx.HTTPStatusError):
+            client._api_embed(["xin chào"])
+        assert stub.requests == 1
+
+    def test_persistent_failure_falls_back_to_tfidf(self, stub, monkeypatch):
+        monkeypatch.setattr("pipeline.core.embeddings.time.sleep", lambda s: None)
+        stub.script = [(503, {})] * 3
+        result = _client(stub).embed_texts(["a b", "b c"])
+        assert result.fallback_used
+        assert stub.requests == 3
@@ -0,0 +1,109 @@
+"""Tests for the persistent cross-build embedding store."""
+
+import numpy as np
+import pytest
+
+from pipeline.core import embedding_store
+from pipeline.core.cassette import RECORD, Cassette
+from pipeline.core.embedding_store import EmbeddingStore, open_embedding_store
+from pipeline.core.embeddings import EmbeddingClient
+
+
+def _vec(seed, dim=8):
+    return np.random.default_rng(seed).standard_normal(dim).tolist()
+
+
+class TestEmbeddingStore:
+
+    def test_round_trip_and_bulk_lookup(self, tmp_path):
+        store = EmbeddingStore(str(tmp_path))
+        assert store.put_many("m", ["a", "b"], [_vec(1), _vec(2)]) == 2
+        assert store.put_many("m", ["a"], [_vec(3)]) == 0     # first write wins
+        found = store.get_many("m", ["b", "x", "a"])
+        assert set(found) == {0, 2}
+        assert found[0].dtype == np.float32
+        assert found[2].tolist() == pytest.approx(_vec(1), rel=1e-6)
+        assert store.get_many("other-model", ["a"]) == {}
+        assert store.stats()["hits"] == 2 and store.stats()["misses"] == 2
+
+    def test_shared_between_instances(self, tmp_path):
+        """Two builds on one store: each sees the other's appends."""
+        first, second = EmbeddingStore(str(tmp_path)), EmbeddingStore(str(tmp_path))
+        first.put_many("m", ["a"], [_vec(1)])
+        assert second.get_many("m", ["a"])[0].tolist() == pytest.approx(_vec(1), rel=1e-6)
+        second.put_many("m", ["b"], [_vec(2)])
+        first.put_many("m", ["c"], [_vec(3)])
+        found = first.get_many("m", ["a", "b", "c"])
+        assert [found[i].tolist() for i in range(3)] == [
+            pytest.approx(_vec(s), rel=1e-6) for s in (1, 2, 3)]
+        assert first.stats()["entries"] == 3
+
+    def test_float16_and_mixed_dims(self, tmp_path):
+        store = EmbeddingStore(str(tmp_path), dtype="float16")
+        store.put_many("m", ["a", "b"], [_vec(1), _vec(2, dim=4)])
+        found = store.get_many("m", ["a", "b"])
+        assert found[0].tolist() == pytest.approx(_vec(1), abs=1e-2)
+        assert len(found[1]) == 4
+        # The dtype is fixed by whoever created the store
+        assert EmbeddingStore(str(tmp_path), dtype="float32").dtype == "float16"
+        with pytest.raises(ValueError):
+            EmbeddingStore(str(tmp_path), dtype="int8")
+
+    def test_lru_eviction_reuses_slots_after_grace(self, tmp_path, monkeypatch):
+        store = EmbeddingStore(str(tmp_path), max_entries=4)
+        store.put_many("m", ["a", "b", "c", "d"], [_vec(i) for i in range(4)])
+        store.get_many("m", ["a"])
+        store.put_many("m", ["e"], [_vec(4)])
+        assert store.stats()["entries"] == 3
+        assert set(store.get_many("m", ["a", "b", "c", "d", "e"])) == {0, 3, 4}
+        size = (tmp_path / "vectors_8.f32").stat().st_size
+
+        # Within the grace period the file grows; afterwards freed slots are reused
+        store.put_many("m", ["f"], [_vec(5)])
+        assert (tmp_path / "vectors_8.f32").stat().st_size > size
+        monkeypatch.setattr(embedding_store, "SLOT_REUSE_GRACE_S", -1.0)
+        size = (tmp_path / "vectors_8.f32").stat().st_size
+        store.put_many("m", ["g"], [_vec(6)])
+        assert (tmp_path / "vectors_8.f32").stat().st_size == size
+        assert store.get_many("m", ["g"])[0].tolist() == pytest.approx(_vec(6), rel=1e-6)
+
+    def test_disabled(self, tmp_path):
+        assert open_embedding_store(str(tmp_path), max_entries=0) is None
+
+
+def _api_client(store, calls, **kwargs):
+    client = EmbeddingClient(api_key="k", store=store, **kwargs)
+
+    def post(texts, retries):
+        calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts], len(texts)
+    client._post_embeddings = post
+    return client
+
+
+class TestEmbeddingClientStore:
+
+    def test_second_build_reads_store(self, tmp_path):
+        calls = []
+        _api_client(EmbeddingStore(str(tmp_path)), calls).embed_texts(["một", "hai ba"])
+        client = _api_client(EmbeddingStore(str(tmp_path)), calls)
+        result = client.embed_texts(["hai ba", "bốn", "một"])
+        assert calls == [["một", "hai ba"], ["bốn"]]
+        assert result.vectors == [[6.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+        assert client.embed_texts(["hai ba"]).from_cache
+        assert client.get_stats()["store"]["entries"] == 3
+
+    def test_fallback_never_mixes_with_stored_vectors(self, tmp_path):
+        store = EmbeddingStore(str(tmp_path))
+        _api_client(store, []).embed_texts(["facebook ads"])
+        client = EmbeddingClient(api_key="k", store=store)
+        client._post_embeddings = lambda texts, retries: (_ for _ in ()).throw(OSError("down"))
+        result = client.embed_texts(["facebook ads", "python loops"])
+        assert result.fallback_used
+        assert len({len(v) for v in result.vectors}) == 1
+        assert store.stats()["entries"] == 1
+
+    def test_store_unused_under_cassette(self, tmp_path):
+        client = EmbeddingClient(api_key="k", store=EmbeddingStore(str(tmp_path / "s")),
+                                 cassette=Cassette(str(tmp_path / "c.jsonl"), RECORD))
+        assert "store" not in client.get_stats()
@@ -0,0 +1,93 @@
+"""Tests for incremental JSON item parsing of streamed responses."""
+
+import json
+
+import pytest
+
+from pipeline.core.json_stream import IncrementalJsonParser, JsonStream
+
+DOC = {
+    "chunk_index": 1,
+    "atoms": [
+        {"title": "Brackets [inside] {strings}", "tags": ["a", "b"]},
+        {"title": 'Escaped \\" quote and \\\\ slash', "nested": {"x": [1, [2]]}},
+        {"title": "Tiếng Việt có dấu", "confidence": 0.9},
+    ],
+    "atoms_count": 3,
+}
+
+
+def _feed_all(parser, text, step):
+    out = []
+    for i in range(0, len(text), step):
+        out.extend(parser.feed(text[i:i + step]))
+    return out
+
+
+class TestIncrementalJsonParser:
+
+    @pytest.mark.parametrize("step", [1, 2, 5, 13, 10_000])
+    def test_items_independent_of_chunking(self, step):
+        text = json.dumps(DOC, ensure_ascii=False)
+        parser = IncrementalJsonParser("atoms")
+        assert _feed_all(parser, text, step) == DOC["atoms"]
+        assert parser.complete
+
+    def test_items_emitted_as_soon_as_closed(self):
+        parser = IncrementalJsonParser("atoms")
+        assert parser.feed('{"atoms": [{"a": 1}, {"b"') == [{"a": 1}]
+        assert parser.feed(': 2}') == [{"b": 2}]
+        assert not parser.complete
+
+    def test_skips_fences_and_prose(self):
+        text = "Here you go:\n```json\n" + json.dumps(DOC) + "\n```"
+        assert IncrementalJsonParser("atoms").feed(text) == DOC["atoms"]
+
+    def test_first_array_when_no_key(self):
+        parser = IncrementalJsonParser()
+        assert parser.feed('{"n": 1, "results": [{"id": 1}], "more": [{"id": 9}]}') == [{"id": 1}]
+
+    def test_items_key_skips_other_arrays(self):
+        parser = IncrementalJsonParser("results")
+        items = parser.feed('{"tags": [{"no": 1}], "results": [{"id": 1}, {"id": 2}]}')
+        assert items == [{"id": 1}, {"id": 2}]
+
+    def test_key_text_inside_value_not_mistaken(self):
+        parser = IncrementalJsonParser("atoms")
+        items = parser.feed('{"note": "atoms", "other": [1], "atoms": [{"id": 1}]}')
+        assert items == [{"id": 1}]
+
+    def test_root_list_with_scalars(self):
+        assert IncrementalJsonParser().feed('[1, "two", {"three": 3}, [4], null]') == [
+            1, "two", {"three": 3}, [4], None,
+        ]
+
+    def test_truncated_stream_keeps_complete_prefix(self):
+        text = json.dumps(DOC, ensure_ascii=False)
+        cut = text.index("Tiếng")
+        parser = IncrementalJsonParser("atoms")
+        assert parser.feed(text[:cut]) == DOC["atoms"][:2]
+        assert not parser.complete
+        assert text[:parser.last_item_end].endswith("}")
+
+
+class TestJsonStream:
+
+    def test_iterate_then_result(self):
+        text = json.dumps(DOC)
+        stream = JsonStream([text[:40], text[40:]], json.loads, "atoms", {"stop_reason": "end_turn"})
+        assert list(stream) == DOC["atoms"]
+        assert not stream.truncated
+        assert stream.result() == DOC
+
+    def test_truncation_from_stop_reason(self):
+        stream = JsonStream(['{"atoms": [{"a": 1}, {"b'], lambda t: None, "atoms",
+                            {"stop_reason": "max_tokens"})
+        assert list(stream) == [{"a": 1}]
+        assert stream.truncated
+
+    def test_truncation_from_unclosed_root(self):
+        stream = JsonStream(['{"atoms": [{"a": 1}'], lambda t: None, "atoms")
+        list(stream)
+        assert stream.truncated
+        assert stream.items == [{"a": 1}]
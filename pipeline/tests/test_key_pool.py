@@ -0,0 +1,127 @@
+"""Tests for the per-provider API key pool."""
+
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from pipeline.clients.claude_client import ClaudeClient, CreditExhaustedError
+from pipeline.clients.key_pool import KeyPool, PooledKey
+from pipeline.core.rate_limiter import RateLimiter
+
+
+def _keys(n):
+    return [PooledKey(f"main#{i + 1}", f"bucket{i}", None, "openai") for i in range(n)]
+
+
+class TestKeyPool:
+
+    def test_round_robin_without_limits(self):
+        pool = KeyPool("main", _keys(3))
+        picked = []
+        for _ in range(6):
+            key = pool.pick()
+            picked.append(key.label)
+            pool.release(key)
+        assert picked == ["main#1", "main#2", "main#3"] * 2
+
+    def test_prefers_key_with_most_budget(self, tmp_path):
+        limiter = RateLimiter(str(tmp_path))
+        keys = _keys(2)
+        for key in keys:
+            limiter.configure(key.bucket, rpm=10)
+        for _ in range(5):
+            limiter.acquire("bucket1")
+        pool = KeyPool("main", keys, limiter)
+        assert pool.headroom("bucket1") == pytest.approx(0.5, abs=0.01)
+        assert pool.pick().label == "main#1"
+        limiter.penalize("bucket0", 30)
+        assert pool.pick().label == "main#2"
+        limiter.close()
+
+    def test_busy_key_skipped(self):
+        pool = KeyPool("main", _keys(2))
+        first = pool.pick()
+        assert pool.pick() is not first
+
+    def test_retire(self):
+        pool = KeyPool("main", _keys(2))
+        assert pool.retire(pool.keys[0], "credit balance is too low") == 1
+        assert all(pool.pick().label == "main#2" for _ in range(3))
+        assert pool.retire(pool.keys[1]) == 0
+        assert pool.pick() is None
+        assert [s["retired"] for s in pool.stats()] == [True, True]
+
+
+def _completion(text):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+    )
+
+
+def _credit_error():
+    response = httpx.Response(400, request=httpx.Request("POST", "https://example.com"))
+    return openai.BadRequestError(
+        "Your credit balance is too low to access the API", response=response, body=None,
+    )
+
+
+def _fake_sdk(label, calls, fail=False):
+    def create(**kwargs):
+        calls.append(label)
+        if fail:
+            raise _credit_error()
+        return _completion(f'{{"key": "{label}"}}')
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _pooled_client(monkeypatch, fail=(), **kwargs):
+    client = ClaudeClient(api_key="k1", api_keys=["k2", "k3", "k2"],
+                          base_url="https://example.com", **kwargs)
+    calls = []
+    for key in client._main_keys.keys:
+        key.client = _fake_sdk(key.label, calls, fail=key.label in fail)
+    monkeypatch.setattr(type(client)._call_uncached.retry, "sleep", lambda s: None)
+    return client, calls
+
+
+class TestClientKeyPool:
+
+    def test_keys_deduplicated_and_spread(self, monkeypatch):
+        client, calls = _pooled_client(monkeypatch)
+        assert len(client._main_keys) == 3
+        assert client._light_keys is client._main_keys
+        for i in range(6):
+            client.call("sys", f"u{i}")
+        assert calls == ["main#1", "main#2", "main#3"] * 2
+
+    def test_credit_error_retires_key_and_retries_elsewhere(self, monkeypatch):
+        client, calls = _pooled_client(monkeypatch, fail={"main#1"})
+        results = {client.call_json("sys", f"u{i}")["key"] for i in range(4)}
+        assert "main#1" not in results
+        assert calls.count("main#1") == 1
+        stats = {s["key"]: s for s in client.get_key_pool_stats()["main"]}
+        assert stats["main#1"]["retired"]
+        assert "credit balance" in stats["main#1"]["retired_reason"]
+        assert stats["main#1"]["errors"] == 1
+
+    def test_all_keys_retired_raises(self, monkeypatch):
+        client, _ = _pooled_client(monkeypatch, fail={"main#1", "main#2", "main#3"})
+        with pytest.raises(CreditExhaustedError):
+            client.call("sys", "u")
+        assert all(s["retired"] for s in client.get_key_pool_stats()["main"])
+
+    def test_pool_reported_in_telemetry(self, monkeypatch, tmp_path):
+        client, _ = _pooled_client(monkeypatch, cache_dir=str(tmp_path), rpm=100)
+        client.call("sys", "u")
+        summary = client.get_telemetry_summary()
+        assert set(summary["by_key"]) == {"main#1"}
+        assert [s["key"] for s in summary["key_pools"]["main"]] == ["main#1", "main#2", "main#3"]
+        assert set(client.get_rate_limit_stats()) == {"main#1", "main#2", "main#3"}
+
+    def test_single_key_has_no_pool_stats(self):
+        client = ClaudeClient(api_key="k", base_url="https://example.com")
+        assert client.get_key_pool_stats() == {}
+        assert "key_pools" not in client.get_telemetry_summary()
@@ -0,0 +1,290 @@
+"""Batch-mode tests against a local stand-in for the provider batch APIs."""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipeline.clients.claude_client import ClaudeClient
+
+MODEL = "claude-sonnet-4-5-20250929"
+
+
+def _answer(user: str) -> str:
+    return json.dumps({"echo": user})
+
+
+class _StubState:
+    def __init__(self):
+        self.batches = {}          # id -> list of (custom_id, body)
+        self.files = {}            # id -> text
+        self.polls = {}            # id -> retrieve count
+        self.submissions = 0
+        self.interactive_calls = 0
+        self.batches_supported = True
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    state: _StubState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _base(self) -> str:
+        return f"http://{self.headers['Host']}"
+
+    # ── Anthropic Message Batches ──
+
+    def _anthropic_batch(self, batch_id, ended):
+        return {
+            "id": batch_id, "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else 1, "succeeded": 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2026-01-01T00:00:00Z", "expires_at": "2026-01-02T00:00:00Z",
+            "ended_at": None, "archived_at": None, "cancel_initiated_at": None,
+            "results_url": f"{self._base()}/v1/messages/batches/{batch_id}/results"
+            if ended else None,
+        }
+
+    def _anthropic_message(self, user):
+        return {
+            "id": "msg", "type": "message", "role": "assistant", "model": MODEL,
+            "content": [{"type": "text", "text": _answer(user)}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 50},
+        }
+
+    # ── OpenAI-compatible Batch API ──
+
+    def _openai_batch(self, batch_id, done):
+        return {
+            "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions",
+            "input_file_id": "file-in", "completion_window": "24h",
+            "status": "completed" if done else "in_progress", "created_at": 0,
+            "output_file_id": f"out-{batch_id}" if done else None,
+            "error_file_id": None,
+            "request_counts": {"total": 1, "completed": 0, "failed": 0},
+        }
+
+    def _chat_completion(self, user):
+        return {
+            "id": "chat", "object": "chat.completion", "created": 0, "model": MODEL,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": _answer(user)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        }
+
+    def do_POST(self):
+        st = self.state
+        raw = self._body()
+        if self.path == "/v1/messages/batches":
+            with st.lock:
+                st.submissions += 1
+                batch_id = f"msgbatch_{st.submissions}"
+                st.batches[batch_id] = [
+                    (r["custom_id"], r["params"]) for r in json.loads(raw)["requests"]
+                ]
+                st.polls[batch_id] = 0
+            return self._send(200, self._anthropic_batch(batch_id, ended=False))
+        if self.path == "/v1/messages":
+            with st.lock:
+                st.interactive_calls += 1
+            user = json.loads(raw)["messages"][0]["content"]
+            return self._send(200, self._anthropic_message(user))
+        if self.path == "/v1/files":
+            lines = re.findall(rb'^\{"custom_id".*$', raw, re.M)
+            with st.lock:
+                file_id = f"file-{len(st.files) + 1}"
+                st.files[file_id] = b"\n".join(lines).decode()
+            return self._send(200, {"id": file_id, "object": "file", "bytes": len(raw),
+                                    "created_at": 0, "filename": "batch.jsonl",
+                                    "purpose": "batch", "status": "processed"})
+        if self.path == "/v1/batches":
+            if not st.batches_supported:
+                return self._send(404, {"error": {"message": "not found"}})
+            body = json.loads(raw)
+            with st.lock:
+                st.submissions += 1
+                batch_id = f"batch_{st.submissions}"
+                st.batches[batch_id] = [
+                    (r["custom_id"], r["body"])
+                    for r in map(json.loads, st.files[body["input_file_id"]].splitlines())
+                ]
+                st.polls[batch_id] = 0
+            return self._send(200, self._openai_batch(batch_id, done=False))
+        if self.path == "/v1/chat/completions":
+            with st.lock:
+                st.interactive_calls += 1
+            user = json.loads(raw)["messages"][1]["content"]
+            return self._send(200, self._chat_completion(user))
+        self._send(404, {"error": {"message": self.path}})
+
+    def do_GET(self):
+        st = self.state
+        m = re.fullmatch(r"/v1/messages/batches/([^/]+)(/results)?", self.path)
+        if m:
+            batch_id = m.group(1)
+            if m.group(2):
+                lines = []
+                for custom_id, params in st.batches[batch_id]:
+                    user = params["messages"][0]["content"]
+                    if "fail" in user:
+                        result = {"type": "errored", "error": {"type": "error", "error": {
+                            "type": "api_error", "message": "boom"}}}
+                    else:
+                        result = {"type": "succeeded", "message": self._anthropic_message(user)}
+                    lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+                return self._send(200, "\n".join(lines).encode(), "application/x-jsonl")
+            st.polls[batch_id] += 1
+            return self._send(200, self._anthropic_batch(batch_id, ended=st.polls[batch_id] >= 2))
+        m = re.fullmatch(r"/v1/batches/([^/]+)", self.path)
+        if m:
+            batch_id = m.group(1)
+            st.polls[batch_id] += 1
+            return self._send(200, self._openai_batch(batch_id, done=st.polls[batch_id] >= 2))
+        m = re.fullmatch(r"/v1/files/out-([^/]+)/content", self.path)
+        if m:
+            lines = []
+            for custom_id, body in st.batches[m.group(1)]:
+                user = body["messages"][1]["content"]
+                if "fail" in user:
+                    record = {"custom_id": custom_id, "response": {
+                        "status_code": 500, "body": {"error": {"message": "boom"}}}}
+                else:
+                    record = {"custom_id": custom_id, "response": {
+                        "status_code": 200, "body": self._chat_completion(user)}}
+                lines.append(json.dumps(record))
+            return self._send(200, "\n".join(lines).encode(), "application/jsonl")
+        self._send(404, {"error": {"message": self.path}})
+
+
+@pytest.fixture
+def stub():
+    state = _StubState()
+    handler = type("Handler", (_Handler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def _openai_client(stub, **kwargs):
+    kwargs.setdefault("batch_mode", True)
+    return ClaudeClient(api_key="k", model=MODEL, base_url=stub.url,
+                        batch_poll_seconds=0.01, **kwargs)
+
+
+def _requests(*users):
+    return [{"system": "s", "user": u, "phase": "p4"} for u in users]
+
+
+class TestOpenAICompatibleBatch:
+
+    def test_results_parsed_in_order_at_batch_price(self, stub):
+        client = _openai_client(stub)
+        results = client.call_json_batch(_requests(*[f"u{i}" for i in range(5)]))
+        assert results == [{"echo": f"u{i}"} for i in range(5)]
+        assert stub.submissions == 1
+        assert stub.interactive_calls == 0
+        summary = client.get_cost_summary()
+        assert summary["calls"] == 5
+        assert summary["cost_usd"] == pytest.approx(
+            round(5 * 0.5 * (100 * 3.0 + 50 * 15.0) / 1_000_000, 4))
+
+    def test_results_feed_response_cache(self, stub, tmp_path):
+        client = _openai_client(stub, cache_dir=str(tmp_path))
+        first = client.call_batch(_requests("a", "b", "c", "d"))
+        again = client.call_batch(_requests("a", "b", "c", "d"))
+        assert first == again
+        assert stub.submissions == 1
+        assert client.call("s", "a") == _answer("a")
+        assert stub.interactive_calls == 0
+
+    def test_duplicate_prompts_submitted_once(self, stub):
+        client = _openai_client(stub)
+        results = client.call_batch(_requests("x", "y", "x", "y"))
+        assert results == [_answer("x"), _answer("y"), _answer("x"), _answer("y")]
+        assert len(stub.batches["batch_1"]) == 2
+
+    def test_failed_item_falls_back_to_interactive(self, stub):
+        client = _openai_client(stub)
+        results = client.call_json_batch(_requests("u0", "fail-me", "u2", "u3"))
+        assert results[1] == {"echo": "fail-me"}
+        assert stub.interactive_calls == 1
+
+    def test_unsupported_batch_api_falls_back(self, stub):
+        stub.batches_supported = False
+        client = _openai_client(stub)
+        results = client.call_json_batch(_requests("a", "b", "c", "d"))
+        assert results == [{"echo": u} for u in "abcd"]
+        assert stub.interactive_calls == 4
+
+    def test_small_batches_stay_interactive(self, stub):
+        client = _openai_client(stub, batch_min_requests=10)
+        client.call_batch(_requests("a", "b"))
+        assert stub.submissions == 0
+        assert stub.interactive_calls == 2
+
+
+class TestAnthropicMessageBatch:
+
+    def test_message_batch_round_trip(self, stub, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", stub.url)
+        client = ClaudeClient(api_key="k", model=MODEL, batch_mode=True,
+                              batch_poll_seconds=0.01)
+        assert client.sdk_type == "anthropic"
+        results = client.call_json_batch(_requests("a", "b", "c", "d"))
+        assert results == [{"echo": u} for u in "abcd"]
+        assert stub.submissions == 1
+        assert stub.interactive_calls == 0
+        assert stub.polls["msgbatch_1"] >= 2
+
+    def test_errored_item_retried_interactively(self, stub, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", stub.url)
+        client = ClaudeClient(api_key="k", model=MODEL, batch_mode=True,
+                              batch_poll_seconds=0.01)
+        retried = []
+
+        def _interactive(system, user, *args, **kwargs):
+            retried.append(user)
+            return _answer(user), 100, 50, {}
+
+        monkeypatch.setattr(client, "_call_api", _interactive)
+        results = client.call_json_batch(_requests("a", "fail", "c", "d"))
+        assert results == [{"echo": u} for u in ("a", "fail", "c", "d")]
+        assert retried == ["fail"]
+
+    @pytest.mark.parametrize("caching", [True, False])
+    def test_breakpoints_follow_prompt_caching(self, stub, monkeypatch, caching):
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", stub.url)
+        client = ClaudeClient(api_key="k", model=MODEL, batch_mode=True,
+                              batch_poll_seconds=0.01, prompt_caching=caching)
+        system = "Quy tắc tối ưu chiến dịch quảng cáo. " * 300
+        client.call_batch([{"system": system, "user": u, "cache_prefix": "head "}
+                           for u in "abcd"])
+        params = stub.batches["msgbatch_1"][0][1]
+        if caching:
+            assert params["system"] == [{"type": "text", "text": system,
+                                         "cache_control": {"type": "ephemeral"}}]
+            assert params["messages"][0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+        else:
+            assert params["system"] == system
+            assert params["messages"][0]["content"] == "head a"
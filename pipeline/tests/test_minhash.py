@@ -0,0 +1,174 @@
+"""Tests for MinHash LSH candidate generation and P3 cross-source dedup on top of it."""
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from pipeline.core import minhash
+from pipeline.core.minhash import (
+    MinHashLSH, candidate_pairs, expected_recall, lsh_bands, overlap_to_jaccard,
+    shared_token_pairs,
+)
+from pipeline.phases import p3_dedup
+from pipeline.phases.p3_dedup import _cross_source_dedup, _keyword_overlap
+
+
+class _Logger:
+    def debug(self, *a, **k):
+        pass
+    info = warn = debug
+
+
+def _keyword_sets(n, vocab=5000, size=20, seed=0):
+    rng = random.Random(seed)
+    return [{f"kw{rng.randrange(vocab)}" for _ in range(size)} for _ in range(n)]
+
+
+def _synthetic_atoms(n_transcript, n_baseline, n_duplicates, seed=0):
+    """Random 25-keyword atoms; baseline i rewords transcript i for i < n_duplicates."""
+    rng = random.Random(seed)
+    vocab = [f"chude{i:05d}" for i in range(20000)]
+    common = vocab[:200]                      # shared domain words
+
+    def words():
+        return rng.sample(vocab, 20) + rng.sample(common, 5)
+
+    transcript = [{"id": f"t{i}", "source": "transcript", "title": "",
+                   "content": " ".join(words()), "confidence": 0.9}
+                  for i in range(n_transcript)]
+    baseline = [{"id": f"b{i}", "source": "baseline", "title": "",
+                 "content": " ".join(words()), "confidence": 0.5}
+                for i in range(n_baseline)]
+    for i in range(n_duplicates):
+        kept = transcript[i]["content"].split()
+        rng.shuffle(kept)
+        baseline[i]["content"] = " ".join(kept[:18] + rng.sample(vocab, 10))
+    return transcript + baseline
+
+
+def _all_pairs(queries, corpus, min_overlap, **kwargs):
+    """The previous behaviour: every transcript × baseline pair, row-major."""
+    return np.divmod(np.arange(len(queries) * len(corpus)), len(corpus))
+
+
+class TestBands:
+
+    def test_bands_reach_recall(self):
+        for threshold in (0.15, 0.25, 0.5, 0.8):
+            bands, rows = lsh_bands(threshold)
+            assert bands * rows <= minhash.DEFAULT_NUM_PERM
+            assert expected_recall(threshold, bands, rows) >= 0.95 or rows == 1
+
+    def test_higher_threshold_more_selective(self):
+        assert lsh_bands(0.8)[1] > lsh_bands(0.25)[1]
+
+    def test_overlap_to_jaccard(self):
+        small, large = set(range(10)), set(range(4, 24))    # overlap 0.6, ratio 2
+        jaccard = len(small & large) / len(small | large)
+        assert overlap_to_jaccard(0.6, size_ratio=2.0) == pytest.approx(jaccard)
+
+
+class TestMinHashLSH:
+
+    def test_signature_agreement_estimates_jaccard(self):
+        index = MinHashLSH(0.5)
+        a = {f"w{i}" for i in range(40)}
+        b = {f"w{i}" for i in range(20, 60)}                 # Jaccard 1/3
+        sig = index.signatures([a, b, a])
+        assert (sig[0] == sig[2]).all()
+        assert np.mean(sig[0] == sig[1]) == pytest.approx(1 / 3, abs=0.1)
+
+    def test_query_finds_near_duplicates(self):
+        corpus = _keyword_sets(1000)
+        rng = random.Random(1)
+        queries = [set(rng.sample(sorted(s), 16)) | {f"new{i}", f"new{i}x"}
+                   for i, s in enumerate(corpus)]
+        index = MinHashLSH(overlap_to_jaccard(0.6))
+        index.add(corpus[:400])
+        index.add(corpus[400:])
+        qi, ci = index.query(queries)
+        assert np.mean(np.isin(np.arange(1000) * 1000 + np.arange(1000), qi * 1000 + ci)) >= 0.99
+        assert len(qi) < 1000 * 1000 * 0.05
+        assert (np.diff(qi * 1000 + ci) > 0).all()           # row-major, no repeats
+
+    def test_empty_sets_never_match(self):
+        index = MinHashLSH(0.5)
+        index.add([set(), {"ads", "budget"}])
+        qi, ci = index.query([set(), {"ads", "budget"}])
+        assert list(zip(qi.tolist(), ci.tolist())) == [(1, 1)]
+
+    def test_empty_index(self):
+        assert len(MinHashLSH(0.5).query([{"ads"}])[0]) == 0
+
+
+class TestCandidatePairs:
+
+    def test_shared_token_pairs_exact(self):
+        queries = [{"ads", "budget"}, {"python"}, set()]
+        corpus = [{"budget", "daily"}, {"seo"}, {"python", "ads"}]
+        qi, ci = shared_token_pairs(queries, corpus)
+        assert list(zip(qi.tolist(), ci.tolist())) == [(0, 0), (0, 2), (1, 2)]
+
+    def test_small_inputs_join_exactly(self):
+        queries, corpus = _keyword_sets(50, seed=1), _keyword_sets(40, seed=2)
+        qi, ci = candidate_pairs(queries, corpus, min_overlap=0.4)
+        expected = {(i, j) for i, q in enumerate(queries) for j, c in enumerate(corpus)
+                    if q & c}
+        assert set(zip(qi.tolist(), ci.tolist())) == expected
+
+    def test_large_inputs_keep_pairs_above_overlap(self):
+        queries, corpus = _keyword_sets(300, vocab=400, seed=1), _keyword_sets(300, vocab=400)
+        qi, ci = candidate_pairs(queries, corpus, min_overlap=0.4, exact_max_pairs=0)
+        found = set(zip(qi.tolist(), ci.tolist()))
+        needed = {(i, j) for i, q in enumerate(queries) for j, c in enumerate(corpus)
+                  if _keyword_overlap(q, c) >= 0.4}
+        assert len(found) < 300 * 300
+        assert len(found & needed) >= 0.95 * len(needed)
+
+
+class TestCrossSourceDedup:
+
+    def _run(self, atoms, monkeypatch, pairs=None):
+        if pairs is not None:
+            monkeypatch.setattr(p3_dedup, "candidate_pairs", pairs)
+        atoms = [dict(a) for a in atoms]
+        return _cross_source_dedup(atoms, _Logger())
+
+    def test_same_result_as_all_pairs(self, monkeypatch):
+        atoms = _synthetic_atoms(120, 80, 30, seed=3)
+        # Some contradictions: same topic, different numbers
+        for a in atoms[5:10] + atoms[125:130]:
+            a["content"] += f" {a['id'][1:]}0%"
+        expected = self._run(atoms, monkeypatch, pairs=_all_pairs)
+        monkeypatch.undo()
+        exact = self._run(atoms, monkeypatch)
+        assert exact["conflicts"] == expected["conflicts"]
+        assert [a["id"] for a in exact["atoms"]] == [a["id"] for a in expected["atoms"]]
+
+    def test_lsh_mode_finds_planted_duplicates(self, monkeypatch):
+        atoms = _synthetic_atoms(400, 300, 60, seed=4)
+        expected = self._run(atoms, monkeypatch, pairs=_all_pairs)
+        lsh = self._run(atoms, monkeypatch, pairs=lambda q, c, min_overlap: candidate_pairs(
+            q, c, min_overlap, exact_max_pairs=0))
+        assert lsh["stats"]["duplicates_merged"] == expected["stats"]["duplicates_merged"] == 60
+
+    def test_benchmark_10k_atoms(self, monkeypatch):
+        """6k transcript × 4k baseline = 24M pairs; LSH scores about 1% of them."""
+        atoms = _synthetic_atoms(6000, 4000, 500, seed=5)
+        scored = []
+        original = p3_dedup.candidate_pairs
+
+        def counting(*args, **kwargs):
+            qi, ci = original(*args, **kwargs)
+            scored.append(len(qi))
+            return qi, ci
+
+        start = time.perf_counter()
+        result = self._run(atoms, monkeypatch, pairs=counting)
+        elapsed = time.perf_counter() - start
+
+        assert result["stats"]["duplicates_merged"] == 500
+        assert scored[0] < 6000 * 4000 // 50
+        assert elapsed < 20                   # the all-pairs loop takes ~45s here
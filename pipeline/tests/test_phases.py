@@ -69,6 +69,39 @@ class TestP2Extract:
         assert len(data["atoms"]) > 0
         assert data["atoms"][0]["id"].startswith("atom_")
 
+    def test_progress_reported_per_chunk(self, build_config, tmp_output_dir, seekers_cache, seekers_lookup):
+        from pipeline.core.logger import PipelineLogger
+        from pipeline.tests.conftest import MockClaudeClient
+
+        events = []
+
+        class RecordingLogger(PipelineLogger):
+            def phase_progress(self, phase, name, progress):
+                events.append(("progress", progress))
+
+        class RecordingClaude(MockClaudeClient):
+            def call_json(self, system, user, **kwargs):
+                events.append(("call", None))
+                return super().call_json(system, user, **kwargs)
+
+        path = os.path.join(tmp_output_dir, "long.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(f"Đoạn {i}: " + "ngân sách quảng cáo " * 200
+                                for i in range(6)))
+        build_config.transcript_paths = [path]
+        result = run_p2(build_config, RecordingClaude(), seekers_cache, seekers_lookup,
+                        RecordingLogger(build_id="test_build"))
+        assert result.status == "done"
+
+        calls = [i for i, (kind, _) in enumerate(events) if kind == "call"]
+        assert len(calls) > 1
+        # Progress moves while later chunks are still outstanding
+        assert any(kind == "progress" and value > 0
+                   for kind, value in events[calls[0]:calls[-1]])
+        chunk_progress = [v for kind, v in events[:calls[-1] + 2] if kind == "progress"]
+        assert chunk_progress == sorted(chunk_progress)
+        assert chunk_progress[-1] == 70
+
     def test_extract_no_transcripts_fails(self, build_config, mock_claude, logger, seekers_cache, seekers_lookup):
         build_config.transcript_paths = []
         result = run_p2(build_config, mock_claude, seekers_cache, seekers_lookup, logger)
@@ -332,6 +365,33 @@ class TestP4Verify:
         for atom in data["atoms"]:
             assert atom["status"] in ("verified", "updated", "flagged", "unverified", "passthrough")
 
+    def test_batch_progress_reported_per_batch(self, build_config):
+        from pipeline.core.logger import PipelineLogger
+        from pipeline.phases.p4_verify import _verify_with_claude_batch
+        from pipeline.tests.conftest import MockClaudeClient
+
+        events = []
+
+        class RecordingLogger(PipelineLogger):
+            def phase_progress(self, phase, name, progress):
+                events.append(("progress", progress))
+
+        class RecordingClaude(MockClaudeClient):
+            def call_json(self, system, user, **kwargs):
+                events.append(("call", None))
+                return {"results": []}
+
+        atoms = [{"id": f"atom_{i:04d}", "title": f"Atom {i}", "content": f"Nội dung {i}.",
+                  "category": "tools", "tags": [], "confidence": 0.8} for i in range(60)]
+        verified, _, _, ids = _verify_with_claude_batch(
+            atoms, build_config, RecordingClaude(), None, RecordingLogger(build_id="test_build"))
+        assert verified == 60 and len(ids) == 60
+
+        calls = [i for i, (kind, _) in enumerate(events) if kind == "call"]
+        assert len(calls) == 3
+        assert [kind for kind, _ in events] == ["call", "progress"] * 3
+        assert events[-1] == ("progress", 85)
+
     def test_verify_no_input_fails(self, build_config, mock_claude, logger, seekers_cache, seekers_lookup):
         result = run_p4(build_config, mock_claude, seekers_cache, seekers_lookup, logger)
         assert result.status == "failed"
@@ -435,6 +495,31 @@ class TestP5Build:
         zip_path = os.path.join(build_config.output_dir, "package.zip")
         assert os.path.exists(zip_path)
 
+    def test_knowledge_progress_reported_per_response(self, build_config, seekers_cache,
+                                                      seekers_lookup):
+        from pipeline.core.logger import PipelineLogger
+        from pipeline.prompts.p5_build_prompts import P5_KNOWLEDGE_SYSTEM
+        from pipeline.tests.conftest import MockClaudeClient
+
+        events = []
+
+        class RecordingLogger(PipelineLogger):
+            def phase_progress(self, phase, name, progress):
+                events.append(("progress", progress))
+
+        class RecordingClaude(MockClaudeClient):
+            def call_json(self, system, user, **kwargs):
+                if system == P5_KNOWLEDGE_SYSTEM:
+                    events.append(("call", None))
+                return super().call_json(system, user, **kwargs)
+
+        self._setup_p4_output(build_config.output_dir)
+        result = run_p5(build_config, RecordingClaude(), seekers_cache, seekers_lookup,
+                        RecordingLogger(build_id="test_build"))
+        assert result.status == "done"
+        # Two pillars of five steps: progress follows each knowledge response
+        assert events[:4] == [("call", None), ("progress", 16), ("call", None), ("progress", 32)]
+
     def test_build_no_input_fails(self, build_config, mock_claude, logger, seekers_cache, seekers_lookup):
         result = run_p5(build_config, mock_claude, seekers_cache, seekers_lookup, logger)
         assert result.status == "failed"
@@ -1171,6 +1256,229 @@ class TestP3OverDedupAndIntegrity:
         assert result.quality_score < 100.0
 
 
+class TestP3PreClustering:
+
+    @staticmethod
+    def _atom(aid, title, content, category="campaign_management"):
+        return {"id": aid, "title": title, "content": content, "category": category,
+                "tags": [], "confidence": 0.9, "status": "raw"}
+
+    def test_keyword_clusters(self):
+        from pipeline.phases.p3_dedup import _cluster_atoms
+        atoms = [
+            self._atom("a1", "Ngân sách quảng cáo", "Đặt ngân sách hàng ngày cho chiến dịch."),
+            self._atom("a2", "Pixel", "Cài đặt pixel trên website để theo dõi."),
+            self._atom("a3", "Lookalike", "Tạo tệp lookalike từ khách hàng cũ."),
+            self._atom("a4", "Ngân sách quảng cáo", "Đặt ngân sách hàng ngày cho chiến dịch mới."),
+        ]
+        clusters = _cluster_atoms(atoms)
+        assert [[a["id"] for a in c] for c in clusters] == [["a1", "a4"], ["a2"], ["a3"]]
+
+    def test_embedding_clusters_link_transitively(self):
+        import numpy as np
+        from pipeline.phases.p3_dedup import _cluster_atoms
+
+        class FakeEmbeddings:
+            _api_available = True
+
+            def similar_pairs(self, texts, threshold):
+                assert threshold == 0.60
+                return np.array([0, 2]), np.array([2, 3]), np.array([0.9, 0.7])
+
+        atoms = [self._atom(f"a{i}", f"T{i}", f"C{i}") for i in range(5)]
+        clusters = _cluster_atoms(atoms, FakeEmbeddings())
+        assert [[a["id"] for a in c] for c in clusters] == [["a0", "a2", "a3"], ["a1"], ["a4"]]
+
+    def test_singletons_skip_claude(self, build_config, mock_claude, logger):
+        atoms = [
+            self._atom("atom_0001", "Ngân sách", "Đặt ngân sách hàng ngày."),
+            self._atom("atom_0002", "Pixel", "Cài đặt pixel trên website."),
+            self._atom("atom_0003", "Lookalike", "Tạo tệp lookalike từ khách hàng."),
+        ]
+        write_json({"atoms": atoms, "total_atoms": 3, "score": 85.0},
+                   os.path.join(build_config.output_dir, "atoms_raw.json"))
+        result = run_p3(build_config, mock_claude, None, None, logger)
+        assert result.status == "done"
+        assert mock_claude.call_count == 0
+        assert result.atoms_count == 3
+
+    def test_duplicates_far_apart_share_one_call(self, build_config, logger):
+        from pipeline.tests.conftest import MockClaudeClient
+
+        class RecordingClaude(MockClaudeClient):
+            prompts = []
+
+            def call_json(self, system, user, **kwargs):
+                self.call_count += 1
+                ids = json.loads(user.split("--- ATOMS START ---")[1]
+                                 .split("--- ATOMS END ---")[0])
+                self.prompts.append([a["id"] for a in ids])
+                return {"unique_atoms": [{"id": ids[0]["id"]}], "conflicts": [],
+                        "stats": {"duplicates_found": len(ids) - 1}}
+
+        # 70 unrelated atoms; the first and the last are duplicates
+        topics = [f"chủđề{i}a khíacạnh{i}b" for i in range(70)]
+        atoms = [self._atom(f"atom_{i:04d}", topic, f"{topic} chitiết{i}c.")
+                 for i, topic in enumerate(topics)]
+        atoms.append(self._atom("atom_0070", topics[0], f"{topics[0]} chitiết0c."))
+        write_json({"atoms": atoms, "total_atoms": len(atoms), "score": 85.0},
+                   os.path.join(build_config.output_dir, "atoms_raw.json"))
+
+        claude = RecordingClaude()
+        result = run_p3(build_config, claude, None, None, logger)
+        assert result.status == "done"
+        assert claude.prompts == [["atom_0000", "atom_0070"]]
+        assert result.atoms_count == 70
+
+
+class TestP3ConflictResolution:
+
+    def test_apply_resolutions_drops_rejected_atoms_once(self):
+        import time
+        from pipeline.core.types import Conflict
+        from pipeline.phases.p3_dedup import _apply_resolutions, _find_atom
+
+        atoms = [{"id": f"atom_{i:04d}"} for i in range(4000)]
+        by_id = {a["id"]: a for a in atoms}
+        conflicts = []
+        for n in range(600):
+            a, b = by_id[f"atom_{2 * n:04d}"], by_id[f"atom_{2 * n + 1:04d}"]
+            conflict = Conflict(id=f"conflict_{n + 1:03d}", atom_a=a, atom_b=b,
+                                conflict_type="duplicate", description="")
+            if n % 3 < 2:
+                conflict.auto_resolved = True
+                conflict.resolution = "keep_a" if n % 3 == 0 else "keep_b"
+            conflicts.append(conflict)
+
+        start = time.perf_counter()
+        kept = _apply_resolutions(atoms, conflicts)
+        assert time.perf_counter() - start < 0.1
+        rejected = ({f"atom_{2 * n + 1:04d}" for n in range(600) if n % 3 == 0}
+                    | {f"atom_{2 * n:04d}" for n in range(600) if n % 3 == 1})
+        assert [a["id"] for a in kept] == [a["id"] for a in atoms if a["id"] not in rejected]
+        assert _find_atom(by_id, "atom_0007") is by_id["atom_0007"]
+        assert _find_atom(by_id, "missing")["title"] == "Unknown"
+
+    def test_conflict_rejects_atom_from_later_group(self, build_config, logger):
+        from pipeline.tests.conftest import MockClaudeClient
+
+        class CrossGroupClaude(MockClaudeClient):
+            def call_json(self, system, user, **kwargs):
+                ids = json.loads(user.split("--- ATOMS START ---")[1]
+                                 .split("--- ATOMS END ---")[0])
+                ids = [a["id"] for a in ids]
+                conflicts = []
+                if "ads_00" in ids:
+                    # Longer atom_a wins: the pixel atom (next call) is dropped
+                    conflicts.append({"atom_a_id": "ads_00", "atom_b_id": "pixel_00",
+                                      "conflict_type": "duplicate", "description": "x"})
+                return {"unique_atoms": [{"id": i} for i in ids], "conflicts": conflicts,
+                        "stats": {"duplicates_found": 0}}
+
+        atoms = []
+        for cat in ("ads", "pixel"):
+            atoms += [{"id": f"{cat}_{i:02d}", "title": f"{cat}", "content": f"{cat} chi tiết đầy đủ {i}.",
+                       "category": cat, "tags": [], "confidence": 0.9, "status": "raw"}
+                      for i in range(40)]
+        atoms[0]["content"] += " Thêm thông tin."
+        write_json({"atoms": atoms, "total_atoms": len(atoms), "score": 85.0},
+                   os.path.join(build_config.output_dir, "atoms_raw.json"))
+
+        result = run_p3(build_config, CrossGroupClaude(), None, None, logger)
+        assert result.status == "done"
+        with open(os.path.join(build_config.output_dir, "atoms_deduplicated.json")) as f:
+            kept = [a["id"] for a in json.load(f)["atoms"]]
+        assert "pixel_00" not in kept and "ads_00" in kept
+        assert len(kept) == 79
+
+
+class TestP3ParallelGroups:
+
+    def _run(self, build_config, dedup_max_workers=0):
+        """Four categories of near-identical atoms: one cluster, one call each.
+
+        Later categories answer first.
+        """
+        import re
+        import threading
+        import time
+        from pipeline.clients.claude_client import ClaudeClient
+        from pipeline.core.logger import PipelineLogger
+        from pipeline.tests.conftest import MockClaudeClient
+
+        categories = ["ads", "pixel", "audience", "budget"]
+
+        class SlowDedupClaude(MockClaudeClient):
+            def __init__(self):
+                super().__init__()
+                self.max_in_flight_light = 4
+                self.in_flight = 0
+                self.peak = 0
+                self._lock = threading.Lock()
+
+            def call_json(self, system, user, **kwargs):
+                ids = re.findall(r'"id": "(\w+)"', user)
+                category = ids[0].split("_")[0]
+                with self._lock:
+                    self.in_flight += 1
+                    self.peak = max(self.peak, self.in_flight)
+                time.sleep(0.05 * (len(categories) - categories.index(category)))
+                with self._lock:
+                    self.in_flight -= 1
+                return {
+                    "unique_atoms": [{"id": i} for i in ids],
+                    "conflicts": [{"atom_a_id": ids[0], "atom_b_id": ids[1],
+                                   "conflict_type": "contradictory_data",
+                                   "description": category}],
+                    "stats": {"duplicates_found": 0},
+                }
+
+            def call_json_batch(self, requests, max_workers=None, on_result=None):
+                return ClaudeClient._run_batch(self, self.call_json, requests,
+                                               max_workers, on_result)
+
+        class RecordingLogger(PipelineLogger):
+            def __init__(self):
+                super().__init__()
+                self.progress = []
+
+            def phase_progress(self, phase, name, progress):
+                self.progress.append(progress)
+
+        atoms = [
+            {"id": f"{cat}_{i:02d}", "title": f"{cat} {i}", "content": f"Nội dung {cat} {i}.",
+             "category": cat, "tags": [], "confidence": 0.9, "status": "raw"}
+            for cat in categories for i in range(40)
+        ]
+        write_json({"atoms": atoms, "total_atoms": len(atoms), "score": 85.0},
+                   os.path.join(build_config.output_dir, "atoms_raw.json"))
+        build_config.dedup_max_workers = dedup_max_workers
+        claude, logger = SlowDedupClaude(), RecordingLogger()
+        start = time.perf_counter()
+        result = run_p3(build_config, claude, None, None, logger)
+        elapsed = time.perf_counter() - start
+        with open(os.path.join(build_config.output_dir, "conflicts.json")) as f:
+            conflicts = json.load(f)["conflicts"]
+        return result, claude, logger, conflicts, elapsed
+
+    def test_groups_run_concurrently_and_merge_in_order(self, build_config):
+        result, claude, logger, conflicts, elapsed = self._run(build_config)
+        assert result.status == "done"
+        assert claude.peak == 4
+        assert elapsed < 0.5                    # sequential would take 0.5s
+        assert [(c["id"], c["description"]) for c in conflicts] == [
+            ("conflict_001", "ads"), ("conflict_002", "pixel"),
+            ("conflict_003", "audience"), ("conflict_004", "budget"),
+        ]
+        assert logger.progress[:4] == [20, 40, 60, 80]
+
+    def test_worker_limit(self, build_config):
+        result, claude, _, conflicts, _ = self._run(build_config, dedup_max_workers=2)
+        assert result.status == "done"
+        assert claude.peak == 2
+        assert [c["id"] for c in conflicts] == [f"conflict_{n:03d}" for n in range(1, 5)]
+
+
 class TestP5IncludesUnverified:
 
     def test_p5_builds_with_unverified_atoms(self, build_config, mock_claude, logger, seekers_cache, seekers_lookup):
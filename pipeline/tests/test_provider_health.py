@@ -0,0 +1,256 @@
+"""Tests for circuit breakers, hedged requests and provider failover.
+
+The client tests run against two local OpenAI-compatible stub servers
+(main and light) so routing goes through the real SDK and HTTP stack.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+from pipeline.clients.claude_client import ClaudeClient
+from pipeline.core.provider_health import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ProviderHealth,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+
+    def test_opens_on_error_rate_then_probes(self):
+        clock = _Clock()
+        breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5,
+                                 cooldown_s=30, clock=clock)
+        for ok in (True, False, True, False):
+            breaker.record(ok, 1.0)
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+        clock.now = 31
+        assert breaker.allow()              # the single half-open probe
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record(True, 1.0)
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        clock = _Clock()
+        breaker = CircuitBreaker(min_calls=1, error_rate=1.0, cooldown_s=10, clock=clock)
+        breaker.record(False)
+        clock.now = 11
+        assert breaker.allow()
+        breaker.record(False)
+        assert breaker.state == OPEN
+        assert breaker.trips == 2
+
+    def test_lost_probe_expires(self):
+        clock = _Clock()
+        breaker = CircuitBreaker(min_calls=1, error_rate=1.0, cooldown_s=10, clock=clock)
+        breaker.record(False)
+        clock.now = 11
+        assert breaker.allow()
+        clock.now = 15
+        assert not breaker.allow()
+        clock.now = 22
+        assert breaker.allow()
+
+    def test_opens_on_latency(self):
+        breaker = CircuitBreaker(min_calls=5, max_latency_s=10)
+        for _ in range(4):
+            breaker.record(True, 1.0)
+        breaker.record(True, 30.0)
+        assert breaker.state == OPEN
+
+    def test_needs_min_calls(self):
+        breaker = CircuitBreaker(min_calls=5, error_rate=0.5)
+        for _ in range(4):
+            breaker.record(False)
+        assert breaker.state == CLOSED
+
+
+class TestHedgeDelay:
+
+    def test_percentile_with_floor(self):
+        health = ProviderHealth(hedge_percentile=90, hedge_min_delay_s=0.5,
+                                hedge_min_samples=10)
+        for i in range(9):
+            health.record("light", True, float(i + 1))
+        assert health.hedge_delay("light") is None
+        health.record("light", True, 10.0)
+        assert health.hedge_delay("light") == 9.0
+
+        fast = ProviderHealth(hedge_min_delay_s=2.0, hedge_min_samples=1)
+        fast.record("light", True, 0.1)
+        assert fast.hedge_delay("light") == 2.0
+
+    def test_disabled(self):
+        health = ProviderHealth(hedge_percentile=0, hedge_min_samples=1)
+        health.record("light", True, 1.0)
+        assert health.hedge_delay("light") is None
+
+
+# ── Stub providers ──
+
+
+class _StubProvider:
+    """OpenAI-compatible /v1/chat/completions with a scripted delay/status."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.delay = 0.0
+        self.status = 200
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    payload = {"error": {"message": f"{stub.name} down"}}
+                else:
+                    payload = {
+                        "id": "x", "object": "chat.completion", "created": 0,
+                        "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                            "role": "assistant", "content": json.dumps({"from": stub.name}),
+                        }}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5,
+                                  "total_tokens": 15},
+                    }
+                data = json.dumps(payload).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def providers():
+    main, light = _StubProvider("main"), _StubProvider("light")
+    yield main, light
+    main.close()
+    light.close()
+
+
+def _client(main, light, monkeypatch, **kwargs) -> ClaudeClient:
+    kwargs.setdefault("model", "main-model")
+    kwargs.setdefault("model_light", "light-model")
+    client = ClaudeClient(
+        api_key="k", base_url=main.url, base_url_light=light.url, **kwargs,
+    )
+    # No SDK-level retries or tenacity back-off sleeps in tests
+    client.main_client = OpenAI(api_key="k", base_url=main.url + "/v1", max_retries=0)
+    client.light_client = OpenAI(api_key="k", base_url=light.url + "/v1", max_retries=0)
+    monkeypatch.setattr(type(client)._call_uncached.retry, "sleep", lambda s: None)
+    return client
+
+
+class TestHedging:
+
+    def test_slow_light_request_hedged_to_main(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch, hedge_min_delay=0.2)
+        for _ in range(10):
+            client.health.record("light", True, 0.05)
+        light.delay = 2.0
+
+        start = time.time()
+        result = client.call_json("sys", "u", use_light_model=True)
+        assert result == {"from": "main"}
+        assert time.time() - start < 1.5
+        assert (main.requests, light.requests) == (1, 1)
+        assert client.hedge_count == 1 and client.hedge_wins == 1
+
+    def test_fast_light_request_not_hedged(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch, hedge_min_delay=1.0)
+        for _ in range(10):
+            client.health.record("light", True, 0.05)
+        assert client.call_json("sys", "u", use_light_model=True) == {"from": "light"}
+        assert main.requests == 0
+        assert client.hedge_count == 0
+
+    def test_no_hedging_without_latency_history(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch)
+        assert client.call_json("sys", "u", use_light_model=True) == {"from": "light"}
+        assert main.requests == 0
+
+
+class TestFailover:
+
+    def test_retry_switches_provider_once_breaker_opens(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch, hedge_percentile=0)
+        client.health = ProviderHealth(hedge_percentile=0, min_calls=2, error_rate=0.5)
+        light.status = 503
+
+        assert client.call_json("sys", "u", use_light_model=True) == {"from": "main"}
+        assert light.requests == 2
+        assert client.health.is_open("light")
+
+        # New light requests go straight to main while the breaker is open
+        assert client.call_json("sys", "u2", use_light_model=True) == {"from": "main"}
+        assert light.requests == 2
+        assert client.get_provider_health()["failovers"] == 2
+
+    def test_client_errors_do_not_trip_breaker(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch)
+        client.health = ProviderHealth(min_calls=1, error_rate=0.5)
+        light.status = 400
+        with pytest.raises(Exception):
+            client.call("sys", "u", use_light_model=True)
+        assert not client.health.is_open("light")
+
+    def test_main_model_requests_stay_on_main(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch)
+        client.health = ProviderHealth(min_calls=1, error_rate=0.5)
+        main.status = 503
+        with pytest.raises(Exception):
+            client.call("sys", "u")
+        assert light.requests == 0
+
+    def test_main_requests_stay_on_main_when_models_match(self, providers, monkeypatch):
+        main, light = providers
+        client = _client(main, light, monkeypatch, model="same-model",
+                         model_light="same-model", hedge_min_delay=0.2)
+        for _ in range(10):
+            client.health.record("main", True, 0.05)
+        main.delay = 0.5
+        assert client.call_json("sys", "u") == {"from": "main"}
+
+        client.health = ProviderHealth(min_calls=1, error_rate=0.5)
+        main.delay, main.status = 0, 503
+        with pytest.raises(Exception):
+            client.call("sys", "u2")
+        assert light.requests == 0
+        assert client.hedge_count == 0
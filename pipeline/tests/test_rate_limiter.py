@@ -0,0 +1,128 @@
+"""Tests for the cross-process SQLite token-bucket rate limiter."""
+
+import time
+
+import httpx
+import openai
+import pytest
+
+from pipeline.core.rate_limiter import RateLimiter, bucket_name, retry_after_seconds
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    lim = RateLimiter(str(tmp_path))
+    yield lim
+    lim.close()
+
+
+class TestBuckets:
+
+    def test_bucket_name_hides_key(self):
+        name = bucket_name("https://proxy.example.com/", "sk-secret")
+        assert "sk-secret" not in name
+        assert name.startswith("https://proxy.example.com#")
+        assert bucket_name(None, "k") != bucket_name(None, "k2")
+
+    def test_unlimited_never_waits(self, limiter):
+        limiter.configure("b")
+        for _ in range(100):
+            assert limiter.acquire("b", tokens=10_000) < 0.1
+        assert limiter.utilisation("b")["rpm_utilisation"] == 0.0
+
+    def test_rpm_bucket_throttles(self, limiter):
+        limiter.configure("b", rpm=600)          # 10 req/s refill
+        for _ in range(600):
+            limiter.acquire("b")
+        assert limiter.utilisation("b")["rpm_utilisation"] > 0.99
+        waited = limiter.acquire("b")
+        assert waited >= 0.05
+
+    def test_tpm_settle_refunds_estimate(self, limiter):
+        limiter.configure("b", tpm=1000)
+        limiter.acquire("b", tokens=900)
+        assert limiter.utilisation("b")["tpm_utilisation"] == pytest.approx(0.9, abs=0.01)
+        limiter.settle("b", estimated=900, actual=100)
+        assert limiter.utilisation("b")["tpm_utilisation"] == pytest.approx(0.1, abs=0.01)
+
+    def test_oversized_request_waits_for_full_bucket_only(self, limiter):
+        limiter.configure("b", tpm=6000)
+        assert limiter.acquire("b", tokens=50_000, timeout=1) < 0.5
+
+
+class TestSharedAcrossProcesses:
+
+    def test_budget_shared_between_instances(self, tmp_path):
+        a = RateLimiter(str(tmp_path))
+        b = RateLimiter(str(tmp_path))
+        a.configure("b", rpm=6)                  # one request per 10s refill
+        b.configure("b", rpm=6)
+        for _ in range(6):
+            a.acquire("b")
+        with pytest.raises(TimeoutError):
+            b.acquire("b", timeout=0.5)
+        a.close()
+        b.close()
+
+    def test_retry_after_blocks_every_instance(self, tmp_path):
+        a = RateLimiter(str(tmp_path))
+        b = RateLimiter(str(tmp_path))
+        a.configure("b")
+        b.configure("b")
+        a.penalize("b", 30)
+        assert b.utilisation("b")["blocked_for_s"] > 29
+        with pytest.raises(TimeoutError):
+            b.acquire("b", timeout=1)
+        a.close()
+        b.close()
+
+    def test_short_penalty_then_proceeds(self, limiter):
+        limiter.configure("b")
+        limiter.penalize("b", 0.2)
+        waited = limiter.acquire("b")
+        assert 0.1 <= waited < 2
+
+
+class TestRetryAfterHeader:
+
+    def _error(self, headers):
+        request = httpx.Request("POST", "https://example.com/v1/chat/completions")
+        response = httpx.Response(429, headers=headers, request=request)
+        return openai.RateLimitError("slow down", response=response, body=None)
+
+    def test_seconds(self):
+        assert retry_after_seconds(self._error({"retry-after": "7"})) == 7.0
+
+    def test_milliseconds_preferred(self):
+        err = self._error({"retry-after": "7", "retry-after-ms": "1500"})
+        assert retry_after_seconds(err) == 1.5
+
+    def test_missing_or_invalid(self):
+        assert retry_after_seconds(self._error({})) == 0.0
+        assert retry_after_seconds(self._error({"retry-after": "soon"})) == 0.0
+        assert retry_after_seconds(ValueError("no response")) == 0.0
+
+
+class TestClaudeClientIntegration:
+
+    def test_calls_draw_from_shared_bucket(self, monkeypatch, tmp_path):
+        from pipeline.clients.claude_client import ClaudeClient
+        client = ClaudeClient(api_key="k", model="m", base_url="https://example.com",
+                              cache_dir=str(tmp_path), rpm=100, tpm=100_000)
+        monkeypatch.setattr(client, "_call_api", lambda *a, **k: ("ok", 40, 10, {}))
+        client.call_batch([{"system": "s", "user": f"u{i}", "max_tokens": 1000}
+                           for i in range(10)])
+
+        usage = client.get_rate_limit_stats()["main"]
+        assert usage["rpm_utilisation"] == pytest.approx(0.1, abs=0.01)
+        # Reserved max_tokens were settled back down to the real 50 tokens/call
+        assert usage["tpm_utilisation"] == pytest.approx(0.005, abs=0.002)
+
+    def test_light_provider_has_own_bucket(self, tmp_path):
+        from pipeline.clients.claude_client import ClaudeClient
+        client = ClaudeClient(api_key="k", model="m", base_url="https://example.com",
+                              base_url_light="https://light.example.com",
+                              cache_dir=str(tmp_path), rpm=10, rpm_light=99)
+        stats = client.get_rate_limit_stats()
+        assert stats["main"]["rpm_limit"] == 10
+        assert stats["light"]["rpm_limit"] == 99
@@ -0,0 +1,193 @@
+"""Tests for the single-file SQLite LLM response cache."""
+
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from pipeline.core.response_cache import ResponseCache, LEGACY_NAMESPACE
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = ResponseCache(str(tmp_path))
+    yield c
+    c.close()
+
+
+class TestGetSet:
+
+    def test_miss_then_hit(self, cache):
+        assert cache.get("k1", "model-a") is None
+        cache.set("k1", "hello", "model-a")
+        assert cache.get("k1", "model-a") == "hello"
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_namespaces_are_isolated(self, cache):
+        cache.set("k1", "from a", "model-a")
+        cache.set("k1", "from b", "model-b")
+        assert cache.get("k1", "model-a") == "from a"
+        assert cache.get("k1", "model-b") == "from b"
+        assert cache.stats()["namespaces"] == {"model-a": 1, "model-b": 1}
+
+    def test_overwrite_keeps_byte_total_exact(self, cache):
+        cache.set("k1", "x" * 100, "m")
+        cache.set("k1", "y" * 40, "m")
+        assert cache.stats()["total_bytes"] == 40
+        assert cache.get("k1", "m") == "y" * 40
+
+    def test_unicode_size_in_bytes(self, cache):
+        cache.set("k1", "Tiếng Việt", "m")
+        assert cache.stats()["total_bytes"] == len("Tiếng Việt".encode("utf-8"))
+
+    def test_single_file_on_disk(self, tmp_path, cache):
+        for i in range(50):
+            cache.set(f"k{i}", f"v{i}", "m")
+        json_files = [p for p in os.listdir(tmp_path) if p.endswith(".json")]
+        assert json_files == []
+        assert cache.stats()["entries"] == 50
+
+    def test_persists_across_instances(self, tmp_path):
+        a = ResponseCache(str(tmp_path))
+        a.set("k1", "persisted", "m")
+        a.close()
+        b = ResponseCache(str(tmp_path))
+        assert b.get("k1", "m") == "persisted"
+        b.close()
+
+
+class TestTTL:
+
+    def test_expired_entry_is_a_miss(self, tmp_path):
+        c = ResponseCache(str(tmp_path), ttl_hours=1)
+        c.set("k1", "old", "m")
+        c._conn.execute("UPDATE responses SET created_at = ?", (time.time() - 7200,))
+        assert c.get("k1", "m") is None
+        assert c.stats()["entries"] == 0
+        c.close()
+
+    def test_purge_expired(self, tmp_path):
+        c = ResponseCache(str(tmp_path), ttl_hours=1)
+        c.set("old", "v", "m")
+        c.set("new", "v", "m")
+        c._conn.execute(
+            "UPDATE responses SET created_at = ? WHERE key = 'old'", (time.time() - 7200,),
+        )
+        assert c.purge_expired() == 1
+        assert c.get("new", "m") == "v"
+        c.close()
+
+    def test_zero_ttl_never_expires(self, tmp_path):
+        c = ResponseCache(str(tmp_path), ttl_hours=0)
+        c.set("k1", "v", "m")
+        c._conn.execute("UPDATE responses SET created_at = 0")
+        assert c.get("k1", "m") == "v"
+        c.close()
+
+
+class TestLRUEviction:
+
+    def test_size_cap_evicts_least_recently_used(self, tmp_path):
+        c = ResponseCache(str(tmp_path), max_bytes=1000)
+        for i in range(8):
+            c.set(f"k{i}", "x" * 100, "m")
+            time.sleep(0.002)
+        # Touch k0 so it becomes most recently used
+        assert c.get("k0", "m") is not None
+        time.sleep(0.002)
+        c.set("k8", "x" * 300, "m")
+
+        stats = c.stats()
+        assert stats["total_bytes"] <= 1000
+        assert stats["evictions"] > 0
+        assert c.get("k0", "m") is not None      # recently used survives
+        assert c.get("k1", "m") is None          # oldest untouched evicted
+        assert c.get("k8", "m") is not None
+        c.close()
+
+    def test_under_cap_no_eviction(self, tmp_path):
+        c = ResponseCache(str(tmp_path), max_bytes=10_000)
+        for i in range(10):
+            c.set(f"k{i}", "x" * 100, "m")
+        assert c.stats()["evictions"] == 0
+        assert c.stats()["entries"] == 10
+        c.close()
+
+
+class TestLegacyMigration:
+
+    def _write_legacy(self, directory, model, system, user, response):
+        full = hashlib.sha256((model + system + user).encode()).hexdigest()
+        path = os.path.join(directory, f"claude_{full[:16]}.json")
+        with open(path, "w") as f:
+            json.dump({"response": response}, f)
+        return full
+
+    def test_import_and_promote(self, tmp_path):
+        full = self._write_legacy(str(tmp_path), "model-a", "sys", "usr", "old answer")
+        c = ResponseCache(str(tmp_path))
+        assert c.import_legacy_files() == 1
+        assert not list(tmp_path.glob("claude_*.json"))
+        assert c.stats()["namespaces"] == {LEGACY_NAMESPACE: 1}
+
+        assert c.get(full, "model-a") == "old answer"
+        # Promoted to the full key in the model namespace
+        assert c.stats()["namespaces"] == {"model-a": 1}
+        assert c.get(full, "model-a") == "old answer"
+        c.close()
+
+    def test_import_skips_corrupt_files(self, tmp_path):
+        (tmp_path / "claude_deadbeefdeadbeef.json").write_text("{not json")
+        c = ResponseCache(str(tmp_path))
+        assert c.import_legacy_files() == 0
+        c.close()
+
+    def test_claude_client_migrates_on_open(self, tmp_path):
+        from pipeline.clients.claude_client import ClaudeClient
+        full = self._write_legacy(str(tmp_path), "model-a", "sys", "usr", "cached!")
+        client = ClaudeClient(api_key="k", model="model-a",
+                              base_url="https://example.com", cache_dir=str(tmp_path))
+        assert client._cache_key("model-a", "sys", "usr") == full
+        assert client.call("sys", "usr") == "cached!"
+        assert client.call_count == 0
+        assert client.get_cache_stats()["hits"] == 1
+
+
+class TestLeases:
+
+    def test_second_owner_denied_until_release(self, tmp_path):
+        a = ResponseCache(str(tmp_path))
+        b = ResponseCache(str(tmp_path))
+        assert a.acquire_lease("k", "m")
+        assert a.acquire_lease("k", "m")          # re-entrant for the owner
+        assert not b.acquire_lease("k", "m")
+        a.release_lease("k", "m")
+        assert b.acquire_lease("k", "m")
+        a.close()
+        b.close()
+
+    def test_expired_lease_taken_over(self, tmp_path):
+        a = ResponseCache(str(tmp_path))
+        b = ResponseCache(str(tmp_path))
+        assert a.acquire_lease("k", "m", ttl=-1)
+        assert b.acquire_lease("k", "m")
+        a.close()
+        b.close()
+
+    def test_wait_returns_none_without_lease(self, cache):
+        assert cache.wait_for_response("k", "m", timeout=0) is None
+
+    def test_wait_times_out(self, tmp_path):
+        a = ResponseCache(str(tmp_path))
+        b = ResponseCache(str(tmp_path))
+        a.acquire_lease("k", "m")
+        start = time.time()
+        assert b.wait_for_response("k", "m", timeout=0.2, poll=0.05) is None
+        assert time.time() - start < 2
+        a.close()
+        b.close()
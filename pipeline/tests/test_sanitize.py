@@ -0,0 +1,122 @@
+"""Equivalence and speed of the fused sanitize_api_text against the original passes.
+
+Run directly for the micro-benchmark:  python -m pipeline.tests.test_sanitize
+"""
+
+import random
+import re
+import time
+import unicodedata
+
+import pytest
+
+from pipeline.clients.claude_client import sanitize_api_text
+
+
+def _reference(text: str) -> str:
+    """The original multi-pass implementation, kept as the oracle."""
+    if not text:
+        return ""
+    text = text.encode("utf-8", errors="replace").decode("utf-8", errors="replace")
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\x00", "")
+    text = text.replace("\ufeff", "")
+    text = re.sub(r"[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]", "", text)
+    text = re.sub(r"[\ud800-\udfff]", "", text)
+    text = re.sub(r"[\ue000-\uf8ff]", "", text)
+    text = re.sub(r"[\ufffd-\uffff]", "", text)
+    text = re.sub(r"[\U00010000-\U0010FFFF]", "", text)
+    return text
+
+
+# Code points around every boundary the sanitizer cares about
+_POOL = (
+    list("abcXYZ019 .,:;{}[]\"'\n\t\r")
+    + [chr(c) for c in range(0x00, 0x20)] + ["\x7f", "\x80", "\x9f", "\xa0"]
+    + list("ăâđêôơưàảãáạằẳẵắặầẩẫấậèẻẽéẹềểễếệìỉĩíịòỏõóọồổỗốộờởỡớợùủũúụừửữứựỳỷỹýỵ")
+    + ["\u0300", "\u0301", "\u0303", "\u0306", "\u0309", "\u0323", "\u0302", "\u031b"]
+    + ["\ufeff", "\ue000", "\ue123", "\uf8ff", "豈", "\ufffc", "\ufffd", "\ufffe", "\uffff"]
+    + ["\ud800", "\udbff", "\udc00", "\udfff", "\ud83d", "\ude00"]
+    + ["\U0001f600", "\U00010000", "\U0010ffff", "\U0001d15e", "\U0001d157\U0001d165"]
+    + ["中", "文", "한", "Å", "Ω", "ẛ\u0323", "\u0344", "क़"]
+)
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(_POOL) for _ in range(length))
+
+
+class TestEquivalence:
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_random_mixed_text(self, seed):
+        rng = random.Random(seed)
+        for _ in range(100):
+            text = _random_text(rng, rng.randint(0, 60))
+            assert sanitize_api_text(text) == _reference(text), repr(text)
+
+    @pytest.mark.parametrize("text", [
+        "",
+        "plain ascii",
+        "tab\tnewline\ncr\r",
+        "\x00\x01\x1f\x7f",
+        "e\x01\u0301",                  # control between letter and combining mark
+        "a\u0306",                      # NFD -> NFC
+        "Tie\u0302\u0301ng Vie\u0323\u0302t",
+        "\ud83d\ude00 split surrogate pair",
+        "\ud800",
+        "\U0001f600 emoji",
+        "\ufeffBOM\ufffd\ufffe\uffff",
+        "\ue000PUA\uf8ff",
+        "ÅΩ",                 # singletons that NFC rewrites
+    ])
+    def test_edge_cases(self, text):
+        assert sanitize_api_text(text) == _reference(text)
+
+    def test_clean_text_returned_unchanged(self):
+        text = "Ứng dụng AI Agent trong bán lẻ và thương mại điện tử"
+        assert sanitize_api_text(text) == text
+        ascii_text = "already clean"
+        assert sanitize_api_text(ascii_text) is ascii_text
+
+
+def _prompt(kind: str, size: int = 50_000) -> str:
+    rng = random.Random(0)
+    words = {
+        "ascii": ["atom", "content", "title", '"id":', "{", "},", "the", "market"],
+        "vietnamese": ["thương", "hiệu", "cá", "nhân", "mạng", "xã", "hội", "điều", '"id":'],
+        "dirty": ["thương", "hiệu", "\x00", "\ufeff", "\ue001", "\U0001f600", "a\u0301"],
+    }[kind]
+    out = []
+    total = 0
+    while total < size:
+        w = rng.choice(words)
+        out.append(w)
+        total += len(w) + 1
+    return " ".join(out)
+
+
+def _bench(fn, text: str, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat
+
+
+class TestLargePrompt:
+    # Timing is machine-dependent: compare speed with `python -m
+    # pipeline.tests.test_sanitize`, not in the suite
+
+    @pytest.mark.parametrize("kind", ["ascii", "vietnamese", "dirty"])
+    def test_fused_matches_reference_on_large_prompt(self, kind):
+        text = _prompt(kind)
+        assert sanitize_api_text(text) == _reference(text)
+
+
+if __name__ == "__main__":
+    for kind in ("ascii", "vietnamese", "dirty"):
+        text = _prompt(kind)
+        old = _bench(_reference, text, 200)
+        new = _bench(sanitize_api_text, text, 200)
+        print(f"{kind:>10} {len(text) // 1000}KB: reference {old * 1e3:.3f} ms, "
+              f"fused {new * 1e3:.3f} ms ({old / new:.1f}x)")
@@ -0,0 +1,95 @@
+"""Tests for the vectorised similarity helpers."""
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from pipeline.core import similarity as sim
+from pipeline.core.embeddings import EmbeddingClient, _cosine_similarity
+
+
+def _vectors(n, dim, seed=0):
+    rng = random.Random(seed)
+    return [[rng.uniform(-1, 1) for _ in range(dim)] for _ in range(n)]
+
+
+class TestMatrixHelpers:
+
+    def test_unit_matrix(self):
+        matrix = sim.unit_matrix([[3.0, 4.0], [0.0, 0.0]])
+        assert matrix.dtype == np.float32 and matrix.flags.c_contiguous
+        assert matrix[0].tolist() == pytest.approx([0.6, 0.8])
+        assert matrix[1].tolist() == [0.0, 0.0]
+        assert sim.unit_matrix([]).shape == (0, 0)
+
+    def test_matches_pure_python_cosine(self):
+        queries, corpus = _vectors(7, 16, seed=1), _vectors(11, 16, seed=2)
+        corpus.append([0.0] * 16)
+        matrix = sim.cosine_matrix(sim.unit_matrix(queries), sim.unit_matrix(corpus),
+                                   chunk_rows=3)
+        for q, row in zip(queries, matrix):
+            expected = [_cosine_similarity(q, c) for c in corpus]
+            assert row.tolist() == pytest.approx(expected, abs=1e-6)
+
+    def test_pairs_above(self):
+        queries = sim.unit_matrix(_vectors(20, 8, seed=3))
+        corpus = sim.unit_matrix(_vectors(30, 8, seed=4))
+        full = sim.cosine_matrix(queries, corpus)
+        rows, cols, scores = sim.pairs_above(queries, corpus, threshold=0.5, chunk_rows=4)
+        expected = np.argwhere(full >= 0.5)
+        assert np.array_equal(np.stack([rows, cols], axis=1), expected)
+        assert np.array_equal(scores, full[rows, cols])
+
+    def test_self_pairs_upper_triangle(self):
+        matrix = sim.unit_matrix([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [1.0, 0.1]])
+        rows, cols, _ = sim.pairs_above(matrix, threshold=0.9, chunk_rows=1)
+        assert list(zip(rows.tolist(), cols.tolist())) == [(0, 1), (0, 3), (1, 3)]
+
+    def test_top_k(self):
+        queries = sim.unit_matrix(_vectors(5, 8, seed=5))
+        corpus = sim.unit_matrix(_vectors(9, 8, seed=6))
+        full = sim.cosine_matrix(queries, corpus)
+        indices, scores = sim.top_k(queries, corpus, k=3, chunk_rows=2)
+        assert indices.shape == scores.shape == (5, 3)
+        for row, idx in zip(full, indices):
+            assert idx.tolist() == np.argsort(-row, kind="stable")[:3].tolist()
+
+    def test_top_k_pads_below_threshold(self):
+        queries = sim.unit_matrix([[1.0, 0.0]])
+        corpus = sim.unit_matrix([[0.0, 1.0], [1.0, 0.0]])
+        indices, scores = sim.top_k(queries, corpus, k=3, threshold=0.5)
+        assert indices.tolist() == [[1, -1, -1]]
+        assert scores.tolist() == [[1.0, 0.0, 0.0]]
+
+
+class TestEmbeddingClientVectorised:
+
+    def test_similarity_matrix_unchanged(self):
+        client = EmbeddingClient()
+        queries, corpus = ["ads manager setup", "audience"], ["ads manager", "python basics"]
+        vectors = client.embed_texts(queries + corpus).vectors
+        expected = [[_cosine_similarity(q, c) for c in vectors[2:]] for q in vectors[:2]]
+        matrix = client.similarity_matrix(queries, corpus)
+        assert len(matrix) == 2
+        for row, exp in zip(matrix, expected):
+            assert row == pytest.approx(exp, abs=1e-6)
+
+    def test_similar_pairs_and_top_matches(self):
+        client = EmbeddingClient()
+        texts = ["facebook ads budget", "facebook ads budget", "python loops"]
+        rows, cols, _ = client.similar_pairs(texts, threshold=0.9)
+        assert list(zip(rows.tolist(), cols.tolist())) == [(0, 1)]
+        indices, _ = client.top_matches(["python loops"], texts)
+        assert indices.tolist() == [[2]]
+        assert client.top_matches([], texts)[0].shape == (0, 1)
+        assert len(client.similar_pairs(["a"], [])[0]) == 0
+
+    def test_thousand_atoms_self_similarity_is_fast(self):
+        """1,000 × 1,536-dim atoms×atoms pairs in under two seconds."""
+        vectors = np.random.default_rng(0).standard_normal((1000, 1536)).tolist()
+        start = time.perf_counter()
+        rows, _, _ = sim.pairs_above(sim.unit_matrix(vectors), threshold=0.8)
+        assert time.perf_counter() - start < 2.0
+        assert len(rows) == 0
@@ -0,0 +1,119 @@
+"""Tests for the sparse hashed TF-IDF fallback."""
+
+import math
+import random
+import re
+import time
+
+import numpy as np
+import pytest
+
+from pipeline.core import similarity as sim
+from pipeline.core.embeddings import EmbeddingClient, _cosine_similarity
+from pipeline.core.sparse_tfidf import (
+    N_FEATURES, SparseRows, TfidfModel, hashed_terms, tfidf_rows,
+)
+
+
+def _dense_tfidf(texts):
+    """The old vocabulary-sized fallback, as the reference."""
+    tokenized = [re.findall(r"\w+", t.lower()) for t in texts]
+    vocab = {tok: i for i, tok in enumerate(dict.fromkeys(t for toks in tokenized for t in toks))}
+    df = {tok: sum(tok in set(toks) for toks in tokenized) for tok in vocab}
+    has_idf = any(d < len(texts) for d in df.values())
+    vectors = []
+    for tokens in tokenized:
+        vec = [0.0] * len(vocab)
+        for tok in set(tokens):
+            tf = tokens.count(tok) / len(tokens)
+            idf = math.log(len(texts) / df[tok]) if df[tok] < len(texts) else 0.0
+            vec[vocab[tok]] = tf * idf if has_idf else tf
+        vectors.append(vec)
+    return vectors
+
+
+def _texts(n, seed=0):
+    rng = random.Random(seed)
+    words = [f"từ{i}" for i in range(400)]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(2, 25))) for _ in range(n)]
+
+
+class TestSparseRows:
+
+    def test_hashed_terms(self):
+        features, counts = hashed_terms("Ads ads BUDGET")
+        assert len(features) == 2 and sorted(counts.tolist()) == [1.0, 2.0]
+        assert features.max() < N_FEATURES
+        assert len(hashed_terms("  !! ")[0]) == 0
+
+    def test_normalized_and_slicing(self):
+        rows = SparseRows.from_rows([
+            (np.array([1, 5]), np.array([3.0, 4.0])), (np.array([], dtype=np.int64), np.array([])),
+            (np.array([2]), np.array([0.0])),
+        ]).normalized()
+        assert rows.norms().tolist() == pytest.approx([1.0, 0.0, 0.0])
+        assert rows.data.tolist() == pytest.approx([0.6, 0.8])
+        tail = rows[1:3]
+        assert len(tail) == 2 and len(tail.indices) == 0
+
+    def test_matches_dense_reference(self):
+        texts = _texts(60)
+        dense = _dense_tfidf(texts)
+        rows = tfidf_rows(texts)
+        scores = sim.cosine_matrix(rows[:20], rows[20:], chunk_rows=7)
+        for i in range(20):
+            expected = [_cosine_similarity(dense[i], dense[j]) for j in range(20, 60)]
+            assert scores[i].tolist() == pytest.approx(expected, abs=1e-5)
+
+    def test_raw_tf_when_every_term_everywhere(self):
+        rows = tfidf_rows(["a b", "b a", "a b b"])
+        assert sim.cosine_matrix(rows[:1], rows[1:2])[0, 0] == pytest.approx(1.0)
+
+    def test_pairs_and_top_k_accept_sparse_rows(self):
+        rows = tfidf_rows(["ads budget", "ads budget", "python loops", "python loops fast"])
+        r, c, _ = sim.pairs_above(rows, threshold=0.5)
+        assert list(zip(r.tolist(), c.tolist())) == [(0, 1), (2, 3)]
+        indices, _ = sim.top_k(rows[2:3], rows, k=2)
+        assert indices.tolist() == [[2, 3]]
+
+
+class TestIncrementalModel:
+
+    def test_idf_from_whole_corpus(self):
+        model = TfidfModel()
+        corpus = ["ads budget", "ads audience", "python loops", "ads python"]
+        model.partial_fit(hashed_terms(t) for t in corpus)
+        assert model.n_docs == 4
+        rows = model.transform([hashed_terms("ads budget")]).normalized()
+        # ads (3 of 4 docs) weighs less than budget (1 of 4)
+        weights = dict(zip(rows.indices.tolist(), rows.data.tolist()))
+        ads, budget = hashed_terms("ads")[0][0], hashed_terms("budget")[0][0]
+        assert weights[int(budget)] > weights[int(ads)] > 0
+
+    def test_client_accumulates_each_text_once(self):
+        client = EmbeddingClient(tfidf_incremental=True)
+        client.fit_tfidf(["ads budget", "python loops"])
+        client.similarity_matrix(["ads budget"], ["python loops", "ads audience"])
+        assert client._tfidf_model.n_docs == 3
+        # Unlike per-call fitting, a pair scores the same whatever it is compared with
+        first = client.similarity("ads budget", "ads audience")
+        matrix = client.similarity_matrix(["ads budget"], ["python loops", "ads audience"])
+        assert matrix[0][1] == pytest.approx(first)
+        assert client._tfidf_model.n_docs == 3
+
+    def test_fit_ignored_without_incremental_mode(self):
+        client = EmbeddingClient()
+        client.fit_tfidf(["ads budget"])
+        assert client._tfidf_model is None
+
+
+def test_large_fallback_corpus_is_fast():
+    """400 × 600 texts over a 5k-word vocabulary without dense vectors."""
+    rng = random.Random(7)
+    words = [f"w{i}" for i in range(5000)]
+    texts = [" ".join(rng.choice(words) for _ in range(40)) for _ in range(1000)]
+    client = EmbeddingClient()
+    start = time.perf_counter()
+    matrix = client.similarity_array(texts[:400], texts[400:])
+    assert time.perf_counter() - start < 2.0
+    assert matrix.shape == (400, 600)
@@ -0,0 +1,135 @@
+"""Tests for per-call LLM telemetry."""
+
+import json
+import os
+
+import pytest
+
+from pipeline.core.telemetry import CallRecord, LlmTelemetry, percentile
+from pipeline.tests.test_claude_client import _ScriptedApi, _make_client
+
+
+def _rec(phase="p1", latency=1.0, **kwargs):
+    return CallRecord(phase=phase, model="m", prompt_hash="h", latency_s=latency, **kwargs)
+
+
+class TestPercentile:
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([3.0], 99) == 3.0
+        assert percentile([], 50) == 0.0
+
+
+class TestSummary:
+
+    def test_aggregates_per_phase_and_model(self):
+        telemetry = LlmTelemetry()
+        for i in range(1, 21):
+            telemetry.record(_rec("p1", latency=float(i), output_tokens=100))
+        telemetry.record(_rec("p3", latency=2.0, cache_hit=True))
+        telemetry.record(_rec("p3", latency=4.0, output_tokens=40, retries=1))
+        telemetry.record(_rec("p3", latency=0.5, error="ClaudeAPIError"))
+
+        summary = telemetry.summary()
+        p1 = summary["by_phase"]["p1"]
+        assert p1["calls"] == 20
+        assert p1["latency_s"]["p50"] == 10.0
+        assert p1["latency_s"]["p95"] == 19.0
+        assert p1["output_tokens_per_s"] == round(2000 / 210, 1)
+
+        p3 = summary["by_phase"]["p3"]
+        assert p3["calls"] == 1
+        assert p3["cache_hits"] == 1
+        assert p3["cache_hit_rate"] == 0.5
+        assert p3["errors"] == 1
+        assert p3["retries"] == 1
+        assert summary["overall"]["calls"] == 21
+        assert list(summary["by_model"]) == ["m"]
+
+    def test_write(self, tmp_path):
+        telemetry = LlmTelemetry()
+        telemetry.record(_rec(ttfb_s=0.2))
+        path = telemetry.write(str(tmp_path))
+        data = json.loads(open(path, encoding="utf-8").read())
+        assert data["summary"]["overall"]["ttfb_s"]["p50"] == 0.2
+        assert data["calls"][0]["phase"] == "p1"
+
+
+class TestClientRecording:
+
+    def test_calls_continuations_and_cache_hits_recorded(self, monkeypatch, tmp_path):
+        client = _make_client(cache_dir=str(tmp_path))
+        api = _ScriptedApi([('{"a": [1, ', "max_tokens"), ('2]}', "end_turn")])
+        monkeypatch.setattr(client, "_call_api", api)
+
+        client.call_json("sys", "u", phase="p2")
+        client.call_json("sys", "u", phase="p2")
+
+        kinds = [(r.kind, r.cache_hit) for r in client.telemetry.records]
+        assert kinds == [("call", False), ("continuation", False), ("call", True)]
+        assert all(r.phase == "p2" for r in client.telemetry.records)
+        first = client.telemetry.records[0]
+        assert first.input_tokens == 100 and first.output_tokens == 50
+        assert first.prompt_hash and first.latency_s >= 0
+
+        summary = client.get_telemetry_summary()["by_phase"]["p2"]
+        assert summary["calls"] == 2
+        assert summary["cache_hit_rate"] == 0.5
+
+    def test_failed_attempts_counted_as_retries(self, monkeypatch):
+        import httpx
+        import openai
+
+        client = _make_client()
+        response = httpx.Response(529, request=httpx.Request("POST", "https://example.com"))
+        overloaded = openai.APIStatusError("overloaded", response=response, body=None)
+        replies = iter([overloaded, ('{"ok": 1}', 10, 5, {})])
+
+        def _flaky(*args, **kwargs):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        monkeypatch.setattr(client, "_call_api", _flaky)
+        monkeypatch.setattr(type(client)._call_uncached.retry, "sleep", lambda s: None)
+        client.call("sys", "u", phase="p1")
+
+        failed, ok = client.telemetry.records
+        assert failed.error == "APIStatusError" and failed.retries == 0
+        assert not ok.error and ok.retries == 1
+
+
+class TestRunnerReport:
+
+    def _runner(self, build_config, monkeypatch, phase_func):
+        from pipeline.orchestrator import runner as runner_mod
+
+        monkeypatch.setattr(runner_mod, "PHASES", [("p4", "P4 Verify", phase_func)])
+        return runner_mod.PipelineRunner(build_config)
+
+    def test_written_when_run_raises(self, build_config, monkeypatch):
+        def _boom(*args):
+            raise RuntimeError("boom")
+
+        runner = self._runner(build_config, monkeypatch, _boom)
+        with pytest.raises(RuntimeError):
+            runner.run()
+        assert os.path.exists(os.path.join(build_config.output_dir, "llm_telemetry.json"))
+
+    def test_written_when_resume_fails(self, build_config, monkeypatch):
+        from pipeline.core.types import PhaseResult, PipelineState
+        from pipeline.orchestrator.state import save_checkpoint
+
+        logged = []
+        runner = self._runner(build_config, monkeypatch, lambda *a: PhaseResult(
+            phase_id="p4", status="failed", error_message="x"))
+        monkeypatch.setattr(runner, "_log_cache_stats", lambda: logged.append(True))
+        save_checkpoint(PipelineState(build_id="b"), build_config.output_dir)
+        assert runner.resume_after_resolve({}) == 1
+        assert logged == [True]
+        assert os.path.exists(os.path.join(build_config.output_dir, "llm_telemetry.json"))
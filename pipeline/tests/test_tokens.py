@@ -0,0 +1,130 @@
+"""Tests for offline token counting and token-based chunking."""
+
+import base64
+import sys
+
+import pytest
+
+from pipeline.core import tokens
+from pipeline.core.tokens import (
+    HeuristicTokenCounter, TiktokenCounter, TokenCounter, model_limits,
+    set_token_counter,
+)
+from pipeline.core.utils import chunk_text, estimate_tokens
+
+VIETNAMESE = (
+    "Trong buổi học hôm nay, chúng ta sẽ tìm hiểu cách xây dựng thương hiệu "
+    "cá nhân trên mạng xã hội. Điều quan trọng nhất là sự nhất quán."
+)
+ENGLISH = (
+    "In today's session we will look at how to build a personal brand on "
+    "social media. The most important thing is consistency over time."
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_counter():
+    set_token_counter(None)
+    yield
+    set_token_counter(None)
+
+
+class TestHeuristic:
+
+    def test_english_close_to_four_chars_per_token(self):
+        counter = HeuristicTokenCounter()
+        assert 3.5 <= counter.chars_per_token(ENGLISH) <= 5.0
+
+    def test_vietnamese_denser_than_english(self):
+        counter = HeuristicTokenCounter()
+        assert counter.chars_per_token(VIETNAMESE) < 3.2
+        assert counter.count(VIETNAMESE) > len(VIETNAMESE) // 4 * 1.3
+
+    def test_empty_text(self):
+        assert HeuristicTokenCounter().count("") == 0
+        assert estimate_tokens("") == 0
+
+    def test_calibration_moves_toward_reported_usage(self):
+        counter = HeuristicTokenCounter()
+        text = VIETNAMESE * 20
+        raw = counter.count(text, "m")
+        for _ in range(30):
+            counter.observe("m", counter.count(text, "m"), int(raw * 1.5))
+        assert counter.count(text, "m") == pytest.approx(raw * 1.5, rel=0.02)
+        # Other models and model-less counts keep the base rates
+        assert counter.count(text) == raw
+        assert counter.scale("other") == 1.0
+
+    def test_small_prompts_do_not_calibrate(self):
+        counter = HeuristicTokenCounter()
+        counter.observe("m", 10, 50)
+        assert counter.scale("m") == 1.0
+
+    def test_scale_bounded(self):
+        counter = HeuristicTokenCounter()
+        for _ in range(100):
+            counter.observe("m", 1000, 100_000)
+        assert counter.scale("m") == counter.SCALE_BOUNDS[1]
+
+    def test_counter_without_raw_count_cannot_be_built(self):
+        class Incomplete(TokenCounter):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+
+class TestTiktoken:
+
+    def _byte_vocab(self, tmp_path):
+        """Minimal vocabulary: one token per byte, no merges."""
+        path = tmp_path / "bytes.tiktoken"
+        path.write_text("\n".join(
+            f"{base64.b64encode(bytes([b])).decode()} {b}" for b in range(256)
+        ))
+        return str(path)
+
+    def test_counts_from_local_vocab(self, tmp_path):
+        counter = TiktokenCounter(self._byte_vocab(tmp_path))
+        assert counter.count("abc") == 3
+        assert counter.count("ế") == len("ế".encode("utf-8"))
+
+    def test_env_selects_vocab(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("TOKENIZER_VOCAB", self._byte_vocab(tmp_path))
+        assert tokens.get_token_counter().name == "tiktoken"
+
+    def test_missing_vocab_falls_back(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("TOKENIZER_VOCAB", str(tmp_path / "nope.tiktoken"))
+        assert tokens.get_token_counter().name == "heuristic"
+
+    def test_missing_tiktoken_falls_back_and_logs_once(self, tmp_path, monkeypatch, caplog):
+        monkeypatch.setenv("TOKENIZER_VOCAB", self._byte_vocab(tmp_path))
+        monkeypatch.setitem(sys.modules, "tiktoken", None)
+        monkeypatch.setattr(tokens, "_fallback_logged", False)
+        with caplog.at_level("WARNING", logger="pipeline.core.tokens"):
+            assert tokens.get_token_counter().name == "heuristic"
+            set_token_counter(None)
+            assert tokens.get_token_counter().name == "heuristic"
+        assert len(caplog.records) == 1
+        assert "tiktoken is not installed" in caplog.records[0].getMessage()
+
+
+class TestChunkText:
+
+    def test_vietnamese_chunks_fit_token_budget(self):
+        text = "\n\n".join([VIETNAMESE] * 200)
+        counter = HeuristicTokenCounter()
+        chunks = chunk_text(text, max_tokens=1000, overlap=50)
+        assert len(chunks) > 1
+        assert all(counter.count(c) <= 1100 for c in chunks)
+
+    def test_short_text_single_chunk(self):
+        assert chunk_text(ENGLISH, max_tokens=1000) == [ENGLISH]
+
+
+class TestModelLimits:
+
+    def test_known_and_unknown_models(self):
+        assert model_limits("claude-haiku-4-5-20251001")[0] == 200_000
+        window, max_output = model_limits("some-proxy-model")
+        assert window > 0 and max_output == 0